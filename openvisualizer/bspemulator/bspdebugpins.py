@@ -6,7 +6,6 @@
 
 import logging
 
-from openvisualizer.bspemulator import vcdlogger
 from openvisualizer.bspemulator.bspmodule import BspModule
 
 
@@ -35,7 +34,7 @@ class BspDebugPins(BspModule):
         self.vcdlog = vcdlog
 
         if self.vcdlog:
-            self.vcdLogger = vcdlogger.VcdLogger()
+            self.vcdLogger = self.engine.get_vcd_logger()
 
     # ======================== public ==========================================
 
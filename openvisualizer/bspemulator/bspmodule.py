@@ -6,8 +6,6 @@
 import logging
 from abc import ABCMeta
 
-from openvisualizer.simengine import simengine
-
 
 class BspModule(object):
     """ Emulates the 'board' BSP module. """
@@ -23,7 +21,7 @@ class BspModule(object):
 
         # local variables
         self.is_initialized = False
-        self.engine = simengine.SimEngine()
+        self.engine = self.motehandler.engine
 
         # logging
         self.log = logging.getLogger(self._name + '_' + str(self.motehandler.get_id()))
@@ -8,6 +8,7 @@ import logging
 
 from openvisualizer.bspemulator.bspmodule import BspModule
 from openvisualizer.simengine import propagation
+from openvisualizer.simengine.timeline import TimeLine
 from openvisualizer.eventbus.eventbusclient import EventBusClient
 
 
@@ -44,13 +45,17 @@ class BspRadio(BspModule, EventBusClient):
     INTR_ENDOFFRAME_PROPAGATION = 'radio.endofframe_fromPropagation'
     INTR_CCAEND_SELF = 'radio.ccaend_fromSelf'
 
+    # durations, in ns
+    TX_DELAY = 214000
+    CCA_DURATION = 128000
+
     nbActiveSignals = 0      # nb of active signals on the medium (=0 -> idle)
     
     def __init__(self, motehandler):
 
         # initialize the parents
         BspModule.__init__(self, motehandler)
-        EventBusClient.__init__(self, name='BspRadio_{0}'.format(self.motehandler.get_id()), registrations=[])
+        EventBusClient.__init__(self, name=self.engine.register_radio(self.motehandler.get_id()), registrations=[])
 
         # local variables
         self.timeline = self.engine.timeline
@@ -62,10 +67,11 @@ class BspRadio(BspModule, EventBusClient):
         self.is_rf_on = False  # radio is off
         self.tx_buf = []
         self.rx_buf = []
-        self.delay_tx = 0.000214
+        self.delay_tx = self.TX_DELAY
         self.rssi = -50
         self.lqi = 100
         self.crc_passes = True
+        self.rx_from = None  # mote the frame being received is from
 
         # set initial state
         self._change_state(RadioState.STOPPED)
@@ -159,7 +165,7 @@ class BspRadio(BspModule, EventBusClient):
     
         # calculate when the end of the CCA will occurs
         current_time = self.timeline.get_current_time()
-        CCA_time = current_time + 0.000128   #128us
+        CCA_time = current_time + self.CCA_DURATION
         
         if (self.state != RadioState.LISTENING):
             self.log.error("{0}: Eror, We are not in the listening State to Trigger a CCA".format(
@@ -385,6 +391,7 @@ class BspRadio(BspModule, EventBusClient):
     # ======================== indication from Propagation =====================
 
     def indicate_tx_start(self, mote_id, packet, channel):
+        """ Returns True when the radio starts receiving the frame. """
 
         if self.log.isEnabledFor(logging.DEBUG):
             self.log.debug(
@@ -399,6 +406,8 @@ class BspRadio(BspModule, EventBusClient):
             self._change_state(RadioState.RECEIVING)
 
             self.rx_buf = packet
+            self.rx_from = mote_id
+            self.crc_passes = True
 
             # log
             if self.log.isEnabledFor(logging.DEBUG):
@@ -411,8 +420,11 @@ class BspRadio(BspModule, EventBusClient):
                 self.intr_start_of_frame_from_propagation,
                 self.INTR_STARTOFFRAME_PROPAGATION,
             )
+            return True
+
+        return False
 
-    def indicate_tx_end(self, mote_id):
+    def indicate_tx_end(self, mote_id, crc_passes=True):
 
         # saves the nb of active signals
         self.nbActiveSignals = self.nbActiveSignals - 1
@@ -422,9 +434,13 @@ class BspRadio(BspModule, EventBusClient):
         if self.log.isEnabledFor(logging.DEBUG):
             self.log.debug('indicate_tx_end from mote_id={0}'.format(mote_id))
 
-        if self.is_initialized and self.state == RadioState.RECEIVING:
+        # the end of another frame, overlapping the one being received, does not end the reception
+        if self.is_initialized and self.state == RadioState.RECEIVING and self.rx_from == mote_id:
             self._change_state(RadioState.LISTENING)
 
+            self.rx_from = None
+            self.crc_passes = crc_passes
+
             # schedule end of frame
             self.timeline.schedule_event(
                 self.timeline.get_current_time(),
@@ -437,7 +453,8 @@ class BspRadio(BspModule, EventBusClient):
 
     @staticmethod
     def _packet_length_to_duration(num_bytes):
-        return float(num_bytes * 8) / 250000.0
+        """ Returns the time it takes to send num_bytes at 250 kbps, in ns. """
+        return num_bytes * 8 * TimeLine.NS_PER_SECOND // 250000
 
     def _change_state(self, new_state):
         self.state = new_state
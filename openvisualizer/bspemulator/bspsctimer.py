@@ -91,7 +91,8 @@ class BspSctimer(bspmodule.BspModule):
                 # we're already too late, schedule compare event right now
                 ticks_before_event = 0
             else:
-                ticks_before_event = compare_value - counter_val
+                # the compare value may be past the rollover of the counter
+                ticks_before_event = (compare_value - counter_val) % self.ROLLOVER
 
             # calculate time at overflow event
             compare_time = self.hw_crystal.get_time_in(ticks_before_event)
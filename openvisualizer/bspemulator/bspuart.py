@@ -6,12 +6,20 @@
 
 import logging
 import threading
+from collections import deque
 
 from openvisualizer.bspemulator.bspmodule import BspModule
+from openvisualizer.simengine.timeline import TimeLine
 
 
 class BspUart(BspModule):
-    """ Emulates the 'uart' BSP module """
+    """
+    Emulates the 'uart' BSP module.
+
+    The bytes the mote writes are handed over to the mote probe a whole HDLC frame at a time, the mote waiting for the
+    mote probe to be done reading the frame. The frames the mote probe writes are delivered to the mote as bursts, one
+    timeline event per frame, when the last byte of the frame has been received at BAUDRATE.
+    """
 
     _name = 'BspUart'
 
@@ -24,12 +32,18 @@ class BspUart(BspModule):
     XONXOFF_ESCAPE = 0x12
     XONXOFF_MASK = 0x10
 
+    HDLC_FLAG = 0x7e
+
+    # bytes after which the mote probe reads the RX buffer, even within a frame
+    RX_BUFFER_THRESHOLD = 256
+
     def __init__(self, motehandler):
         # initialize the parent
         super(BspUart, self).__init__(motehandler)
 
         # local variables
         self.timeline = self.engine.timeline
+        self.byte_duration = self._transmission_time(1)
         self.interrupts_enabled = False
         self.tx_interrupt_flag = False
         self.rx_interrupt_flag = False
@@ -37,7 +51,8 @@ class BspUart(BspModule):
         self.uart_rx_buffer_sem = threading.Semaphore()
         self.uart_rx_buffer_sem.acquire()
         self.uart_rx_buffer_lock = threading.Lock()
-        self.uart_tx_buffer = []  # the bytes to be sent over UART
+        self.uart_rx_in_frame = False  # the RX buffer ends within a HDLC frame
+        self.uart_tx_frames = deque()  # the frames to be sent over UART, the first one is being sent
         self.uart_tx_next = None  # the byte that was just signaled to mote
         self.uart_tx_buffer_lock = threading.Lock()
         self.wait_for_done_reading = threading.Lock()
@@ -65,19 +80,18 @@ class BspUart(BspModule):
         return return_val
 
     def write(self, bytes_to_write):
-        """ Write a string of bytes to the mote. """
+        """ Write a string of bytes to the mote, queued after the bytes not sent yet. """
 
         assert len(bytes_to_write)
 
-        if len(self.uart_tx_buffer) != 0:
-            return 0
-
         with self.uart_tx_buffer_lock:
-            self.uart_tx_buffer = [ord(b) for b in bytes_to_write]
+            self.uart_tx_frames.append([ord(b) for b in bytes_to_write])
+            # the frame is sent after the one being sent
+            if len(self.uart_tx_frames) > 1:
+                return len(bytes_to_write)
 
-        self.engine.pause()
+        # the timeline takes its own lock, the simulation is neither paused nor resumed
         self._schedule_next_tx()
-        self.engine.resume()
 
         return len(bytes_to_write)
 
@@ -147,7 +161,7 @@ class BspUart(BspModule):
         self.tx_interrupt_flag = True
 
         # calculate the time at which the byte will have been sent
-        done_sending_time = self.timeline.get_current_time() + float(1.0 / float(self.BAUDRATE))
+        done_sending_time = self.timeline.get_current_time() + self.byte_duration
 
         # schedule uart TX interrupt in 1/BAUDRATE seconds
         self.timeline.schedule_event(done_sending_time, self.motehandler.get_id(), self.intr_tx, self.INTR_TX)
@@ -156,18 +170,10 @@ class BspUart(BspModule):
             self.f_xon_xoff_escaping = True
             self.xon_xoff_escaped_byte = byte_to_write
             # add to receive buffer
-            with self.uart_rx_buffer_lock:
-                self.uart_rx_buffer += [self.XONXOFF_ESCAPE]
+            self._add_to_rx_buffer([self.XONXOFF_ESCAPE])
         else:
             # add to receive buffer
-            with self.uart_rx_buffer_lock:
-                self.uart_rx_buffer += [byte_to_write]
-
-        # release the semaphore indicating there is something in RX buffer
-        self.uart_rx_buffer_sem.release()
-
-        # wait for the moteProbe to be done reading
-        self.wait_for_done_reading.acquire()
+            self._add_to_rx_buffer([byte_to_write])
 
     def cmd_set_cts(self, state):
         """ Emulates: void uart_setCTS(bool state) """
@@ -180,23 +186,16 @@ class BspUart(BspModule):
         self.tx_interrupt_flag = True
 
         # calculate the time at which the byte will have been sent
-        done_sending_time = self.timeline.get_current_time() + float(1.0 / float(self.BAUDRATE))
+        done_sending_time = self.timeline.get_current_time() + self.byte_duration
 
         # schedule uart TX interrupt in 1/BAUDRATE seconds
         self.timeline.schedule_event(done_sending_time, self.motehandler.get_id(), self.intr_tx, self.INTR_TX)
 
         # add to receive buffer
-        with self.uart_rx_buffer_lock:
-            if state:
-                self.uart_rx_buffer += [self.XON]
-            else:
-                self.uart_rx_buffer += [self.XOFF]
-
-        # release the semaphore indicating there is something in RX buffer
-        self.uart_rx_buffer_sem.release()
-
-        # wait for the moteProbe to be done reading
-        self.wait_for_done_reading.acquire()
+        if state:
+            self._add_to_rx_buffer([self.XON])
+        else:
+            self._add_to_rx_buffer([self.XOFF])
 
     def cmd_write_circular_buffer_fastsim(self, buf):
         """ Emulates: void uart_writeCircularBuffer_FASTSIM(uint8_t* buffer, uint8_t len) """
@@ -221,26 +220,19 @@ class BspUart(BspModule):
         self.tx_interrupt_flag = True
 
         # calculate the time at which the buffer will have been sent
-        done_sending_time = self.timeline.get_current_time() + float(float(len(buf)) / float(self.BAUDRATE))
+        done_sending_time = self.timeline.get_current_time() + self._transmission_time(len(buf))
 
         # schedule uart TX interrupt in len(buffer)/BAUDRATE seconds
         self.timeline.schedule_event(done_sending_time, self.motehandler.get_id(), self.intr_tx, self.INTR_TX)
 
         # add to receive buffer
-        with self.uart_rx_buffer_lock:
-            i = 0
-            while i != len(buf):
-                if buf[i] == self.XON or buf[i] == self.XOFF or buf[i] == self.XONXOFF_ESCAPE:
-                    new_item = (self.XONXOFF_ESCAPE, buf[i] ^ self.XONXOFF_MASK)
-                    buf[i:i + 1] = new_item
-                i += 1
-            self.uart_rx_buffer += buf
-
-        # release the semaphore indicating there is something in RX buffer
-        self.uart_rx_buffer_sem.release()
-
-        # wait for the moteProbe to be done reading
-        self.wait_for_done_reading.acquire()
+        i = 0
+        while i != len(buf):
+            if buf[i] == self.XON or buf[i] == self.XOFF or buf[i] == self.XONXOFF_ESCAPE:
+                new_item = (self.XONXOFF_ESCAPE, buf[i] ^ self.XONXOFF_MASK)
+                buf[i:i + 1] = new_item
+            i += 1
+        self._add_to_rx_buffer(buf)
 
     def cmd_read_byte(self):
         """ Emulates: uint8_t uart_readByte()"""
@@ -269,20 +261,13 @@ class BspUart(BspModule):
             self.tx_interrupt_flag = True
 
             # calculate the time at which the byte will have been sent
-            done_sending_time = self.timeline.get_current_time() + float(1.0 / float(self.BAUDRATE))
+            done_sending_time = self.timeline.get_current_time() + self.byte_duration
 
             # schedule uart TX interrupt in 1/BAUDRATE seconds
             self.timeline.schedule_event(done_sending_time, self.motehandler.get_id(), self.intr_tx, self.INTR_TX)
 
             # add to receive buffer
-            with self.uart_rx_buffer_lock:
-                self.uart_rx_buffer += [self.xon_xoff_escaped_byte ^ self.XONXOFF_MASK]
-
-            # release the semaphore indicating there is something in RX buffer
-            self.uart_rx_buffer_sem.release()
-
-            # wait for the moteProbe to be done reading
-            self.wait_for_done_reading.acquire()
+            self._add_to_rx_buffer([self.xon_xoff_escaped_byte ^ self.XONXOFF_MASK])
 
         else:
             # send interrupt to mote
@@ -292,7 +277,7 @@ class BspUart(BspModule):
         return False
 
     def intr_rx(self):
-        """ Interrupt to indicate to mote it received a byte from the UART. """
+        """ Interrupt to indicate to mote it received a frame from the UART, one interrupt per byte. """
 
         # log the activity
         if self.log.isEnabledFor(logging.DEBUG):
@@ -300,28 +285,53 @@ class BspUart(BspModule):
 
         with self.uart_tx_buffer_lock:
 
-            # make sure there is a byte to TX
-            assert len(self.uart_tx_buffer)
+            # make sure there is a frame to TX
+            assert len(self.uart_tx_frames)
 
-            # get the byte that is being transmitted
-            self.uart_tx_next = self.uart_tx_buffer.pop(0)
+            # get the frame that has been transmitted
+            frame = self.uart_tx_frames.popleft()
 
-            # schedule the next interrupt, if any bytes left
-            if len(self.uart_tx_buffer):
+            # schedule the next frame, if any
+            if len(self.uart_tx_frames):
                 self._schedule_next_tx()
 
-        # send RX interrupt to mote
-        self.motehandler.mote.uart_isr_rx()
+        # send an RX interrupt to mote for every byte
+        isr_rx = self.motehandler.mote.uart_isr_rx
+        for byte in frame:
+            self.uart_tx_next = byte
+            isr_rx()
 
         # do *not* kick the scheduler
         return False
 
     # ======================== private =========================================
 
+    @classmethod
+    def _transmission_time(cls, num_bytes):
+        """ Returns the time it takes to send num_bytes at BAUDRATE, in ns. """
+        return (num_bytes * TimeLine.NS_PER_SECOND + cls.BAUDRATE // 2) // cls.BAUDRATE
+
+    def _add_to_rx_buffer(self, bytes_to_add):
+        """ Adds bytes written by the mote to the RX buffer, hands the buffer over once it ends a frame. """
+
+        with self.uart_rx_buffer_lock:
+            self.uart_rx_buffer += bytes_to_add
+            if bytes_to_add.count(self.HDLC_FLAG) % 2:
+                self.uart_rx_in_frame = not self.uart_rx_in_frame
+            if self.uart_rx_in_frame and len(self.uart_rx_buffer) < self.RX_BUFFER_THRESHOLD:
+                return
+
+        # release the semaphore indicating there is something in RX buffer
+        self.uart_rx_buffer_sem.release()
+
+        # wait for the moteProbe to be done reading
+        self.wait_for_done_reading.acquire()
+
     def _schedule_next_tx(self):
+        """ Schedules the end of the reception of the first frame of the TX buffer. """
 
-        # calculate time at which byte will get out
-        time_next_tx = self.timeline.get_current_time() + float(1.0 / float(self.BAUDRATE))
+        # calculate time at which the last byte of the frame will get out
+        time_next_tx = self.timeline.get_current_time() + self._transmission_time(len(self.uart_tx_frames[0]))
 
         # schedule that event
         self.timeline.schedule_event(
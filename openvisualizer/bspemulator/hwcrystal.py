@@ -7,12 +7,20 @@
 
 import logging
 import random
+from fractions import gcd
 
 from openvisualizer.bspemulator.hwmodule import HwModule
+from openvisualizer.simengine.timeline import TimeLine
 
 
 class HwCrystal(HwModule):
-    """ Emulates the mote's crystal. """
+    """
+    Emulates the mote's crystal.
+
+    The ticks are computed in integer ns of simulated time. The period of a tick is kept as an exact fraction of ns
+    (1953125/64 ns at 32768 Hz without drift) and tick k is at ts_tick + floor(k * period), so that the ticks never
+    drift from each other, however long the simulation.
+    """
 
     _name = 'HwCrystal'
 
@@ -31,14 +39,15 @@ class HwCrystal(HwModule):
         # local variables
         self.drift = float(random.uniform(-self.max_drift, self.max_drift))
 
-        # the duration of one tick. Since it is constant, it is only calculated once by _getPeriod(). Therefore, do not
-        # use directly, rather use property period
-        self._period = None
+        # the duration of one tick is period_num/period_den ns
+        (self.period_num, self.period_den) = self.tick_period(self.frequency, self.drift)
 
-        # ts_tick is a timestamp associated with any tick in the past. Since the period is constant, it is used to
-        # ensure alignement of timestamps to an integer number of ticks.
+        # ts_tick is the timestamp of the tick the crystal started at, all the ticks are counted from it
         self.ts_tick = None
 
+        # the index of the last tick, for the time it was computed at; the sctimer asks for it several times per event
+        self.last_tick_cache = (None, None)
+
     # ======================== public ==========================================
 
     def start(self):
@@ -46,6 +55,7 @@ class HwCrystal(HwModule):
 
         # get the timestamp of a
         self.ts_tick = self.timeline.get_current_time()
+        self.last_tick_cache = (None, None)
 
         # log
         if self.log.isEnabledFor(logging.DEBUG):
@@ -76,15 +86,7 @@ class HwCrystal(HwModule):
         # make sure crystal has been started
         assert self.ts_tick is not None
 
-        current_time = self.timeline.get_current_time()
-        time_since_last = current_time - self.ts_tick
-
-        ticks_since_last = round(float(time_since_last) / float(self.period))
-        time_last_tick = self.ts_tick + ticks_since_last * self.period
-
-        self.ts_tick = time_last_tick
-
-        return time_last_tick
+        return self._tick_time(self._last_tick())
 
     def get_time_in(self, num_ticks):
         """
@@ -114,9 +116,7 @@ class HwCrystal(HwModule):
         assert self.ts_tick is not None
         assert num_ticks >= 0
 
-        time_last_tick = self.get_time_last_tick()
-
-        return time_last_tick + num_ticks * self.period
+        return self._tick_time(self._last_tick() + num_ticks)
 
     def get_ticks_since(self, event_time):
         """
@@ -150,24 +150,41 @@ class HwCrystal(HwModule):
         # make sure that event_time passed is in the past
         assert (event_time <= current_time)
 
-        # get the time of the last tick
-        time_last_tick = self.get_time_last_tick()
+        # count the ticks from the first one at or after event_time up to the last tick, which may be before
+        # event_time when both are within the same tick
+        first_tick = -((self.ts_tick - event_time) * self.period_den // self.period_num)
+
+        return max(self._last_tick() - first_tick, 0)
 
-        # return the number of ticks
-        if time_last_tick < event_time:
-            return_val = 0
-        else:
-            return_val = int(float(time_last_tick - event_time) / float(self.period))
+    @staticmethod
+    def tick_period(frequency, drift):
+        """
+        Returns the duration of one tick, in ns, as the numerator and denominator of an irreducible fraction.
 
-        return return_val
+        :param frequency: The nominal frequency, in Hz.
+        :param drift: The drift of the crystal, in ppm, rounded to the ppb.
+        """
+        period_num = TimeLine.NS_PER_SECOND * (1000000000 + int(round(drift * 1000)))
+        period_den = frequency * 1000000000
+        divisor = gcd(period_num, period_den)
+        return period_num // divisor, period_den // divisor
 
     # ======================== private =========================================
 
     @property
     def period(self):
+        """ The duration of one tick, in seconds. """
+        return TimeLine.time_to_seconds(float(self.period_num) / self.period_den)
 
-        if self._period is None:
-            self._period = float(1) / float(self.frequency)  # nominal period
-            self._period += float(self.drift / 1000000.0) * float(self._period)  # apply drift
-
-        return self._period
+    def _last_tick(self):
+        """ Returns the index of the tick closest to the current time. """
+        current_time = self.timeline.get_current_time()
+        (cached_time, index) = self.last_tick_cache
+        if current_time != cached_time:
+            index = (2 * (current_time - self.ts_tick) * self.period_den + self.period_num) // (2 * self.period_num)
+            self.last_tick_cache = (current_time, index)
+        return index
+
+    def _tick_time(self, index):
+        """ Returns the timestamp of a tick, in ns. """
+        return self.ts_tick + index * self.period_num // self.period_den
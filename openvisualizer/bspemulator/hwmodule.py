@@ -6,8 +6,6 @@
 import logging
 from abc import ABCMeta
 
-from openvisualizer.simengine import simengine
-
 
 class HwModule(object):
     """ Parent class for all hardware modules. """
@@ -22,7 +20,7 @@ class HwModule(object):
         self.motehandler = motehandler
 
         # local variables
-        self.engine = simengine.SimEngine()
+        self.engine = self.motehandler.engine
 
         # logging
         self.log = logging.getLogger(self._name + '_' + str(self.motehandler.get_id()))
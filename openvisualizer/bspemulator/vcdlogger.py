@@ -3,35 +3,25 @@ import threading
 
 
 class VcdLogger(object):
+    """ Logs the debug pins of the motes of an engine into a VCD file. """
+
     ACTIVITY_DUR = 1000  # 1000ns=1us
     FILENAME = 'debugpins.vcd'
-    FILENAME_SWAP = 'debugpins.vcd.swap'
     ENDVAR_LINE = '$upscope $end\n'
     ENDDEF_LINE = '$enddefinitions $end\n'
 
-    # ======================== singleton pattern ===============================
-
-    _instance = None
-    _init = False
-
     SIGNAMES = ['frame', 'slot', 'fsm', 'task', 'isr', 'radio', 'ka', 'syncPacket', 'syncAck', 'debug']
 
-    def __new__(cls, *args, **kwargs):
-        if not cls._instance:
-            cls._instance = super(VcdLogger, cls).__new__(cls, *args, **kwargs)
-        return cls._instance
-
     # ======================== main ============================================
 
-    def __init__(self):
+    def __init__(self, filename=FILENAME):
 
-        # don't re-initialize an instance (singleton pattern)
-        if self._init:
-            return
-        self._init = True
+        # store params
+        self.filename = filename
+        self.filename_swap = filename + '.swap'
 
         # local variables
-        self.f = open(self.FILENAME, 'w')
+        self.f = open(self.filename, 'w')
         self.sig_name = {}
         self.last_ts = {}
         self.data_lock = threading.RLock()
@@ -52,6 +42,10 @@ class VcdLogger(object):
 
     # ======================== public ==========================================
 
+    def close(self):
+        with self.data_lock:
+            self.f.close()
+
     def set_enabled(self, enabled):
         assert enabled in [True, False]
 
@@ -59,6 +53,7 @@ class VcdLogger(object):
             self.enabled = enabled
 
     def log(self, ts, mote, signal, state):
+        """ Logs the state of a signal at simulated time ts, in ns. """
 
         assert signal in self.SIGNAMES
         assert state in [True, False]
@@ -82,7 +77,7 @@ class VcdLogger(object):
 
             # format
             output = []
-            ts_temp = int(ts * 1000000) * 1000
+            ts_temp = ts
             if ((mote, signal) in self.last_ts) and self.last_ts[(mote, signal)] == ts:
                 ts_temp += self.ACTIVITY_DUR
             output += ['#{0}\n'.format(ts_temp)]
@@ -110,8 +105,8 @@ class VcdLogger(object):
         self.f.close()
 
         # === FILENAME -> FILENAME_SWAP
-        fswap = open(self.FILENAME_SWAP, 'w')
-        for line in open(self.FILENAME, 'r'):
+        fswap = open(self.filename_swap, 'w')
+        for line in open(self.filename, 'r'):
             # declare variables
             if line == self.ENDVAR_LINE:
                 for signal in self.SIGNAMES:
@@ -132,8 +127,8 @@ class VcdLogger(object):
         fswap.close()
 
         # === FILENAME_SWAP -> FILENAME
-        os.remove(self.FILENAME)
-        os.rename(self.FILENAME_SWAP, self.FILENAME)
+        os.remove(self.filename)
+        os.rename(self.filename_swap, self.filename)
 
         # === re-open FILENAME
-        self.f = open(self.FILENAME, 'a')
+        self.f = open(self.filename, 'a')
@@ -10,14 +10,14 @@ import click
 
 from openvisualizer.client.plugins.plugin import Plugin
 from openvisualizer.client.utils import transform_into_ipv6
-from openvisualizer.client.webserver import WebServer
+from openvisualizer.client.webserver import WebServer, ThreadingWSGIServer
 from openvisualizer.motehandler.motestate.motestate import MoteState
 
 
 class Proxy(object):
     def __init__(self, host, port):
         url = 'http://{}:{}'.format(host, str(port))
-        self.rpc_server = xmlrpclib.ServerProxy(url)
+        self.rpc_server = xmlrpclib.ServerProxy(url, allow_none=True)
 
 
 pass_proxy = click.make_pass_decorator(Proxy, ensure=True)
@@ -194,10 +194,10 @@ def web(rpc_host, rpc_port, web_port, web_host, debug):
 
     if debug != 'DEBUG':
         bottle.debug(False)
-        bottle_server.run(host=web_host, port=web_port, quiet=True)
+        bottle_server.run(host=web_host, port=web_port, quiet=True, server_class=ThreadingWSGIServer)
     else:
         bottle.debug(True)
-        bottle_server.run(host=web_host, port=web_port)
+        bottle_server.run(host=web_host, port=web_port, server_class=ThreadingWSGIServer)
 
 
 @click.command()
@@ -0,0 +1,172 @@
+# Copyright (c) 2010-2013, Regents of the University of California.
+# All rights reserved.
+#
+# Released under the BSD 3-Clause license as published at the link below.
+# https://openwsn.atlassian.net/wiki/display/OW/License
+"""
+Streams of the OpenVisualizer server state, shared by the clients of the web server.
+"""
+
+import json
+import logging
+import socket
+import threading
+import time
+import xmlrpclib
+from abc import ABCMeta, abstractmethod
+
+logger = logging.getLogger(__name__)
+
+
+class StateStream(threading.Thread):
+    """
+    Fetches the updates of a state from the OpenVisualizer server, in a single thread whatever the number of
+    subscribers.
+
+    The state is a dictionary of items. Each fetch that changes items gives them a new version, a subscriber passes the
+    version it last received to wait() and gets the items changed since. The versions are only meaningful within a
+    stream, the event ids prefix them with the id of the stream.
+    """
+    __metaclass__ = ABCMeta
+
+    RETRY_DELAY = 1  # seconds
+
+    def __init__(self, rpc_server_addr):
+        # store params
+        self.rpc_server = xmlrpclib.ServerProxy('http://{}:{}'.format(*rpc_server_addr), allow_none=True)
+
+        # local variables
+        self.data_lock = threading.Condition()
+        self.stream_id = '{0:x}'.format(int(time.time() * 1000))
+        self.version = 0
+        self.items = {}
+        self.subscribers = 0
+        self.go_on = True
+
+        # initialize the parent class
+        super(StateStream, self).__init__()
+        self.daemon = True
+
+    def run(self):
+        try:
+            logger.debug('start running {0}'.format(self.name))
+
+            while self.go_on:
+                try:
+                    changes = self._fetch()
+                except (socket.error, xmlrpclib.Fault) as err:
+                    logger.error('{0}: {1}'.format(self.name, err))
+                    self._reset()
+                    time.sleep(self.RETRY_DELAY)
+                    continue
+
+                if not changes:
+                    continue
+
+                with self.data_lock:
+                    self.version += 1
+                    for (name, value) in changes.items():
+                        self.items[name] = (self.version, value)
+                    self.data_lock.notify_all()
+
+            logger.debug('exit {0}'.format(self.name))
+        except Exception as err:
+            logger.critical(err)
+            raise
+
+    # ======================== public ==========================================
+
+    def wait(self, since=None, timeout=None):
+        """
+        Waits up to timeout seconds for items changed after version since.
+
+        :param since: version returned by a previous call, None for all the items
+        :returns: tuple (version, changes), changes being a dictionary of the items changed after since
+        """
+        with self.data_lock:
+            since = since or 0
+            deadline = time.time() + timeout if timeout else None
+            while self.go_on and self.version <= since:
+                remaining = deadline - time.time() if deadline else None
+                if remaining is not None and remaining <= 0:
+                    break
+                self.data_lock.wait(remaining)
+
+            changes = dict((name, value) for (name, (version, value)) in self.items.items() if version > since)
+            return self.version, changes
+
+    def format_event(self, version, changes):
+        """ Formats changes as a server-sent event. """
+        return 'id: {0}:{1}\nevent: state\ndata: {2}\n\n'.format(self.stream_id, version, json.dumps(changes))
+
+    def parse_event_id(self, event_id):
+        """ Returns the version in the id of the last event received by a client, None if not from this stream. """
+        try:
+            (stream_id, version) = event_id.split(':')
+            if stream_id == self.stream_id:
+                return int(version)
+        except (AttributeError, ValueError):
+            pass
+        return None
+
+    def close(self):
+        with self.data_lock:
+            self.go_on = False
+            self.data_lock.notify_all()
+
+    # ======================== private =========================================
+
+    @abstractmethod
+    def _fetch(self):
+        """ Blocks until the state changes, or for a while, and returns the changed items. """
+        raise NotImplementedError()
+
+    def _reset(self):
+        """ Called when the server could not be reached, the next fetch starts over. """
+        pass
+
+
+class MoteStateStream(StateStream):
+    """ Stream of the state elements of a mote, pushed by the server as they are updated. """
+
+    def __init__(self, rpc_server_addr, mote_id):
+        super(MoteStateStream, self).__init__(rpc_server_addr)
+        self.name = 'MoteStateStream@{0}'.format(mote_id)
+
+        self.mote_id = mote_id
+        self.server_version = None
+
+    def _fetch(self):
+        changes = self.rpc_server.wait_mote_state(self.mote_id, self.server_version)
+        self.server_version = changes['version']
+        return changes['states']
+
+    def _reset(self):
+        self.server_version = None
+
+
+class EventBusStream(StateStream):
+    """ Stream of the event bus statistics, polled from the server and only pushed when they change. """
+
+    POLL_INTERVAL = 1  # seconds
+
+    def __init__(self, rpc_server_addr):
+        super(EventBusStream, self).__init__(rpc_server_addr)
+        self.name = 'EventBusStream'
+
+        self.last = {}
+
+    def _fetch(self):
+        if self.last:
+            time.sleep(self.POLL_INTERVAL)
+
+        current = {
+            'isDebugPkts': 'true' if self.rpc_server.get_wireshark_debug() else 'false',
+            'stats': self.rpc_server.get_ebm_stats(),
+        }
+        changes = dict((k, v) for (k, v) in current.items() if self.last.get(k) != v)
+        self.last = current
+        return changes
+
+    def _reset(self):
+        self.last = {}
@@ -13,8 +13,15 @@ from blessed import Terminal
 
 
 class View(threading.Thread):
+    """
+    Renders the state of a mote. The state is streamed from the server: every call returns, as soon as they change,
+    the state elements updated since the previous call, and the view is rendered at most every refresh_rate seconds.
+    """
     __metaclass__ = ABCMeta
 
+    # maximum time a request for the state blocks, bounds the time to quit the view
+    WAIT_TIMEOUT = 2
+
     def __init__(self, proxy, mote_id, refresh_rate):
         super(View, self).__init__()
 
@@ -28,14 +35,19 @@ class View(threading.Thread):
         self.error_msg = ''
 
     def run(self):
+        mote_state = {}
+        version = None
+
         while not self.quit:
             try:
-                mote_state = self.rpc_server.get_mote_state(self.mote_id)
+                changes = self.rpc_server.wait_mote_state(self.mote_id, version, self.WAIT_TIMEOUT)
             except Fault as err:
                 logging.error("Caught fault from server")
                 self.close()
                 self.error_msg = err.faultString
             except socket.error as err:
+                # the server may restart, start over with the full state
+                version = None
                 if errno.ECONNREFUSED:
                     logging.error("Connection refused error")
                     self.print_connrefused_msg()
@@ -45,6 +57,10 @@ class View(threading.Thread):
                     print(self.term.home + self.term.red_on_black + err)
                     View.block()
             else:
+                if version is not None and not changes['states']:
+                    continue
+                mote_state.update(changes['states'])
+                version = changes['version']
                 self.render(mote_state)
                 time.sleep(self.refresh_rate)
 
@@ -10,12 +10,16 @@ import json
 import logging
 import re
 import socket
+import threading
 import xmlrpclib
+from SocketServer import ThreadingMixIn
+from wsgiref.simple_server import WSGIServer
 
 import bottle
 import pkg_resources
 
 from openvisualizer import VERSION, PACKAGE_NAME
+from openvisualizer.client.statestream import MoteStateStream, EventBusStream
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
@@ -27,9 +31,17 @@ logger.addHandler(st)
 bottle.view = functools.partial(bottle.view, ovVersion=VERSION)
 
 
-class WebServer:
+class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    """ WSGI server handling each request in a thread, the streams keep their connection open. """
+    daemon_threads = True
+
+
+class WebServer(object):
     """ Provides web UI for OpenVisualizer."""
 
+    # a comment line is sent on idle streams, to detect the clients that left
+    KEEPALIVE_INTERVAL = 15  # seconds
+
     def __init__(self, bottle_srv, rpc_server_addr, debug):
         """
         :param bottle_srv: Bottle server instance
@@ -37,9 +49,14 @@ class WebServer:
         logger.debug('create instance')
 
         # store params
-        self.rpc_server = xmlrpclib.ServerProxy('http://{}:{}'.format(*rpc_server_addr))
+        self.rpc_server_addr = rpc_server_addr
         self.bottle_srv = bottle_srv
 
+        # local variables
+        self.rpc_local = threading.local()
+        self.streams_lock = threading.Lock()
+        self.streams = {}
+
         self._define_routes()
 
         # To find page templates
@@ -49,6 +66,13 @@ class WebServer:
 
     # ======================== public ==========================================
 
+    @property
+    def rpc_server(self):
+        """ RPC proxy of the calling thread, the requests are served by several threads. """
+        if not hasattr(self.rpc_local, 'proxy'):
+            self.rpc_local.proxy = xmlrpclib.ServerProxy('http://{}:{}'.format(*self.rpc_server_addr), allow_none=True)
+        return self.rpc_local.proxy
+
     # ======================== private =========================================
 
     def _define_routes(self):
@@ -60,6 +84,7 @@ class WebServer:
         self.bottle_srv.route(path='/moteview', callback=self._show_moteview)
         self.bottle_srv.route(path='/moteview/:moteid', callback=self._show_moteview)
         self.bottle_srv.route(path='/motedata/:moteid', callback=self._get_mote_data)
+        self.bottle_srv.route(path='/motestream/:moteid', callback=self._stream_mote_data)
         self.bottle_srv.route(path='/toggleDAGroot/:moteid', callback=self._toggle_dagroot)
         self.bottle_srv.route(path='/eventBus', callback=self._show_event_bus)
         self.bottle_srv.route(path='/routing', callback=self._show_routing)
@@ -67,6 +92,7 @@ class WebServer:
         self.bottle_srv.route(path='/connectivity', callback=self._show_connectivity)
         self.bottle_srv.route(path='/connectivity/motes', callback=self._show_motes_connectivity)
         self.bottle_srv.route(path='/eventdata', callback=self._get_event_data)
+        self.bottle_srv.route(path='/eventstream', callback=self._stream_event_data)
         self.bottle_srv.route(path='/wiresharkDebug/:enabled', callback=self._set_wireshark_debug)
         self.bottle_srv.route(path='/gologicDebug/:enabled', callback=WebServer._set_gologic_debug)
         self.bottle_srv.route(path='/topology', callback=self._topology_page)
@@ -158,6 +184,60 @@ class WebServer:
             logger.debug('Found mote {0} in mote_states'.format(moteid))
         return states
 
+    def _stream_mote_data(self, moteid):
+        """
+        Server-sent events carrying the state elements of the provided mote: all of them, then the updated ones.
+        :param moteid: 16-bit ID of mote
+        """
+        return self._stream(moteid, lambda: MoteStateStream(self.rpc_server_addr, moteid))
+
+    def _stream_event_data(self):
+        """ Server-sent events carrying the event bus statistics, when they change. """
+        return self._stream(None, lambda: EventBusStream(self.rpc_server_addr))
+
+    def _stream(self, key, create_stream):
+        """
+        Subscribes the request to the stream identified by key, created if needed, and returns the generator of the
+        server-sent events. All the clients of a stream share its connection to the OpenVisualizer server.
+        """
+        last_event_id = bottle.request.get_header('Last-Event-ID')
+
+        bottle.response.content_type = 'text/event-stream'
+        bottle.response.set_header('Cache-Control', 'no-cache')
+
+        def events():
+            stream = self._subscribe(key, create_stream)
+            try:
+                version = stream.parse_event_id(last_event_id)
+                while stream.go_on:
+                    (new_version, changes) = stream.wait(version, self.KEEPALIVE_INTERVAL)
+                    if changes:
+                        version = new_version
+                        yield stream.format_event(version, changes)
+                    else:
+                        yield ': keepalive\n\n'
+            finally:
+                self._unsubscribe(key, stream)
+
+        return events()
+
+    def _subscribe(self, key, create_stream):
+        with self.streams_lock:
+            stream = self.streams.get(key)
+            if stream is None:
+                stream = create_stream()
+                stream.start()
+                self.streams[key] = stream
+            stream.subscribers += 1
+        return stream
+
+    def _unsubscribe(self, key, stream):
+        with self.streams_lock:
+            stream.subscribers -= 1
+            if stream.subscribers == 0:
+                stream.close()
+                del self.streams[key]
+
     def _set_wireshark_debug(self, enabled):
         """
         Selects whether eventBus must export debug packets.
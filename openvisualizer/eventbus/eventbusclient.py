@@ -7,7 +7,7 @@
 import logging
 import threading
 
-from pydispatch import dispatcher
+from openvisualizer.eventbus.eventbusrouter import EventBusRouter
 
 log = logging.getLogger('EventBusClient')
 log.setLevel(logging.ERROR)
@@ -38,7 +38,7 @@ class EventBusClient(object):
 
         # store params
         self.data_lock = threading.RLock()
-        self.registrations = []
+        self._router = EventBusRouter()
 
         # give this thread a name
         self.name = name
@@ -46,67 +46,36 @@ class EventBusClient(object):
         # local variables
         self.go_on = True
 
+        # attach to the router, this fixes the order in which clients are notified
+        self._router.attach(self)
+
         # register registrations
         for r in registrations:
             self.register(sender=r['sender'], signal=r['signal'], callback=r['callback'])
 
-        # connect to dispatcher
-        dispatcher.connect(receiver=self._event_bus_notification)
-
     # ======================== public ==========================================
 
     def dispatch(self, signal, data):
-        return dispatcher.send(sender=self.name, signal=signal, data=data)
+        return self._router.send(sender=self.name, signal=signal, data=data)
 
-    def register(self, sender, signal, callback):
+    @property
+    def registrations(self):
+        return self._router.get_registrations(self)
 
-        # detect duplicate registrations
-        with self.data_lock:
-            for reg in self.registrations:
-                if reg['sender'] == sender and reg['signal'] == signal and reg['callback'] == callback:
-                    raise SystemError(
-                        "Duplicate registration of sender={0} signal={1} callback={2}".format(
-                            sender,
-                            signal,
-                            callback,
-                        ),
-                    )
-
-        # register
-        new_registration = {
-            'sender': sender,
-            'signal': signal,
-            'callback': callback,
-            'numRx': 0,
-        }
-
-        with self.data_lock:
-            self.registrations += [new_registration]
+    def register(self, sender, signal, callback):
+        self._router.register(self, sender=sender, signal=signal, callback=callback)
 
     def unregister(self, sender, signal, callback):
+        self._router.unregister(self, sender=sender, signal=signal, callback=callback)
 
-        with self.data_lock:
-            for reg in self.registrations:
-                if reg['sender'] == sender and self._signals_equivalent(reg['signal'], signal) and \
-                        reg['callback'] == callback:
-                    self.registrations.remove(reg)
+    def detach(self):
+        """ Removes all the registrations of this client, the event bus no longer references it. """
+        self._router.detach(self)
 
     # ======================== private =========================================
 
-    def _event_bus_notification(self, signal, sender, data):
-
-        callback = None
-
-        # find the callback
-        with self.data_lock:
-            for r in self.registrations:
-                if self._signals_equivalent(r['signal'], signal) and (
-                        r['sender'] == sender or r['sender'] == self.WILDCARD):
-                    callback = r['callback']
-                    break
-
-        if not callback:
-            return None
+    def _notify(self, callback, sender, signal, data):
+        """ Called by the router for the first registration of this client which matches the signal. """
 
         # call the callback
         try:
@@ -117,21 +86,7 @@ class EventBusClient(object):
             print output
 
     def _signals_equivalent(self, s1, s2):
-        return_val = True
-        if type(s1) == type(s2) == str:
-            if (s1 != s2) and (s1 != self.WILDCARD) and (s2 != self.WILDCARD):
-                return_val = False
-        elif type(s1) == type(s2) == tuple:
-            if len(s1) == len(s2) == 3:
-                for i in range(3):
-                    if (s1[i] != s2[i]) and (s1[i] != self.WILDCARD) and (s2[i] != self.WILDCARD):
-                        return_val = False
-            else:
-                return_val = False
-        else:
-            return_val = False
-
-        return return_val
+        return self._router.signals_equivalent(s1, s2)
 
     def _dispatch_protocol(self, signal, data):
         """ used to sent to the eventbus a signal and look whether someone responds or not"""
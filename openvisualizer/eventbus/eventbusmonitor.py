@@ -4,18 +4,19 @@
 # Released under the BSD 3-Clause license as published at the link below.
 # https://openwsn.atlassian.net/wiki/display/OW/License
 
-import copy
 import json
 import logging
 import threading
+import time
 
 from pydispatch import dispatcher
-from scapy.compat import raw
-from scapy.layers.inet import UDP
-from scapy.layers.inet6 import IPv6
 
+from openvisualizer.eventbus.eventbusrouter import EventBusRouter
+from openvisualizer.eventbus.pcapngwriter import PcapngWriter
+from openvisualizer.eventbus.signalstats import LatencyHistograms, ShardedCounters
+from openvisualizer.eventbus.zepencoder import ZepEncoder
 from openvisualizer.opentun.opentun import OpenTun
-from openvisualizer.utils import format_buf, calculate_fcs, format_ipv6_addr
+from openvisualizer.utils import format_buf, calculate_fcs
 
 log = logging.getLogger('EventBusMonitor')
 log.setLevel(logging.ERROR)
@@ -23,43 +24,70 @@ log.addHandler(logging.NullHandler())
 
 
 class EventBusMonitor(object):
+    # dummy IEEE802.15.4 data frame header: frame control, sequence number, destination PAN ID
+    MAC_HEADER = bytearray([0x41, 0xcc, 0x66, 0xfe, 0xca])
 
-    def __init__(self):
+    def __init__(self, pcapng_file=None):
+        """
+        :param pcapng_file: name of a pcapng file to write the debug packets to, instead of sending them to the Internet
+            interface
+        """
 
         # log
         log.debug("create instance")
 
         # store params
+        self.pcapng_file = pcapng_file
 
         # local variables
         self.data_lock = threading.Lock()
-        self.stats = {}
+        self.stats = ShardedCounters()  # (sender, signal) -> number of dispatches
+        self.latencies = LatencyHistograms()  # (sender, signal, receiver) -> duration of the callbacks
         self.wireshark_debug_enabled = True
         self.dagoot_eui64 = [0x00] * 8
         self.sim_mode = False
 
+        # the debug packets are sent to the host itself, from and to the address of the Internet interface
+        self.zep_encoder = ZepEncoder(OpenTun.IPV6PREFIX + OpenTun.IPV6HOST, OpenTun.IPV6PREFIX + OpenTun.IPV6HOST)
+        self.pcapng_writer = PcapngWriter(pcapng_file) if pcapng_file else None
+
         # give this instance a name
         self.name = 'EventBusMonitor'
 
         # connect to dispatcher
         dispatcher.connect(self._eventbus_notification)
 
+        # time the callbacks of the EventBus clients
+        EventBusRouter().set_latency_histograms(self.latencies)
+
     # ======================== public ==========================================
 
     def get_stats(self):
+        """
+        Returns the number of dispatches of every signal, by sender, and how long the callbacks of the receivers took,
+        the receivers taking the longest in total first.
 
-        # get a copy of stats
-        with self.data_lock:
-            temp_stats = copy.deepcopy(self.stats)
+        :returns: JSON string of a list of dictionaries with the 'sender', the 'signal', the number of dispatches
+            ('num') and the 'receivers', a list of dictionaries with the name of the 'receiver' and the summary of its
+            latency histogram, see LatencyHistograms.get_histograms()
+        """
+
+        receivers = {}
+        for ((sender, signal, receiver), histogram) in self.latencies.get_histograms().items():
+            histogram['receiver'] = receiver
+            receivers.setdefault((sender, signal), []).append(histogram)
 
         # format as a dictionnary
-        return_val = [
-            {
+        return_val = []
+        for (k, v) in self.stats.get_counts().items():
+            latencies = receivers.get(k, [])
+            latencies.sort(key=lambda h: h['mean_us'] * h['num'], reverse=True)
+            return_val.append({
                 'sender': k[0],
                 'signal': k[1],
                 'num': v,
-            } for (k, v) in temp_stats.items()
-        ]
+                'receivers': latencies,
+            })
 
         # send back JSON string
         return json.dumps(return_val)
@@ -71,19 +99,19 @@ class EventBusMonitor(object):
         """
         with self.data_lock:
             self.wireshark_debug_enabled = (True and is_enabled)
-        log.info('%s export of ZEP mesh debug packets to Internet',
-                 'Enabled' if self.wireshark_debug_enabled else 'Disabled')
+        log.info('%s export of ZEP mesh debug packets to %s', 'Enabled' if self.wireshark_debug_enabled else 'Disabled',
+                 self.pcapng_file or 'Internet')
+
+    def close(self):
+        if self.pcapng_writer:
+            self.pcapng_writer.close()
 
     # ======================== private =========================================
 
     def _eventbus_notification(self, signal, sender, data):
         """ Adds the signal to stats log and performs signal-specific handling """
 
-        with self.data_lock:
-            key = (sender, signal)
-            if key not in self.stats:
-                self.stats[key] = 0
-            self.stats[key] += 1
+        self.stats.increment((sender, signal))
 
         if signal == 'infoDagRoot' and data['isDAGroot'] == 1:
             self.dagoot_eui64 = data['eui64'][:]
@@ -119,9 +147,7 @@ class EventBusMonitor(object):
                     body = frame[1:-2]
                     _ = frame[-2:]  # crc
 
-                    # wrap with zep header
-                    zep = self._wrap_zep_crc(body, frequency)
-                    self._dispatch_mesh_debug_packet(zep)
+                    self._dispatch_mesh_debug_packet(self._wrap_crc(body), frequency)
 
             else:
                 # non-simulation mode
@@ -130,101 +156,49 @@ class EventBusMonitor(object):
                     # Forwards a copy of the data received from a mode to the Internet interface for debugging.
                     (previous_hop, lowpan) = data
 
-                    zep = self._wrap_mac_and_zep(previous_hop=previous_hop, next_hop=self.dagoot_eui64, lowpan=lowpan)
-                    self._dispatch_mesh_debug_packet(zep)
+                    mac = self._wrap_mac(previous_hop=previous_hop, next_hop=self.dagoot_eui64, lowpan=lowpan)
+                    self._dispatch_mesh_debug_packet(mac, 0)
 
                 if signal == 'fromMote.sniffedPacket':
                     body = data[0:-3]
                     _ = data[-3:-1]  # crc
                     frequency = data[-1]
 
-                    # wrap with zep header
-                    zep = self._wrap_zep_crc(body, frequency)
-                    self._dispatch_mesh_debug_packet(zep)
+                    self._dispatch_mesh_debug_packet(self._wrap_crc(body), frequency)
 
                 if signal == 'bytesToMesh':
                     # Forwards a copy of the 6LoWPAN packet destined for the mesh to the tun interface for debugging.
                     (next_hop, lowpan) = data
 
-                    zep = self._wrap_mac_and_zep(previous_hop=self.dagoot_eui64, next_hop=next_hop, lowpan=lowpan)
-                    self._dispatch_mesh_debug_packet(zep)
+                    mac = self._wrap_mac(previous_hop=self.dagoot_eui64, next_hop=next_hop, lowpan=lowpan)
+                    self._dispatch_mesh_debug_packet(mac, 0)
 
-    def _wrap_mac_and_zep(self, previous_hop, next_hop, lowpan):
-        """
-        Returns Exegin ZEP protocol header and dummy 802.15.4 header wrapped around outgoing 6LoWPAN layer packet.
-        """
+    def _wrap_mac(self, previous_hop, next_hop, lowpan):
+        """ Returns dummy 802.15.4 header and CRC wrapped around outgoing 6LoWPAN layer packet. """
 
-        phop = previous_hop[:]
-        phop.reverse()
-        nhop = next_hop[:]
-        nhop.reverse()
-
-        # ZEP
-        zep = [ord('E'), ord('X')]  # Protocol ID String
-        zep += [0x02]  # Protocol Version
-        zep += [0x01]  # Type
-        zep += [0x00]  # Channel ID
-        zep += [0x00, 0x01]  # Device ID
-        zep += [0x01]  # LQI/CRC mode
-        zep += [0xff]
-        zep += [0x01] * 8  # timestamp
-        zep += [0x02] * 4  # sequence number
-        zep += [0x00] * 10  # reserved
-        zep += [21 + len(lowpan) + 2]  # length
-
-        # IEEE802.15.4                 (data frame with dummy values)
-        mac = [0x41, 0xcc]  # frame control
-        mac += [0x66]  # sequence number
-        mac += [0xfe, 0xca]  # destination PAN ID
-        mac += nhop  # destination address
-        mac += phop  # source address
-        mac += lowpan
-        # CRC
-        mac += calculate_fcs(mac)
-
-        return zep + mac
-
-    def _wrap_zep_crc(self, body, frequency):
-
-        # ZEP header
-        zep = [ord('E'), ord('X')]  # Protocol ID String
-        zep += [0x02]  # Protocol Version
-        zep += [0x01]  # Type
-        zep += [frequency]  # Channel ID
-        zep += [0x00, 0x01]  # Device ID
-        zep += [0x01]  # LQI/CRC mode
-        zep += [0xff]
-        zep += [0x01] * 8  # timestamp
-        zep += [0x02] * 4  # sequence number
-        zep += [0x00] * 10  # reserved
-        zep += [len(body) + 2]  # length
-
-        # mac frame
-        mac = body
-        mac += calculate_fcs(mac)
-
-        return zep + mac
-
-    def _dispatch_mesh_debug_packet(self, zep):
-        """
-        Wraps ZEP-based debug packet, for outgoing mesh 6LoWPAN message,  with UDP and IPv6 headers. Then forwards as
-        an event to the Internet interface.
-        """
+        mac = self.MAC_HEADER[:]
+        mac += bytearray(reversed(next_hop))  # destination address
+        mac += bytearray(reversed(previous_hop))  # source address
+        mac += bytearray(lowpan)
 
-        # UDP
-        udp = UDP(sport=0, dport=17754)
-        udp.add_payload("".join([chr(i) for i in zep]))
+        return self._wrap_crc(mac)
 
-        # Common address for source and destination
-        addr = []
-        addr += OpenTun.IPV6PREFIX
-        addr += OpenTun.IPV6HOST
-        addr = format_ipv6_addr(addr)
+    @staticmethod
+    def _wrap_crc(body):
+        mac = bytearray(body)
+        mac += bytearray(calculate_fcs(mac))
+        return mac
 
-        # IP
-        ip = IPv6(version=6, tc=0, src=addr, hlim=64, dst=addr)
-        ip = ip / udp
+    def _dispatch_mesh_debug_packet(self, mac, channel):
+        """
+        Wraps debug packet, for outgoing mesh 6LoWPAN message, with ZEP, UDP and IPv6 headers. Then writes it to the
+        pcapng file, if any, or forwards it as an event to the Internet interface.
+        """
 
-        data = [ord(b) for b in raw(ip)]
+        timestamp = time.time()
+        pkt = self.zep_encoder.encode(mac, channel, timestamp)
 
-        dispatcher.send(sender=self.name, signal='v6ToInternet', data=data)
+        if self.pcapng_writer:
+            self.pcapng_writer.write(pkt, timestamp)
+        else:
+            dispatcher.send(sender=self.name, signal='v6ToInternet', data=list(pkt))
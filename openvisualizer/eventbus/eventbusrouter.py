@@ -0,0 +1,312 @@
+# Copyright (c) 2010-2013, Regents of the University of California.
+# All rights reserved.
+#
+# Released under the BSD 3-Clause license as published at the link below.
+# https://openwsn.atlassian.net/wiki/display/OW/License
+
+"""
+Central signal router for the EventBus.
+
+Instead of connecting every :class:`EventBusClient` to PyDispatcher and letting each client scan its own registrations,
+all registrations are stored in a single router which indexes them by sender and signal. A dispatch only visits the
+registrations which can match the signal, so its cost scales with the number of subscribers, not the number of
+clients.
+"""
+
+import logging
+import threading
+import timeit
+
+from pydispatch import dispatcher
+
+log = logging.getLogger('EventBusRouter')
+log.setLevel(logging.ERROR)
+log.addHandler(logging.NullHandler())
+
+
+class EventBusRouter(object):
+    """
+    Indexes the registrations of all EventBusClients.
+
+    Registrations are stored in three indexes:
+
+    - exact signals (strings and tuples without wildcards), keyed by (sender, signal);
+    - the string wildcard, keyed by sender;
+    - tuple signals with wildcards, grouped by wildcard mask and keyed by (sender, non-wildcard elements).
+
+    Matching semantics are identical to the former per-client scan: a client only invokes the callback of its first
+    matching registration (in registration order), and clients are visited in the order they were attached.
+
+    The router references the clients through their registrations only: a client is forgotten when its last
+    registration is removed, or when it is detached, and attached again, last, when it registers again.
+    """
+
+    WILDCARD = '*'
+    TUPLE_LENGTH = 3
+
+    # ======================== singleton pattern ===============================
+
+    _instance = None
+    _init = False
+
+    def __new__(cls, *args, **kwargs):
+        if not cls._instance:
+            cls._instance = super(EventBusRouter, cls).__new__(cls, *args, **kwargs)
+        return cls._instance
+
+    # ======================== main ============================================
+
+    def __init__(self):
+
+        # don't re-initialize an instance (singleton pattern)
+        if self._init:
+            return
+        self._init = True
+
+        # log
+        log.debug("create instance")
+
+        # local variables
+        self.data_lock = threading.RLock()
+        self._clients = {}  # client -> attach order
+        self._client_regs = {}  # client -> list of registrations, in registration order
+        self._exact = {}  # (sender, signal) -> list of registrations
+        self._any_signal = {}  # sender -> list of registrations with signal WILDCARD
+        self._masked = {}  # wildcard mask -> {(sender, projected signal): list of registrations}
+        self._next_client = 0
+        self._next_reg = 0
+        self._latencies = None
+
+        # connect to dispatcher, this catches the signals sent directly through PyDispatcher
+        dispatcher.connect(receiver=self._dispatcher_notification)
+
+    # ======================== public ==========================================
+
+    def attach(self, client):
+        """ Add a client, the attach order defines the order in which clients are notified. """
+        with self.data_lock:
+            if client not in self._clients:
+                self._clients[client] = self._next_client
+                self._client_regs[client] = []
+                self._next_client += 1
+
+    def detach(self, client):
+        """ Removes all the registrations of a client and forgets it. """
+        with self.data_lock:
+            for reg in self._client_regs.pop(client, []):
+                self._remove_from_index(reg)
+            self._clients.pop(client, None)
+
+    def set_latency_histograms(self, latencies):
+        """
+        Times the callbacks of the clients, the durations are recorded in latencies, a LatencyHistograms, keyed by
+        (sender, signal, client name). None stops the timing.
+        """
+        self._latencies = latencies
+
+    def get_registrations(self, client):
+        with self.data_lock:
+            return list(self._client_regs.get(client, []))
+
+    def register(self, client, sender, signal, callback):
+
+        with self.data_lock:
+            self.attach(client)
+
+            # detect duplicate registrations
+            for reg in self._client_regs[client]:
+                if reg['sender'] == sender and reg['signal'] == signal and reg['callback'] == callback:
+                    raise SystemError(
+                        "Duplicate registration of sender={0} signal={1} callback={2}".format(
+                            sender,
+                            signal,
+                            callback,
+                        ),
+                    )
+
+            new_registration = {
+                'sender': sender,
+                'signal': signal,
+                'callback': callback,
+                'numRx': 0,
+                'client': client,
+                'order': self._next_reg,
+            }
+            self._next_reg += 1
+
+            self._client_regs[client].append(new_registration)
+            bucket = self._get_bucket(sender, signal, create=True)
+            if bucket is not None:
+                bucket.append(new_registration)
+
+    def unregister(self, client, sender, signal, callback):
+
+        with self.data_lock:
+            for reg in list(self._client_regs.get(client, [])):
+                if reg['sender'] == sender and self.signals_equivalent(reg['signal'], signal) and \
+                        reg['callback'] == callback:
+                    self._client_regs[client].remove(reg)
+                    self._remove_from_index(reg)
+
+            if client in self._client_regs and not self._client_regs[client]:
+                self.detach(client)
+
+    def lookup(self, sender, signal):
+        """ Returns the registrations to invoke for this sender and signal, at most one per client. """
+
+        with self.data_lock:
+            if self._has_wildcard(signal):
+                # wildcards in the dispatched signal match anything, this is rare, so just scan
+                candidates = [
+                    reg for regs in self._client_regs.values() for reg in regs
+                    if (reg['sender'] == sender or reg['sender'] == self.WILDCARD) and
+                    self.signals_equivalent(reg['signal'], signal)
+                ]
+            else:
+                candidates = []
+                senders = (sender,) if sender == self.WILDCARD else (sender, self.WILDCARD)
+                for s in senders:
+                    for bucket in self._candidate_buckets(s, signal):
+                        candidates.extend(bucket)
+
+            if not candidates:
+                return []
+
+            # first matching registration of every client
+            first = {}
+            for reg in candidates:
+                current = first.get(reg['client'])
+                if current is None or reg['order'] < current['order']:
+                    first[reg['client']] = reg
+
+            return sorted(first.values(), key=lambda r: self._clients[r['client']])
+
+    def deliver(self, sender, signal, data):
+        """ Calls the matching callbacks, returns a list of (callback, return value) tuples. """
+
+        return_val = []
+        latencies = self._latencies
+        for reg in self.lookup(sender, signal):
+            if latencies is None:
+                return_val.append((reg['callback'], reg['client']._notify(reg['callback'], sender, signal, data)))
+            else:
+                start = timeit.default_timer()
+                return_val.append((reg['callback'], reg['client']._notify(reg['callback'], sender, signal, data)))
+                latencies.record((sender, signal, reg['client'].name), timeit.default_timer() - start)
+        return return_val
+
+    def send(self, sender, signal, data):
+        """
+        Dispatch a signal to the registered clients and to the receivers connected directly to PyDispatcher.
+
+        Has the same return value as dispatcher.send().
+        """
+
+        return_val = self.deliver(sender, signal, data)
+        return_val += dispatcher.send(sender=sender, signal=signal, data=data, routed=True)
+        return return_val
+
+    @classmethod
+    def signals_equivalent(cls, s1, s2):
+        return_val = True
+        if type(s1) == type(s2) == str:
+            if (s1 != s2) and (s1 != cls.WILDCARD) and (s2 != cls.WILDCARD):
+                return_val = False
+        elif type(s1) == type(s2) == tuple:
+            if len(s1) == len(s2) == cls.TUPLE_LENGTH:
+                for i in range(cls.TUPLE_LENGTH):
+                    if (s1[i] != s2[i]) and (s1[i] != cls.WILDCARD) and (s2[i] != cls.WILDCARD):
+                        return_val = False
+            else:
+                return_val = False
+        else:
+            return_val = False
+
+        return return_val
+
+    # ======================== private =========================================
+
+    def _dispatcher_notification(self, signal, sender, data, routed=False):
+        # signals sent through send() have already been delivered
+        if routed:
+            return None
+
+        self.deliver(sender, signal, data)
+
+    def _has_wildcard(self, signal):
+        if type(signal) == str:
+            return signal == self.WILDCARD
+        elif type(signal) == tuple:
+            return self.WILDCARD in signal
+        return False
+
+    def _candidate_buckets(self, sender, signal):
+        if type(signal) == str:
+            bucket = self._exact.get((sender, signal))
+            if bucket:
+                yield bucket
+            bucket = self._any_signal.get(sender)
+            if bucket:
+                yield bucket
+        elif type(signal) == tuple and len(signal) == self.TUPLE_LENGTH:
+            bucket = self._exact.get((sender, signal))
+            if bucket:
+                yield bucket
+            for mask, index in self._masked.items():
+                bucket = index.get((sender, self._project(mask, signal)))
+                if bucket:
+                    yield bucket
+
+    def _get_bucket(self, sender, signal, create=False):
+        """ Returns the index list a registration belongs to, None if the signal can never match. """
+
+        if type(signal) == str:
+            if signal == self.WILDCARD:
+                index, key = self._any_signal, sender
+            else:
+                index, key = self._exact, (sender, signal)
+        elif type(signal) == tuple and len(signal) == self.TUPLE_LENGTH:
+            if self.WILDCARD not in signal:
+                index, key = self._exact, (sender, signal)
+            else:
+                mask = tuple(e == self.WILDCARD for e in signal)
+                if mask not in self._masked:
+                    if not create:
+                        return None
+                    self._masked[mask] = {}
+                index, key = self._masked[mask], (sender, self._project(mask, signal))
+        else:
+            return None
+
+        if key not in index:
+            if not create:
+                return None
+            index[key] = []
+        return index[key]
+
+    def _remove_from_index(self, reg):
+        bucket = self._get_bucket(reg['sender'], reg['signal'])
+        if bucket is None:
+            return
+        bucket.remove(reg)
+        if bucket:
+            return
+
+        # drop empty buckets, so stale wildcard masks do not cost a lookup
+        signal = reg['signal']
+        if type(signal) == str:
+            if signal == self.WILDCARD:
+                del self._any_signal[reg['sender']]
+            else:
+                del self._exact[(reg['sender'], signal)]
+        elif self.WILDCARD not in signal:
+            del self._exact[(reg['sender'], signal)]
+        else:
+            mask = tuple(e == self.WILDCARD for e in signal)
+            del self._masked[mask][(reg['sender'], self._project(mask, signal))]
+            if not self._masked[mask]:
+                del self._masked[mask]
+
+    @staticmethod
+    def _project(mask, signal):
+        return tuple(e for (is_wildcard, e) in zip(mask, signal) if not is_wildcard)
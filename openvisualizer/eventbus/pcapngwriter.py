@@ -0,0 +1,87 @@
+# Copyright (c) 2010-2013, Regents of the University of California.
+# All rights reserved.
+#
+# Released under the BSD 3-Clause license as published at the link below.
+# https://openwsn.atlassian.net/wiki/display/OW/License
+
+import logging
+import struct
+import threading
+import time
+
+log = logging.getLogger('PcapngWriter')
+log.setLevel(logging.ERROR)
+log.addHandler(logging.NullHandler())
+
+
+class PcapngWriter(object):
+    """
+    Writes packets to a pcapng file, with a single interface of the given link type and timestamps in microseconds.
+
+    The file is flushed after every packet, so that it can be followed while it is written, e.g. with
+    'tail -c +1 -f debug.pcapng | wireshark -k -i -'.
+    """
+
+    LINKTYPE_RAW = 101  # raw IPv4/IPv6 packets
+    LINKTYPE_IEEE802_15_4_WITHFCS = 195
+
+    SECTION_HEADER_BLOCK = 0x0a0d0d0a
+    INTERFACE_DESCRIPTION_BLOCK = 0x00000001
+    ENHANCED_PACKET_BLOCK = 0x00000006
+    BYTE_ORDER_MAGIC = 0x1a2b3c4d
+
+    SNAPLEN = 0xffff
+
+    def __init__(self, filename, linktype=LINKTYPE_RAW):
+
+        # store params
+        self.filename = filename
+        self.linktype = linktype
+
+        # local variables
+        self.data_lock = threading.Lock()
+        self.num_packets = 0
+        self.file = open(filename, 'wb')
+
+        # section header: version 1.0, section length unknown
+        self._write_block(self.SECTION_HEADER_BLOCK, struct.pack('<IHHq', self.BYTE_ORDER_MAGIC, 1, 0, -1))
+        # interface 0
+        self._write_block(self.INTERFACE_DESCRIPTION_BLOCK, struct.pack('<HHI', linktype, 0, self.SNAPLEN))
+        self.file.flush()
+
+        log.info('writing the packets of link type {0} to {1}'.format(linktype, filename))
+
+    # ======================== public ==========================================
+
+    def write(self, pkt, timestamp=None):
+        """
+        :param pkt: packet, as a bytearray, a string or a list of bytes
+        :param timestamp: time the packet was captured, now if None
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        microseconds = int(timestamp * 1000000)
+        pkt = bytearray(pkt)
+
+        body = struct.pack('<IIIII', 0, microseconds >> 32, microseconds & 0xffffffff, len(pkt), len(pkt))
+        body += pkt + bytearray(-len(pkt) % 4)
+
+        with self.data_lock:
+            if self.file is None:
+                return
+            self._write_block(self.ENHANCED_PACKET_BLOCK, body)
+            self.file.flush()
+            self.num_packets += 1
+
+    def close(self):
+        with self.data_lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+    # ======================== private =========================================
+
+    def _write_block(self, block_type, body):
+        # block type, total length, body, total length again
+        length = struct.pack('<I', len(body) + 12)
+        self.file.write(struct.pack('<I', block_type) + length + str(body) + length)
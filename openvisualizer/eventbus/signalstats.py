@@ -0,0 +1,180 @@
+# Copyright (c) 2010-2013, Regents of the University of California.
+# All rights reserved.
+#
+# Released under the BSD 3-Clause license as published at the link below.
+# https://openwsn.atlassian.net/wiki/display/OW/License
+
+"""
+Statistics of the EventBus signals, updated by all the threads which dispatch signals without sharing a lock.
+
+Every thread updates its own shard, a dictionary only this thread writes to. A lock is only taken the first time a
+thread updates the statistics, to register its shard. Reading the statistics merges copies of the shards, taken
+while holding the GIL: a reader may miss the update in progress in a thread, never corrupt it. The shards of the
+threads which exited are merged into a single retired shard, whenever a thread registers its shard or the statistics
+are read: the threads started per request do not pile up shards, their counts are kept.
+"""
+
+import threading
+
+
+class ThreadShards(object):
+    """ Base class of the sharded statistics, holds the shard of every running thread. """
+
+    def __init__(self):
+        self.shards_lock = threading.Lock()
+        self.shards = []  # (thread, shard)
+        self.retired = {}  # shards of the threads which exited, merged
+        self.local = threading.local()
+
+    # ======================== private =========================================
+
+    def _get_shard(self):
+        """ Returns the shard of the calling thread. """
+        try:
+            return self.local.shard
+        except AttributeError:
+            shard = {}
+            self.local.shard = shard
+            with self.shards_lock:
+                self._retire_shards()
+                self.shards.append((threading.current_thread(), shard))
+            return shard
+
+    def _get_shards(self):
+        """ Returns the shards of the running threads and a copy of the retired shard. """
+        with self.shards_lock:
+            self._retire_shards()
+            retired = {}
+            self._merge(retired, self.retired)
+            return [shard for (_, shard) in self.shards] + [retired]
+
+    def _retire_shards(self):
+        """ Merges the shards of the threads which exited into the retired shard, shards_lock must be held. """
+        running = []
+        for (thread, shard) in self.shards:
+            if thread.is_alive():
+                running.append((thread, shard))
+            else:
+                self._merge(self.retired, shard)
+        self.shards = running
+
+    def _merge(self, into, shard):
+        """ Adds the statistics of a shard to the ones of another. """
+        raise NotImplementedError("Should be implemented by child class")
+
+
+class ShardedCounters(ThreadShards):
+    """ Counters, keyed by any hashable. """
+
+    # ======================== public ==========================================
+
+    def increment(self, key):
+        shard = self._get_shard()
+        shard[key] = shard.get(key, 0) + 1
+
+    def get_counts(self):
+        """ Returns a dictionary of the counters, summed over the shards. """
+        counts = {}
+        for shard in self._get_shards():
+            self._merge(counts, shard)
+        return counts
+
+    # ======================== private =========================================
+
+    def _merge(self, into, shard):
+        for (key, num) in shard.items():
+            into[key] = into.get(key, 0) + num
+
+
+class LatencyHistograms(ThreadShards):
+    """
+    Histograms of durations, keyed by any hashable.
+
+    The buckets are powers of two of microseconds: bucket 0 counts the durations below 1 us, bucket i the durations
+    from 2^(i-1) us to 2^i us, the last bucket all the longer durations.
+    """
+
+    NUM_BUCKETS = 24  # up to about 8 seconds
+
+    # indexes in the histogram lists
+    NUM = 0
+    TOTAL = 1
+    MAX = 2
+    BUCKETS = 3
+
+    # ======================== public ==========================================
+
+    def record(self, key, duration):
+        """
+        :param duration: duration, in seconds
+        """
+        shard = self._get_shard()
+        histogram = shard.get(key)
+        if histogram is None:
+            histogram = [0, 0.0, 0.0] + [0] * self.NUM_BUCKETS
+            shard[key] = histogram
+
+        histogram[self.NUM] += 1
+        histogram[self.TOTAL] += duration
+        if duration > histogram[self.MAX]:
+            histogram[self.MAX] = duration
+        histogram[self.BUCKETS + min(int(duration * 1000000).bit_length(), self.NUM_BUCKETS - 1)] += 1
+
+    def get_histograms(self):
+        """
+        Returns a dictionary of the histograms, merged over the shards.
+
+        :returns: dictionary of dictionaries with the number of durations ('num'), their mean ('mean_us') and maximum
+            ('max_us'), estimates of their median ('p50_us') and 99th percentile ('p99_us'), in microseconds, and the
+            counts of the buckets ('histogram')
+        """
+        merged = {}
+        for shard in self._get_shards():
+            self._merge(merged, shard)
+
+        return dict((key, self._summarize(histogram)) for (key, histogram) in merged.items())
+
+    @classmethod
+    def bucket_upper_bound(cls, index):
+        """ Upper bound of a bucket, in microseconds, None for the last one. """
+        return 2 ** index if index < cls.NUM_BUCKETS - 1 else None
+
+    # ======================== private =========================================
+
+    def _merge(self, into, shard):
+        for (key, histogram) in shard.items():
+            histogram = list(histogram)
+            current = into.get(key)
+            if current is None:
+                into[key] = histogram
+            else:
+                current[self.NUM] += histogram[self.NUM]
+                current[self.TOTAL] += histogram[self.TOTAL]
+                current[self.MAX] = max(current[self.MAX], histogram[self.MAX])
+                for i in range(self.BUCKETS, len(current)):
+                    current[i] += histogram[i]
+
+    def _summarize(self, histogram):
+        num = histogram[self.NUM]
+        buckets = histogram[self.BUCKETS:]
+        return {
+            'num': num,
+            'mean_us': histogram[self.TOTAL] * 1000000 / num if num else 0.0,
+            'max_us': histogram[self.MAX] * 1000000,
+            'p50_us': self._percentile(buckets, num, 0.5, histogram[self.MAX]),
+            'p99_us': self._percentile(buckets, num, 0.99, histogram[self.MAX]),
+            'histogram': buckets,
+        }
+
+    def _percentile(self, buckets, num, fraction, maximum):
+        """ Upper bound of the bucket holding the percentile, at most the maximum. """
+        rank = fraction * num
+        cumulated = 0
+        for (i, count) in enumerate(buckets):
+            cumulated += count
+            if count and cumulated >= rank:
+                upper_bound = self.bucket_upper_bound(i)
+                if upper_bound is None:
+                    break
+                return min(float(upper_bound), maximum * 1000000)
+        return maximum * 1000000
@@ -0,0 +1,139 @@
+# Copyright (c) 2010-2013, Regents of the University of California.
+# All rights reserved.
+#
+# Released under the BSD 3-Clause license as published at the link below.
+# https://openwsn.atlassian.net/wiki/display/OW/License
+
+import array
+import itertools
+import logging
+import struct
+import sys
+import time
+
+log = logging.getLogger('ZepEncoder')
+log.setLevel(logging.ERROR)
+log.addHandler(logging.NullHandler())
+
+
+class ZepEncoder(object):
+    """
+    Wraps IEEE802.15.4 frames into IPv6/UDP/ZEP packets, for viewing them in Wireshark.
+
+    The headers are assembled once into a template. Encoding a frame copies the template, patches the lengths, the
+    channel, the timestamp and the sequence number in it and computes the UDP checksum, with the sum of the constant
+    part of the pseudo header precomputed. See http://wiki.wireshark.org/IEEE_802.15.4 for ZEP details.
+    """
+
+    ZEP_PORT = 17754
+    HOP_LIMIT = 64
+
+    IPV6_HEADER_LENGTH = 40
+    UDP_HEADER_LENGTH = 8
+    ZEP_HEADER_LENGTH = 32
+    HEADER_LENGTH = IPV6_HEADER_LENGTH + UDP_HEADER_LENGTH + ZEP_HEADER_LENGTH
+
+    # offsets of the patched fields
+    IPV6_PAYLOAD_LENGTH = 4
+    UDP_LENGTH = IPV6_HEADER_LENGTH + 4
+    UDP_CHECKSUM = IPV6_HEADER_LENGTH + 6
+    ZEP_CHANNEL = IPV6_HEADER_LENGTH + UDP_HEADER_LENGTH + 4
+    ZEP_TIMESTAMP = IPV6_HEADER_LENGTH + UDP_HEADER_LENGTH + 9
+    ZEP_LENGTH = IPV6_HEADER_LENGTH + UDP_HEADER_LENGTH + 31
+
+    NTP_EPOCH_OFFSET = 2208988800  # seconds from 1900 to 1970
+    NTP_TIMESTAMP_STRUCT = struct.Struct('>IIL')  # seconds, fraction, sequence number
+
+    NEXT_HEADER_UDP = 17
+
+    def __init__(self, src, dst):
+        """
+        :param src: source IPv6 address, list of 16 bytes
+        :param dst: destination IPv6 address, list of 16 bytes
+        """
+
+        # local variables
+        self.sequence_numbers = itertools.count(1)
+
+        # IPv6
+        template = bytearray([0x60, 0x00, 0x00, 0x00])  # version, traffic class, flow label
+        template += bytearray(2)  # payload length
+        template += bytearray([self.NEXT_HEADER_UDP, self.HOP_LIMIT])
+        template += bytearray(src)
+        template += bytearray(dst)
+
+        # UDP
+        template += struct.pack('>HH', 0, self.ZEP_PORT)  # source and destination ports
+        template += bytearray(4)  # length, checksum
+
+        # ZEP
+        template += 'EX'  # protocol ID string
+        template += bytearray([0x02])  # protocol version
+        template += bytearray([0x01])  # type
+        template += bytearray([0x00])  # channel ID
+        template += bytearray([0x00, 0x01])  # device ID
+        template += bytearray([0x01])  # LQI/CRC mode
+        template += bytearray([0xff])  # LQI
+        template += bytearray(8)  # timestamp
+        template += bytearray(4)  # sequence number
+        template += bytearray(10)  # reserved
+        template += bytearray(1)  # length
+
+        assert len(template) == self.HEADER_LENGTH
+        self.template = template
+
+        # the pseudo header, but for the length, and the UDP ports never change
+        self.constant_sum = self._sum(bytearray(src) + bytearray(dst)) + self.NEXT_HEADER_UDP + self.ZEP_PORT
+
+    # ======================== public ==========================================
+
+    def encode(self, frame, channel, timestamp=None):
+        """
+        Returns the IPv6 packet carrying frame in a ZEP packet.
+
+        :param frame: IEEE802.15.4 frame, FCS included
+        :param channel: channel the frame was sent on
+        :param timestamp: time the frame was sent, now if None
+        :returns: bytearray
+        """
+        if timestamp is None:
+            timestamp = time.time()
+
+        pkt = self.template + bytearray(frame)
+        udp_length = len(pkt) - self.IPV6_HEADER_LENGTH
+
+        struct.pack_into('>H', pkt, self.IPV6_PAYLOAD_LENGTH, udp_length)
+        struct.pack_into('>H', pkt, self.UDP_LENGTH, udp_length)
+        pkt[self.ZEP_CHANNEL] = channel
+
+        timestamp += self.NTP_EPOCH_OFFSET
+        seconds = int(timestamp)
+        self.NTP_TIMESTAMP_STRUCT.pack_into(pkt, self.ZEP_TIMESTAMP, seconds, int((timestamp - seconds) * 0x100000000),
+                                            next(self.sequence_numbers) & 0xffffffff)
+        pkt[self.ZEP_LENGTH] = len(frame)
+
+        # the length appears in the pseudo header and in the UDP header
+        checksum = self._fold(self.constant_sum + 2 * udp_length + self._sum(pkt, self.UDP_LENGTH + 4))
+        checksum = ~checksum & 0xffff
+        struct.pack_into('>H', pkt, self.UDP_CHECKSUM, checksum or 0xffff)
+
+        return pkt
+
+    # ======================== private =========================================
+
+    @staticmethod
+    def _sum(buf, start=0):
+        """ Sum of the 16-bit big-endian words of buf, from start, not folded. """
+        words = buf[start:]
+        if len(words) % 2:
+            words.append(0)
+        words = array.array('H', str(words))
+        if sys.byteorder == 'little':
+            words.byteswap()
+        return sum(words)
+
+    @staticmethod
+    def _fold(value):
+        while value >> 16:
+            value = (value & 0xffff) + (value >> 16)
+        return value
@@ -7,15 +7,20 @@
 """
 
 import binascii
+import collections
+import functools
+import hashlib
 import logging.handlers
 import os
 import threading
+import time
 
 import cbor
 import json
 import verboselogs
 from appdirs import user_data_dir
-from coap import coap, coapResource, coapDefines as Defs, coapUtils as Utils, coapObjectSecurity as Oscoap
+from coap import coap, coapException, coapResource, coapDefines as Defs, coapUtils as Utils, \
+    coapObjectSecurity as Oscoap
 
 from openvisualizer.eventbus.eventbusclient import EventBusClient
 from openvisualizer.jrc.cojp_defines import CoJPLabel
@@ -30,12 +35,24 @@ log.addHandler(logging.NullHandler())
 
 # ======================== Top Level jrc Class =============================
 class JRC(object):
-    def __init__(self):
+    # directory where the OSCORE contexts are persisted
+    CONTEXT_DIR = user_data_dir('openvisualizer')
+
+    def __init__(self, context_dir=CONTEXT_DIR):
+        """
+        :param context_dir: directory where the OSCORE contexts are written, in the background, or None to keep them in
+            memory only
+        """
         coap_resource = JoinResource()
-        self.coap_server = CoapServer(coap_resource, ContextHandler(coap_resource).security_context_lookup)
+        self.context_handler = ContextHandler(coap_resource, context_dir)
+        self.coap_server = CoapServer(coap_resource, self.context_handler.security_context_lookup)
+
+    def get_stats(self):
+        return self.coap_server.get_stats()
 
     def close(self):
         self.coap_server.close()
+        self.context_handler.close()
 
 
 # ======================== Security Context Handler =========================
@@ -44,8 +61,13 @@ class ContextHandler(object):
     master_secret = "DEADBEEFCAFEDEADBEEFCAFEDEADBEEF"
     master_salt = ""
 
-    def __init__(self, join_resource):
+    def __init__(self, join_resource, context_dir=None):
         self.join_resource = join_resource
+        self.persister = ContextPersister(context_dir) if context_dir else None
+
+    def close(self):
+        if self.persister:
+            self.persister.close()
 
     # ======================== Context Handler needs to be registered =============================
     def security_context_lookup(self, kid, kid_context):
@@ -54,45 +76,40 @@ class ContextHandler(object):
         sender_id = "JRC"
         recipient_id = ""
 
-        # if eui-64 is found in the list of joined nodes, return the appropriate context
+        # if eui-64 is found in the joined nodes, return the appropriate context
         # this is important for replay protection
-        for dictionary in self.join_resource.joinedNodes:
-            if dictionary['eui64'] == eui64:
-                try:
-                    log.verbose("Node {0} found in joinedNodes. Returning context {1}.".format(
-                        format_ipv6_addr(dictionary['eui64']), str(dictionary['context'])))
-                except TypeError:
-                    log.error("Type-error in conversion of {}".format(dictionary['eui64']))
-
-                return dictionary['context']
-
-        # if eui-64 is not found, create a new tentative context but only add it to the list of joined nodes in the GET
+        context = self.join_resource.joined_nodes.get(eui64)
+        if context is not None:
+            if log.isEnabledFor(logging.VERBOSE):
+                log.verbose("Node {0} found in joined nodes. Returning context {1}.".format(
+                    format_ipv6_addr(Utils.str2buf(eui64)), str(context)))
+            return context
+
+        # if eui-64 is not found, create a new tentative context but only add it to the joined nodes in the POST
         # handler of the join resource
-        file_path = os.path.abspath(os.path.join(user_data_dir('openvisualizer'), "oscore_context_{0}.json".
-                                                 format(binascii.hexlify(eui64))))
-        if not os.path.exists(os.path.dirname(file_path)):
-            os.makedirs(os.path.dirname(file_path))
-
-        log.verbose("New node: {0}. Creating new OSCORE context in {1}.".
-                    format(format_ipv6_addr(Utils.str2buf(eui64)), file_path))
+        if log.isEnabledFor(logging.VERBOSE):
+            log.verbose("New node: {0}. Creating new OSCORE context.".format(format_ipv6_addr(Utils.str2buf(eui64))))
 
         # FIXME: until persistency is implemented in firmware, we need to overwrite the security context for each run
         # FIXME: this is a security issue as AEAD nonces get reused and should not be used in a production environment
-        self.security_context_create_overwrite(file_path,
-                                               binascii.hexlify(eui64),
-                                               self.master_salt,
-                                               self.master_secret,
-                                               binascii.hexlify(sender_id),
-                                               binascii.hexlify(recipient_id))
+        context = OscoreContext(
+            self.security_context_dict(binascii.hexlify(eui64),
+                                       self.master_salt,
+                                       self.master_secret,
+                                       binascii.hexlify(sender_id),
+                                       binascii.hexlify(recipient_id)),
+            on_change=self.persister.schedule if self.persister else None,
+        )
 
-        context = Oscoap.SecurityContext(securityContextFilePath=file_path)
+        if self.persister:
+            self.persister.schedule(context)
 
         return context
 
-    # create and return a security context file
+    # create and return the parameters of a security context
     @staticmethod
-    def security_context_create_overwrite(file_path, id_context, master_salt, master_secret, sender_id, recipient_id):
-        ctx_dict = {
+    def security_context_dict(id_context, master_salt, master_secret, sender_id, recipient_id):
+        return {
             "aeadAlgorithm": "AES_CCM_16_64_128",
             "hashFunction": "sha256",
             "idContext": id_context,
@@ -104,8 +121,165 @@ class ContextHandler(object):
             "sequenceNumber": 0,
         }
 
-        with open(file_path, "w") as context_file:
-            json.dump(ctx_dict, context_file, indent=4, sort_keys=True)
+
+class OscoreContext(Oscoap.SecurityContext):
+    """
+    OSCORE security context held in memory.
+
+    Unlike coapObjectSecurity.SecurityContext, it is built from a dict rather than from a JSON file, and it does not
+    rewrite the file each time its sequence number or its replay window change: it calls on_change(context) instead.
+    """
+
+    def __init__(self, security_context, on_change=None):
+        # don't call the parent constructor, which loads the context from a file
+        self.securityContextFilePath = None
+        self.lock = threading.RLock()
+        self.securityContext = security_context
+        self.on_change = on_change
+
+        self.aeadAlgorithm = getattr(Oscoap, security_context['aeadAlgorithm'])()
+        self.hashFunction = getattr(hashlib, security_context['hashFunction'])
+
+        # mandatory parameters
+        self.masterSecret = binascii.unhexlify(security_context['masterSecret'])
+        self.senderID = binascii.unhexlify(security_context['senderID'])
+        self.recipientID = binascii.unhexlify(security_context['recipientID'])
+
+        # optional parameters
+        self.masterSalt = binascii.unhexlify(security_context.get('masterSalt', ''))
+        if 'idContext' in security_context:
+            self.idContext = binascii.unhexlify(security_context['idContext'])
+        else:
+            self.idContext = None
+
+        if len(self.senderID) > self.aeadAlgorithm.maxIdLen or len(self.recipientID) > self.aeadAlgorithm.maxIdLen:
+            raise coapException.oscoreError('Max ID length for AEAD algorithm {0} is {1}.'.format(
+                self.aeadAlgorithm.value, self.aeadAlgorithm.maxIdLen))
+
+        # derived parameters
+        self.commonIV = self._derive(self.hashFunction, '', 'IV', self.aeadAlgorithm.ivLength)
+        self.senderKey = self._derive(self.hashFunction, self.senderID, 'Key', self.aeadAlgorithm.keyLength)
+        self.recipientKey = self._derive(self.hashFunction, self.recipientID, 'Key', self.aeadAlgorithm.keyLength)
+
+    def replayWindowUpdate(self, sequenceNumber, reset=False):  # noqa: N802, N803
+        with self.lock:
+            replay_window = self.securityContext['replayWindow']
+            assert sequenceNumber > min(replay_window)
+            assert sequenceNumber not in replay_window
+
+            if len(replay_window) == self.REPLAY_WINDOW_SIZE:
+                replay_window.remove(min(replay_window))
+
+            if reset is False:
+                replay_window.append(sequenceNumber)
+            else:
+                self.securityContext['replayWindow'] = [sequenceNumber]
+
+        self._changed()
+
+    def getSequenceNumber(self):  # noqa: N802
+        with self.lock:
+            self.securityContext['sequenceNumber'] += 1
+            sequence_number = self.securityContext['sequenceNumber']
+
+            if sequence_number > self.aeadAlgorithm.maxSequenceNumber:
+                raise coapException.oscoreError('Reached maximum sequence number.')
+
+        self._changed()
+        return sequence_number
+
+    def to_json(self):
+        with self.lock:
+            return json.dumps(self.securityContext, indent=4, sort_keys=True)
+
+    def _derive(self, hash_function, id, type, length):
+        return self._hkdfDeriveParameter(hash_function, self.masterSecret, self.masterSalt, id, self.idContext,
+                                         self.aeadAlgorithm.value, type, length)
+
+    def _changed(self):
+        if self.on_change:
+            self.on_change(self)
+
+
+class ContextPersister(threading.Thread):
+    """
+    Writes the OSCORE contexts to their JSON file, in the background.
+
+    The writes of a context are coalesced: a context which changes several times before the thread gets to it is
+    written once, in its latest state.
+    """
+
+    def __init__(self, context_dir):
+        # store params
+        self.context_dir = context_dir
+
+        # local variables
+        self.pending = collections.OrderedDict()  # id context -> context
+        self.cond = threading.Condition()
+        self.writing = False
+        self.goOn = True
+
+        if not os.path.exists(context_dir):
+            os.makedirs(context_dir)
+
+        # initialize the parent class
+        super(ContextPersister, self).__init__()
+        self.name = 'ContextPersister'
+        self.daemon = True
+
+        self.start()
+
+    def run(self):
+        while True:
+            with self.cond:
+                while self.goOn and not self.pending:
+                    self.cond.wait()
+                if not self.pending:
+                    break
+                (pending, self.pending) = (self.pending, collections.OrderedDict())
+                self.writing = True
+
+            for context in pending.values():
+                self._write(context)
+
+            with self.cond:
+                self.writing = False
+                self.cond.notify_all()
+
+    # ======================== public ==========================================
+
+    def get_file_path(self, id_context):
+        return os.path.abspath(os.path.join(self.context_dir,
+                                            "oscore_context_{0}.json".format(binascii.hexlify(id_context))))
+
+    def schedule(self, context):
+        """ Queues context to be written. """
+        with self.cond:
+            self.pending[context.idContext] = context
+            self.cond.notify_all()
+
+    def flush(self):
+        """ Waits until the queued contexts are written. """
+        with self.cond:
+            while self.pending or self.writing:
+                self.cond.wait()
+
+    def close(self):
+        """ Writes the queued contexts and stops the thread. """
+        with self.cond:
+            self.goOn = False
+            self.cond.notify_all()
+        self.join()
+
+    # ======================== private =========================================
+
+    def _write(self, context):
+        file_path = self.get_file_path(context.idContext)
+        try:
+            with open(file_path, "w") as context_file:
+                context_file.write(context.to_json())
+        except (IOError, OSError) as err:
+            log.error("could not write OSCORE context to {0}: {1}".format(file_path, err))
 
 
 # ======================== Interface with OpenVisualizer ======================================
@@ -113,10 +287,20 @@ class CoapServer(EventBusClient):
     # link-local prefix
     LINK_LOCAL_PREFIX = [0xfe, 0x80, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00]
 
+    # maximum number of CoAP endpoints kept open for the requesters, the least recently used one is closed first
+    MAX_ENDPOINTS = 256
+
+    # window over which the joins per second are counted, in seconds
+    RATE_WINDOW = 1.0
+
+    # maximum number of requests waiting for their response, the oldest one is forgotten first
+    MAX_PENDING_REQUESTS = 1024
+
     def __init__(self, coap_resource, context_handler=None):
         # log
         log.debug("create instance")
         self.coap_resource = coap_resource
+        self.coap_resource.on_join = self._join_notif
 
         # run CoAP server in testing mode
         # this mode does not open a real socket, rather uses PyDispatcher for sending/receiving messages
@@ -126,11 +310,22 @@ class CoapServer(EventBusClient):
         self.coap_server.addSecurityContextHandler(context_handler)
         self.coap_server.maxRetransmit = 1
 
-        self.coap_client = None
-
         self.dagroot_eui64 = None
 
-        # store params
+        # local variables
+        self.stateLock = threading.Lock()
+        # IPv6 address of the requester -> CoAP endpoint forwarding its requests, in least recently used order
+        self.coap_clients = collections.OrderedDict()
+        # (IPv6 address of the requester, CoAP token) -> time the request was first received, in arrival order
+        self.request_times = collections.OrderedDict()
+        self.join_times = collections.deque()
+        self.stats = {
+            'numRequests': 0,
+            'numResponses': 0,
+            'numJoins': 0,
+            'latencySum': 0.0,
+            'latencyMax': 0.0,
+        }
 
         # initialize parent class
         super(CoapServer, self).__init__(
@@ -154,14 +349,38 @@ class CoapServer(EventBusClient):
             ],
         )
 
-        # local variables
-        self.stateLock = threading.Lock()
-
     # ======================== public ==========================================
 
     def close(self):
-        # nothing to do
-        pass
+        self.detach()
+
+        with self.stateLock:
+            for coap_client in self.coap_clients.values():
+                coap_client.close()
+            self.coap_clients.clear()
+        self.coap_server.close()
+
+    def get_stats(self):
+        """
+        Returns the number of requests received from the mesh and of responses sent back, the number of successful
+        joins, of nodes that joined, the joins per second over the last RATE_WINDOW, and the mean and maximum latencies
+        between a request and its response, in seconds.
+        """
+
+        with self.stateLock:
+            self._expire_join_times(time.time())
+            stats = {
+                'numRequests': self.stats['numRequests'],
+                'numResponses': self.stats['numResponses'],
+                'numJoins': self.stats['numJoins'],
+                'numJoinedNodes': len(self.coap_resource.joined_nodes),
+                'numEndpoints': len(self.coap_clients),
+                'joinsPerSecond': len(self.join_times) / self.RATE_WINDOW,
+                'latencyMean': self.stats['latencySum'] / self.stats['numResponses'] if self.stats['numResponses']
+                else 0.0,
+                'latencyMax': self.stats['latencyMax'],
+            }
+        return stats
 
     # ======================== private =========================================
 
@@ -228,32 +447,62 @@ class CoapServer(EventBusClient):
         """
 
         sender = format_ipv6_addr(data[0])
+        coap_client = self._get_coap_client(sender)
+
+        key = self._request_key(sender, data[1])
+        with self.stateLock:
+            self.stats['numRequests'] += 1
+            # a retransmitted request keeps the time of the first transmission
+            if key not in self.request_times:
+                if len(self.request_times) >= self.MAX_PENDING_REQUESTS:
+                    self.request_times.popitem(last=False)
+                self.request_times[key] = time.time()
+
         # FIXME pass source port within the signal and open coap client at this port
-        self.coap_client = \
-            coap.coap(ipAddress=sender, udpPort=Defs.DEFAULT_UDP_PORT, testing=True,
-                      receiveCallback=self._receive_from_coap)
         # low level forward of the CoAP message
-        self.coap_client.socketUdp.sendUdp(destIp='', destPort=Defs.DEFAULT_UDP_PORT, msg=data[1])
+        coap_client.socketUdp.sendUdp(destIp='', destPort=Defs.DEFAULT_UDP_PORT, msg=data[1])
         return True
 
-    def _receive_from_coap(self, timestamp, sender, data):
+    def _get_coap_client(self, address):
+        """ Returns the CoAP endpoint of the requester, which is created on its first request and then reused. """
+
+        with self.stateLock:
+            coap_client = self.coap_clients.pop(address, None)
+            if coap_client is None:
+                if len(self.coap_clients) >= self.MAX_ENDPOINTS:
+                    self.coap_clients.popitem(last=False)[1].close()
+                # the responses are forwarded to the requester whose endpoint received them
+                coap_client = coap.coap(ipAddress=address, udpPort=Defs.DEFAULT_UDP_PORT, testing=True,
+                                        receiveCallback=functools.partial(self._receive_from_coap, address))
+            self.coap_clients[address] = coap_client
+
+        return coap_client
+
+    def _receive_from_coap(self, address, timestamp, sender, data):
         """
         Receive CoAP response and forward it to the mesh network.
         Appends UDP and IPv6 headers to the CoAP message and forwards it on the Eventbus towards the mesh.
         """
-        self.coap_client.close()
+
+        now = time.time()
+        with self.stateLock:
+            self.stats['numResponses'] += 1
+            request_time = self.request_times.pop(self._request_key(address, data), None)
+            if request_time is not None:
+                self.stats['latencySum'] += now - request_time
+                self.stats['latencyMax'] = max(self.stats['latencyMax'], now - request_time)
 
         # UDP
         udp_len = len(data) + 8
 
         udp = Utils.int2buf(sender[1], 2)  # src port
-        udp += Utils.int2buf(self.coap_client.udpPort, 2)  # dest port
+        udp += Utils.int2buf(Defs.DEFAULT_UDP_PORT, 2)  # dest port
         udp += [udp_len >> 8, udp_len & 0xff]  # length
         udp += [0x00, 0x00]  # checksum
         udp += data
 
         # destination address of the packet is CoAP client's IPv6 address (address of the mote)
-        dst_ipv6_address = Utils.ipv6AddrString2Bytes(self.coap_client.ipAddress)
+        dst_ipv6_address = Utils.ipv6AddrString2Bytes(address)
         assert len(dst_ipv6_address) == 16
         # source address of the packet is DAG root's IPV6 address
         # use the same prefix (link-local or global) as in the destination address
@@ -284,11 +533,31 @@ class CoapServer(EventBusClient):
         # announce network prefix
         self.dispatch(signal='v6ToMesh', data=ip)
 
+    def _join_notif(self, eui64):
+        """ Called by the join resource for every join response it returns. """
+
+        now = time.time()
+        with self.stateLock:
+            self.stats['numJoins'] += 1
+            self.join_times.append(now)
+            self._expire_join_times(now)
+
+    @staticmethod
+    def _request_key(address, message):
+        """ Matches a request with its response, by requester and CoAP token. """
+        header = bytearray(message[:12])
+        return address, bytes(header[4:4 + (header[0] & 0x0f)])
+
+    def _expire_join_times(self, now):
+        while self.join_times and self.join_times[0] <= now - self.RATE_WINDOW:
+            self.join_times.popleft()
+
 
 # ==================== Implementation of CoAP join resource =====================
 class JoinResource(coapResource.coapResource):
     def __init__(self):
-        self.joinedNodes = []
+        self.joined_nodes = {}  # eui64 -> OSCORE context
+        self.on_join = None  # to be assigned, called with the EUI-64 of the node for every join response
 
         self.networkKey = Utils.str2buf(os.urandom(16))  # random key every time OpenVisualizer is initialized
         self.networkKeyIndex = 0x01  # L2 key index
@@ -315,19 +584,11 @@ class JoinResource(coapResource.coapResource):
         if object_security:
             # we need to add the pledge to a list of joined nodes, if not present already
             eui64 = Utils.buf2str(object_security.kidContext)
-            found = False
-            for node in self.joinedNodes:
-                if node['eui64'] == eui64:
-                    found = True
-                    break
+            if eui64 not in self.joined_nodes:
+                self.joined_nodes[eui64] = object_security.context
 
-            if not found:
-                self.joinedNodes += [
-                    {
-                        'eui64': eui64,  # remove last prepended byte
-                        'context': object_security.context,
-                    },
-                ]
+            if self.on_join:
+                self.on_join(eui64)
 
             # return the Join Response regardless of whether it is a first or Nth join attempt
             return Defs.COAP_RC_2_04_CHANGED, [], resp_payload
@@ -10,14 +10,13 @@ Contains application model for OpenVisualizer. Expects to be called by top-level
 import json
 import logging.config
 import os
-import platform
 import shutil
 import signal
 import sys
-import tempfile
 import time
 from ConfigParser import SafeConfigParser
 from SimpleXMLRPCServer import SimpleXMLRPCServer
+from SocketServer import ThreadingMixIn
 from argparse import ArgumentParser
 from xmlrpclib import Fault
 
@@ -32,6 +31,8 @@ from openvisualizer.eventbus import eventbusmonitor
 from openvisualizer.eventbus.eventbusclient import EventBusClient
 from openvisualizer.jrc import jrc
 from openvisualizer.motehandler.moteconnector import moteconnector
+from openvisualizer.motehandler.moteconnector.openparser.eventstore import EventStore
+from openvisualizer.motehandler.moteconnector.openparser.parserdata import ParserData
 from openvisualizer.motehandler.moteprobe import emulatedmoteprobe
 from openvisualizer.motehandler.moteprobe import testbedmoteprobe
 from openvisualizer.motehandler.moteprobe.iotlabmoteprobe import IotlabMoteProbe
@@ -39,10 +40,11 @@ from openvisualizer.motehandler.moteprobe.serialmoteprobe import SerialMoteProbe
 from openvisualizer.motehandler.motestate import motestate
 from openvisualizer.motehandler.motestate.motestate import MoteState
 from openvisualizer.openlbr import openlbr
+from openvisualizer.openlbr.txscheduler import TxScheduler
 from openvisualizer.opentun.opentun import OpenTun
 from openvisualizer.opentun.opentunnull import OpenTunNull
 from openvisualizer.rpl import topology, rpl
-from openvisualizer.simengine import simengine, motehandler
+from openvisualizer.simengine import simengine, motehandler, firmware
 from openvisualizer.utils import extract_component_codes, extract_log_descriptions, extract_6top_rcs, \
     extract_6top_states
 
@@ -113,15 +115,26 @@ class ColoredFormatter(coloredlogs.ColoredFormatter):
         return res
 
 
-class OpenVisualizerServer(SimpleXMLRPCServer, EventBusClient):
+class OpenVisualizerServer(ThreadingMixIn, SimpleXMLRPCServer, EventBusClient):
     """
     Class implements and RPC server that allows monitoring and (remote) management of a mesh network.
+
+    Requests are served in their own thread, so that clients blocked in wait_mote_state() do not hold the others.
     """
 
+    daemon_threads = True
+
+    # maximum time a wait_mote_state() call blocks, in seconds
+    STREAM_TIMEOUT = 10
+
     def __init__(self, host, port, simulator_mode, debug, vcdlog,
                  use_page_zero, sim_topology, testbed_motes, mqtt_broker,
                  opentun, fw_path, auto_boot, root, port_mask, baudrate,
-                 topo_file, iotlab_motes, iotlab_passwd, iotlab_user):
+                 topo_file, iotlab_motes, iotlab_passwd, iotlab_user, pcapng=None,
+                 event_store_backpressure=EventStore.BLOCK, event_store_batch_size=EventStore.BATCH_SIZE,
+                 event_store_flush_interval=EventStore.FLUSH_INTERVAL, tx_rate=TxScheduler.TX_RATE,
+                 tx_burst=TxScheduler.TX_BURST, kpi_window_size=ParserData.KPI_WINDOW_SIZE,
+                 kpi_window_duration=ParserData.KPI_WINDOW_DURATION):
 
         # store params
         self.host = host
@@ -138,8 +151,9 @@ class OpenVisualizerServer(SimpleXMLRPCServer, EventBusClient):
         self.sim_topology = sim_topology
 
         self.debug = debug
-        if self.debug and not opentun:
-            log.warning("Wireshark debugging requires opentun")
+        self.pcapng = pcapng
+        if self.debug and not (opentun or pcapng):
+            log.warning("Wireshark debugging requires opentun or a pcapng file")
 
         self.use_page_zero = use_page_zero
         self.vcdlog = vcdlog
@@ -149,6 +163,16 @@ class OpenVisualizerServer(SimpleXMLRPCServer, EventBusClient):
         else:
             self.fw_path = fw_path
 
+        self.event_store_options = {
+            'backpressure': event_store_backpressure,
+            'batch_size': event_store_batch_size,
+            'flush_interval': event_store_flush_interval,
+        }
+        self.kpi_options = {
+            'kpi_window_size': kpi_window_size,
+            'kpi_window_duration': kpi_window_duration,
+        }
+
         self.root = root
         self.dagroot = None
         self.auto_boot = auto_boot
@@ -170,8 +194,8 @@ class OpenVisualizerServer(SimpleXMLRPCServer, EventBusClient):
                 os.kill(os.getpid(), signal.SIGTERM)
 
         # local variables
-        self.ebm = eventbusmonitor.EventBusMonitor()
-        self.openlbr = openlbr.OpenLbr(use_page_zero)
+        self.ebm = eventbusmonitor.EventBusMonitor(pcapng)
+        self.openlbr = openlbr.OpenLbr(use_page_zero, tx_rate, tx_burst)
         self.rpl = rpl.RPL()
         self.jrc = jrc.JRC()
         self.topology = topology.Topology()
@@ -180,7 +204,7 @@ class OpenVisualizerServer(SimpleXMLRPCServer, EventBusClient):
         # create opentun call last since indicates prefix
         self.opentun = OpenTun.create(opentun)
 
-        if self.debug and opentun:
+        if self.debug and (opentun or pcapng):
             self.ebm.wireshark_debug_enabled = True
         else:
             self.ebm.wireshark_debug_enabled = False
@@ -189,22 +213,16 @@ class OpenVisualizerServer(SimpleXMLRPCServer, EventBusClient):
             self.simengine = simengine.SimEngine(self.sim_topology)
             self.simengine.start()
 
-            self.temp_dir = self.copy_sim_fw()
+            (oos_openwsn, self.temp_dir) = firmware.load_sim_fw(self.fw_path)
 
             if self.temp_dir is None:
                 log.critical("failed to import simulation files! Exiting now!")
                 os.kill(os.getpid(), signal.SIGTERM)
 
-            sys.path.append(os.path.join(self.temp_dir))
-            motehandler.read_notif_ids(os.path.join(self.temp_dir, 'openwsnmodule_obj.h'))
-
-            import oos_openwsn  # pylint: disable=import-error
-
-            self.mote_probes = []
-            for _ in range(self.simulator_mode):
-                mote_handler = motehandler.MoteHandler(oos_openwsn.OpenMote(), self.vcdlog)
-                self.simengine.indicate_new_mote(mote_handler)
-                self.mote_probes += [emulatedmoteprobe.EmulatedMoteProbe(emulated_mote=mote_handler)]
+            mote_handlers = [motehandler.MoteHandler(self.simengine, oos_openwsn.OpenMote(), self.vcdlog)
+                             for _ in range(self.simulator_mode)]
+            self.simengine.indicate_new_motes(mote_handlers)
+            self.mote_probes = [emulatedmoteprobe.EmulatedMoteProbe(emulated_mote=mh) for mh in mote_handlers]
 
             # load the saved topology from the topology file
             if self.topo_file:
@@ -236,7 +254,9 @@ class OpenVisualizerServer(SimpleXMLRPCServer, EventBusClient):
             os.kill(os.getpid(), signal.SIGTERM)
             return
 
-        self.mote_connectors = [moteconnector.MoteConnector(mp, fw_defines, mqtt_broker) for mp in self.mote_probes]
+        self.mote_connectors = [moteconnector.MoteConnector(mp, fw_defines, mqtt_broker, self.event_store_options,
+                                                            self.kpi_options)
+                                for mp in self.mote_probes]
 
         # create a MoteState for each MoteConnector
         self.mote_states = [motestate.MoteState(mc) for mc in self.mote_connectors]
@@ -256,6 +276,7 @@ class OpenVisualizerServer(SimpleXMLRPCServer, EventBusClient):
             self.register_function(self.boot_motes)
             self.register_function(self.set_root)
             self.register_function(self.get_mote_state)
+            self.register_function(self.wait_mote_state)
             self.register_function(self.get_dagroot)
             self.register_function(self.get_dag)
             self.register_function(self.get_motes_connectivity)
@@ -263,6 +284,11 @@ class OpenVisualizerServer(SimpleXMLRPCServer, EventBusClient):
             self.register_function(self.enable_wireshark_debug)
             self.register_function(self.disable_wireshark_debug)
             self.register_function(self.get_ebm_stats)
+            self.register_function(self.get_event_store_stats)
+            self.register_function(self.get_source_route_stats)
+            self.register_function(self.get_reassembly_stats)
+            self.register_function(self.get_mesh_tx_stats)
+            self.register_function(self.get_jrc_stats)
             self.register_function(self.get_network_topology)
             self.register_function(self.update_network_topology)
             self.register_function(self.create_motes_connection)
@@ -319,26 +345,7 @@ class OpenVisualizerServer(SimpleXMLRPCServer, EventBusClient):
         if topo_config is None:
             return
 
-        # delete each connections automatically established during motes creation
-        connections_to_delete = self.simengine.propagation.retrieve_connections()
-        for co in connections_to_delete:
-            from_mote = int(co['fromMote'])
-            to_mote = int(co['toMote'])
-            self.simengine.propagation.delete_connection(from_mote, to_mote)
-
-        motes = topo_config['motes']
-        for mote in motes:
-            mh = self.simengine.get_mote_handler_by_id(mote['id'])
-            mh.set_location(mote['lat'], mote['lon'])
-
-        # implements new connections
-        connect = topo_config['connections']
-        for co in connect:
-            from_mote = int(co['fromMote'])
-            to_mote = int(co['toMote'])
-            pdr = float(co['pdr'])
-            self.simengine.propagation.create_connection(from_mote, to_mote)
-            self.simengine.propagation.update_connection(from_mote, to_mote, pdr)
+        self.simengine.load_topology(topo_config)
 
         try:
             # recover dagroot
@@ -369,83 +376,6 @@ class OpenVisualizerServer(SimpleXMLRPCServer, EventBusClient):
 
         return topo_config
 
-    def copy_sim_fw(self):
-        """
-        Copy simulation files from build folder in openwsn-fw to a temporary directory.
-        The latter is subsequently added to the python path.
-        """
-
-        hosts = ['amd64-linux', 'x86-linux', 'amd64-windows', 'x86-windows']
-        if os.name == 'nt':
-            index = 2 if platform.architecture()[0] == '64bit' else 3
-        else:
-            index = 0 if platform.architecture()[0] == '64bit' else 1
-
-        host = hosts[index]
-
-        # in openwsn-fw, directory containing 'openwsnmodule_obj.h'
-        inc_dir = os.path.join(self.fw_path, 'bsp', 'boards', 'python')
-        if not os.path.exists(inc_dir):
-            log.critical("path '{}' does not exist".format(inc_dir))
-            return
-
-        # in openwsn-fw, directory containing extension library
-        lib_dir = os.path.join(self.fw_path, 'build', 'python_gcc', 'projects', 'common')
-        if not os.path.exists(lib_dir):
-            log.critical("path '{}' does not exist".format(lib_dir))
-            return
-
-        temp_dir = tempfile.mkdtemp()
-
-        # Build source and destination pathnames.
-        arch_and_os = host.split('-')
-        lib_ext = 'pyd' if arch_and_os[1] == 'windows' else 'so'
-        source_name = 'oos_openwsn.{0}'.format(lib_ext)
-        dest_name = 'oos_openwsn-{0}.{1}'.format(arch_and_os[0], lib_ext)
-        dest_dir = os.path.join(temp_dir, arch_and_os[1])
-
-        try:
-            shutil.copy(os.path.join(inc_dir, 'openwsnmodule_obj.h'), temp_dir)
-        except IOError:
-            log.critical("could not find {} file".format('openwsnmodule_obj.h'))
-            return
-
-        log.verbose(
-            "copying '{}' to temporary dir '{}'".format(os.path.join(inc_dir, 'openwsnmodule_obj.h'), temp_dir))
-
-        try:
-            os.makedirs(os.path.join(dest_dir))
-        except OSError:
-            pass
-
-        try:
-            shutil.copy(os.path.join(lib_dir, source_name), os.path.join(dest_dir, dest_name))
-        except IOError:
-            log.critical("Could not find: {}".format(str(os.path.join(lib_dir, source_name))))
-            return
-
-        log.verbose(
-            "copying '{}' to '{}'".format(os.path.join(lib_dir, source_name), os.path.join(dest_dir, dest_name)))
-
-        # Copy the module directly to sim_files directory if it matches this host.
-        if arch_and_os[0] == 'amd64':
-            arch_match = platform.architecture()[0] == '64bit'
-        else:
-            arch_match = platform.architecture()[0] == '32bit'
-        if arch_and_os[1] == 'windows':
-            os_match = os.name == 'nt'
-        else:
-            os_match = os.name == 'posix'
-
-        if arch_match and os_match:
-            try:
-                shutil.copy(os.path.join(lib_dir, source_name), temp_dir)
-            except IOError:
-                log.critical("could not find {}".format(str(os.path.join(lib_dir, source_name))))
-                return
-
-        return temp_dir
-
     def extract_stack_defines(self):
         """ Extract firmware definitions for the OpenVisualizer parser from the OpenWSN-FW files. """
         log.info('extracting firmware definitions.')
@@ -465,14 +395,19 @@ class OpenVisualizerServer(SimpleXMLRPCServer, EventBusClient):
         log.debug('RPC: {}'.format(self.shutdown.__name__))
 
         self.opentun.close()
+        self.ebm.close()
         self.rpl.close()
         self.jrc.close()
+        self.openlbr.close()
         for probe in self.mote_probes:
             probe.close()
             if probe.daemon is False:
                 probe.join()
+        for mc in self.mote_connectors:
+            mc.parser.parser_event.close()
 
         if self.simulator_mode:
+            self.simengine.close()
             OpenVisualizerServer.cleanup_temporary_files([self.temp_dir])
 
         os.kill(os.getpid(), signal.SIGTERM)
@@ -543,34 +478,49 @@ class OpenVisualizerServer(SimpleXMLRPCServer, EventBusClient):
         log.debug('RPC: {}'.format(self.get_dagroot.__name__))
         return self.dagroot
 
-    def get_mote_state(self, mote_id):
+    def get_mote_state(self, mote_id, since=None):
         """
-        Returns the MoteState object for the provided connected mote.
+        Returns the state of the provided connected mote.
         :param mote_id: 16-bit ID of mote
-        :rtype: MoteState or None if not found
+        :param since: None for the JSON data of all the state elements, or a version returned by a previous call to
+                      only get the elements updated since, see wait_mote_state(); 0 gets all the elements updated so
+                      far along with the version
+        :returns: dictionary from element name to JSON data, or if since is given, dictionary with the latest 'version'
+                  and the JSON data of the updated 'states'
         """
         log.debug('RPC: {}'.format(self.get_mote_state.__name__))
 
-        for ms in self.mote_states:
-            id_manager = ms.get_state_elem(ms.ST_IDMANAGER)
-            if id_manager and id_manager.get_16b_addr():
-                addr = ''.join(['%02x' % b for b in id_manager.get_16b_addr()])
-                if addr == mote_id:
-                    return OpenVisualizerServer._extract_mote_states(ms)
-        else:
-            error_msg = "Unknown mote ID: {}".format(mote_id)
-            log.warning("returning fault: {}".format(error_msg))
-            raise Fault(faultCode=-1, faultString=error_msg)
+        version, states = self._find_mote_state(mote_id).get_changes(since)
+        if since is None:
+            return states
+        return {'version': version, 'states': states}
+
+    def wait_mote_state(self, mote_id, since=None, timeout=STREAM_TIMEOUT):
+        """
+        Streams the state of a mote: blocks until a state element of the mote is updated after version since, or until
+        timeout seconds elapsed, and returns the elements updated after since.
+        :param mote_id: 16-bit ID of mote
+        :param since: version returned by the previous call, None to get all the elements without waiting
+        :param timeout: maximum time to wait, bounded by STREAM_TIMEOUT
+        :returns: dictionary with the latest 'version' and the JSON data of the updated 'states'
+        """
+        log.debug('RPC: {}'.format(self.wait_mote_state.__name__))
+
+        ms = self._find_mote_state(mote_id)
+        version, states = ms.wait_changes(since, min(timeout, self.STREAM_TIMEOUT))
+        return {'version': version, 'states': states}
 
     def enable_wireshark_debug(self):
-        if isinstance(self.opentun, OpenTunNull):
-            raise Fault(faultCode=-1, faultString="Wireshark debugging requires opentun to be active on the server")
+        if isinstance(self.opentun, OpenTunNull) and not self.pcapng:
+            raise Fault(faultCode=-1,
+                        faultString="Wireshark debugging requires opentun to be active on the server, or a pcapng file")
         else:
             self.ebm.wireshark_debug_enabled = True
 
     def disable_wireshark_debug(self):
-        if isinstance(self.opentun, OpenTunNull):
-            raise Fault(faultCode=-1, faultString="Wireshark debugging requires opentun to be active on the server")
+        if isinstance(self.opentun, OpenTunNull) and not self.pcapng:
+            raise Fault(faultCode=-1,
+                        faultString="Wireshark debugging requires opentun to be active on the server, or a pcapng file")
         else:
             self.ebm.wireshark_debug_enabled = False
 
@@ -580,6 +530,25 @@ class OpenVisualizerServer(SimpleXMLRPCServer, EventBusClient):
     def get_ebm_stats(self):
         return self.ebm.get_stats()
 
+    def get_event_store_stats(self):
+        # the event store is shared by all the motes
+        for mc in self.mote_connectors:
+            if mc.parser.parser_event.event_store:
+                return mc.parser.parser_event.event_store.get_stats()
+        return {}
+
+    def get_source_route_stats(self):
+        return self.rpl.source_route.get_stats()
+
+    def get_reassembly_stats(self):
+        return self.openlbr.fragmentor.get_stats()
+
+    def get_mesh_tx_stats(self):
+        return self.openlbr.tx_scheduler.get_stats()
+
+    def get_jrc_stats(self):
+        return self.jrc.get_stats()
+
     def get_motes_connectivity(self):
         motes = []
         states = []
@@ -612,9 +581,9 @@ class OpenVisualizerServer(SimpleXMLRPCServer, EventBusClient):
         if not self.simulator_mode:
             return False
 
+        # the connections of the motes which moved are recomputed
         for (_, v) in connections.items():
-            mh = self.simengine.get_mote_handler_by_id(v['id'])
-            mh.set_location(v['lat'], v['lon'])
+            self.simengine.propagation.move_mote(v['id'], v['lat'], v['lon'])
 
         return True
 
@@ -684,24 +653,17 @@ class OpenVisualizerServer(SimpleXMLRPCServer, EventBusClient):
 
         return mote_dict
 
-    @staticmethod
-    def _extract_mote_states(ms):
-        states = {
-            ms.ST_IDMANAGER: ms.get_state_elem(ms.ST_IDMANAGER).to_json('data'),
-            ms.ST_ASN: ms.get_state_elem(ms.ST_ASN).to_json('data'),
-            ms.ST_ISSYNC: ms.get_state_elem(ms.ST_ISSYNC).to_json('data'),
-            ms.ST_MYDAGRANK: ms.get_state_elem(ms.ST_MYDAGRANK).to_json('data'),
-            ms.ST_KAPERIOD: ms.get_state_elem(ms.ST_KAPERIOD).to_json('data'),
-            ms.ST_OUPUTBUFFER: ms.get_state_elem(ms.ST_OUPUTBUFFER).to_json('data'),
-            ms.ST_BACKOFF: ms.get_state_elem(ms.ST_BACKOFF).to_json('data'),
-            ms.ST_MACSTATS: ms.get_state_elem(ms.ST_MACSTATS).to_json('data'),
-            ms.ST_SCHEDULE: ms.get_state_elem(ms.ST_SCHEDULE).to_json('data'),
-            ms.ST_QUEUE: ms.get_state_elem(ms.ST_QUEUE).to_json('data'),
-            ms.ST_NEIGHBORS: ms.get_state_elem(ms.ST_NEIGHBORS).to_json('data'),
-            ms.ST_JOINED: ms.get_state_elem(ms.ST_JOINED).to_json('data'),
-            ms.ST_MSF: ms.get_state_elem(ms.ST_MSF).to_json('data'),
-        }
-        return states
+    def _find_mote_state(self, mote_id):
+        for ms in self.mote_states:
+            id_manager = ms.get_state_elem(ms.ST_IDMANAGER)
+            if id_manager and id_manager.get_16b_addr():
+                addr = ''.join(['%02x' % b for b in id_manager.get_16b_addr()])
+                if addr == mote_id:
+                    return ms
+
+        error_msg = "Unknown mote ID: {}".format(mote_id)
+        log.warning("returning fault: {}".format(error_msg))
+        raise Fault(faultCode=-1, faultString=error_msg)
 
 
 def _add_iotlab_parser_args(parser):
@@ -762,7 +724,14 @@ def _add_parser_args(parser):
         dest='debug',
         default=False,
         action='store_true',
-        help='Enables debugging with wireshark (requires opentun).',
+        help='Enables debugging with wireshark (requires opentun or --pcapng).',
+    )
+
+    parser.add_argument(
+        '--pcapng',
+        dest='pcapng',
+        action='store',
+        help='Writes the wireshark debug packets to a pcapng file, instead of the TUN device.',
     )
 
     parser.add_argument(
@@ -866,6 +835,63 @@ def _add_parser_args(parser):
              'simulation options.',
     )
 
+    parser.add_argument(
+        '--event-store-backpressure',
+        dest='event_store_backpressure',
+        default=EventStore.BLOCK,
+        choices=[EventStore.BLOCK, EventStore.DROP],
+        help='Policy when the queue of the mote events to store is full: block the parser or drop the event.',
+    )
+
+    parser.add_argument(
+        '--event-store-batch-size',
+        dest='event_store_batch_size',
+        default=EventStore.BATCH_SIZE,
+        type=int,
+        help='Number of mote events written to the database in a single transaction.',
+    )
+
+    parser.add_argument(
+        '--event-store-flush-interval',
+        dest='event_store_flush_interval',
+        default=EventStore.FLUSH_INTERVAL,
+        type=float,
+        help='Maximum time, in seconds, a mote event waits before being written to the database.',
+    )
+
+    parser.add_argument(
+        '--tx-rate',
+        dest='tx_rate',
+        default=TxScheduler.TX_RATE,
+        type=float,
+        help='Maximum number of fragments per second sent to the mesh network through the DAG root.',
+    )
+
+    parser.add_argument(
+        '--tx-burst',
+        dest='tx_burst',
+        default=TxScheduler.TX_BURST,
+        type=int,
+        help='Maximum number of fragments sent back-to-back to the mesh network through the DAG root.',
+    )
+
+    parser.add_argument(
+        '--kpi-window-size',
+        dest='kpi_window_size',
+        default=ParserData.KPI_WINDOW_SIZE,
+        type=int,
+        help='Number of the last packets of every mote the KPIs published to the MQTT broker are computed over.',
+    )
+
+    parser.add_argument(
+        '--kpi-window-duration',
+        dest='kpi_window_duration',
+        default=ParserData.KPI_WINDOW_DURATION,
+        type=float,
+        help='Maximum age, in seconds, of the packets the KPIs published to the MQTT broker are computed over '
+             '(default: no limit).',
+    )
+
 
 # ============================ main ============================================
 
@@ -949,8 +975,16 @@ def main():
         if args.debug:
             options.append('wireshark debug         = {0}'.format(True))
 
+    if args.pcapng:
+        options.append('pcapng file             = {0}'.format(args.pcapng))
+
     options.append('use page zero           = {0}'.format(args.use_page_zero))
     options.append('use VCD logger          = {0}'.format(args.vcdlog))
+    options.append('event store             = {0}, batches of {1}, flushed every {2}s'.format(
+        args.event_store_backpressure, args.event_store_batch_size, args.event_store_flush_interval))
+    options.append('mesh tx pacing          = {0} fragments/s, bursts of {1}'.format(args.tx_rate, args.tx_burst))
+    options.append('kpi window              = {0} packets, {1} seconds'.format(args.kpi_window_size,
+                                                                               args.kpi_window_duration))
 
     if not args.simulator_mode and args.port_mask:
         options.append('serial port mask        = {0}'.format(args.port_mask))
@@ -992,6 +1026,14 @@ def main():
         iotlab_motes=args.iotlab_motes,
         iotlab_user=args.username,
         iotlab_passwd=args.password,
+        pcapng=args.pcapng,
+        event_store_backpressure=args.event_store_backpressure,
+        event_store_batch_size=args.event_store_batch_size,
+        event_store_flush_interval=args.event_store_flush_interval,
+        tx_rate=args.tx_rate,
+        tx_burst=args.tx_burst,
+        kpi_window_size=args.kpi_window_size,
+        kpi_window_duration=args.kpi_window_duration,
     )
 
     try:
@@ -21,7 +21,7 @@ log.addHandler(logging.NullHandler())
 
 class MoteConnector(EventBusClient):
 
-    def __init__(self, mote_probe, stack_defines, mqtt_broker):
+    def __init__(self, mote_probe, stack_defines, mqtt_broker, event_store_options=None, kpi_options=None):
 
         # log
         log.debug("create instance")
@@ -32,7 +32,8 @@ class MoteConnector(EventBusClient):
         self.serialport = self.mote_probe.portname
 
         # local variables
-        self.parser = openparser.OpenParser(mqtt_broker, stack_defines, self.serialport)
+        self.parser = openparser.OpenParser(mqtt_broker, stack_defines, self.serialport, event_store_options,
+                                            kpi_options)
         self.state_lock = threading.Lock()
         self.network_prefix = None
         self._subscribed_data_for_dagroot = False
@@ -140,7 +141,11 @@ class MoteConnector(EventBusClient):
 
         next_hop, lowpan = data
 
-        self._send_to_mote_probe(data_to_send=[openparser.OpenParser.SERFRAME_PC2MOTE_DATA] + next_hop + lowpan)
+        data_to_send = bytearray([openparser.OpenParser.SERFRAME_PC2MOTE_DATA])
+        data_to_send.extend(next_hop)
+        data_to_send.extend(lowpan)
+
+        self._send_to_mote_probe(data_to_send=data_to_send)
 
     # ======================== public ==========================================
 
@@ -150,11 +155,15 @@ class MoteConnector(EventBusClient):
     # ======================== private =========================================
 
     def _send_to_mote_probe(self, data_to_send):
+        # the mote probe HDLC-frames the bytes as they are
+        if not isinstance(data_to_send, bytearray):
+            data_to_send = bytearray(data_to_send)
+
         try:
             dispatcher.send(
                 sender=self.name,
                 signal='fromMoteConnector@' + self.serialport,
-                data=''.join([chr(c) for c in data_to_send]),
+                data=data_to_send,
             )
 
         except socket.error as err:
@@ -0,0 +1,295 @@
+# Copyright (c) 2017, CNRS.
+# All rights reserved.
+#
+# Released under the BSD 3-Clause license as published at the link below.
+# https://openwsn.atlassian.net/wiki/display/OW/License
+
+import Queue
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+log = logging.getLogger('EventStore')
+log.setLevel(logging.ERROR)
+log.addHandler(logging.NullHandler())
+
+
+class EventStore(threading.Thread):
+    """
+    Write-behind store of the mote events, shared by all the motes.
+
+    The parsers push rows into a bounded queue. A dedicated writer thread drains the queue and inserts the rows with
+    one executemany() per table and a single commit per batch. A batch is flushed as soon as it holds batch_size rows,
+    or flush_interval seconds after its first row was queued.
+
+    When the queue is full, the 'block' policy makes the producer wait for the writer, while the 'drop' policy discards
+    the row and counts it. Should the writer thread die, the rows are dropped rather than queued: the producers never
+    wait on a queue that nothing drains.
+    """
+
+    BLOCK = 'block'
+    DROP = 'drop'
+
+    QUEUE_SIZE = 10000
+    BATCH_SIZE = 500
+    FLUSH_INTERVAL = 0.5  # seconds
+    WAIT_TIMEOUT = 0.5  # seconds between the checks that the writer thread is alive, while waiting on it
+
+    # table name -> list of (column, type), in insertion order
+    TABLES = [
+        ('pkt', [
+            ('asn', 'int'), ('moteid', 'text'), ('event', 'text'), ('l2src', 'text'), ('l2dest', 'text'),
+            ('type', 'text'), ('validrx', 'int'), ('slotOffset', 'int'), ('channelOffset', 'int'), ('shared', 'int'),
+            ('autoCell', 'int'), ('priority', 'int'), ('numTxAttempts', 'int'), ('lqi', 'int'), ('rssi', 'int'),
+            ('crc', 'int'), ('buffer_pos', 'int'), ('l3src', 'text'), ('l3dest', 'text'), ('l4proto', 'int'),
+            ('l4destport', 'int'),
+        ]),
+        ('schedule', [
+            ('asn', 'int'), ('moteid', 'text'), ('event', 'text'), ('neighbor', 'text'), ('neighbor2', 'text'),
+            ('type', 'text'), ('shared', 'int'), ('anycast', 'int'), ('priority', 'int'), ('slotOffset', 'int'),
+            ('channelOffset', 'int'),
+        ]),
+        ('rpl', [
+            ('asn', 'int'), ('moteid', 'text'), ('event', 'text'), ('addr1', 'text'), ('addr2', 'text'),
+        ]),
+        ('sixtop', [
+            ('asn', 'int'), ('moteid', 'text'), ('seqNum', 'int'), ('event', 'text'), ('neighbor', 'text'),
+            ('neighbor2', 'text'), ('type', 'int'), ('command', 'int'), ('code', 'int'), ('numCells', 'int'),
+        ]),
+        ('sixtopStates', [
+            ('asn', 'int'), ('moteid', 'text'), ('state', 'text'),
+        ]),
+        ('frameInterrupt', [
+            ('asn', 'int'), ('moteid', 'text'), ('intrpt', 'text'), ('state', 'text'),
+        ]),
+        ('application', [
+            ('asn', 'int'), ('moteid', 'text'), ('component', 'text'), ('seqnum', 'int'), ('buffer_pos', 'int'),
+        ]),
+        ('queue', [
+            ('asn', 'int'), ('moteid', 'text'), ('buffer_pos', 'int'), ('event', 'text'),
+        ]),
+        ('config', [
+            ('asn', 'int'), ('moteid', 'text'), ('sixtop_timeout', 'int'), ('sixtop_anycast', 'int'),
+            ('sixtop_lowest', 'int'), ('msf_numcells', 'int'), ('msf_maxcells', 'int'), ('msf_mincells', 'int'),
+            ('neigh_maxrssi', 'int'), ('neigh_minrssi', 'int'), ('rpl_dagroot', 'int'), ('debug_timing', 'int'),
+            ('debug_rpl_enqueue', 'int'), ('debug_rank', 'int'), ('debug_sixtop', 'int'), ('debug_schedule', 'int'),
+            ('debug_cca', 'int'), ('cexample_period', 'int'),
+        ]),
+    ]
+
+    # queue markers
+    _FLUSH = 'flush'
+    _STOP = 'stop'
+
+    # ======================== singleton pattern ===============================
+
+    _instance = None
+    _init = False
+
+    def __new__(cls, *args, **kwargs):
+        if not cls._instance:
+            cls._instance = super(EventStore, cls).__new__(cls)
+        return cls._instance
+
+    # ======================== main ============================================
+
+    def __init__(self, db_filename, queue_size=QUEUE_SIZE, batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL,
+                 backpressure=BLOCK):
+
+        # don't re-initialize an instance (singleton pattern)
+        if self._init:
+            return
+
+        if backpressure not in [self.BLOCK, self.DROP]:
+            raise ValueError('unknown backpressure policy {0}'.format(backpressure))
+
+        # log
+        log.debug('create instance')
+
+        # store params
+        self.db_filename = db_filename
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.backpressure = backpressure
+
+        # local variables
+        self.data_lock = threading.Lock()
+        self.stats = {
+            'queued': 0,
+            'flushed': 0,
+            'dropped': 0,
+            'failed': 0,
+            'batches': 0,
+        }
+        self._queue = Queue.Queue(maxsize=queue_size)
+        self._inserts = {}
+        for (table, columns) in self.TABLES:
+            self._inserts[table] = 'INSERT INTO {0} ({1}) VALUES ({2})'.format(
+                table,
+                ', '.join(c for (c, _) in columns),
+                ','.join('?' for _ in columns),
+            )
+        self._closed = False
+
+        # flush the existing db, create the tables
+        self._create_db()
+
+        # only mark the instance as initialized once the db exists, a failed creation can be retried
+        self._init = True
+
+        # initialize the parent class
+        super(EventStore, self).__init__()
+        self.name = 'EventStore'
+        self.daemon = True
+
+        self.start()
+
+    def run(self):
+        try:
+            log.debug('start running')
+
+            dbconn = self._connect()
+            batch = {}
+            num_rows = 0
+            deadline = None
+
+            while True:
+                try:
+                    if deadline is None:
+                        item = self._queue.get()
+                    else:
+                        item = self._queue.get(timeout=max(deadline - time.time(), 0))
+                except Queue.Empty:
+                    item = None
+
+                if item is None:
+                    # the flush interval elapsed
+                    pass
+                elif item[0] == self._FLUSH:
+                    self._write_batch(dbconn, batch, num_rows)
+                    batch, num_rows, deadline = {}, 0, None
+                    item[1].set()
+                    continue
+                elif item[0] == self._STOP:
+                    break
+                else:
+                    (table, row) = item
+                    batch.setdefault(table, []).append(row)
+                    num_rows += 1
+                    if deadline is None:
+                        deadline = time.time() + self.flush_interval
+                    if num_rows < self.batch_size:
+                        continue
+
+                self._write_batch(dbconn, batch, num_rows)
+                batch, num_rows, deadline = {}, 0, None
+
+            self._write_batch(dbconn, batch, num_rows)
+            dbconn.close()
+
+            log.debug('exit')
+        except Exception as err:
+            log.critical(err)
+            raise
+
+    # ======================== public ==========================================
+
+    def insert(self, table, row):
+        """
+        Queues a row for insertion in table.
+
+        :param table: name of the table, see TABLES
+        :param row: tuple of values, in the column order of TABLES
+        :returns: False if the row was dropped
+        """
+        if table not in self._inserts:
+            raise ValueError('unknown table {0}'.format(table))
+
+        if self._closed or not self._put((table, row), self.backpressure == self.BLOCK):
+            with self.data_lock:
+                self.stats['dropped'] += 1
+            return False
+
+        with self.data_lock:
+            self.stats['queued'] += 1
+        return True
+
+    def flush(self):
+        """ Blocks until all the rows queued so far are written to the db. """
+        if self._closed:
+            return
+        done = threading.Event()
+        if not self._put((self._FLUSH, done), True):
+            return
+        while not done.wait(self.WAIT_TIMEOUT):
+            if not self.is_alive():
+                log.error('the writer thread died, the events are not written')
+                return
+
+    def get_stats(self):
+        with self.data_lock:
+            stats = dict(self.stats)
+        stats['pending'] = self._queue.qsize()
+        return stats
+
+    def close(self):
+        """ Writes the pending rows and stops the writer thread. A new EventStore can be created afterwards. """
+        if self._closed:
+            return
+        self._closed = True
+        self._put((self._STOP, None), True)
+        self.join()
+        EventStore._instance = None
+
+    # ======================== private =========================================
+
+    def _put(self, item, block):
+        """ Queues an item, returns False if the queue is full and block is False, or if the writer thread died. """
+        while self.is_alive():
+            try:
+                self._queue.put(item, block=block, timeout=self.WAIT_TIMEOUT)
+                return True
+            except Queue.Full:
+                if not block:
+                    return False
+        return False
+
+    def _create_db(self):
+        if os.path.exists(self.db_filename):
+            os.remove(self.db_filename)
+
+        dbconn = sqlite3.connect(self.db_filename)
+        # the journal mode is persistent, all the later connections use the write-ahead log
+        dbconn.execute('PRAGMA journal_mode=WAL')
+        for (table, columns) in self.TABLES:
+            dbconn.execute('CREATE TABLE {0} ({1})'.format(table, ', '.join(' '.join(c) for c in columns)))
+        dbconn.commit()
+        dbconn.close()
+
+        log.info('created the sqlite db {0}'.format(self.db_filename))
+
+    def _connect(self):
+        dbconn = sqlite3.connect(self.db_filename)
+        # with WAL, NORMAL only syncs at checkpoints and stays consistent after a crash
+        dbconn.execute('PRAGMA synchronous=NORMAL')
+        return dbconn
+
+    def _write_batch(self, dbconn, batch, num_rows):
+        if num_rows == 0:
+            return
+
+        try:
+            with dbconn:
+                for (table, rows) in batch.items():
+                    dbconn.executemany(self._inserts[table], rows)
+        except sqlite3.Error as err:
+            log.error('could not write {0} events: {1}'.format(num_rows, err))
+            with self.data_lock:
+                self.stats['failed'] += num_rows
+            return
+
+        with self.data_lock:
+            self.stats['flushed'] += num_rows
+            self.stats['batches'] += 1
@@ -0,0 +1,211 @@
+# Copyright (c) 2010-2013, Regents of the University of California.
+# All rights reserved.
+#
+# Released under the BSD 3-Clause license as published at the link below.
+# https://openwsn.atlassian.net/wiki/display/OW/License
+
+import collections
+import logging
+import threading
+import time
+
+log = logging.getLogger('Kpi')
+log.setLevel(logging.ERROR)
+log.addHandler(logging.NullHandler())
+
+
+class MoteKpi(object):
+    """
+    KPIs of the uinject traffic of one mote, over a rolling window of its last samples.
+
+    Every update is O(1) amortized: the sums are kept running, the samples leaving the window are subtracted, and the
+    lowest and highest counters of the window are tracked with monotonic queues.
+
+    The 16-bit counters of the motes are unwrapped into sequence numbers, relative to the last counter received: a
+    counter less than half the counter space ahead is a newer packet, otherwise an older one received out of order.
+    The PDR is the number of distinct sequence numbers in the window over the span of these sequence numbers.
+    """
+
+    COUNTER_MODULO = 0x10000
+    CELLS_PER_SLOTFRAME = 64.0
+
+    def __init__(self, window_size=None, window_duration=None):
+        """
+        :param window_size: maximum number of samples in the window, None for no limit
+        :param window_duration: maximum age of the samples in the window, in seconds, None for no limit
+        """
+        # store params
+        self.window_size = window_size
+        self.window_duration = window_duration
+
+        # local variables
+        self.samples = collections.deque()  # (index, timestamp, seq, latency, cells_tx)
+        self.num_samples = 0  # index of the next sample
+        self.sum_latency = 0
+        self.sum_cells_tx = 0
+        self.seq_counts = {}  # seq -> number of samples in the window
+        self.min_seqs = collections.deque()  # (index, seq), increasing seq
+        self.max_seqs = collections.deque()  # (index, seq), decreasing seq
+        self.last_counter = None
+        self.last_seq = 0
+
+    def __len__(self):
+        return len(self.samples)
+
+    # ======================== public ==========================================
+
+    def add_sample(self, counter, latency, cells_tx, timestamp):
+        seq = self._unwrap(counter)
+        index = self.num_samples
+        self.num_samples += 1
+
+        self.samples.append((index, timestamp, seq, latency, cells_tx))
+        self.sum_latency += latency
+        self.sum_cells_tx += cells_tx
+        self.seq_counts[seq] = self.seq_counts.get(seq, 0) + 1
+
+        while self.min_seqs and self.min_seqs[-1][1] >= seq:
+            self.min_seqs.pop()
+        self.min_seqs.append((index, seq))
+        while self.max_seqs and self.max_seqs[-1][1] <= seq:
+            self.max_seqs.pop()
+        self.max_seqs.append((index, seq))
+
+        if self.window_size is not None:
+            while len(self.samples) > self.window_size:
+                self._evict()
+        self.expire(timestamp)
+
+    def expire(self, now):
+        """ Drops the samples older than the window duration. """
+        if self.window_duration is None:
+            return
+        # always keep the last sample, a mote which stopped sending keeps its last KPIs
+        while len(self.samples) > 1 and self.samples[0][1] < now - self.window_duration:
+            self._evict()
+
+    def get_kpis(self):
+        num = len(self.samples)
+        if not num:
+            return {'avg_cellsUsage': 0.0, 'avg_latency': 0.0, 'avg_pdr': 0.0, 'numSamples': 0}
+
+        span = 1 + self.max_seqs[0][1] - self.min_seqs[0][1]
+        return {
+            'avg_cellsUsage': self.sum_cells_tx / float(num) / self.CELLS_PER_SLOTFRAME,
+            'avg_latency': self.sum_latency / float(num),
+            'avg_pdr': len(self.seq_counts) / float(span),
+            'numSamples': num,
+        }
+
+    # ======================== private =========================================
+
+    def _unwrap(self, counter):
+        if self.last_counter is not None:
+            diff = (counter - self.last_counter) % self.COUNTER_MODULO
+            if diff >= self.COUNTER_MODULO // 2:
+                diff -= self.COUNTER_MODULO
+            self.last_seq += diff
+        else:
+            self.last_seq = counter
+        self.last_counter = counter
+        return self.last_seq
+
+    def _evict(self):
+        (index, _, seq, latency, cells_tx) = self.samples.popleft()
+        self.sum_latency -= latency
+        self.sum_cells_tx -= cells_tx
+
+        if self.seq_counts[seq] == 1:
+            del self.seq_counts[seq]
+        else:
+            self.seq_counts[seq] -= 1
+
+        if self.min_seqs[0][0] == index:
+            self.min_seqs.popleft()
+        if self.max_seqs[0][0] == index:
+            self.max_seqs.popleft()
+
+
+class KpiAggregator(object):
+    """
+    KPIs of the uinject traffic of all the motes, fed by the parser thread and read by the publisher.
+
+    Only the motes updated since the last call to pop_updates() are returned by it, along with the network KPIs, the
+    average of the KPIs of all the motes.
+    """
+
+    def __init__(self, window_size=None, window_duration=None):
+        # store params
+        self.window_size = window_size
+        self.window_duration = window_duration
+
+        # local variables
+        self.data_lock = threading.Lock()
+        self.motes = {}
+        self.updated = collections.OrderedDict()
+        self.stats = {'numSamples': 0, 'numPublished': 0}
+
+    # ======================== public ==========================================
+
+    def add_sample(self, src_id, counter, latency, cells_tx, timestamp=None):
+        if timestamp is None:
+            timestamp = time.time()
+
+        with self.data_lock:
+            mote = self.motes.get(src_id)
+            if mote is None:
+                mote = MoteKpi(self.window_size, self.window_duration)
+                self.motes[src_id] = mote
+            mote.add_sample(counter, latency, cells_tx, timestamp)
+
+            # most recently updated last
+            self.updated.pop(src_id, None)
+            self.updated[src_id] = True
+            self.stats['numSamples'] += 1
+
+    def get_kpis(self, src_id):
+        with self.data_lock:
+            return self.motes[src_id].get_kpis()
+
+    def get_network_kpis(self, now=None):
+        with self.data_lock:
+            return self._get_network_kpis(time.time() if now is None else now)
+
+    def pop_updates(self, now=None):
+        """
+        Returns the KPIs of the motes updated since the previous call, and of the network.
+
+        :returns: tuple (network, motes), network being None and motes empty when no mote was updated
+        """
+        with self.data_lock:
+            if not self.updated:
+                return None, collections.OrderedDict()
+
+            network = self._get_network_kpis(time.time() if now is None else now)
+            motes = collections.OrderedDict((src_id, self.motes[src_id].get_kpis()) for src_id in self.updated)
+            self.updated.clear()
+            self.stats['numPublished'] += 1
+            return network, motes
+
+    def get_stats(self):
+        with self.data_lock:
+            stats = self.stats.copy()
+            stats['numMotes'] = len(self.motes)
+            stats['numWindowSamples'] = sum(len(m) for m in self.motes.values())
+        return stats
+
+    # ======================== private =========================================
+
+    def _get_network_kpis(self, now):
+        network = {'avg_cellsUsage': 0.0, 'avg_latency': 0.0, 'avg_pdr': 0.0}
+        if not self.motes:
+            return network
+
+        for mote in self.motes.values():
+            mote.expire(now)
+            for (k, v) in mote.get_kpis().items():
+                if k in network:
+                    network[k] += v
+        for k in network:
+            network[k] /= len(self.motes)
+        return network
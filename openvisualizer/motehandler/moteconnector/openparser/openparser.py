@@ -38,7 +38,7 @@ class OpenParser(parser.Parser):
     SERFRAME_ACTION_NO = ord('N')
     SERFRAME_ACTION_TOGGLE = ord('T')
 
-    def __init__(self, mqtt_broker, stack_defines, mote_port):
+    def __init__(self, mqtt_broker, stack_defines, mote_port, event_store_options=None, kpi_options=None):
         # log
         log.debug("create instance")
 
@@ -53,10 +53,10 @@ class OpenParser(parser.Parser):
         self.parser_success = ParserLogs(self.SERFRAME_MOTE2PC_SUCCESS, stack_defines)
         self.parser_error = ParserLogs(self.SERFRAME_MOTE2PC_ERROR, stack_defines)
         self.parser_critical = ParserLogs(self.SERFRAME_MOTE2PC_CRITICAL, stack_defines)
-        self.parser_data = parserdata.ParserData(mqtt_broker, mote_port)
+        self.parser_data = parserdata.ParserData(mqtt_broker, mote_port, **(kpi_options or {}))
         self.parser_packet = parserpacket.ParserPacket()
         self.parser_printf = parserprintf.ParserPrintf()
-        self.parser_event = parserevent.ParserEvent(mote_port)
+        self.parser_event = parserevent.ParserEvent(mote_port, event_store_options)
 
         # register subparsers
         self._add_sub_parser(
@@ -6,6 +6,7 @@
 
 import logging
 from abc import ABCMeta
+from collections import OrderedDict
 
 from openvisualizer.motehandler.moteconnector.openparser.parserexception import ParserException
 
@@ -44,6 +45,7 @@ class Parser(object):
 
         # local variables
         self.parsing_keys = []
+        self.parsing_table = OrderedDict()  # index -> {value: sub parser}
         self.header_parsing_keys = []
         self.named_tuple = {}
 
@@ -52,7 +54,8 @@ class Parser(object):
     def parse_input(self, data):
 
         # log
-        log.debug("received data: {0}".format(data))
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("received data: {0}".format(data))
 
         # ensure data not short longer than header
         self._check_length(data)
@@ -60,10 +63,11 @@ class Parser(object):
         # parse the header
         # TODO
 
-        # call the next header parser
-        for key in self.parsing_keys:
-            if data[key.index] == key.val:
-                return key.parser.parse_input(data[self.header_length:])
+        # call the next header parser, a single lookup per index
+        for (index, sub_parsers) in self.parsing_table.items():
+            sub_parser = sub_parsers.get(data[index])
+            if sub_parser is not None:
+                return sub_parser.parse_input(data[self.header_length:])
 
         # if you get here, no key was found
         raise ParserException(ParserException.ExceptionType.NO_KEY, "type={0} (\"{1}\")".format(data[0], chr(data[0])))
@@ -75,4 +79,10 @@ class Parser(object):
             raise ParserException(ParserException.ExceptionType.TOO_SHORT)
 
     def _add_sub_parser(self, index=None, val=None, parser=None):
-        self.parsing_keys.append(ParsingKey(index, val, parser))
+        """
+        Registers the parser of the frames with val at index. The keys are looked up by index, in the order the
+        indexes were first registered, and the first parser registered for an index and value is used.
+        """
+        key = ParsingKey(index, val, parser)
+        self.parsing_keys.append(key)
+        self.parsing_table.setdefault(index, {}).setdefault(val, parser)
@@ -8,10 +8,12 @@ import json
 import logging
 import struct
 import threading
+import time
 
 import paho.mqtt.client as mqtt
 
 from openvisualizer.motehandler.moteconnector.openparser import parser
+from openvisualizer.motehandler.moteconnector.openparser.kpi import KpiAggregator
 
 log = logging.getLogger('ParserData')
 log.setLevel(logging.ERROR)
@@ -23,7 +25,14 @@ class ParserData(parser.Parser):
 
     UINJECT_MASK = 'uinject'
 
-    def __init__(self, mqtt_broker_address, mote_port):
+    KPI_TOPIC = 'opentestbed/uinject/arrived'
+    KPI_QOS = 1
+    KPI_PUBLISH_INTERVAL = 1.0  # seconds
+    KPI_WINDOW_SIZE = 1000  # samples per mote
+    KPI_WINDOW_DURATION = None  # seconds, None for no limit
+
+    def __init__(self, mqtt_broker_address, mote_port, kpi_window_size=KPI_WINDOW_SIZE,
+                 kpi_window_duration=KPI_WINDOW_DURATION):
 
         # log
         log.debug("create instance")
@@ -37,7 +46,7 @@ class ParserData(parser.Parser):
             'asn_0_1',  # H
         ]
 
-        self.avg_kpi = {}
+        self.kpi = KpiAggregator(kpi_window_size, kpi_window_duration)
 
         self.mote_port = mote_port
         self.broker = mqtt_broker_address
@@ -58,6 +67,11 @@ class ParserData(parser.Parser):
                 self.mqtt_thread = threading.Thread(name='mqtt_loop_thread', target=self.mqtt_client.loop_forever)
                 self.mqtt_thread.start()
 
+                # publish the KPIs at most once per interval, whatever the rate of the packets
+                self.kpi_thread = threading.Thread(name='kpi_publish_thread', target=self._kpi_publish_loop)
+                self.kpi_thread.daemon = True
+                self.kpi_thread.start()
+
     # ======================== private =========================================
 
     def _on_mqtt_connect(self, client, userdata, flags, rc):
@@ -65,6 +79,16 @@ class ParserData(parser.Parser):
 
         self.mqtt_connected = True
 
+    def _kpi_publish_loop(self):
+        try:
+            while True:
+                time.sleep(self.KPI_PUBLISH_INTERVAL)
+                if self.mqtt_connected:
+                    self.publish_kpi()
+        except Exception as err:
+            log.critical(err)
+            raise
+
     # ======================== public ==========================================
 
     def parse_input(self, data):
@@ -142,27 +166,7 @@ class ParserData(parser.Parser):
 
                 pkt_info['dutyCycle'] = float(num_ticks_on) / float(num_ticks_in_total)  # duty cycle
 
-                # self.avg_kpi:
-                if src_id in self.avg_kpi:
-                    self.avg_kpi[src_id]['counter'].append(pkt_info['counter'])
-                    self.avg_kpi[src_id]['latency'].append(pkt_info['latency'])
-                    self.avg_kpi[src_id]['numCellsUsedTx'].append(pkt_info['numCellsUsedTx'])
-                    self.avg_kpi[src_id]['numCellsUsedRx'].append(pkt_info['numCellsUsedRx'])
-                    self.avg_kpi[src_id]['dutyCycle'].append(pkt_info['dutyCycle'])
-                else:
-                    self.avg_kpi[src_id] = {
-                        'counter': [pkt_info['counter']],
-                        'latency': [pkt_info['latency']],
-                        'numCellsUsedTx': [pkt_info['numCellsUsedTx']],
-                        'numCellsUsedRx': [pkt_info['numCellsUsedRx']],
-                        'dutyCycle': [pkt_info['dutyCycle']],
-                        'avg_cellsUsage': 0.0,
-                        'avg_latency': 0.0,
-                        'avg_pdr': 0.0,
-                    }
-
-                if self.mqtt_connected:
-                    self.publish_kpi(src_id)
+                self.kpi.add_sample(src_id, pkt_info['counter'], pkt_info['latency'], pkt_info['numCellsUsedTx'])
 
                 # in case we want to send the computed time to internet..
                 # computed=struct.pack('<H', timeinus)#to be appended to the pkt
@@ -196,42 +200,17 @@ class ParserData(parser.Parser):
 
     # ========================== mqtt publish ====================================
 
-    def publish_kpi(self, src_id):
-
-        payload = {'token': 123}
+    def publish_kpi(self):
+        """ Publishes the network KPIs along with the KPIs of the motes updated since the last publication. """
 
-        mote_data = self.avg_kpi[src_id]
+        (network, motes) = self.kpi.pop_updates()
+        if not motes:
+            return
 
-        self.avg_kpi[src_id]['avg_cellsUsage'] = \
-            float(sum(mote_data['numCellsUsedTx']) / len(mote_data['numCellsUsedTx'])) / float(64)
-
-        self.avg_kpi[src_id]['avg_latency'] = \
-            sum(self.avg_kpi[src_id]['latency']) / len(self.avg_kpi[src_id]['latency'])
-
-        mote_data['counter'].sort()  # sort the counter before calculating
-
-        self.avg_kpi[src_id]['avg_pdr'] = \
-            float(len(set(mote_data['counter']))) / float(1 + mote_data['counter'][-1] - mote_data['counter'][0])
-
-        avg_pdr_all = 0.0
-        avg_latency_all = 0.0
-        avg_num_cells_usage_all = 0.0
-
-        for mote, data in self.avg_kpi.items():
-            avg_pdr_all += data['avg_pdr']
-            avg_latency_all += data['avg_latency']
-            avg_num_cells_usage_all += data['avg_cellsUsage']
-
-        num_motes = len(self.avg_kpi)
-        avg_pdr_all = avg_pdr_all / float(num_motes)
-        avg_latency_all = avg_latency_all / float(num_motes)
-        avg_num_cells_usage_all = avg_num_cells_usage_all / float(num_motes)
-
-        payload['avg_cellsUsage'] = avg_num_cells_usage_all
-        payload['avg_latency'] = avg_latency_all
-        payload['avg_pdr'] = avg_pdr_all
-        payload['src_id'] = src_id
+        payload = {'token': 123}
+        payload.update(network)
+        payload['src_id'] = next(reversed(motes))  # the mote updated last
+        payload['motes'] = motes
 
-        if self.mqtt_connected:
-            # publish the cmd message
-            self.mqtt_client.publish(topic='opentestbed/uinject/arrived', payload=json.dumps(payload), qos=2)
+        # publish the cmd message
+        self.mqtt_client.publish(topic=self.KPI_TOPIC, payload=json.dumps(payload), qos=self.KPI_QOS)
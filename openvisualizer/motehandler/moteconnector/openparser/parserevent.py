@@ -5,13 +5,12 @@
 # https://openwsn.atlassian.net/wiki/display/OW/License
 
 import logging
-import sys
+import os
 import sqlite3
 import traceback
 
-import threading
-
 from openvisualizer.motehandler.moteconnector.openparser import parser
+from openvisualizer.motehandler.moteconnector.openparser.eventstore import EventStore
 from openvisualizer.motehandler.moteconnector.openparser.parserexception import ParserException
 from openvisualizer.utils import format_buf
 
@@ -27,7 +26,7 @@ class ParserEvent(parser.Parser):
     buffer = ""
 
 
-    def __init__(self, mote_port):
+    def __init__(self, mote_port, event_store_options=None):
 
         # log
         log.debug('create instance')
@@ -36,73 +35,16 @@ class ParserEvent(parser.Parser):
         super(ParserEvent, self).__init__(self.HEADER_LENGTH)
        
        
-        # create the db
+        # all the motes share the same db, written by a single thread, the options are keyword arguments of EventStore
+        self.event_store = None
         try:
-            #one db per mote (for concurrent access)
             directory = os.path.dirname(log.handlers[0].baseFilename)
-            self.dbfilename = directory+'/openv_events.' + mote_port + '.db'
-        
-            #flush the existing one + connection
-            if (os.path.exists(self.dbfilename)):
-                os.remove(self.dbfilename)
-            dbconn = sqlite3.connect(self.dbfilename) # check_same_thread=False)
-            dbconn.isolation_level = 'EXCLUSIVE'
-            dbconn.execute('BEGIN EXCLUSIVE')
-            log.success("created the sqlite db {}".format(self.dbfilename))
-
-
-            # Create tables
-            c = dbconn.cursor()
-            #packet reception / transmission
-            c.execute('''CREATE TABLE pkt
-            (asn int, moteid text, event text, l2src text, l2dest text, type text, validrx int, slotOffset int, channelOffset int, shared int, autoCell int, priority int, numTxAttempts int, lqi int, rssi int, crc int, buffer_pos int, l3src text, l3dest text, l4proto int, l4destport int)''')
-            
-             #schedule modification
-            c.execute('''CREATE TABLE schedule
-            (asn int, moteid text, event text, neighbor text, neighbor2 text, type text, shared int, anycast int,  priority int, slotOffset int, channelOffset int)''')
-            
-            #RPL changes
-            c.execute('''CREATE TABLE rpl
-            (asn int, moteid text, event text, addr1 text, addr2 text)''')
-            
-           
-            #SIXTOP
-            c.execute('''CREATE TABLE sixtop
-            (asn int, moteid text, seqNum int, event text, neighbor text, neighbor2 text,
-            type int, command int, code int, numCells int)''')
-            
-            #SIXTOP STATE CHANGED
-            c.execute('''CREATE TABLE sixtopStates
-            (asn int, moteid text, state text)''')
-                        
-             #FRAME INTERRUPT
-            c.execute('''CREATE TABLE frameInterrupt
-            (asn int, moteid text, intrpt text, state text)''')
-       
-            #APPLICATION
-            c.execute('''CREATE TABLE application
-            (asn int, moteid text, component text, seqnum int, buffer_pos int)''')
-            
-            #QUEUE
-            c.execute('''CREATE TABLE queue
-            (asn int, moteid text, buffer_pos int, event text)''')
-
-            #CONFIG EVENT
-            c.execute('''CREATE TABLE config (asn int, moteid text, sixtop_timeout int, sixtop_anycast int, sixtop_lowest int, msf_numcells int, msf_maxcells int, msf_mincells int, neigh_maxrssi int, neigh_minrssi int, rpl_dagroot  int, debug_timing int, debug_rpl_enqueue int, debug_rank int, debug_sixtop int, debug_schedule int, debug_cca int, cexample_period int)''')
-            
-            dbconn.commit()
-            dbconn.close()
-            
-            #to be initalized later for each thread
-            self.dbconn = {}
-            
-        except AttributeError:
+            self.event_store = EventStore(os.path.join(directory, 'openv_events.db'), **(event_store_options or {}))
+        except (AttributeError, IndexError):
             log.error("no LogHandler for parserEvent: we cannot store the events in a sqlite DB")
-        except:
-            log.error("Unexpected error for the db creation and connection:", sys.exc_info()[0])
+        except (sqlite3.Error, OSError) as err:
+            log.error("Unexpected error for the db creation: {0}".format(err))
 
-        
-         
     # returns a string with the decimal value of a uint16_t
     @staticmethod
     def bytes_to_string(bytestring):
@@ -470,23 +412,15 @@ class ParserEvent(parser.Parser):
             return("DELETE")
         return(str(code))
         
-    #return a connection to the DB for this thread
-    def get_dbconn(self):
-        threadname = threading.current_thread().name
-        
-        #creates the connection for this thread if none exists
-        if self.dbconn.has_key(threadname) is False:
-            dbconn = sqlite3.connect(self.dbfilename)
-            dbconn.isolation_level = 'EXCLUSIVE'
-            dbconn.execute('BEGIN EXCLUSIVE')
-            self.dbconn[threadname]  = dbconn
-            
-            log.success("connection to sqlite db {}, threadname {}".format(self.dbfilename, threadname))
+    def close(self):
+        """ Writes the pending events to the db. """
+        if self.event_store:
+            self.event_store.close()
+
+    def _store_event(self, table, row):
+        if self.event_store:
+            self.event_store.insert(table, row)
 
-        
-        return(self.dbconn[threadname])
-           
-       
     def parse_input(self, data):
 
         # log
@@ -534,10 +468,9 @@ class ParserEvent(parser.Parser):
                 
                 
                 
-                dbconn = self.get_dbconn()
-                c = dbconn.cursor()
-                c.execute("""INSERT INTO pkt (asn,moteid,event,l2src,l2dest,type,validrx, slotOffset,channelOffset,shared,autoCell, priority,numTxAttempts,lqi,rssi,crc,buffer_pos,l3src,l3dest,l4proto,l4destport) VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)""", (asn, moteid, event, l2src, l2dest, type, validRx, slotOffset, channelOffset, shared, isAutoCell, priority, numTxAttempts, lqi, rssi, crc, buffer_pos,l3src,l3dest,l4proto,l4destport))
-                dbconn.commit()
+                self._store_event('pkt', (asn, moteid, event, l2src, l2dest, type, validRx, slotOffset, channelOffset,
+                                          shared, isAutoCell, priority, numTxAttempts, lqi, rssi, crc, buffer_pos,
+                                          l3src, l3dest, l4proto, l4destport))
 
              
             #SCHEDULE
@@ -557,10 +490,8 @@ class ParserEvent(parser.Parser):
                 channelOffset   = data[36]
                 
 
-                dbconn = self.get_dbconn()
-                c = dbconn.cursor()
-                c.execute("""INSERT INTO schedule (asn, moteid, event, neighbor, neighbor2, type, shared, anycast, priority, slotOffset,channelOffset) VALUES (?,?,?,?,?,?,?,?,?,?,?)""", (asn, moteid, event, neighbor, neighbor2, type, shared, anycast, priority, slotOffset, channelOffset))
-                dbconn.commit()
+                self._store_event('schedule', (asn, moteid, event, neighbor, neighbor2, type, shared, anycast,
+                                               priority, slotOffset, channelOffset))
     
                 
             #RPL
@@ -573,10 +504,7 @@ class ParserEvent(parser.Parser):
                 addr1           = ParserEvent.bytes_to_addr(data[15:23])
                 addr2           = ParserEvent.bytes_to_addr(data[23:31])
 
-                dbconn = self.get_dbconn()
-                c = dbconn.cursor()
-                c.execute("""INSERT INTO rpl (asn, moteid, event, addr1, addr2) VALUES (?,?,?,?,?)""", (asn, moteid, event, addr1, addr2))
-                dbconn.commit()
+                self._store_event('rpl', (asn, moteid, event, addr1, addr2))
                     
             #SIXTOP
             elif (typeStat == 4):
@@ -593,10 +521,7 @@ class ParserEvent(parser.Parser):
                 seqNum          = data[34]
                 numCells        = data[35]
                 
-                dbconn = self.get_dbconn()
-                c = dbconn.cursor()
-                c.execute("""INSERT INTO sixtop (asn, moteid, event, neighbor, neighbor2, type, code, command, seqNum, numCells) VALUES (?,?,?,?,?,?,?,?,?,?)""", (asn, moteid, event, neighbor, neighbor2, type, code, command, seqNum, numCells))
-                dbconn.commit()
+                self._store_event('sixtop', (asn, moteid, seqNum, event, neighbor, neighbor2, type, command, code, numCells))
 
             #SIXTOP STATE CHANGED
             elif (typeStat == 5):
@@ -606,10 +531,7 @@ class ParserEvent(parser.Parser):
 
                 state           = ParserEvent.sixtopStateString(data[14])
                 
-                dbconn = self.get_dbconn()
-                c = dbconn.cursor()
-                c.execute("""INSERT INTO sixtopStates (asn, moteid, state) VALUES (?,?,?)""", (asn, moteid, state))
-                dbconn.commit()
+                self._store_event('sixtopStates', (asn, moteid, state))
      
                     
             #SIXTOP STATE CHANGED
@@ -621,10 +543,7 @@ class ParserEvent(parser.Parser):
                 intrpt = ParserEvent.frameInterruptString(data[14])
                 state  = ParserEvent.ieee154eStateString(data[15])
 
-                dbconn = self.get_dbconn()
-                c = dbconn.cursor()
-                c.execute("""INSERT INTO frameInterrupt (asn, moteid, intrpt, state) VALUES (?,?,?,?)""", (asn, moteid, intrpt, state))
-                dbconn.commit()
+                self._store_event('frameInterrupt', (asn, moteid, intrpt, state))
   
             #APPLICATION
             elif (typeStat == 7):
@@ -636,10 +555,7 @@ class ParserEvent(parser.Parser):
                 seqnum  = data[15] + 256 * data[16]
                 buffer_pos = data[17]
                 
-                dbconn = self.get_dbconn()
-                c = dbconn.cursor()
-                c.execute("""INSERT INTO application (asn, moteid, component, seqnum, buffer_pos) VALUES (?,?,?,?,?)""", (asn, moteid, component, seqnum, buffer_pos))
-                dbconn.commit()
+                self._store_event('application', (asn, moteid, component, seqnum, buffer_pos))
    
             #OPENQUEUE
             elif (typeStat == 8):
@@ -650,10 +566,7 @@ class ParserEvent(parser.Parser):
                 buffer_pos = data[14]
                 event  = ParserEvent.queueEventString(data[15])
 
-                dbconn = self.get_dbconn()
-                c = dbconn.cursor()
-                c.execute("""INSERT INTO queue (asn, moteid, buffer_pos, event) VALUES (?,?,?,?)""", (asn, moteid, buffer_pos, event))
-                dbconn.commit()
+                self._store_event('queue', (asn, moteid, buffer_pos, event))
                
             #CONFIG
             elif (typeStat == 9):
@@ -685,18 +598,15 @@ class ParserEvent(parser.Parser):
                 #app
                 cexample_period = data[30] + 256 * data[31]
                 
-                dbconn = self.get_dbconn()
-                c = dbconn.cursor()
-                c.execute("""INSERT INTO config (asn, moteid, sixtop_timeout, sixtop_anycast, sixtop_lowest, msf_numcells, msf_maxcells, msf_mincells, neigh_maxrssi, neigh_minrssi, rpl_dagroot , debug_timing, debug_rpl_enqueue, debug_rank, debug_sixtop, debug_schedule, debug_cca, cexample_period) VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)""", (asn, moteid, sixtop_timeout, sixtop_anycast, sixtop_lowest, msf_numcells, msf_maxcells, msf_mincells, neigh_maxrssi, neigh_minrssi, rpl_dagroot , debug_timing, debug_rpl_enqueue, debug_rank, debug_sixtop, debug_schedule, debug_cca, cexample_period))
-                dbconn.commit()
+                self._store_event('config', (asn, moteid, sixtop_timeout, sixtop_anycast, sixtop_lowest, msf_numcells,
+                                             msf_maxcells, msf_mincells, neigh_maxrssi, neigh_minrssi, rpl_dagroot,
+                                             debug_timing, debug_rpl_enqueue, debug_rank, debug_sixtop, debug_schedule,
+                                             debug_cca, cexample_period))
                     
    
             else:
                 log.error('unknown statistic type={0}'.format(typeStat))
                
-        except sqlite3.OperationalError as e:
-            log.error(e)
-            log.error(e.args)
         except  Exception as e:
             log.error("Unexpected error:")
             traceback.print_exc()
@@ -29,6 +29,7 @@ class FieldParsingKey(object):
 
 class ParserStatus(parser.Parser):
     HEADER_LENGTH = 4
+    HEADER_STRUCT = struct.Struct('<HB')  # moteId, statusElem
 
     def __init__(self):
 
@@ -40,6 +41,7 @@ class ParserStatus(parser.Parser):
 
         # local variables
         self.fields_parsing_keys = []
+        self.status_parsers = {}  # status element -> (key, compiled structure, named tuple)
 
         # register fields
         self._add_fields_parser(
@@ -256,66 +258,78 @@ class ParserStatus(parser.Parser):
 
     def parse_input(self, data):
 
-        log.debug("received data={0}".format(data))
-        
+        # only format the log messages when they are logged
+        debug = log.isEnabledFor(logging.DEBUG)
+        if debug:
+            log.debug("received data={0}".format(data))
+
         # ensure data not short longer than header
         self._check_length(data)
 
-        header_bytes = data[:3]
+        # a single copy of the frame, unpacked in place
+        buf = bytearray(data)
 
         # extract mote_id and status_elem
         try:
-            (mote_id, status_elem) = struct.unpack('<HB', ''.join([chr(c) for c in header_bytes]))
+            (mote_id, status_elem) = self.HEADER_STRUCT.unpack_from(buf)
         except struct.error:
             raise ParserException(ParserException.ExceptionType.DESERIALIZE.value,
-                                  "could not extract moteId and statusElem from {0}".format(header_bytes))
-
-        log.debug("moteId={0} statusElem={1}".format(mote_id, status_elem))
+                                  "could not extract moteId and statusElem from {0}".format(data[:3]))
 
-        # jump the header bytes
-        data = data[3:]
+        if debug:
+            log.debug("moteId={0} statusElem={1}".format(mote_id, status_elem))
 
         # call the next header parser
-        for key in self.fields_parsing_keys:
-            if status_elem == key.val:
-
-                # log
-                log.debug("parsing {0}, ({1} bytes) as {2}".format(data, len(data), key.name))
+        try:
+            (key, key_struct, key_tuple) = self.status_parsers[status_elem]
+        except KeyError:
+            # if you get here, no key was found
+            raise ParserException(ParserException.ExceptionType.NO_KEY.value,
+                                  "type={0} (\"{1}\")".format(data[3], chr(data[3])))
 
-                # parse byte array
-                try:
-                    fields = struct.unpack(key.structure, ''.join([chr(c) for c in data]))
-                except struct.error as err:
-                    print(err)                    
-                    raise ParserException(
-                        ParserException.ExceptionType.DESERIALIZE.value,
-                        "could not extract tuple {0} by applying {1} to {2}; error: {3}".format(
-                            key.name,
-                            key.structure,
-                            format_buf(data),
-                            str(err),
-                        ),
-                    )
+        # log
+        if debug:
+            log.debug("parsing {0}, ({1} bytes) as {2}".format(data[3:], len(data) - 3, key.name))
 
-                # map to name tuple
-                return_tuple = self.named_tuple[key.name](*fields)
+        # parse byte array, skipping the header bytes
+        if len(buf) - 3 == key_struct.size:
+            fields = key_struct.unpack_from(buf, 3)
+        else:
+            try:
+                # the frame has the wrong length, get the same error as unpacking it
+                struct.unpack(key.structure, str(buf[3:]))
+            except struct.error as err:
+                print(err)
+                raise ParserException(
+                    ParserException.ExceptionType.DESERIALIZE.value,
+                    "could not extract tuple {0} by applying {1} to {2}; error: {3}".format(
+                        key.name,
+                        key.structure,
+                        format_buf(data[3:]),
+                        str(err),
+                    ),
+                )
 
-                # log
-                log.debug("parsed into {0}".format(return_tuple))
+        # map to name tuple
+        return_tuple = key_tuple(*fields)
 
-                # map to name tuple
-                return 'status', return_tuple
+        # log
+        if debug:
+            log.debug("parsed into {0}".format(return_tuple))
 
-        # if you get here, no key was found
-        raise ParserException(ParserException.ExceptionType.NO_KEY.value,
-                              "type={0} (\"{1}\")".format(data[0], chr(data[0])))
+        # map to name tuple
+        return 'status', return_tuple
 
     # ======================== private =========================================
 
     def _add_fields_parser(self, index=None, val=None, name=None, structure=None, fields=None):
 
         # add to fields parsing keys
-        self.fields_parsing_keys.append(FieldParsingKey(index, val, name, structure, fields))
+        key = FieldParsingKey(index, val, name, structure, fields)
+        self.fields_parsing_keys.append(key)
 
         # define named tuple
         self.named_tuple[name] = collections.namedtuple("Tuple_" + name, fields)
+
+        # compile the key, the first key registered for a value is used
+        self.status_parsers.setdefault(val, (key, struct.Struct(structure), self.named_tuple[name]))
@@ -40,6 +40,9 @@ class MoteProbe(threading.Thread):
     XONXOFF_ESCAPE = 0x12
     XONXOFF_MASK = 0x10
 
+    _XONXOFF_ESCAPE_CHAR = chr(XONXOFF_ESCAPE)
+    _XONXOFF_CHARS = chr(XON) + chr(XOFF)
+
     # XOFF            is transmitted as [XONXOFF_ESCAPE,           XOFF^XONXOFF_MASK]==[0x12,0x13^0x10]==[0x12,0x03]
     # XON             is transmitted as [XONXOFF_ESCAPE,            XON^XONXOFF_MASK]==[0x12,0x11^0x10]==[0x12,0x01]
     # XONXOFF_ESCAPE  is transmitted as [XONXOFF_ESCAPE, XONXOFF_ESCAPE^XONXOFF_MASK]==[0x12,0x12^0x10]==[0x12,0x02]
@@ -58,10 +61,7 @@ class MoteProbe(threading.Thread):
         # to be assigned, callback
         self.send_to_parser = None
 
-        # frame parsing variables
-        self.rx_buf = ''
-        self.hdlc_flag = False
-        self.receiving = False
+        # XON/XOFF escaping state, the HDLC framing state is kept by self.hdlc
         self.xonxoff_escaping = False
 
         # give this thread a name
@@ -152,77 +152,34 @@ class MoteProbe(threading.Thread):
     def _rcv_data(self):
         raise NotImplementedError("Should be implemented by child class")
 
-    def _handle_frame(self):
-        """ Handles a HDLC frame """
-        valid_frame = False
-        temp_buf = self.rx_buf
-        try:
-            self.rx_buf = self.hdlc.dehdlcify(self.rx_buf)
+    def _xonxoff_unescape(self, chunk):
+        """ Removes the XONXOFF bytes and escaping from a slice of the serial stream, an escape split across two slices
+        is carried over. An escape is never applied to an HDLC flag, so flags always delimit frames. """
+        escaping = self.xonxoff_escaping
+        out = []
+        for i, part in enumerate(chunk.split(self._XONXOFF_ESCAPE_CHAR)):
+            if i > 0:
+                escaping = True
+            if not part:
+                continue
+            if escaping:
+                if part[0] != self.hdlc.HDLC_FLAG:
+                    out.append(chr(ord(part[0]) ^ self.XONXOFF_MASK))
+                    part = part[1:]
+                escaping = False
+            out.append(part.translate(None, self._XONXOFF_CHARS))
+
+        self.xonxoff_escaping = escaping
+        return ''.join(out)
+
+    def _parse_bytes(self, octets):
+        """ Parses bytes received from serial pipe, frames are extracted by the streaming HDLC decoder """
+        if not isinstance(octets, str):
+            octets = ''.join(octets)
 
+        for frame in self.hdlc.feed(self._xonxoff_unescape(octets)):
             if log.isEnabledFor(logging.DEBUG):
-                log.debug("{}: {} dehdlcized input: {}".format(
-                    self.name,
-                    format_string_buf(temp_buf),
-                    format_string_buf(self.rx_buf)))
+                log.debug("{}: dehdlcized input: {}".format(self.name, format_string_buf(frame)))
 
             if self.send_to_parser:
-                self.send_to_parser([ord(c) for c in self.rx_buf])
-
-            valid_frame = True
-        except openhdlc.HdlcException as err:
-            log.warning('{}: invalid serial frame: {} {}'.format(self.name, format_string_buf(temp_buf), err))
-
-        return valid_frame
-
-    def _rx_buf_add(self, byte):
-        """ Adds byte to buffer and escapes the XONXOFF bytes """
-        if byte == chr(self.XONXOFF_ESCAPE):
-            self.xonxoff_escaping = True
-        else:
-            if self.xonxoff_escaping is True:
-                self.rx_buf += chr(ord(byte) ^ self.XONXOFF_MASK)
-                self.xonxoff_escaping = False
-            elif byte != chr(self.XON) and byte != chr(self.XOFF):
-                self.rx_buf += byte
-
-    def _parse_bytes(self, octets):
-        """ Parses bytes received from serial pipe """
-        for byte in octets:
-            if not self.receiving:
-                if self.hdlc_flag and byte != self.hdlc.HDLC_FLAG:
-                    # start of frame
-                    if log.isEnabledFor(logging.DEBUG):
-                        log.debug("%s: start of HDLC frame %s %s",
-                                  self.name,
-                                  format_string_buf(self.hdlc.HDLC_FLAG),
-                                  format_string_buf(byte),
-                                  )
-                    self.receiving = True
-                    # discard received self.hdlc_flag
-                    self.hdlc_flag = False
-                    self.xonxoff_escaping = False
-                    self.rx_buf = self.hdlc.HDLC_FLAG
-                    self._rx_buf_add(byte)
-                elif byte == self.hdlc.HDLC_FLAG:
-                    # received hdlc flag
-                    self.hdlc_flag = True
-                else:
-                    # drop garbage
-                    pass
-            else:
-                if byte != self.hdlc.HDLC_FLAG:
-                    # middle of frame
-                    self._rx_buf_add(byte)
-                else:
-                    # end of frame, received self.hdlc_flag
-                    if log.isEnabledFor(logging.DEBUG):
-                        log.debug("{}: end of hdlc frame {}".format(self.name, format_string_buf(byte)))
-
-                    self.hdlc_flag = True
-                    self.receiving = False
-                    self._rx_buf_add(byte)
-                    valid_frame = self._handle_frame()
-
-                    if valid_frame:
-                        # discard valid frame self.hdlc_flag
-                        self.hdlc_flag = False
+                self.send_to_parser([ord(c) for c in frame])
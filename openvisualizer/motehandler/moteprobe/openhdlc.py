@@ -5,9 +5,10 @@ HDLC framing module.
                   October 2012
 """
 
+import binascii
 import logging
 
-from openvisualizer.utils import format_string_buf
+from openvisualizer.utils import format_string_buf, BITREVERSE
 
 log = logging.getLogger('OpenHdlc')
 log.setLevel(logging.ERROR)
@@ -18,6 +19,42 @@ class HdlcException(Exception):
     pass
 
 
+# binascii.crc_hqx() computes the MSB-first CRC-CCITT, the HDLC FCS is its reflection
+def _reverse16(value):
+    return (ord(BITREVERSE[value & 0xff]) << 8) | ord(BITREVERSE[value >> 8])
+
+
+def _to_str(buf):
+    if isinstance(buf, str):
+        return buf
+    elif isinstance(buf, bytearray):
+        return str(buf)
+    elif isinstance(buf, memoryview):
+        return buf.tobytes()
+    else:
+        return str(bytearray(buf))
+
+
+def crc16(buf, crc=0xffff):
+    """
+    Computes the HDLC FCS-16 (CRC-16/X-25 without final XOR) over a whole buffer.
+
+    The computation is delegated to binascii.crc_hqx() on the bit-reversed input, so no Python code runs per byte.
+
+    :param buf: str, bytearray or memoryview
+    :param crc: initial value
+    """
+    return _reverse16(binascii.crc_hqx(_to_str(buf).translate(BITREVERSE), _reverse16(crc)))
+
+
+def crc16_table(buf, crc=0xffff):
+    """ Table-driven reference implementation of crc16(), iterates over a bytearray. """
+    table = OpenHdlc.FCS16TAB
+    for b in bytearray(buf):
+        crc = (crc >> 8) ^ table[(crc ^ b) & 0xff]
+    return crc
+
+
 class OpenHdlc(object):
     HDLC_FLAG = '\x7e'
     HDLC_FLAG_ESCAPED = '\x5e'
@@ -61,6 +98,13 @@ class OpenHdlc(object):
         0x7bc7, 0x6a4e, 0x58d5, 0x495c, 0x3de3, 0x2c6a, 0x1ef1, 0x0f78,
     )
 
+    def __init__(self):
+        # streaming decoder state, see feed()
+        self.rx_buf = ''
+        self.hdlc_flag = False
+        self.receiving = False
+        self.num_invalid_frames = 0
+
     # ============================ public ======================================
 
     def hdlcify(self, in_buf):
@@ -70,21 +114,19 @@ class OpenHdlc(object):
         Use 0x00 for both addr byte, and control byte.
         """
 
-        # make copy of input
-        out_buf = in_buf[:]
+        out_buf = _to_str(in_buf)
 
         # calculate CRC
-        crc = self.HDLC_CRCINIT
-        for b in out_buf:
-            crc = self._crc_iteration(crc, b)
-        crc = 0xffff - crc
+        crc = 0xffff - crc16(out_buf, self.HDLC_CRCINIT)
 
         # append CRC
         out_buf = out_buf + chr(crc & 0xff) + chr((crc & 0xff00) >> 8)
 
-        # stuff bytes
-        out_buf = out_buf.replace(self.HDLC_ESCAPE, self.HDLC_ESCAPE + self.HDLC_ESCAPE_ESCAPED)
-        out_buf = out_buf.replace(self.HDLC_FLAG, self.HDLC_ESCAPE + self.HDLC_FLAG_ESCAPED)
+        # stuff bytes, the C-level replace() passes are only run when needed
+        if self.HDLC_ESCAPE in out_buf:
+            out_buf = out_buf.replace(self.HDLC_ESCAPE, self.HDLC_ESCAPE + self.HDLC_ESCAPE_ESCAPED)
+        if self.HDLC_FLAG in out_buf:
+            out_buf = out_buf.replace(self.HDLC_FLAG, self.HDLC_ESCAPE + self.HDLC_FLAG_ESCAPED)
 
         # add flags
         out_buf = self.HDLC_FLAG + out_buf + self.HDLC_FLAG
@@ -97,22 +139,23 @@ class OpenHdlc(object):
 
         :returns: the extracted frame, or -1 if wrong checksum
         """
+        in_buf = _to_str(in_buf)
+
         assert in_buf[0] == self.HDLC_FLAG
         assert in_buf[-1] == self.HDLC_FLAG
 
-        # make copy of input
-        out_buf = in_buf[:]
         if log.isEnabledFor(logging.DEBUG):
-            log.debug("got              {0}".format(format_string_buf(out_buf)))
+            log.debug("got              {0}".format(format_string_buf(in_buf)))
 
         # remove flags
-        out_buf = out_buf[1:-1]
+        out_buf = in_buf[1:-1]
         if log.isEnabledFor(logging.DEBUG):
             log.debug("after flags:     {0}".format(format_string_buf(out_buf)))
 
         # unstuff
-        out_buf = out_buf.replace(self.HDLC_ESCAPE + self.HDLC_FLAG_ESCAPED, self.HDLC_FLAG)
-        out_buf = out_buf.replace(self.HDLC_ESCAPE + self.HDLC_ESCAPE_ESCAPED, self.HDLC_ESCAPE)
+        if self.HDLC_ESCAPE in out_buf:
+            out_buf = out_buf.replace(self.HDLC_ESCAPE + self.HDLC_FLAG_ESCAPED, self.HDLC_FLAG)
+            out_buf = out_buf.replace(self.HDLC_ESCAPE + self.HDLC_ESCAPE_ESCAPED, self.HDLC_ESCAPE)
         if log.isEnabledFor(logging.DEBUG):
             log.debug("after unstuff:   {0}".format(format_string_buf(out_buf)))
 
@@ -120,10 +163,7 @@ class OpenHdlc(object):
             raise HdlcException('packet too short')
 
         # check CRC
-        crc = self.HDLC_CRCINIT
-        for b in out_buf:
-            crc = self._crc_iteration(crc, b)
-        if crc != self.HDLC_CRCGOOD:
+        if crc16(out_buf, self.HDLC_CRCINIT) != self.HDLC_CRCGOOD:
             raise HdlcException('wrong CRC')
 
         # remove CRC
@@ -133,7 +173,61 @@ class OpenHdlc(object):
 
         return out_buf
 
-    # ============================ private =====================================
+    def feed(self, in_buf):
+        """
+        Streaming decoder, feeds a chunk of a byte stream.
+
+        Frames can span several calls. The closing flag of an invalid frame is used as the opening flag of the next
+        one, bytes between a valid frame and the next flag are dropped.
 
-    def _crc_iteration(self, crc, b):
-        return (crc >> 8) ^ self.FCS16TAB[((crc ^ (ord(b))) & 0xff)]
+        :returns: list of the frames completed by in_buf, dehdlcified
+        """
+        in_buf = _to_str(in_buf)
+        flag = self.HDLC_FLAG
+        frames = []
+        pos = 0
+        length = len(in_buf)
+
+        while pos < length:
+            if not self.receiving:
+                if self.hdlc_flag:
+                    # skip repeated hdlc flags
+                    while pos < length and in_buf[pos] == flag:
+                        pos += 1
+                    if pos == length:
+                        break
+
+                    # start of frame
+                    self.receiving = True
+                    self.hdlc_flag = False
+                    self.rx_buf = flag
+                else:
+                    # drop garbage up to the next hdlc flag
+                    end = in_buf.find(flag, pos)
+                    if end < 0:
+                        break
+                    self.hdlc_flag = True
+                    pos = end + 1
+            else:
+                end = in_buf.find(flag, pos)
+                if end < 0:
+                    # middle of frame
+                    self.rx_buf += in_buf[pos:]
+                    break
+
+                # end of frame
+                self.rx_buf += in_buf[pos:end + 1]
+                pos = end + 1
+                self.receiving = False
+                self.hdlc_flag = True
+
+                try:
+                    frames.append(self.dehdlcify(self.rx_buf))
+                except HdlcException as err:
+                    self.num_invalid_frames += 1
+                    log.warning('invalid frame: {0} {1}'.format(format_string_buf(self.rx_buf), err))
+                else:
+                    # discard the closing flag of a valid frame
+                    self.hdlc_flag = False
+
+        return frames
@@ -26,6 +26,8 @@ log.addHandler(logging.NullHandler())
 # ============================ class ===================================
 
 class SerialMoteProbe(MoteProbe):
+    MAX_READ_SIZE = 4096
+
     def __init__(self, port, baudrate):
         self._port = port
         self._baudrate = baudrate
@@ -93,9 +95,12 @@ class SerialMoteProbe(MoteProbe):
         while bytes_written != len(bytearray(hdlc_data)):
             bytes_written += self._serial.write(hdlc_data)
 
-    def _rcv_data(self, rx_bytes=1):
+    def _rcv_data(self, rx_bytes=None):
+        """ Reads all the bytes waiting in the serial pipe, blocks up to the serial timeout for at least one byte. """
+        if rx_bytes is None:
+            rx_bytes = min(max(self._serial.in_waiting, 1), self.MAX_READ_SIZE)
         data = self._serial.read(rx_bytes)
-        if data == 0:
+        if not data:
             raise MoteProbeNoData
         else:
             return data
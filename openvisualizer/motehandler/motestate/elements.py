@@ -1,3 +1,5 @@
+import collections
+import itertools
 import json
 import time
 from abc import ABCMeta
@@ -7,21 +9,49 @@ from openvisualizer.motehandler.motestate.opentype import TypeAsn, OpenType, Typ
 
 
 class StateElem(object):
-    """ Abstract superclass for internal mote state classes. """
+    """
+    Abstract superclass for internal mote state classes.
+
+    Every update gives the element a new version, taken from sequence. MoteState shares one sequence between its
+    elements, so that a client knowing the version it last saw can tell which elements changed since.
+
+    The JSON dumps, and the dictionaries they are built from, are cached until the next update. The state must only
+    change in update(), and an element must not be dumped while it is updated: MoteState does both under its state
+    lock.
+
+    The meta 'updateRate' counts the updates over the last RATE_WINDOW seconds, it decays when the updates stop: the
+    updates which left the window are dropped on every update and dump.
+    """
     __metaclass__ = ABCMeta
 
+    sequence = itertools.count(1)
+
+    # sliding window over which meta 'updateRate' is measured
+    RATE_WINDOW = 10  # seconds
+
     def __init__(self):
         self.meta = [{}]
         self.data = []
+        self.version = 0
+        self.json_cache = {}
+        self.dict_cache = (None, None)
+
+        self.update_times = collections.deque()
 
         self.meta[0]['numUpdates'] = 0
         self.meta[0]['lastUpdated'] = None
+        self.meta[0]['updateRate'] = 0.0
 
     # ======================== public ==========================================
 
     def update(self):
-        self.meta[0]['lastUpdated'] = time.time()
+        now = time.time()
+        self.meta[0]['lastUpdated'] = now
         self.meta[0]['numUpdates'] += 1
+        self.version = next(self.sequence)
+
+        self.update_times.append(now)
+        self._refresh_rate(now)
 
     def to_json(self, aspect='all', is_pretty_print=False):
         """
@@ -41,6 +71,15 @@ class StateElem(object):
                 is a list of the selected aspect's content.
         """
 
+        if self._refresh_rate(time.time()):
+            self.json_cache = {}
+            self.dict_cache = (None, None)
+
+        key = (aspect, bool(is_pretty_print))
+        (version, dump) = self.json_cache.get(key, (None, None))
+        if version == self.version:
+            return dump
+
         if aspect == 'all':
             content = self._to_dict()
         elif aspect == 'data':
@@ -50,15 +89,34 @@ class StateElem(object):
         else:
             raise ValueError('No aspect named {0}'.format(aspect))
 
-        return json.dumps(content, sort_keys=bool(is_pretty_print), indent=4 if is_pretty_print else None)
+        dump = json.dumps(content, sort_keys=bool(is_pretty_print), indent=4 if is_pretty_print else None)
+        self.json_cache[key] = (self.version, dump)
+        return dump
 
     def __str__(self):
         return self.to_json(is_pretty_print=True)
 
     # ======================== private =========================================
 
+    def _refresh_rate(self, now):
+        """ Drops the updates which left the rate window, returns whether meta 'updateRate' changed. """
+        while self.update_times and self.update_times[0] <= now - self.RATE_WINDOW:
+            self.update_times.popleft()
+
+        rate = len(self.update_times) / float(self.RATE_WINDOW)
+        if rate == self.meta[0]['updateRate']:
+            return False
+        self.meta[0]['updateRate'] = rate
+        return True
+
     def _to_dict(self):
+        # cached as well, a table only converts its updated rows
+        (version, return_val) = self.dict_cache
+        if version == self.version:
+            return return_val
+
         return_val = {'meta': StateElem._elem_to_dict(self.meta), 'data': StateElem._elem_to_dict(self.data)}
+        self.dict_cache = (self.version, return_val)
         return return_val
 
     @classmethod
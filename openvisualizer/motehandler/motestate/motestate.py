@@ -9,8 +9,10 @@ structure the mote data. Contained classes inherit from the abstract
 StateElem class.
 """
 
+import itertools
 import logging
 import threading
+import time
 
 from openvisualizer.eventbus.eventbusclient import EventBusClient
 from openvisualizer.motehandler.moteconnector.openparser import parserstatus
@@ -197,35 +199,31 @@ class MoteState(EventBusClient):
         self.state[self.ST_MYDAGRANK] = StateMyDagRank()
         self.state[self.ST_KAPERIOD] = StateKaPeriod()
 
-        self.notif_handlers = {
-            self.parser_status.named_tuple[self.ST_OUPUTBUFFER]:
-                self.state[self.ST_OUPUTBUFFER].update,
-            self.parser_status.named_tuple[self.ST_ASN]:
-                self.state[self.ST_ASN].update,
-            self.parser_status.named_tuple[self.ST_MACSTATS]:
-                self.state[self.ST_MACSTATS].update,
-            self.parser_status.named_tuple[self.ST_SCHEDULEROW]:
-                self.state[self.ST_SCHEDULE].update,
-            self.parser_status.named_tuple[self.ST_BACKOFF]:
-                self.state[self.ST_BACKOFF].update,
-            self.parser_status.named_tuple[self.ST_QUEUEROW]:
-                self.state[self.ST_QUEUE].update,
-            self.parser_status.named_tuple[self.ST_NEIGHBORSROW]:
-                self.state[self.ST_NEIGHBORS].update,
-            self.parser_status.named_tuple[self.ST_ISSYNC]:
-                self.state[self.ST_ISSYNC].update,
-            self.parser_status.named_tuple[self.ST_IDMANAGER]:
-                self.state[self.ST_IDMANAGER].update,
-            self.parser_status.named_tuple[self.ST_MYDAGRANK]:
-                self.state[self.ST_MYDAGRANK].update,
-            self.parser_status.named_tuple[self.ST_KAPERIOD]:
-                self.state[self.ST_KAPERIOD].update,
-            self.parser_status.named_tuple[self.ST_JOINED]:
-                self.state[self.ST_JOINED].update,
-            self.parser_status.named_tuple[self.ST_MSF]:
-                self.state[self.ST_MSF].update,
-
-        }
+        # the versions of the elements of a mote are taken from a single sequence
+        self.sequence = itertools.count(1)
+        for elem in self.state.values():
+            elem.sequence = self.sequence
+        self.state_changed = threading.Condition(self.state_lock)
+
+        # the notifications are routed on the fields of their named tuple, the parser of the mote connector creates
+        # its own named tuple classes
+        self.notif_handlers = {}
+        for (name, elem_name) in [
+            (self.ST_OUPUTBUFFER, self.ST_OUPUTBUFFER),
+            (self.ST_ASN, self.ST_ASN),
+            (self.ST_MACSTATS, self.ST_MACSTATS),
+            (self.ST_SCHEDULEROW, self.ST_SCHEDULE),
+            (self.ST_BACKOFF, self.ST_BACKOFF),
+            (self.ST_QUEUEROW, self.ST_QUEUE),
+            (self.ST_NEIGHBORSROW, self.ST_NEIGHBORS),
+            (self.ST_ISSYNC, self.ST_ISSYNC),
+            (self.ST_IDMANAGER, self.ST_IDMANAGER),
+            (self.ST_MYDAGRANK, self.ST_MYDAGRANK),
+            (self.ST_KAPERIOD, self.ST_KAPERIOD),
+            (self.ST_JOINED, self.ST_JOINED),
+            (self.ST_MSF, self.ST_MSF),
+        ]:
+            self.notif_handlers[self.parser_status.named_tuple[name]._fields] = self.state[elem_name].update
 
         self.mote_connector.received_status_notif = self._received_status_notif
 
@@ -260,6 +258,30 @@ class MoteState(EventBusClient):
 
         return return_val
 
+    def get_changes(self, since=None):
+        """
+        Returns the data of the state elements updated after a version.
+
+        :param since: version returned by a previous call, None for all the elements
+        :returns: tuple (version, changes), version being the latest version of the elements and changes a dictionary
+                  from element name to the JSON of its data
+        """
+        with self.state_lock:
+            return self._get_changes(since)
+
+    def wait_changes(self, since=None, timeout=None):
+        """ Same as get_changes(), but first waits up to timeout seconds for an element to be updated after since. """
+        with self.state_lock:
+            if since is not None and timeout:
+                deadline = time.time() + timeout
+                while self._get_version() == since:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        break
+                    self.state_changed.wait(remaining)
+
+            return self._get_changes(since)
+
     def trigger_action(self, action):
 
         # dispatch
@@ -272,20 +294,32 @@ class MoteState(EventBusClient):
 
     def _received_status_notif(self, data):
         # log
-        log.debug("received {0}".format(data))
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("received {0}".format(data))
+
+        try:
+            handler = self.notif_handlers[data._fields]
+        except KeyError:
+            raise SystemError("No handler for data {0}".format(data))
 
         # lock the state data
         with self.state_lock:
             # call handler
-            found = False
-            for k, v in self.notif_handlers.items():
-                if self._is_namedtuple_instance(data, k):
-                    found = True
-                    v(data)
-                    break
-
-        if not found:
-            raise SystemError("No handler for data {0}".format(data))
+            handler(data)
+            self.state_changed.notify_all()
+
+    def _get_version(self):
+        return max(elem.version for elem in self.state.values())
+
+    def _get_changes(self, since):
+        version = self._get_version()
+        # a version from the future comes from a client of a previous run, it gets all the elements
+        if since is None or since > version:
+            since = -1
+
+        changes = {}
+        for (name, elem) in self.state.items():
+            if elem.version > since:
+                changes[name] = elem.to_json('data')
 
-    def _is_namedtuple_instance(self, var, tuple_instance):
-        return var._fields == tuple_instance._fields
+        return version, changes
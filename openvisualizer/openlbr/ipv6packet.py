@@ -0,0 +1,75 @@
+# Copyright (c) 2010-2013, Regents of the University of California.
+# All rights reserved.
+#
+# Released under the BSD 3-Clause license as published at the link below.
+# https://openwsn.atlassian.net/wiki/display/OW/License
+
+# ============================ classes =========================================
+
+class Ipv6Packet(object):
+    """
+    IPv6 packet held in a bytearray, see http://tools.ietf.org/html/rfc2460#page-4.
+
+    The fields of the header are decoded from the buffer when they are read, the addresses are returned as bytearrays
+    and the payload as a memoryview on the buffer, which is not copied.
+    """
+
+    HEADER_LEN = 40
+
+    __slots__ = ['buf']
+
+    def __init__(self, buf):
+        """
+        :param buf: the packet, a bytearray is used as is, any other buffer or list of bytes is copied
+
+        :raises: ValueError when the buffer is too small for an IPv6 header, or is not an IPv6 packet
+        """
+
+        self.buf = buf if isinstance(buf, bytearray) else bytearray(buf)
+
+        if len(self.buf) < self.HEADER_LEN:
+            raise ValueError('Packet too small ({0} bytes) no space for IPv6 header'.format(len(self.buf)))
+
+        if self.version != 6:
+            raise ValueError('Not an IPv6 packet, version=={0}'.format(self.version))
+
+    def __len__(self):
+        return len(self.buf)
+
+    # ======================== public ==========================================
+
+    @property
+    def version(self):
+        return self.buf[0] >> 4
+
+    @property
+    def traffic_class(self):
+        return ((self.buf[0] & 0x0F) << 4) + (self.buf[1] >> 4)
+
+    @property
+    def flow_label(self):
+        return ((self.buf[1] & 0x0F) << 16) + (self.buf[2] << 8) + self.buf[3]
+
+    @property
+    def payload_length(self):
+        return (self.buf[4] << 8) + self.buf[5]
+
+    @property
+    def next_header(self):
+        return self.buf[6]
+
+    @property
+    def hop_limit(self):
+        return self.buf[7]
+
+    @property
+    def src_addr(self):
+        return self.buf[8:24]
+
+    @property
+    def dst_addr(self):
+        return self.buf[24:40]
+
+    @property
+    def payload(self):
+        return memoryview(self.buf)[self.HEADER_LEN:]
@@ -6,10 +6,11 @@
 
 import logging
 import threading
-import time
 
 from openvisualizer.eventbus.eventbusclient import EventBusClient
+from openvisualizer.openlbr.ipv6packet import Ipv6Packet
 from openvisualizer.openlbr.sixlowpan_frag import Fragmentor
+from openvisualizer.openlbr.txscheduler import TxScheduler
 from openvisualizer.opentun.opentun import OpenTun
 from openvisualizer.utils import format_ipv6_addr, buf2int, calculate_pseudo_header_crc, format_addr, format_buf
 
@@ -102,6 +103,13 @@ class OpenLbr(EventBusClient):
     IPHC_DAM_16B = 2
     IPHC_DAM_ELIDED = 3
 
+    # inline bytes of the traffic class and flow label, and hop limit, per TF and HLIM
+    IPHC_TF_LENGTHS = [4, 3, 1, 0]
+    IPHC_HLIM_VALUES = [None, 1, 64, 255]
+
+    # IID of the 16 bits addresses, see https://tools.ietf.org/html/rfc6282#section-3.2.2
+    IPHC_IID_16B = [0x00, 0x00, 0x00, 0xff, 0xfe, 0x00]
+
     NHC_DISPATCH = 0x0E
 
     NHC_EID_MASK = 0x0E
@@ -128,6 +136,9 @@ class OpenLbr(EventBusClient):
 
     MASK_LENGTH_6LoRH_IPINIP = 0x1F
 
+    # bytes per hop of the RH3 6LoRHs, per type
+    RH3_HOP_LENGTHS = [1, 2, 4, 8, 16]
+
     # === rpl source routing header (RFC6554)
     SR_FIR_TYPE = 0x03
 
@@ -149,7 +160,10 @@ class OpenLbr(EventBusClient):
     # === Errors
     ERR_DESTINATIONUNREACHABLE = 1
 
-    def __init__(self, use_page_zero):
+    # maximum number of flows whose 6LoWPAN header is kept compiled, an arbitrary one is dropped beyond
+    MAX_COMPILED_FLOWS = 256
+
+    def __init__(self, use_page_zero, tx_rate=TxScheduler.TX_RATE, tx_burst=TxScheduler.TX_BURST):
 
         # log
         log.info("create instance")
@@ -160,6 +174,15 @@ class OpenLbr(EventBusClient):
         self.dagRootEui64 = None
         self.use_page_zero = use_page_zero
         self.fragmentor = Fragmentor()
+        # the fragments of all the flows go out through the single DAG root, they share its pacing
+        self.tx_scheduler = TxScheduler(send=self._send_to_mesh, rate=tx_rate, burst=tx_burst)
+        self.lowpan_headers = {}  # flow -> compiled 6LoWPAN header
+        self.iphc_layouts = self._compile_iphc_layouts(None, None)
+        self.stats = {
+            'hits': 0,
+            'misses': 0,
+            'invalidations': 0,
+        }
 
         # initialize parent class
         super(OpenLbr, self).__init__(
@@ -193,6 +216,18 @@ class OpenLbr(EventBusClient):
 
     # ======================== public ==========================================
 
+    def close(self):
+        self.detach()
+        self.tx_scheduler.close()
+
+    def get_stats(self):
+        """ Returns the hits and misses of the compiled 6LoWPAN headers, the number of flows and of invalidations. """
+
+        with self.state_lock:
+            stats = dict(self.stats)
+            stats['flows'] = len(self.lowpan_headers)
+        return stats
+
     # ======================== private =========================================
 
     # ===== IPv6 -> 6LoWPAN
@@ -204,38 +239,39 @@ class OpenLbr(EventBusClient):
         This function assumes there is a component listening on the EventBus
         which answers to the 'getSourceRoute' signal.
 
-        This function dispatches the 6LoWPAN packet with signal 'bytesToMesh'.
+        This function queues the fragments of the 6LoWPAN packet, the TxScheduler dispatches them with signal
+        'bytesToMesh'.
         """
 
         try:
-            ipv6_bytes = data
-            
-            # turn raw byte into dictionary of fields
-            ipv6 = self.disassemble_ipv6(ipv6_bytes)
+            # wrap the raw bytes, the fields are decoded on demand
+            ipv6 = self.disassemble_ipv6(data)
+            ipv6_dst = ipv6.dst_addr
 
             # filter out multicast packets
-            if ipv6['dst_addr'][0] == 0xff:
+            if ipv6_dst[0] == 0xff:
                 return
 
-            if ipv6['dst_addr'][0] == 0xfe and ipv6['dst_addr'][1] == 0x80:
+            if ipv6_dst[0] == 0xfe and ipv6_dst[1] == 0x80:
                 is_link_local = True
             else:
                 is_link_local = False
 
-            log.verbose("v6tomesh: {0}:{1}:{2}".format(sender, data, ipv6['dst_addr'][0]))
+            if log.isEnabledFor(logging.VERBOSE):
+                log.verbose("v6tomesh: {0}:{1}:{2}".format(sender, list(ipv6.buf), ipv6_dst[0]))
 
             # log
             if log.isEnabledFor(logging.DEBUG):
-                log.debug(self._format_ipv6(ipv6, ipv6_bytes))
+                log.debug(self._format_ipv6(ipv6, ipv6.buf))
 
             # convert IPv6 dictionary into 6LoWPAN dictionary
             lowpan = self.ipv6_to_lowpan(ipv6)
 
             # add the source route to this destination
             if len(lowpan['dst_addr']) == 16:
-                dst_addr = lowpan['dst_addr'][8:]
+                dst_addr = list(lowpan['dst_addr'][8:])
             elif len(lowpan['dst_addr']) == 8:
-                dst_addr = lowpan['dst_addr']
+                dst_addr = list(lowpan['dst_addr'])
             else:
                 dst_addr = None
                 log.warning('unsupported address format {0}'.format(lowpan['dst_addr']))
@@ -260,34 +296,36 @@ class OpenLbr(EventBusClient):
 
             # turn dictionary of fields into raw bytes
             lowpan_bytes = self.reassemble_lowpan(lowpan)
-            
-            
-            log.verbose("lowpanbytes {0}".format(lowpan_bytes))
+
+            if log.isEnabledFor(logging.VERBOSE):
+                log.verbose("lowpanbytes {0}".format(list(lowpan_bytes)))
 
             # log
             if log.isEnabledFor(logging.DEBUG):
                 log.debug(self._format_lowpan(lowpan, lowpan_bytes))
 
             # don't forward the ICMPv6 packets to the motes (unsupported)
-            if ipv6['next_header'] == self.IANA_ICMPv6 and ipv6['payload'][0] == self.ERR_DESTINATIONUNREACHABLE:
+            if ipv6.next_header == self.IANA_ICMPv6 and \
+                    ipv6.payload[:1] == bytearray([self.ERR_DESTINATIONUNREACHABLE]):
                 log.error(
                     'ICMPv6 packet with destination {0} dropped (DESTINATIONUNREACHABLE not supported)'.format(
-                        format_ipv6_addr(ipv6['dst_addr'])))
+                        format_ipv6_addr(ipv6_dst)))
                 log.error(self._format_lowpan(lowpan, lowpan_bytes))
                 return
 
-            # dispatch fragments
-            for fragment in self.fragmentor.do_fragment(lowpan_bytes):
-                self.dispatch(
-                    signal='bytesToMesh',
-                    data=(lowpan['nextHop'], fragment),
-                )
-                time.sleep(0.01)
+            # queue fragments, they are paced by the scheduler
+            self.tx_scheduler.enqueue(lowpan['nextHop'], self.fragmentor.do_fragment(lowpan_bytes))
 
         except (ValueError, NotImplementedError) as err:
             log.error(err)
             pass
 
+    def _send_to_mesh(self, next_hop, fragment):
+        self.dispatch(
+            signal='bytesToMesh',
+            data=(next_hop, fragment),
+        )
+
     def _mesh_to_v6_notif(self, sender, signal, data):
         """
         Converts a 6LowPAN packet into a IPv6 packet.
@@ -298,7 +336,7 @@ class OpenLbr(EventBusClient):
         try:
             # reassemble if 6LoWPAN was fragmented
             address, payload = data
-            reassembled = self.fragmentor.do_reassemble(payload)
+            reassembled = self.fragmentor.do_reassemble(payload, address)
 
             if reassembled is not None:
                 data = (address, reassembled)
@@ -409,7 +447,8 @@ class OpenLbr(EventBusClient):
                     # append payload to compute crc again
                     new_udp += ipv6dic['payload'][udp_header_length:]  # data octets
 
-                    udp_len = [0, len(ipv6dic['payload'][udp_header_length:]) + 8]
+                    udp_len = len(ipv6dic['payload'][udp_header_length:]) + 8
+                    udp_len = [udp_len >> 8, udp_len & 0xff]
                     new_udp[idx_len] = udp_len[0]
                     new_udp[idx_len + 1] = udp_len[1]
 
@@ -483,47 +522,25 @@ class OpenLbr(EventBusClient):
 
     def disassemble_ipv6(self, ipv6):
         """
-        Turn byte array representing IPv6 packets into into dictionary
-        of fields.
+        Turn byte array representing IPv6 packets into an Ipv6Packet, whose fields are decoded when they are read.
 
         See http://tools.ietf.org/html/rfc2460#page-4.
 
-        :param ipv6: [in] Byte array representing an IPv6 packet.
+        :param ipv6: [in] Byte array representing an IPv6 packet, a bytearray is not copied.
 
         :raises: ValueError when some part of the process is not defined in
             the standard.
-        :raises: NotImplementedError when some part of the process is defined in
-            the standard, but not implemented in this module.
 
-        :returns: A dictionary of fields.
+        :returns: An Ipv6Packet.
         """
 
-        if len(ipv6) < self.IPv6_HEADER_LEN:
-            raise ValueError('Packet too small ({0} bytes) no space for IPv6 header'.format(len(ipv6)))
-
-        return_val = \
-            {
-                'version': ipv6[0] >> 4,
-                'traffic_class': ((ipv6[0] & 0x0F) << 4) + (ipv6[1] >> 4),
-                'flow_label': ((ipv6[1] & 0x0F) << 16) + (ipv6[2] << 8) + ipv6[3],
-                'payload_length': buf2int(ipv6[4:6]),
-                'next_header': ipv6[6],
-                'hop_limit': ipv6[7],
-                'src_addr': ipv6[8:8 + 16],
-                'dst_addr': ipv6[24:24 + 16],
-                'payload': ipv6[40:],
-            }
-
-        if return_val['version'] != 6:
-            raise ValueError('Not an IPv6 packet, version=={0}'.format(return_val['version']))
-
-        return return_val
+        return Ipv6Packet(ipv6)
 
     def ipv6_to_lowpan(self, ipv6):
         """
         Compact IPv6 header into 6LowPAN header.
 
-        :param ipv6: [in] A disassembled IPv6 packet.
+        :param ipv6: [in] An Ipv6Packet.
 
         :raises: ValueError when some part of the process is not defined in the standard.
         :raises: NotImplementedError when some part of the process is defined in the standard, but not implemented in
@@ -536,8 +553,8 @@ class OpenLbr(EventBusClient):
         lowpan = {}
 
         # tf
-        if ipv6['traffic_class'] != 0:
-            raise NotImplementedError('traffic_class={0} unsupported'.format(ipv6['traffic_class']))
+        if ipv6.traffic_class != 0:
+            raise NotImplementedError('traffic_class={0} unsupported'.format(ipv6.traffic_class))
         # comment the flow_label check as it's zero in 6lowpan network. See follow RFC:
         # https://tools.ietf.org/html/rfc4944#section-10.1
         # if ipv6['flow_label']!=0:
@@ -545,22 +562,22 @@ class OpenLbr(EventBusClient):
         lowpan['tf'] = []
 
         # nh
-        lowpan['nh'] = [ipv6['next_header']]
+        lowpan['nh'] = [ipv6.next_header]
 
         # hlim
-        lowpan['hlim'] = [ipv6['hop_limit']]
+        lowpan['hlim'] = [ipv6.hop_limit]
 
         # cid
         lowpan['cid'] = []
 
         # src_addr
-        lowpan['src_addr'] = ipv6['src_addr']
+        lowpan['src_addr'] = ipv6.src_addr
 
         # dst_addr
-        lowpan['dst_addr'] = ipv6['dst_addr']
+        lowpan['dst_addr'] = ipv6.dst_addr
 
         # payload
-        lowpan['payload'] = ipv6['payload']
+        lowpan['payload'] = ipv6.payload
 
         # join
         return lowpan
@@ -569,16 +586,54 @@ class OpenLbr(EventBusClient):
         """
         Turn dictionary of 6LoWPAN header fields into byte array.
 
+        The header of a flow is compiled once, by _compile_lowpan_header(), and kept until the network prefix or the
+        DAG root change. A flow is identified by the fields the header is built from: the addresses, the next header,
+        the hop limit and the source route.
+
         :param lowpan: [in] dictionary of fields representing a 6LoWPAN header.
 
-        :returns: A list of bytes representing the 6LoWPAN packet.
+        :returns: A bytearray representing the 6LoWPAN packet.
         """
-        return_val = []
 
         if self.use_page_zero:
             print 'Page dispatch page number zero is not supported!\n'
             raise SystemError()
 
+        flow = (
+            str(bytearray(lowpan['src_addr'])),
+            str(bytearray(lowpan['dst_addr'])),
+            tuple(lowpan['nh']),
+            tuple(lowpan['hlim']),
+            tuple(lowpan['tf']),
+            tuple(lowpan['cid']),
+            tuple(map(tuple, lowpan['route'])),
+        )
+
+        with self.state_lock:
+            header = self.lowpan_headers.get(flow)
+            if header is None:
+                self.stats['misses'] += 1
+                header = self._compile_lowpan_header(lowpan)
+                if len(self.lowpan_headers) >= self.MAX_COMPILED_FLOWS:
+                    self.lowpan_headers.popitem()
+                self.lowpan_headers[flow] = header
+            else:
+                self.stats['hits'] += 1
+
+        return_val = bytearray(header)
+        return_val.extend(lowpan['payload'])
+        return return_val
+
+    def _compile_lowpan_header(self, lowpan):
+        """
+        Compresses the headers of a 6LoWPAN dictionary, see reassemble_lowpan().
+
+        :param lowpan: [in] dictionary of fields representing a 6LoWPAN header, it is not modified.
+
+        :returns: A bytearray with the 6LoWPAN header, the payload follows it.
+        """
+        return_val = bytearray()
+
         # the 6lowpan packet contains 4 parts
         # 1. Page Dispatch (page 1)
         # 2. RH3 6LoRH(s)
@@ -588,12 +643,22 @@ class OpenLbr(EventBusClient):
 
         # ===================== 1. Page Dispatch (page 1) =====================
 
-        return_val += [self.PAGE_ONE_DISPATCH]
+        return_val.append(self.PAGE_ONE_DISPATCH)
+
+        # compare the addresses as bytearrays, whatever the type of the fields
+        src_addr = bytearray(lowpan['src_addr'])
+        dst_addr = bytearray(lowpan['dst_addr'])
+        hlim = list(lowpan['hlim'])
+        tun_prefix = bytearray(OpenTun.IPV6PREFIX)
+        tun_addr = tun_prefix + bytearray(OpenTun.IPV6HOST)
+
+        # the stateful compression uses the context 0 of the motes, the network prefix
+        context_prefix = bytearray(self.network_prefix) if self.network_prefix is not None else tun_prefix
 
-        if lowpan['src_addr'][:8] != OpenTun.IPV6PREFIX:
-            compress_reference = OpenTun.IPV6PREFIX + OpenTun.IPV6HOST
+        if src_addr[:8] != tun_prefix:
+            compress_reference = tun_addr
         else:
-            compress_reference = lowpan['src_addr']
+            compress_reference = src_addr
 
         # destination address
         if len(lowpan['route']) > 1:
@@ -604,31 +669,32 @@ class OpenLbr(EventBusClient):
             # =======================3. RH3 6LoRH(s) ==============================
             size_unit_type = 0xff
             size = 0
-            hop_list = []
+            hop_list = bytearray()
 
-            for hop in list(reversed(lowpan['route'][1:])):
+            for hop in reversed(lowpan['route'][1:]):
+                hop = bytearray(hop)
                 size += 1
                 if compress_reference[-8:-1] == hop[-8:-1]:
                     if size_unit_type != 0xff:
                         if size_unit_type != self.TYPE_6LoRH_RH3_0:
-                            return_val += [self.CRITICAL_6LoRH | (size - 2), size_unit_type]
-                            return_val += hop_list
+                            return_val.extend([self.CRITICAL_6LoRH | (size - 2), size_unit_type])
+                            return_val.extend(hop_list)
                             size = 1
                             size_unit_type = self.TYPE_6LoRH_RH3_0
-                            hop_list = [hop[-1]]
+                            hop_list = hop[-1:]
                             compress_reference = hop
                         else:
-                            hop_list += [hop[-1]]
+                            hop_list.append(hop[-1])
                             compress_reference = hop
                     else:
                         size_unit_type = self.TYPE_6LoRH_RH3_0
-                        hop_list += [hop[-1]]
+                        hop_list.append(hop[-1])
                         compress_reference = hop
                 elif compress_reference[-8:-2] == hop[-8:-2]:
                     if size_unit_type != 0xff:
                         if size_unit_type != self.TYPE_6LoRH_RH3_1:
-                            return_val += [self.CRITICAL_6LoRH | (size - 2), size_unit_type]
-                            return_val += hop_list
+                            return_val.extend([self.CRITICAL_6LoRH | (size - 2), size_unit_type])
+                            return_val.extend(hop_list)
                             size = 1
                             size_unit_type = self.TYPE_6LoRH_RH3_1
                             hop_list = hop[-2:]
@@ -643,8 +709,8 @@ class OpenLbr(EventBusClient):
                 elif compress_reference[-8:-4] == hop[-8:-4]:
                     if size_unit_type != 0xff:
                         if size_unit_type != self.TYPE_6LoRH_RH3_2:
-                            return_val += [self.CRITICAL_6LoRH | (size - 2), size_unit_type]
-                            return_val += hop_list
+                            return_val.extend([self.CRITICAL_6LoRH | (size - 2), size_unit_type])
+                            return_val.extend(hop_list)
                             size = 1
                             size_unit_type = self.TYPE_6LoRH_RH3_2
                             hop_list = hop[-4:]
@@ -659,11 +725,11 @@ class OpenLbr(EventBusClient):
                 else:
                     if size_unit_type != 0xff:
                         if size_unit_type != self.TYPE_6LoRH_RH3_3:
-                            return_val += [self.CRITICAL_6LoRH | (size - 2), size_unit_type]
-                            return_val += hop_list
+                            return_val.extend([self.CRITICAL_6LoRH | (size - 2), size_unit_type])
+                            return_val.extend(hop_list)
                             size = 1
                             size_unit_type = self.TYPE_6LoRH_RH3_3
-                            hop_list = hop
+                            hop_list = bytearray(hop)
                             compress_reference = hop
                         else:
                             hop_list += hop
@@ -673,25 +739,25 @@ class OpenLbr(EventBusClient):
                         hop_list += hop
                         compress_reference = hop
 
-            return_val += [self.CRITICAL_6LoRH | (size - 1), size_unit_type]
-            return_val += hop_list
+            return_val.extend([self.CRITICAL_6LoRH | (size - 1), size_unit_type])
+            return_val.extend(hop_list)
 
         # ===================== 2. IPinIP 6LoRH ===============================
 
-        if lowpan['src_addr'][:8] != lowpan['dst_addr'][:8]:
+        if src_addr[:8] != dst_addr[:8]:
             # add RPI
             # TBD
             flag = self.O_FLAG | self.I_FLAG | self.K_FLAG
             sender_rank = 0  # rank of dagroot
-            return_val += [self.CRITICAL_6LoRH | flag, self.TYPE_6LoRH_RPI, sender_rank]
+            return_val.extend([self.CRITICAL_6LoRH | flag, self.TYPE_6LoRH_RPI, sender_rank])
             # ip in ip 6lorh
             length = 1
-            return_val += [self.ELECTIVE_6LoRH | length, self.TYPE_6LoRH_IP_IN_IP]
-            return_val += lowpan['hlim']
+            return_val.extend([self.ELECTIVE_6LoRH | length, self.TYPE_6LoRH_IP_IN_IP])
+            return_val.extend(hlim)
 
-            compress_reference = OpenTun.IPV6PREFIX + OpenTun.IPV6HOST
+            compress_reference = tun_addr
         else:
-            compress_reference = lowpan['src_addr']
+            compress_reference = src_addr
 
         # ========================= 4. IPHC inner header ======================
         # Byte1: 011(3b) TF(2b) NH(1b) HLIM(2b)
@@ -701,18 +767,18 @@ class OpenLbr(EventBusClient):
             raise NotImplementedError()
         # next header is in NHC format
         nh = self.IPHC_NH_INLINE
-        if lowpan['hlim'][0] == 1:
-            hlim = self.IPHC_HLIM_1
-            lowpan['hlim'] = []
-        elif lowpan['hlim'][0] == 64:
-            hlim = self.IPHC_HLIM_64
-            lowpan['hlim'] = []
-        elif lowpan['hlim'][0] == 255:
-            hlim = self.IPHC_HLIM_255
-            lowpan['hlim'] = []
+        if hlim[0] == 1:
+            hlim_mode = self.IPHC_HLIM_1
+            hlim = []
+        elif hlim[0] == 64:
+            hlim_mode = self.IPHC_HLIM_64
+            hlim = []
+        elif hlim[0] == 255:
+            hlim_mode = self.IPHC_HLIM_255
+            hlim = []
         else:
-            hlim = self.IPHC_HLIM_INLINE
-        return_val += [(self.IPHC_DISPATCH << 5) + (tf << 3) + (nh << 2) + (hlim << 0)]
+            hlim_mode = self.IPHC_HLIM_INLINE
+        return_val.append((self.IPHC_DISPATCH << 5) + (tf << 3) + (nh << 2) + (hlim_mode << 0))
 
         # Byte2: CID(1b) SAC(1b) SAM(2b) M(1b) DAC(2b) DAM(2b)
         if len(lowpan['cid']) == 0:
@@ -720,71 +786,68 @@ class OpenLbr(EventBusClient):
         else:
             cid = self.IPHC_CID_YES
 
-        if self._is_link_local(lowpan['src_addr']):
+        if self._is_link_local(src_addr):
             sac = self.IPHC_SAC_STATELESS
-            lowpan['src_addr'] = lowpan['src_addr'][8:]
+            src_addr = src_addr[8:]
         else:
-            if lowpan['src_addr'][:8] == OpenTun.IPV6PREFIX:
+            if src_addr[:8] == context_prefix:
                 sac = self.IPHC_SAC_STATEFUL
-                lowpan['src_addr'] = lowpan['src_addr'][8:]
+                src_addr = src_addr[8:]
             else:
                 sac = self.IPHC_SAC_STATELESS
 
-        if len(lowpan['src_addr']) == 128 / 8:
+        if len(src_addr) == 128 / 8:
             sam = self.IPHC_SAM_128B
-        elif len(lowpan['src_addr']) == 64 / 8:
+        elif len(src_addr) == 64 / 8:
             sam = self.IPHC_SAM_64B
-        elif len(lowpan['src_addr']) == 16 / 8:
+        elif len(src_addr) == 16 / 8:
             sam = self.IPHC_SAM_16B
-        elif len(lowpan['src_addr']) == 0:
+        elif len(src_addr) == 0:
             sam = self.IPHC_SAM_ELIDED
         else:
             raise SystemError()
 
-        if self._is_link_local(lowpan['dst_addr']):
+        if self._is_link_local(dst_addr):
             dac = self.IPHC_DAC_STATELESS
-            lowpan['dst_addr'] = lowpan['dst_addr'][8:]
+            dst_addr = dst_addr[8:]
         else:
 
-            if lowpan['dst_addr'][:8] == OpenTun.IPV6PREFIX:
+            if dst_addr[:8] == context_prefix:
                 dac = self.IPHC_DAC_STATEFUL
-                lowpan['dst_addr'] = lowpan['dst_addr'][8:]
+                dst_addr = dst_addr[8:]
             else:
                 dac = self.IPHC_DAC_STATELESS
 
         m = self.IPHC_M_NO
-        if len(lowpan['dst_addr']) == 128 / 8:
+        if len(dst_addr) == 128 / 8:
             dam = self.IPHC_DAM_128B
-        elif len(lowpan['dst_addr']) == 64 / 8:
+        elif len(dst_addr) == 64 / 8:
             dam = self.IPHC_DAM_64B
-        elif len(lowpan['dst_addr']) == 16 / 8:
+        elif len(dst_addr) == 16 / 8:
             dam = self.IPHC_DAM_16B
-        elif len(lowpan['dst_addr']) == 0:
+        elif len(dst_addr) == 0:
             dam = self.IPHC_DAM_ELIDED
         else:
             raise SystemError()
-        return_val += [(cid << 7) + (sac << 6) + (sam << 4) + (m << 3) + (dac << 2) + (dam << 0)]
+        return_val.append((cid << 7) + (sac << 6) + (sam << 4) + (m << 3) + (dac << 2) + (dam << 0))
 
         # tf
-        return_val += lowpan['tf']
+        return_val.extend(lowpan['tf'])
 
         # nh
-        return_val += lowpan['nh']
+        return_val.extend(lowpan['nh'])
 
         # hlim
-        return_val += lowpan['hlim']
+        return_val.extend(hlim)
 
         # cid
-        return_val += lowpan['cid']
+        return_val.extend(lowpan['cid'])
 
         # src_addr
-        return_val += lowpan['src_addr']
+        return_val.extend(src_addr)
 
         # dst_addr
-        return_val += lowpan['dst_addr']
-
-        # payload
-        return_val += lowpan['payload']
+        return_val.extend(dst_addr)
 
         return return_val
 
@@ -798,6 +861,11 @@ class OpenLbr(EventBusClient):
 
         if pkt_lowpan[0] == self.PAGE_ONE_DISPATCH:
             ptr = 1
+            # skip the RH3 6LoRHs, the source route ends here
+            while pkt_lowpan[ptr] & self.MASK_6LoRH == self.CRITICAL_6LoRH and \
+                    pkt_lowpan[ptr + 1] <= self.TYPE_6LoRH_RH3_4:
+                ptr += 2 + ((pkt_lowpan[ptr] & 0x1f) + 1) * self.RH3_HOP_LENGTHS[pkt_lowpan[ptr + 1]]
+
             if pkt_lowpan[ptr] & self.MASK_6LoRH == self.CRITICAL_6LoRH and pkt_lowpan[ptr + 1] == self.TYPE_6LoRH_RPI:
                 # next header is RPI (hop by hop)
                 pkt_ipv6['next_header'] = self.IANA_IPv6HOPHEADER
@@ -879,159 +947,155 @@ class OpenLbr(EventBusClient):
                         print output
 
                     ptr += length + 1
+            elif (pkt_lowpan[ptr] >> 5) == self.IPHC_DISPATCH:
+                ptr = self._decompress_iphc(pkt_lowpan, ptr, mac_prev_hop, pkt_ipv6)
             else:
                 log.error("ERROR no support this type of 6LoRH yet")
         else:
-            ptr = 2
-            if (pkt_lowpan[0] >> 5) != 0x03:
+            if (pkt_lowpan[0] >> 5) != self.IPHC_DISPATCH:
                 log.error("ERROR not a 6LowPAN packet")
                 return
 
-            # tf
-            tf = ((pkt_lowpan[0]) >> 3) & 0x03
-            if tf == self.IPHC_TF_3B:
-                pkt_ipv6['flow_label'] = ((pkt_lowpan[ptr]) << 16) + ((pkt_lowpan[ptr + 1]) << 8) + (
-                        (pkt_lowpan[ptr + 2]) << 0)
-                ptr = ptr + 3
-            elif tf == self.IPHC_TF_ELIDED:
-                pkt_ipv6['flow_label'] = 0
-            else:
-                log.error("Unsupported or wrong tf")
-            # nh
-            nh = ((pkt_lowpan[0]) >> 2) & 0x01
-            if nh == self.IPHC_NH_INLINE:
-                pkt_ipv6['next_header'] = (pkt_lowpan[ptr])
-                ptr = ptr + 1
-            elif nh == self.IPHC_NH_COMPRESSED:
-                # the next header will be retrieved later
-                pass
-            else:
-                log.error("wrong nh field nh=" + str(nh))
-
-            # hlim
-            hlim = (pkt_lowpan[0]) & 0x03
-            if hlim == self.IPHC_HLIM_INLINE:
-                pkt_ipv6['hop_limit'] = (pkt_lowpan[ptr])
-                ptr = ptr + 1
-            elif hlim == self.IPHC_HLIM_1:
-                pkt_ipv6['hop_limit'] = 1
-            elif hlim == self.IPHC_HLIM_64:
-                pkt_ipv6['hop_limit'] = 64
-            elif hlim == self.IPHC_HLIM_255:
-                pkt_ipv6['hop_limit'] = 255
-            else:
-                log.error("wrong hlim==" + str(hlim))
-
-            # sac
-            sac = ((pkt_lowpan[1]) >> 6) & 0x01
-            if sac == self.IPHC_SAC_STATELESS:
-                prefix = self.LINK_LOCAL_PREFIX
-            elif sac == self.IPHC_SAC_STATEFUL:
-                prefix = self.network_prefix
-            else:
-                log.error("wrong sac==" + str(sac))
-                return
-
-            # sam
-            sam = ((pkt_lowpan[1]) >> 4) & 0x03
-            if sam == self.IPHC_SAM_ELIDED:
-                # pkt from the previous hop
-                pkt_ipv6['src_addr'] = prefix + mac_prev_hop
-
-            elif sam == self.IPHC_SAM_16B:
-                a1 = pkt_lowpan[ptr]
-                a2 = pkt_lowpan[ptr + 1]
-                ptr = ptr + 2
-                s = ''.join(['\x00', '\x00', '\x00', '\x00', '\x00', '\x00', a1, a2])
-                pkt_ipv6['src_addr'] = prefix + s
-
-            elif sam == self.IPHC_SAM_64B:
-                pkt_ipv6['src_addr'] = prefix + pkt_lowpan[ptr:ptr + 8]
-                ptr = ptr + 8
-            elif sam == self.IPHC_SAM_128B:
-                pkt_ipv6['src_addr'] = pkt_lowpan[ptr:ptr + 16]
-                ptr = ptr + 16
-            else:
-                log.error("wrong sam==" + str(sam))
-
-            # dac
-            dac = ((pkt_lowpan[1]) >> 2) & 0x01
-            if dac == self.IPHC_DAC_STATELESS:
-                prefix = self.LINK_LOCAL_PREFIX
-            elif dac == self.IPHC_DAC_STATEFUL:
-                prefix = self.network_prefix
-
-            # dam
-            dam = ((pkt_lowpan[1]) & 0x03)
-            if dam == self.IPHC_DAM_ELIDED:
-                if log.isEnabledFor(logging.DEBUG):
-                    log.debug("IPHC_DAM_ELIDED this packet is for the dagroot!")
-                pkt_ipv6['dst_addr'] = prefix + self.dagRootEui64
-            elif dam == self.IPHC_DAM_16B:
-                a1 = pkt_lowpan[ptr]
-                a2 = pkt_lowpan[ptr + 1]
-                ptr = ptr + 2
-                s = ''.join(['\x00', '\x00', '\x00', '\x00', '\x00', '\x00', a1, a2])
-                pkt_ipv6['dst_addr'] = prefix + s
-            elif dam == self.IPHC_DAM_64B:
-                pkt_ipv6['dst_addr'] = prefix + pkt_lowpan[ptr:ptr + 8]
-                ptr = ptr + 8
-            elif dam == self.IPHC_DAM_128B:
-                pkt_ipv6['dst_addr'] = pkt_lowpan[ptr:ptr + 16]
-                ptr = ptr + 16
-            else:
-                log.error("wrong dam==" + str(dam))
-
-            if nh == self.IPHC_NH_COMPRESSED:
-                if ((pkt_lowpan[ptr] >> 4) & 0x0f) == self.NHC_DISPATCH:
-                    eid = (pkt_lowpan[ptr] & self.NHC_EID_MASK) >> 1
-                    if eid == self.NHC_EID_HOPBYHOP:
-                        pkt_ipv6['next_header'] = self.IANA_IPv6HOPHEADER
-                    elif eid == self.NHC_EID_IPV6:
-                        pkt_ipv6['next_header'] = self.IPV6_HEADER
-                    else:
-                        log.error("wrong NH_EID==" + str(eid))
-                elif pkt_lowpan[ptr] & self.NHC_UDP_ID == self.NHC_UDP_ID:
-                    pkt_ipv6['next_header'] = self.IANA_UDP
-
-            # hop by hop header
-            # composed of NHC, NextHeader,Len + Rpl Option
-            if pkt_ipv6['next_header'] == self.IANA_IPv6HOPHEADER:
-                pkt_ipv6['hop_nhc'] = pkt_lowpan[ptr]
-                ptr = ptr + 1
-                if (pkt_ipv6['hop_nhc'] & 0x01) == 0:
-                    pkt_ipv6['hop_next_header'] = pkt_lowpan[ptr]
-                    ptr = ptr + 1
-                else:
-                    # the next header filed will be elided
-                    pass
-                pkt_ipv6['hop_hdr_len'] = pkt_lowpan[ptr]
-                ptr = ptr + 1
-                # start of rpl Option
-                pkt_ipv6['hop_optionType'] = pkt_lowpan[ptr]
-                ptr = ptr + 1
-                pkt_ipv6['hop_optionLen'] = pkt_lowpan[ptr]
-                ptr = ptr + 1
-                pkt_ipv6['hop_flags'] = pkt_lowpan[ptr]
-                ptr = ptr + 1
-                pkt_ipv6['hop_rplInstanceID'] = pkt_lowpan[ptr]
-                ptr = ptr + 1
-                pkt_ipv6['hop_senderRank'] = ((pkt_lowpan[ptr]) << 8) + ((pkt_lowpan[ptr + 1]) << 0)
-                ptr = ptr + 2
-                # end rpl option
-                if (pkt_ipv6['hop_nhc'] & 0x01) == 1:
-                    if ((pkt_lowpan[ptr] >> 1) & 0x07) == self.NHC_EID_IPV6:
-                        pkt_ipv6['hop_next_header'] = self.IPV6_HEADER
+            ptr = self._decompress_iphc(pkt_lowpan, 0, mac_prev_hop, pkt_ipv6)
 
         # payload
         pkt_ipv6['version'] = 6
-        pkt_ipv6['traffic_class'] = 0
+        pkt_ipv6.setdefault('traffic_class', 0)
         pkt_ipv6['payload'] = pkt_lowpan[ptr:len(pkt_lowpan)]
 
         pkt_ipv6['payload_length'] = len(pkt_ipv6['payload'])
         pkt_ipv6['pre_hop'] = mac_prev_hop
         return pkt_ipv6
 
+    def _decompress_iphc(self, pkt_lowpan, ptr, mac_prev_hop, pkt_ipv6):
+        """
+        Decompress the IPHC header at ptr into pkt_ipv6, see https://tools.ietf.org/html/rfc6282#section-3.1.
+
+        The addresses are built from the layouts compiled for the current context, indexed by the SAC and SAM, and the
+        M, DAC and DAM bits of the header.
+
+        :raises: ValueError when the address mode is reserved, or its context is not known yet.
+        :raises: NotImplementedError when the header uses another context than the default one.
+
+        :returns: The index of the first byte after the header.
+        """
+
+        (src_layouts, dst_layouts) = self.iphc_layouts
+        iphc0 = pkt_lowpan[ptr]
+        iphc1 = pkt_lowpan[ptr + 1]
+        ptr += 2
+
+        # cid
+        if (iphc1 >> 7) == self.IPHC_CID_YES:
+            if pkt_lowpan[ptr] != 0x00:
+                raise NotImplementedError('context identifier {0} unsupported'.format(pkt_lowpan[ptr]))
+            ptr += 1
+
+        # tf, the ECN and DSCP are carried in this order
+        tf = (iphc0 >> 3) & 0x03
+        if tf == self.IPHC_TF_ELIDED:
+            pkt_ipv6['traffic_class'] = 0
+            pkt_ipv6['flow_label'] = 0
+        else:
+            fields = pkt_lowpan[ptr:ptr + self.IPHC_TF_LENGTHS[tf]]
+            ptr += self.IPHC_TF_LENGTHS[tf]
+            if tf == self.IPHC_TF_4B:
+                ecn_dscp = fields[0]
+                pkt_ipv6['flow_label'] = ((fields[1] & 0x0f) << 16) + (fields[2] << 8) + fields[3]
+            elif tf == self.IPHC_TF_3B:
+                ecn_dscp = fields[0] & 0xc0
+                pkt_ipv6['flow_label'] = ((fields[0] & 0x0f) << 16) + (fields[1] << 8) + fields[2]
+            else:
+                ecn_dscp = fields[0]
+                pkt_ipv6['flow_label'] = 0
+            pkt_ipv6['traffic_class'] = ((ecn_dscp & 0x3f) << 2) + (ecn_dscp >> 6)
+
+        # nh
+        nh = (iphc0 >> 2) & 0x01
+        if nh == self.IPHC_NH_INLINE:
+            pkt_ipv6['next_header'] = pkt_lowpan[ptr]
+            ptr += 1
+
+        # hlim
+        hop_limit = self.IPHC_HLIM_VALUES[iphc0 & 0x03]
+        if hop_limit is None:
+            hop_limit = pkt_lowpan[ptr]
+            ptr += 1
+        pkt_ipv6['hop_limit'] = hop_limit
+
+        # src_addr and dst_addr, an elided destination is the DAG root
+        src_layout = src_layouts[(iphc1 >> 4) & 0x07]
+        dst_layout = dst_layouts[iphc1 & 0x0f]
+        if src_layout is None or dst_layout is None:
+            raise ValueError('unsupported address mode {0:#04x}, or unknown context'.format(iphc1))
+        (head, size, tail) = src_layout
+        pkt_ipv6['src_addr'] = head + pkt_lowpan[ptr:ptr + size] + (mac_prev_hop if tail is None else tail)
+        ptr += size
+        (head, size, tail) = dst_layout
+        if isinstance(tail, tuple):
+            (pkt_ipv6['dst_addr'], ptr) = self._decompress_address(dst_layout, pkt_lowpan, ptr)
+        else:
+            pkt_ipv6['dst_addr'] = head + pkt_lowpan[ptr:ptr + size] + tail
+            ptr += size
+
+        if nh == self.IPHC_NH_COMPRESSED:
+            if ((pkt_lowpan[ptr] >> 4) & 0x0f) == self.NHC_DISPATCH:
+                eid = (pkt_lowpan[ptr] & self.NHC_EID_MASK) >> 1
+                if eid == self.NHC_EID_HOPBYHOP:
+                    pkt_ipv6['next_header'] = self.IANA_IPv6HOPHEADER
+                elif eid == self.NHC_EID_IPV6:
+                    pkt_ipv6['next_header'] = self.IPV6_HEADER
+                else:
+                    log.error("wrong NH_EID==" + str(eid))
+            elif pkt_lowpan[ptr] & self.NHC_UDP_ID == self.NHC_UDP_ID:
+                pkt_ipv6['next_header'] = self.IANA_UDP
+
+        # hop by hop header
+        # composed of NHC, NextHeader,Len + Rpl Option
+        if pkt_ipv6['next_header'] == self.IANA_IPv6HOPHEADER:
+            pkt_ipv6['hop_nhc'] = pkt_lowpan[ptr]
+            ptr = ptr + 1
+            if (pkt_ipv6['hop_nhc'] & 0x01) == 0:
+                pkt_ipv6['hop_next_header'] = pkt_lowpan[ptr]
+                ptr = ptr + 1
+            else:
+                # the next header filed will be elided
+                pass
+            pkt_ipv6['hop_hdr_len'] = pkt_lowpan[ptr]
+            ptr = ptr + 1
+            # start of rpl Option
+            pkt_ipv6['hop_optionType'] = pkt_lowpan[ptr]
+            ptr = ptr + 1
+            pkt_ipv6['hop_optionLen'] = pkt_lowpan[ptr]
+            ptr = ptr + 1
+            pkt_ipv6['hop_flags'] = pkt_lowpan[ptr]
+            ptr = ptr + 1
+            pkt_ipv6['hop_rplInstanceID'] = pkt_lowpan[ptr]
+            ptr = ptr + 1
+            pkt_ipv6['hop_senderRank'] = ((pkt_lowpan[ptr]) << 8) + ((pkt_lowpan[ptr + 1]) << 0)
+            ptr = ptr + 2
+            # end rpl option
+            if (pkt_ipv6['hop_nhc'] & 0x01) == 1:
+                if ((pkt_lowpan[ptr] >> 1) & 0x07) == self.NHC_EID_IPV6:
+                    pkt_ipv6['hop_next_header'] = self.IPV6_HEADER
+
+        return ptr
+
+    def _decompress_address(self, layout, pkt_lowpan, ptr):
+        """
+        Build an address from its layout: the head, the number of bytes carried inline, then the tail, either constant
+        or another layout.
+
+        :returns: The address and the index of the byte which follows its inline part.
+        """
+
+        (head, size, tail) = layout
+        addr = head + pkt_lowpan[ptr:ptr + size]
+        ptr += size
+        if isinstance(tail, tuple):
+            (tail, ptr) = self._decompress_address(tail, pkt_lowpan, ptr)
+        return addr + tail, ptr
+
     def reassemble_ipv6_packet(self, pkt):
         pktw = [((6 << 4) + (pkt['traffic_class'] >> 4)),
                 (((pkt['traffic_class'] & 0x0F) << 4) + (pkt['flow_label'] >> 16)),
@@ -1060,6 +1124,7 @@ class OpenLbr(EventBusClient):
         """ Record the network prefix. """
         with self.state_lock:
             self.network_prefix = data
+            self._invalidate_context()
             log.info('Set network prefix  {0}'.format(format_ipv6_addr(data)))
 
     def _info_dagroot_notif(self, sender, signal, data):
@@ -1067,9 +1132,69 @@ class OpenLbr(EventBusClient):
         if data['isDAGroot'] == 1:
             with self.state_lock:
                 self.dagRootEui64 = data['eui64'][:]
+                self._invalidate_context()
+
+    def _invalidate_context(self):
+        """ Drop the compiled 6LoWPAN headers and compile the IPHC address layouts again, with state_lock held. """
+
+        self.lowpan_headers.clear()
+        self.iphc_layouts = self._compile_iphc_layouts(self.network_prefix, self.dagRootEui64)
+        self.stats['invalidations'] += 1
+
+    def _compile_iphc_layouts(self, prefix, dagroot):
+        """
+        Compile the layouts of the IPHC addresses for the network prefix, the context 0, and the DAG root, the
+        destination of the elided addresses. A layout is the head of the address, the number of bytes carried inline
+        and the tail, see _decompress_address(); the tail of an elided source is None, the link-layer address of the
+        previous hop. A layout is None when the address mode is reserved or its context is unknown.
+
+        :returns: The source layouts, indexed by SAC and SAM, and the destination layouts, indexed by M, DAC and DAM.
+        """
+
+        link_local = self.LINK_LOCAL_PREFIX
+        known = prefix is not None
+        prefix = list(prefix) if known else None
+
+        src_layouts = [
+            # SAC=0: inline, link-local prefix and 64 or 16 bits, or the link-layer address
+            ([], 16, []),
+            (link_local, 8, []),
+            (link_local + self.IPHC_IID_16B, 2, []),
+            (link_local, 0, None),
+            # SAC=1: the unspecified address, network prefix and 64 or 16 bits, or the link-layer address
+            ([0x00] * 16, 0, []),
+            (prefix, 8, []) if known else None,
+            (prefix + self.IPHC_IID_16B, 2, []) if known else None,
+            (prefix, 0, None) if known else None,
+        ]
+
+        dst_layouts = [
+            # M=0 DAC=0
+            ([], 16, []),
+            (link_local, 8, []),
+            (link_local + self.IPHC_IID_16B, 2, []),
+            (link_local + list(dagroot), 0, []) if dagroot is not None else None,
+            # M=0 DAC=1, DAM=00 is reserved
+            None,
+            (prefix, 8, []) if known else None,
+            (prefix + self.IPHC_IID_16B, 2, []) if known else None,
+            (prefix + list(dagroot), 0, []) if known and dagroot is not None else None,
+            # M=1 DAC=0: inline, ffXX::00XX:XXXX:XXXX, ffXX::00XX:XXXX and ff02::00XX
+            ([], 16, []),
+            ([0xff], 1, ([0x00] * 9, 5, [])),
+            ([0xff], 1, ([0x00] * 11, 3, [])),
+            ([0xff, 0x02] + [0x00] * 13, 1, []),
+            # M=1 DAC=1: ffXX:XX40:<network prefix>:XXXX:XXXX, the other modes are reserved
+            ([0xff], 2, ([0x40] + prefix, 4, [])) if known else None,
+            None,
+            None,
+            None,
+        ]
+
+        return src_layouts, dst_layouts
 
     def _is_link_local(self, ipv6_address):
-        if ipv6_address[:8] == self.LINK_LOCAL_PREFIX:
+        if list(ipv6_address[:8]) == self.LINK_LOCAL_PREFIX:
             return True
         return False
 
@@ -1081,15 +1206,15 @@ class OpenLbr(EventBusClient):
         output += ['']
         output += ['============================= IPv6 packet =====================================']
         output += ['']
-        output += ['Version:           {0}'.format(ipv6['version'])]
-        output += ['Traffic class:     {0}'.format(ipv6['traffic_class'])]
-        output += ['Flow label:        {0}'.format(ipv6['flow_label'])]
-        output += ['Payload length:    {0}'.format(ipv6['payload_length'])]
-        output += ['Hop Limit:         {0}'.format(ipv6['hop_limit'])]
-        output += ['Next header:       {0}'.format(ipv6['next_header'])]
-        output += ['Source Addr.:      {0}'.format(format_ipv6_addr(ipv6['src_addr']))]
-        output += ['Destination Addr.: {0}'.format(format_ipv6_addr(ipv6['dst_addr']))]
-        output += ['Payload:           {0}'.format(format_buf(ipv6['payload']))]
+        output += ['Version:           {0}'.format(ipv6.version)]
+        output += ['Traffic class:     {0}'.format(ipv6.traffic_class)]
+        output += ['Flow label:        {0}'.format(ipv6.flow_label)]
+        output += ['Payload length:    {0}'.format(ipv6.payload_length)]
+        output += ['Hop Limit:         {0}'.format(ipv6.hop_limit)]
+        output += ['Next header:       {0}'.format(ipv6.next_header)]
+        output += ['Source Addr.:      {0}'.format(format_ipv6_addr(ipv6.src_addr))]
+        output += ['Destination Addr.: {0}'.format(format_ipv6_addr(ipv6.dst_addr))]
+        output += ['Payload:           {0}'.format(format_buf(bytearray(ipv6.payload)))]
         output += ['']
         output += [self._format_wireshark(ipv6_bytes)]
         output += ['']
@@ -1111,7 +1236,7 @@ class OpenLbr(EventBusClient):
             output += ['source route:']
             for hop in lowpan['route']:
                 output += [' - {0}'.format(format_addr(hop))]
-        output += ['payload:           {0}'.format(format_buf(lowpan['payload']))]
+        output += ['payload:           {0}'.format(format_buf(bytearray(lowpan['payload'])))]
         output += ['']
         output += [self._format_wireshark(lowpan_bytes)]
         output += ['']
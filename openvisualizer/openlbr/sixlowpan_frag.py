@@ -5,8 +5,11 @@
 # https://openwsn.atlassian.net/wiki/display/OW/License
 
 import logging
+import threading
+import time
+from collections import OrderedDict
 
-from openvisualizer.utils import buf2int, hex2buf
+from openvisualizer.utils import buf2int
 
 log = logging.getLogger('SixLowPanFrag')
 log.setLevel(logging.INFO)
@@ -16,10 +19,13 @@ log.addHandler(logging.NullHandler())
 # ============================ parameters ======================================
 
 class ReassembleEntry(object):
-    def __init__(self, wanted, received, frag):
+    def __init__(self, wanted, now):
         self.total_bytes = wanted
-        self.recvd_bytes = received
-        self.fragments = frag
+        self.recvd_bytes = 0
+        self.buffer = bytearray(wanted)
+        self.offsets = set()
+        self.created = now
+        self.last_seen = now
 
 
 class Fragmentor(object):
@@ -30,6 +36,9 @@ class Fragmentor(object):
 
     * *https://tools.ietf.org/html/rfc4944*
       Transmission of IPv6 Packets over IEEE 802.15.4 Networks.
+
+    Partial datagrams are identified by their link-layer source, size and tag. They are discarded when their reassembly
+    times out, or, least recently updated first, when the datagrams being reassembled exceed max_buffer_bytes.
     """
 
     FRAG1_DISPATCH = 0xC0
@@ -45,13 +54,35 @@ class Fragmentor(object):
     FRAG1_HDR_SIZE = 4
     FRAGN_HDR_SIZE = 5
 
-    def __init__(self, tag=1):
-        self.reassemble_buffer = dict()
+    # RFC 4944, section 5.3
+    REASSEMBLY_TIMEOUT = 60
+    MAX_BUFFER_BYTES = 64 * 1024
+
+    def __init__(self, tag=1, timeout=REASSEMBLY_TIMEOUT, max_buffer_bytes=MAX_BUFFER_BYTES):
+        self.data_lock = threading.Lock()
+        # (source, size, tag) -> ReassembleEntry, least recently updated first
+        self.reassemble_buffer = OrderedDict()
+        self.buffered_bytes = 0
+        self.timeout = timeout
+        self.max_buffer_bytes = max_buffer_bytes
+        self.stats = {
+            'completed': 0,
+            'expired': 0,
+            'evicted': 0,
+            'dropped': 0,
+        }
 
         self.datagram_tag = tag
 
-    def do_reassemble(self, lowpan_pkt):
-        reassembled_pkt = None
+    def do_reassemble(self, lowpan_pkt, src=None):
+        """
+        Feeds a 6LoWPAN packet to the reassembly buffer.
+
+        :param lowpan_pkt: the 6LoWPAN packet, as a list of bytes
+        :param src: the link-layer source of the packet
+        :returns: lowpan_pkt if it is not a fragment, the reassembled packet if lowpan_pkt is the last missing fragment
+            of a datagram, None otherwise
+        """
 
         # parse fragmentation header
         dispatch = lowpan_pkt[0] & self.FRAG_DISPATCH_MASK
@@ -68,77 +99,53 @@ class Fragmentor(object):
             offset = 0
         else:
             payload = lowpan_pkt[5:]
-            offset = lowpan_pkt[4]
+            offset = lowpan_pkt[4] * 8
 
-        if datagram_tag in self.reassemble_buffer:
-            entry = self.reassemble_buffer[datagram_tag]
-            entry.recvd_bytes += len(payload)
-            entry.fragments.append((offset, payload))
-        else:
-            new_entry = ReassembleEntry(datagram_size, len(payload), [(offset, payload)])
-            self.reassemble_buffer[datagram_tag] = new_entry
-
-        # check if we can reassemble
-        num_of_frags = 0
-        used_tag = None
-        for tag, entry in self.reassemble_buffer.items():
-            if entry.total_bytes == entry.recvd_bytes:
-                frags = sorted(entry.fragments, key=lambda frag: frag[0])
-                used_tag = tag
-                num_of_frags = len(frags)
-                reassembled_pkt = []
-
-                for frag in frags:
-                    reassembled_pkt.extend(frag[1])
-                break
+        with self.data_lock:
+            return self._reassemble(src, datagram_size, datagram_tag, offset, payload)
 
-        if used_tag is not None:
-            del self.reassemble_buffer[used_tag]
+    def get_stats(self):
+        with self.data_lock:
+            stats = dict(self.stats)
+            stats['pending'] = len(self.reassemble_buffer)
+            stats['buffered_bytes'] = self.buffered_bytes
+        return stats
 
-        if reassembled_pkt is not None:
-            log.success("[GATEWAY] Reassembled {} frags with tag {} into an IPv6 packet of size {}".format(
-                num_of_frags, used_tag, len(reassembled_pkt)))
+    def do_fragment(self, ip6_pkt):
+        """
+        Fragments a 6LoWPAN packet which does not fit in a frame.
 
-        return reassembled_pkt
+        :param ip6_pkt: the 6LoWPAN packet, as a bytearray or a list of bytes
+        :returns: the list of the fragments, as bytearrays, or [ip6_pkt] if the packet is not fragmented
+        """
 
-    def do_fragment(self, ip6_pkt):
-        fragment_list = []
         original_length = len(ip6_pkt)
 
-        if len(ip6_pkt) <= self.MAX_FRAGMENT_SIZE + self.FRAGN_HDR_SIZE:
+        if original_length <= self.MAX_FRAGMENT_SIZE + self.FRAGN_HDR_SIZE:
             return [ip6_pkt]
 
-        while len(ip6_pkt) > 0:
-            frag_header = []
-            fragment = []
+        if not isinstance(ip6_pkt, bytearray):
+            ip6_pkt = bytearray(ip6_pkt)
+        # slices of the view do not copy the packet
+        view = memoryview(ip6_pkt)
 
-            datagram_tag = hex2buf("{:04x}".format(self.datagram_tag))
-
-            if len(ip6_pkt) > self.MAX_FRAGMENT_SIZE:
-                frag_len = self.MAX_FRAGMENT_SIZE
-            else:
-                frag_len = len(ip6_pkt)
+        datagram_tag = [(self.datagram_tag >> 8) & 0xff, self.datagram_tag & 0xff]
+        fragment_list = []
 
-            if len(fragment_list) == 0:
+        for offset in range(0, original_length, self.MAX_FRAGMENT_SIZE):
+            if offset == 0:
                 # first fragment
-                dispatch_size = hex2buf("{:02x}".format((self.FRAG1_DISPATCH << 8) | original_length))
-                frag_header.extend(dispatch_size)
-                frag_header.extend(datagram_tag)
+                fragment = bytearray([self.FRAG1_DISPATCH | (original_length >> 8), original_length & 0xff])
+                fragment.extend(datagram_tag)
             else:
                 # subsequent fragment
-                dispatch_size = hex2buf("{:02x}".format((self.FRAGN_DISPATCH << 8) | original_length))
-                offset = [len(fragment_list) * (self.MAX_FRAGMENT_SIZE / 8)]
-                frag_header.extend(dispatch_size)
-                frag_header.extend(datagram_tag)
-                frag_header.extend(offset)
-
-            fragment.extend(frag_header)
-            fragment.extend(ip6_pkt[:frag_len])
+                fragment = bytearray([self.FRAGN_DISPATCH | (original_length >> 8), original_length & 0xff])
+                fragment.extend(datagram_tag)
+                fragment.append(offset / 8)
 
+            fragment.extend(view[offset:offset + self.MAX_FRAGMENT_SIZE])
             fragment_list.append(fragment)
 
-            ip6_pkt = ip6_pkt[frag_len:]
-
         # increment the tag for the new set of fragments
         self.datagram_tag += 1
 
@@ -146,3 +153,69 @@ class Fragmentor(object):
             original_length, len(fragment_list), self.datagram_tag - 1))
 
         return fragment_list
+
+    # ======================== private =========================================
+
+    def _reassemble(self, src, datagram_size, datagram_tag, offset, payload):
+        now = time.time()
+        self._expire(now)
+
+        if offset + len(payload) > datagram_size or datagram_size > self.max_buffer_bytes:
+            log.warning("dropping fragment with tag {} (offset {}, length {}) of a datagram of size {}".format(
+                datagram_tag, offset, len(payload), datagram_size))
+            self.stats['dropped'] += 1
+            return None
+
+        key = (tuple(src) if src is not None else None, datagram_size, datagram_tag)
+        entry = self.reassemble_buffer.pop(key, None)
+
+        if entry is not None and entry.created + self.timeout < now:
+            self._discard(key, entry, 'expired')
+            entry = None
+
+        if entry is None:
+            self._make_room(datagram_size)
+            entry = ReassembleEntry(datagram_size, now)
+            self.buffered_bytes += datagram_size
+
+        if offset not in entry.offsets:
+            entry.offsets.add(offset)
+            entry.buffer[offset:offset + len(payload)] = bytearray(payload)
+            entry.recvd_bytes += len(payload)
+
+        # check if we can reassemble
+        if entry.recvd_bytes < entry.total_bytes:
+            # (re-)insert as the most recently updated datagram
+            entry.last_seen = now
+            self.reassemble_buffer[key] = entry
+            return None
+
+        self.buffered_bytes -= entry.total_bytes
+        self.stats['completed'] += 1
+
+        log.success("[GATEWAY] Reassembled {} frags with tag {} into an IPv6 packet of size {}".format(
+            len(entry.offsets), datagram_tag, entry.total_bytes))
+
+        return list(entry.buffer)
+
+    def _expire(self, now):
+        """ Discards the idle datagrams whose reassembly timed out. """
+        while self.reassemble_buffer:
+            key, entry = next(self.reassemble_buffer.iteritems())
+            if entry.last_seen + self.timeout >= now:
+                # the other datagrams were updated more recently
+                break
+            del self.reassemble_buffer[key]
+            self._discard(key, entry, 'expired')
+
+    def _make_room(self, size):
+        """ Evicts the least recently updated datagrams until size bytes fit in the buffer. """
+        while self.reassemble_buffer and self.buffered_bytes + size > self.max_buffer_bytes:
+            key, entry = self.reassemble_buffer.popitem(last=False)
+            self._discard(key, entry, 'evicted')
+
+    def _discard(self, key, entry, reason):
+        self.buffered_bytes -= entry.total_bytes
+        self.stats[reason] += 1
+        log.warning("{} datagram with tag {} from {} ({}/{} bytes received)".format(
+            reason, key[2], key[0], entry.recvd_bytes, entry.total_bytes))
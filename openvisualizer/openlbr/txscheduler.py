@@ -0,0 +1,161 @@
+# Copyright (c) 2010-2013, Regents of the University of California.
+# All rights reserved.
+#
+# Released under the BSD 3-Clause license as published at the link below.
+# https://openwsn.atlassian.net/wiki/display/OW/License
+
+import logging
+import threading
+import time
+from collections import deque
+
+log = logging.getLogger('TxScheduler')
+log.setLevel(logging.ERROR)
+log.addHandler(logging.NullHandler())
+
+
+class TxDatagram(object):
+    def __init__(self, next_hop, fragments, now):
+        self.next_hop = next_hop
+        self.fragments = deque(fragments)
+        self.queued = now
+
+
+class TxScheduler(threading.Thread):
+    """
+    Paces the fragments sent towards the mesh by the DAG root.
+
+    Datagrams are queued and their fragments are sent from a dedicated thread, at most rate fragments per second with
+    bursts of up to burst fragments (token bucket). Queued datagrams are served in round-robin, one fragment at a time,
+    so that a large datagram does not delay the datagrams queued after it by more than one fragment per round.
+    """
+
+    TX_RATE = 100  # fragments per second
+    TX_BURST = 1  # fragments
+
+    def __init__(self, send, rate=TX_RATE, burst=TX_BURST):
+
+        if rate <= 0 or burst < 1:
+            raise ValueError('invalid pacing, rate {0}, burst {1}'.format(rate, burst))
+
+        # log
+        log.debug('create instance')
+
+        # store params
+        self.send = send
+        self.rate = float(rate)
+        self.burst = burst
+
+        # local variables
+        self.data_lock = threading.Condition()
+        self.datagrams = deque()
+        self.num_fragments = 0
+        self.tokens = float(burst)
+        self.last_refill = time.time()
+        self.go_on = True
+        self.stats = {
+            'sent_fragments': 0,
+            'sent_datagrams': 0,
+            'max_queued_fragments': 0,
+            'latency_sum': 0.0,
+            'latency_max': 0.0,
+        }
+
+        # initialize the parent class
+        super(TxScheduler, self).__init__()
+        self.name = 'TxScheduler'
+        self.daemon = True
+
+        self.start()
+
+    def run(self):
+        try:
+            log.debug('start running')
+
+            while True:
+                with self.data_lock:
+                    while self.go_on and not self.datagrams:
+                        self.data_lock.wait()
+                    if not self.go_on:
+                        break
+
+                    wait = self._take_token()
+                    if wait > 0:
+                        self.data_lock.wait(wait)
+                        continue
+
+                    (next_hop, fragment) = self._next_fragment()
+
+                try:
+                    self.send(next_hop, fragment)
+                except Exception as err:
+                    log.error('could not send fragment to {0}: {1}'.format(next_hop, err))
+
+            log.debug('exit')
+        except Exception as err:
+            log.critical(err)
+            raise
+
+    # ======================== public ==========================================
+
+    def enqueue(self, next_hop, fragments):
+        """
+        Queues the fragments of a datagram.
+
+        :param next_hop: next hop of the datagram
+        :param fragments: list of fragments, sent in order, an empty list is ignored
+        """
+        if not fragments:
+            log.warning('no fragment to send to {0}'.format(next_hop))
+            return
+
+        with self.data_lock:
+            self.datagrams.append(TxDatagram(next_hop, fragments, time.time()))
+            self.num_fragments += len(fragments)
+            self.stats['max_queued_fragments'] = max(self.stats['max_queued_fragments'], self.num_fragments)
+            self.data_lock.notify()
+
+    def get_stats(self):
+        with self.data_lock:
+            stats = dict(self.stats)
+            stats['queued_datagrams'] = len(self.datagrams)
+            stats['queued_fragments'] = self.num_fragments
+
+        latency_sum = stats.pop('latency_sum')
+        stats['latency_avg'] = latency_sum / stats['sent_datagrams'] if stats['sent_datagrams'] else 0.0
+        return stats
+
+    def close(self):
+        with self.data_lock:
+            self.go_on = False
+            self.data_lock.notify()
+
+    # ======================== private =========================================
+
+    def _take_token(self):
+        """ Takes a token from the bucket, returns 0 or, if the bucket is empty, the time until the next token. """
+        now = time.time()
+        self.tokens = min(self.burst, self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    def _next_fragment(self):
+        datagram = self.datagrams.popleft()
+        fragment = datagram.fragments.popleft()
+        self.num_fragments -= 1
+        self.stats['sent_fragments'] += 1
+
+        if datagram.fragments:
+            # serve the other datagrams before the next fragment of this one
+            self.datagrams.append(datagram)
+        else:
+            latency = time.time() - datagram.queued
+            self.stats['sent_datagrams'] += 1
+            self.stats['latency_sum'] += latency
+            self.stats['latency_max'] = max(self.stats['latency_max'], latency)
+
+        return datagram.next_hop, fragment
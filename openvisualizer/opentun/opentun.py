@@ -106,6 +106,8 @@ class OpenTun(EventBusClient):
 
     def close(self):
 
+        self.detach()
+
         if self.tun_read_thread:
 
             self.tun_read_thread.close()
@@ -4,17 +4,21 @@
 # Released under the BSD 3-Clause license as published at the link below.
 # https://openwsn.atlassian.net/wiki/display/OW/License
 
+import errno
 import logging
 import os
+import select
 import struct
 import sys
 import threading
+import time
+from collections import deque
 
 from openvisualizer.opentun.opentun import OpenTun
 from openvisualizer.utils import format_buf, format_crash_message, format_ipv6_addr, format_critical_message
 
 if sys.platform.startswith('linux'):
-    from fcntl import ioctl  # pylint: disable=import-error
+    from fcntl import fcntl, ioctl, F_GETFL, F_SETFL  # pylint: disable=import-error
 
 log = logging.getLogger('OpenTunLinux')
 log.setLevel(logging.ERROR)
@@ -25,21 +29,41 @@ log.addHandler(logging.NullHandler())
 
 class TunReadThread(threading.Thread):
     """
-    Thread which continuously reads input from a TUN interface. When data is received from the interface, it calls a
-    callback configured during instantiation.
+    Thread which reads the packets arriving on the queues of a TUN interface. When data is received from the
+    interface, it calls a callback configured during instantiation.
+
+    The queues are non-blocking file descriptors watched with epoll, every wakeup drains up to MAX_BATCH packets per
+    queue before waiting again. close() wakes the thread up through a pipe, so no packet has to be sent to the
+    interface to stop it.
     """
 
     ETHERNET_MTU = 1500
     IPv6_HEADER_LENGTH = 40
+    PI_LENGTH = 4  # length of the packet information header, see IFF_NO_PI
+    MAX_BATCH = 64  # packets read from a queue per wakeup
 
-    def __init__(self, tun_if, callback):
+    def __init__(self, tun_if, callback, packet_info=True):
+        """
+        :param tun_if: file descriptor of the interface, or list of the file descriptors of its queues
+        :param callback: called with every IPv6 packet read, as a bytearray
+        :param packet_info: whether the packets are preceded by the packet information header
+        """
 
         # store params
         self.tun_if = tun_if
         self.callback = callback
+        self.packet_info = packet_info
 
         # local variables
         self.goOn = True
+        self.queues = list(tun_if) if isinstance(tun_if, (list, tuple)) else [tun_if]
+        (self.wakeup_rx, self.wakeup_tx) = os.pipe()
+        self.stats = {
+            'read_packets': 0,
+            'dropped_packets': 0,
+            'wakeups': 0,
+            'max_batch': 0,
+        }
 
         # initialize parent
         super(TunReadThread, self).__init__()
@@ -51,106 +75,336 @@ class TunReadThread(threading.Thread):
         self.start()
 
     def run(self):
+        epoll = select.epoll()
         try:
+            epoll.register(self.wakeup_rx, select.EPOLLIN)
+            for fd in self.queues:
+                fcntl(fd, F_SETFL, fcntl(fd, F_GETFL) | os.O_NONBLOCK)
+                epoll.register(fd, select.EPOLLIN)
+
             while self.goOn:
+                try:
+                    events = epoll.poll()
+                except IOError as err:
+                    if err.errno == errno.EINTR:
+                        continue
+                    raise
+
+                for (fd, event) in events:
+                    if fd == self.wakeup_rx:
+                        continue
+                    if event & (select.EPOLLHUP | select.EPOLLERR):
+                        # the other end of a stand-in socket was closed
+                        epoll.unregister(fd)
+                        continue
+                    self._drain(fd)
+        except Exception as err:
+            err_msg = format_crash_message(self.name, err)
+            log.critical(err_msg)
+            sys.exit(1)
+        finally:
+            epoll.close()
+            os.close(self.wakeup_rx)
+            os.close(self.wakeup_tx)
+
+    # ======================== public ==========================================
 
-                # wait for data
-                p = os.read(self.tun_if, self.ETHERNET_MTU)
+    def get_stats(self):
+        stats = dict(self.stats)
+        stats['packets_per_wakeup'] = float(stats['read_packets']) / stats['wakeups'] if stats['wakeups'] else 0.0
+        return stats
 
-                # convert input from a string to a byte list
-                p = [ord(b) for b in p]
+    def close(self):
+        self.goOn = False
+        try:
+            os.write(self.wakeup_tx, 'x')
+        except OSError:
+            # the thread already exited
+            pass
+
+    # ======================== private =========================================
 
-                # debug info
+    def _drain(self, fd):
+        """ Reads the packets waiting on a queue, at most MAX_BATCH of them, and passes them to the callback. """
+
+        offset = self.PI_LENGTH if self.packet_info else 0
+        num_read = 0
+
+        while num_read < self.MAX_BATCH:
+            try:
+                p = os.read(fd, self.ETHERNET_MTU)
+            except OSError as err:
+                if err.errno == errno.EAGAIN:
+                    break
+                raise
+            num_read += 1
+
+            # convert input from a string to a bytearray, the packet is not copied any further
+            p = bytearray(p)
+
+            # debug info
+            if log.isEnabledFor(logging.DEBUG):
                 log.debug('packet captured on tun interface: {0}'.format(format_buf(p)))
 
-                # remove tun ID octets
-                p = p[4:]
+            # make sure it's an IPv6 packet (i.e., starts with 0x6x), after the tun ID octets
+            if len(p) < offset + self.IPv6_HEADER_LENGTH or (p[offset] & 0xf0) != 0x60:
+                self.stats['dropped_packets'] += 1
+                continue
+
+            # remove tun ID octets and cut at length of IPv6 packet
+            del p[offset + self.IPv6_HEADER_LENGTH + 256 * p[offset + 4] + p[offset + 5]:]
+            if offset:
+                del p[:offset]
 
-                # make sure it's an IPv6 packet (i.e., starts with 0x6x)
-                if (p[0] & 0xf0) != 0x60:
-                    continue
+            # call the callback
+            self.stats['read_packets'] += 1
+            self.callback(p)
 
-                # because of the nature of tun for Windows, p contains ETHERNET_MTU
-                # bytes. Cut at length of IPv6 packet.
-                p = p[:self.IPv6_HEADER_LENGTH + 256 * p[4] + p[5]]
+        self.stats['wakeups'] += 1
+        self.stats['max_batch'] = max(self.stats['max_batch'], num_read)
 
-                # call the callback
-                self.callback(p)
+
+class TunWriteThread(threading.Thread):
+    """
+    Thread which writes the packets queued by write() to a TUN interface, so that the threads of the EventBus
+    forwarding packets to the Internet never wait on the interface.
+
+    Every wakeup writes all the packets queued so far. At most MAX_QUEUED packets are queued, the packets written
+    beyond are dropped, as the kernel does when the queue of an interface is full. Once closed, the thread writes the
+    packets still queued and exits, the packets written after close() are dropped.
+    """
+
+    MAX_QUEUED = 1000  # packets
+    WRITE_TIMEOUT = 1  # seconds to wait for the interface to accept a packet
+
+    def __init__(self, tun_if, packet_info=True):
+        """
+        :param tun_if: file descriptor of the interface, or of one of its queues
+        :param packet_info: whether the packets are preceded by the packet information header
+        """
+
+        # log
+        log.debug('create instance')
+
+        # store params
+        self.tun_if = tun_if
+        self.packet_info = packet_info
+
+        # local variables
+        self.data_lock = threading.Condition()
+        self.packets = deque()
+        self.go_on = True
+        self.stats = {
+            'written_packets': 0,
+            'dropped_packets': 0,
+            'failed_packets': 0,
+            'wakeups': 0,
+            'max_queued': 0,
+            'latency_sum': 0.0,
+            'latency_max': 0.0,
+        }
+
+        # initialize the parent class
+        super(TunWriteThread, self).__init__()
+        self.name = 'TunWriteThread'
+        self.daemon = True
+
+        self.start()
+
+    def run(self):
+        try:
+            log.debug('start running')
+
+            while True:
+                with self.data_lock:
+                    while self.go_on and not self.packets:
+                        self.data_lock.wait()
+                    if not self.packets:
+                        break
+
+                    # take every packet queued so far
+                    packets = self.packets
+                    self.packets = deque()
+
+                latencies = []
+                num_failed = 0
+                for (data, queued) in packets:
+                    if self._write(data):
+                        latencies.append(time.time() - queued)
+                    else:
+                        num_failed += 1
+
+                with self.data_lock:
+                    self.stats['wakeups'] += 1
+                    self.stats['written_packets'] += len(latencies)
+                    self.stats['failed_packets'] += num_failed
+                    if latencies:
+                        self.stats['latency_sum'] += sum(latencies)
+                        self.stats['latency_max'] = max(self.stats['latency_max'], max(latencies))
+
+            log.debug('exit')
         except Exception as err:
-            err_msg = format_crash_message(self.name, err)
-            log.critical(err_msg)
-            sys.exit(1)
+            log.critical(err)
+            raise
 
     # ======================== public ==========================================
 
+    def write(self, data):
+        """
+        Queues a packet towards the interface.
+
+        :param data: the IPv6 packet, a bytearray or a list of bytes
+        :returns: False if the queue is full or the thread closed, and the packet was dropped
+        """
+        with self.data_lock:
+            num_queued = len(self.packets)
+            if num_queued >= self.MAX_QUEUED or not self.go_on:
+                self.stats['dropped_packets'] += 1
+                return False
+            self.packets.append((data, time.time()))
+            if not num_queued:
+                # otherwise the writer was notified of the packets queued before
+                self.data_lock.notify()
+            if num_queued >= self.stats['max_queued']:
+                self.stats['max_queued'] = num_queued + 1
+        return True
+
+    def get_stats(self):
+        with self.data_lock:
+            stats = dict(self.stats)
+            stats['queued_packets'] = len(self.packets)
+
+        latency_sum = stats.pop('latency_sum')
+        stats['latency_avg'] = latency_sum / stats['written_packets'] if stats['written_packets'] else 0.0
+        return stats
+
     def close(self):
-        self.goOn = False
+        with self.data_lock:
+            self.go_on = False
+            self.data_lock.notify()
 
     # ======================== private =========================================
 
+    def _write(self, data):
+        """ Writes a packet to the interface, returns whether it was written. """
+
+        if self.packet_info:
+            # add tun header, the packet is a list of bytes or a bytearray
+            pkt = bytearray(OpenTunLinux.VIRTUAL_TUN_ID)
+            pkt.extend(data)
+        else:
+            pkt = data if isinstance(data, bytearray) else bytearray(data)
+
+        while True:
+            try:
+                # write over tuntap interface
+                os.write(self.tun_if, pkt)
+                return True
+            except OSError as err:
+                if err.errno != errno.EAGAIN:
+                    log.critical(format_critical_message(err))
+                    return False
+
+            # the file descriptor is shared with the non-blocking reads, wait until the packet fits
+            (_, writable, _) = select.select([], [self.tun_if], [], self.WRITE_TIMEOUT)
+            if not writable:
+                log.error('tun interface not writable, packet dropped')
+                return False
+
 
 # ============================ main class ======================================
 
 @OpenTun.record_os('linux')
 class OpenTunLinux(OpenTun):
-    """Class which interfaces between a TUN virtual interface and an EventBus."""
+    """
+    Class which interfaces between a TUN virtual interface and an EventBus.
+
+    The interface is opened with NUM_QUEUES queues, without the packet information header. The packets of the
+    interface are read from all the queues by a TunReadThread, the packets towards the interface are written by a
+    TunWriteThread.
+
+    A single queue is opened by default: the queues are all read by the same thread, which spends more time waiting
+    on several of them than it gains from the kernel spreading the flows.
+    """
 
     # insert 4 octedts ID tun for compatibility (it'll be discard)
     VIRTUAL_TUN_ID = [0x00, 0x00, 0x86, 0xdd]
 
     IFF_TUN = 0x0001
+    IFF_MULTI_QUEUE = 0x0100
+    IFF_NO_PI = 0x1000
     TUN_SET_IFF = 0x400454ca
 
+    NUM_QUEUES = 1
+
     def __init__(self):
         # log
         log.debug("create instance")
 
+        # packets towards the interface are dropped until it is created
+        self.tun_write_thread = None
+
         # initialize parent class
         super(OpenTunLinux, self).__init__()
 
+        if self.tun_if:
+            self.tun_write_thread = self._create_tun_write_thread()
+
     # ======================== public ==========================================
 
+    def get_stats(self):
+        """ Returns the statistics of the reads from and of the writes to the interface. """
+        return {
+            'read': self.tun_read_thread.get_stats() if self.tun_read_thread else {},
+            'write': self.tun_write_thread.get_stats() if self.tun_write_thread else {},
+        }
+
+    def close(self):
+        self.detach()
+
+        if self.tun_read_thread:
+            self.tun_read_thread.close()
+            self.tun_read_thread.join()
+
+        if self.tun_write_thread:
+            self.tun_write_thread.close()
+            self.tun_write_thread.join()
+
+        if self.tun_if:
+            log.info('Closing tun interface')
+            for fd in self.tun_if:
+                os.close(fd)
+
     # ======================== private =========================================
 
     def _v6_to_internet_notif(self, sender, signal, data):
         """
         Called when receiving data from the EventBus.
 
-        This function forwards the data to the the TUN interface.
-        Read from tun interface and forward to 6lowPAN
+        This function queues the data towards the TUN interface.
         """
 
         # abort if not tun interface
-        if not self.tun_if:
+        if not self.tun_write_thread:
             return
 
-        # add tun header
-        data = self.VIRTUAL_TUN_ID + data
-
-        # convert data to string
-        data = ''.join([chr(b) for b in data])
-
-        try:
-            # write over tuntap interface
-            os.write(self.tun_if, data)
-            log.debug("data dispatched to tun correctly {0}, {1}".format(signal, sender))
-        except Exception as err:
-            err_msg = format_critical_message(err)
-            log.critical(err_msg)
+        if self.tun_write_thread.write(data):
+            log.debug("data queued to tun {0}, {1}".format(signal, sender))
+        else:
+            log.warning("tun write queue full, packet from {0} dropped".format(sender))
 
     def _create_tun_if(self):
         """
         Open a TUN/TAP interface and switch it to TUN mode.
 
-        :returns: The handler of the interface, which can be used for later read/write operations.
+        :returns: The list of the file descriptors of the queues of the interface, which can be used for later
+            read/write operations.
         """
 
         try:
             # =====
             log.info("opening tun interface")
-            return_val = os.open("/dev/net/tun", os.O_RDWR)
-            ifs = ioctl(return_val, self.TUN_SET_IFF, struct.pack("16sH", "tun%d", self.IFF_TUN))
-            ifname = ifs[:16].strip("\x00")
+            (queues, ifname) = self._open_queues(self.NUM_QUEUES)
 
             # =====
             log.debug("configuring the IPv6 address")
@@ -184,15 +438,49 @@ class OpenTunLinux(OpenTun):
         except IOError as err:
             # happens when not root
             log.warning('Could not created tun interface. Are you root? ({0})'.format(err))
-            return_val = None
+            queues = None
 
-        return return_val
+        return queues
+
+    def _open_queues(self, num_queues):
+        """
+        Opens the queues of a new interface, the kernel spreads the flows of the packets it sends over them. Falls
+        back to a single queue on the kernels without IFF_MULTI_QUEUE.
+
+        :returns: The list of the file descriptors of the queues and the name of the interface.
+        """
+
+        flags = self.IFF_TUN | self.IFF_NO_PI
+        if num_queues > 1:
+            flags |= self.IFF_MULTI_QUEUE
+
+        queues = []
+        ifname = "tun%d"
+        try:
+            while len(queues) < num_queues:
+                queues.append(os.open("/dev/net/tun", os.O_RDWR))
+                ifs = ioctl(queues[-1], self.TUN_SET_IFF, struct.pack("16sH", ifname, flags))
+                ifname = ifs[:16].strip("\x00")
+        except IOError as err:
+            # the interface is deleted with its last queue
+            for fd in queues:
+                os.close(fd)
+            if err.errno != errno.EINVAL or num_queues == 1:
+                raise
+            log.warning('tun interface without multiple queues ({0})'.format(err))
+            return self._open_queues(1)
+
+        return queues, ifname
 
     def _create_tun_read_thread(self):
         """
         Creates and starts the thread to read messages arriving from the
         TUN interface.
         """
-        return TunReadThread(self.tun_if, self._v6_to_mesh_notif)
+        return TunReadThread(self.tun_if, self._v6_to_mesh_notif, packet_info=False)
+
+    def _create_tun_write_thread(self):
+        """ Creates and starts the thread to write the messages towards the TUN interface, on its first queue. """
+        return TunWriteThread(self.tun_if[0], packet_info=False)
 
     # ======================== helpers =========================================
@@ -53,19 +53,20 @@ class TunReadThread(threading.Thread):
                 # wait for data
                 p = os.read(self.tun_if, self.ETHERNET_MTU)
 
-                # convert input from a string to a byte list
-                p = [ord(b) for b in p]
+                # convert input from a string to a bytearray, the packet is not copied any further
+                p = bytearray(p)
 
                 # debug info
-                log.debug('packet captured on tun interface: {0}'.format(format_buf(p)))
+                if log.isEnabledFor(logging.DEBUG):
+                    log.debug('packet captured on tun interface: {0}'.format(format_buf(p)))
 
                 # make sure it's an IPv6 packet (i.e., starts with 0x6x)
-                if (p[0] & 0xf0) != 0x60:
+                if len(p) < self.IPv6_HEADER_LENGTH or (p[0] & 0xf0) != 0x60:
                     continue
 
                 # because of the nature of tun for Windows, p contains ETHERNET_MTU
                 # bytes. Cut at length of IPv6 packet.
-                p = p[:self.IPv6_HEADER_LENGTH + 256 * p[4] + p[5]]
+                del p[self.IPv6_HEADER_LENGTH + 256 * p[4] + p[5]:]
 
                 # call the callback
                 self.callback(p)
@@ -108,8 +109,9 @@ class OpenTunMACOS(OpenTun):
         This function forwards the data to the the TUN interface. Read from tun interface and forward to 6lowPAN
         """
 
-        # convert data to string
-        data = ''.join([chr(b) for b in data])
+        # convert data to a buffer, a bytearray is not copied
+        if not isinstance(data, bytearray):
+            data = bytearray(data)
 
         try:
             # write over tuntap interface
@@ -78,8 +78,8 @@ class TunReadThread(threading.Thread):
                     log.error(err)
                     raise ValueError('Error writing to TUN')
                 else:
-                    # convert input from a string to a byte list
-                    p = [ord(b) for b in p]
+                    # convert input from a string to a bytearray, the packet is not copied any further
+                    p = bytearray(p)
                     # print "tun input"
                     # print p
                     # make sure it's an IPv6 packet (starts with 0x6x)
@@ -89,7 +89,7 @@ class TunReadThread(threading.Thread):
 
                     # because of the nature of tun for Windows, p contains ETHERNET_MTU
                     # bytes. Cut at length of IPv6 packet.
-                    p = p[:self.IPv6_HEADER_LENGTH + 256 * p[4] + p[5]]
+                    del p[self.IPv6_HEADER_LENGTH + 256 * p[4] + p[5]:]
 
                     # call the callback
                     self.callback(p)
@@ -150,7 +150,7 @@ class OpenTunWindows(OpenTun):
         """
 
         # convert data to string
-        data = ''.join([chr(b) for b in data])
+        data = str(bytearray(data))
         # write over tuntap interface
         try:
             win32file.WriteFile(self.tun_if, data, self.overlapped_tx)
@@ -91,8 +91,7 @@ class RPL(eventbusclient.EventBusClient):
     # ======================== public ==========================================
 
     def close(self):
-        # nothing to do
-        pass
+        self.detach()
 
     # ======================== private =========================================
 
@@ -24,15 +24,43 @@ log.addHandler(logging.NullHandler())
 
 
 class SourceRoute(EventBusClient):
+    """
+    Calculates source routes from the parents announced in the DAOs.
+
+    The parents are received through the 'updateParents' and 'removeParents' signals, no bus round-trip is needed to
+    compute a route. Routes are cached per destination. A reverse tree, mapping each node to the nodes which use it as
+    preferred parent, lets a change of a node invalidate exactly the routes which go through it.
+    """
 
     def __init__(self):
 
         # local variables
         self.dataLock = threading.Lock()
-        self.parents = {}
+        self.parents = {}  # node -> list of parents, the first one being the preferred parent
+        self.children = {}  # node -> set of nodes which have it as preferred parent
+        self.routes = {}  # destination -> cached source route
+        self.stats = {
+            'hits': 0,
+            'misses': 0,
+            'invalidations': 0,
+        }
 
         # initialize parent class
-        super(SourceRoute, self).__init__(name='SourceRoute', registrations=[])
+        super(SourceRoute, self).__init__(
+            name='SourceRoute',
+            registrations=[
+                {
+                    'sender': self.WILDCARD,
+                    'signal': 'updateParents',
+                    'callback': self._update_parents_notif,
+                },
+                {
+                    'sender': self.WILDCARD,
+                    'signal': 'removeParents',
+                    'callback': self._remove_parents_notif,
+                },
+            ],
+        )
 
     # ======================== public ==========================================
 
@@ -45,44 +73,104 @@ class SourceRoute(EventBusClient):
         :returns: The source route, a list of EUI64 address, ordered from destination to source.
         """
 
-        source_route = []
+        if not dest_addr:
+            return []
+
         with self.dataLock:
             try:
-                parents = self._dispatch_and_get_result(signal='getParents', data=None)
-                self._get_source_route_internal(dest_addr, source_route, parents)
+                route = self.routes.get(tuple(dest_addr))
+                if route is None:
+                    self.stats['misses'] += 1
+                    route = self._get_source_route_internal(dest_addr)
+                    self.routes[tuple(dest_addr)] = route
+                else:
+                    self.stats['hits'] += 1
             except Exception as err:
                 log.error(err)
                 raise
 
-        return source_route
+        # the caller may modify the route
+        return list(route)
+
+    def get_stats(self):
+        with self.dataLock:
+            stats = dict(self.stats)
+            stats['cached_routes'] = len(self.routes)
+        return stats
 
     # ======================== private =========================================
 
-    def _get_source_route_internal(self, dest_addr, source_route, parents):
+    def _update_parents_notif(self, sender, signal, data):
+        # data[0] == source address, data[1] == list of parents
+        node = tuple(data[0])
+        parents = data[1]
 
-        if not dest_addr:
-            # no more parents
-            return
+        with self.dataLock:
+            old_parents = self.parents.get(node)
+            self.parents[node] = parents
 
-        if not parents.get(tuple(dest_addr)):
-            # this node does not have a list of parents
-            return
+            # routes only depend on the preferred parent, and on nodes having parents
+            if old_parents and parents and old_parents[0] == parents[0]:
+                return
 
-        # first time add destination address
-        if dest_addr not in source_route:
-            source_route += [dest_addr]
+            self._invalidate(node)
+            self._set_preferred_parent(node, old_parents, parents)
 
-        # pick a parent
-        parent = parents.get(tuple(dest_addr))[0]
+    def _remove_parents_notif(self, sender, signal, data):
+        with self.dataLock:
+            for node in data:
+                node = tuple(node)
+                old_parents = self.parents.pop(node, None)
+                if old_parents is None:
+                    continue
+                self._invalidate(node)
+                self._set_preferred_parent(node, old_parents, None)
+
+    def _set_preferred_parent(self, node, old_parents, parents):
+        if old_parents:
+            old_children = self.children.get(tuple(old_parents[0]))
+            if old_children:
+                old_children.discard(node)
+                if not old_children:
+                    del self.children[tuple(old_parents[0])]
+        if parents:
+            self.children.setdefault(tuple(parents[0]), set()).add(node)
+
+    def _invalidate(self, node):
+        """ Drops the cached routes of node and of all the nodes routed through it. """
+        pending = [node]
+        visited = set(pending)
+        while pending:
+            n = pending.pop()
+            if self.routes.pop(n, None) is not None:
+                self.stats['invalidations'] += 1
+            for child in self.children.get(n, ()):
+                if child not in visited:
+                    visited.add(child)
+                    pending.append(child)
+
+    def _get_source_route_internal(self, dest_addr):
+        source_route = []
+        visited = set()
 
-        # avoid loops
-        if parent not in source_route:
+        node = dest_addr
+        while node and self.parents.get(tuple(node)):
+            # first time add destination address
+            if tuple(node) not in visited:
+                source_route += [node]
+                visited.add(tuple(node))
+
+            # pick a parent
+            parent = self.parents[tuple(node)][0]
+
+            # avoid loops
+            if tuple(parent) in visited:
+                break
             source_route += [parent]
+            visited.add(tuple(parent))
 
-            # add non empty parents recursively
-            nextparent = self._get_source_route_internal(parent, source_route, parents)
+            node = parent
 
-            if nextparent:
-                source_route += [nextparent]
+        return source_route
 
     # ======================== helpers =========================================
@@ -89,13 +89,19 @@ class Topology(EventBusClient):
 
     def _clear_node_timeout(self):
         threshold = time.time() - self.NODE_TIMEOUT_THRESHOLD
+        evicted = []
         with self.data_lock:
             for node in self.parents_last_seen.keys():
                 if self.parents_last_seen[node] < threshold:
                     if node in self.parents:
                         del self.parents[node]
+                        evicted += [node]
                     del self.parents_last_seen[node]
 
+        # let the source routes through these nodes be recalculated
+        if evicted:
+            self.dispatch(signal='removeParents', data=evicted)
+
     # ======================== private =========================================
 
     # ======================== helpers =========================================
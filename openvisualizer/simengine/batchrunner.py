@@ -0,0 +1,224 @@
+# Copyright (c) 2010-2013, Regents of the University of California.
+# All rights reserved.
+#
+# Released under the BSD 3-Clause license as published at the link below.
+# https://openwsn.atlassian.net/wiki/display/OW/License
+
+"""
+Runs independent simulations on a pool of processes and aggregates their results, e.g. for regression sweeps.
+
+Every simulation runs in a fresh process, with its own engine, random seed and topology: the firmware of the emulated
+motes is a C extension, and the threads of the motes of a finished simulation stay blocked until their process exits.
+"""
+
+import json
+import logging
+import multiprocessing
+import os
+import random
+import time
+from collections import OrderedDict
+
+import pkg_resources
+
+from openvisualizer import PACKAGE_NAME
+from openvisualizer.motehandler.moteprobe.emulatedmoteprobe import EmulatedMoteProbe
+from openvisualizer.simengine import firmware, motehandler, simengine
+from openvisualizer.simengine.timeline import TimeLine
+
+log = logging.getLogger('BatchRunner')
+log.setLevel(logging.ERROR)
+log.addHandler(logging.NullHandler())
+
+
+# ============================ functions =======================================
+
+def run_simulation(params):
+    """
+    Runs one simulation, in the current process, and returns its result.
+
+    :param params: dict with the path to openwsn-fw 'fw_path', the random 'seed', the simulated 'duration' in seconds,
+        the maximum wall-clock duration 'timeout' in seconds, or None, and either a 'topo_file' or a number of motes
+        'num_motes' and a 'sim_topology'
+    :returns: dict with the params, the 'wall_clock' duration in seconds and, unless an 'error' occurred, whether the
+        run 'completed', the 'simulated' time in seconds, the number of timeline 'events', the number of 'serial_frames'
+        the motes sent and the statistics of the propagation model
+    """
+
+    result = OrderedDict((k, params.get(k)) for k in ['topo_file', 'seed', 'num_motes', 'sim_topology', 'duration'])
+    start = time.time()
+
+    try:
+        random.seed(params['seed'])
+
+        topo_config = None
+        if params.get('topo_file'):
+            topo_config = _load_topology(params['topo_file'])
+            # the connections are loaded from the file, see OpenVisualizerServer.load_motes_from_topology_file()
+            (result['num_motes'], result['sim_topology']) = (len(topo_config['motes']), 'fully-meshed')
+
+        oos_openwsn = firmware.load_sim_fw(params['fw_path'])[0]
+        if oos_openwsn is None:
+            raise RuntimeError('could not load the firmware from {0}'.format(params['fw_path']))
+
+        engine = simengine.SimEngine(result['sim_topology'] or '')
+        mote_handlers = [motehandler.MoteHandler(engine, oos_openwsn.OpenMote(), False)
+                         for _ in range(result['num_motes'])]
+        engine.indicate_new_motes(mote_handlers)
+        if topo_config:
+            engine.load_topology(topo_config)
+
+        # read the serial output of the motes, as the server does
+        serial_frames = [0]
+
+        def count_frame(frame):
+            serial_frames[0] += 1
+
+        for mh in mote_handlers:
+            EmulatedMoteProbe(emulated_mote=mh).send_to_parser = count_frame
+
+        for mh in mote_handlers:
+            engine.timeline.schedule_event(0, mh.get_id(), mh.hw_supply.switch_on, mh.hw_supply.INTR_SWITCHON)
+
+        result['completed'] = engine.run_until(TimeLine.seconds_to_time(params['duration']), params.get('timeout'))
+        result['simulated'] = TimeLine.time_to_seconds(engine.timeline.get_current_time())
+        result['events'] = engine.timeline.get_stats().get_num_events()
+        result['serial_frames'] = serial_frames[0]
+        result.update(engine.propagation.get_stats())
+    except Exception as err:
+        log.error('simulation {0} failed: {1}'.format(params, err))
+        result['error'] = '{0}: {1}'.format(type(err).__name__, err)
+
+    result['wall_clock'] = time.time() - start
+    return result
+
+
+def _load_topology(topo_file):
+    """ Loads a topology file, from the examples of the package if it is not found locally. """
+
+    local_path = '/'.join(('topologies', str(topo_file)))
+    if os.path.isfile(topo_file):
+        f = open(topo_file, 'r')
+    elif pkg_resources.resource_exists(PACKAGE_NAME, local_path):
+        f = pkg_resources.resource_stream(PACKAGE_NAME, local_path)
+    else:
+        raise IOError('could not open file: {0}'.format(topo_file))
+
+    try:
+        return json.load(f)
+    finally:
+        f.close()
+
+
+# ============================ classes =========================================
+
+class BatchRunner(object):
+    """ Runs a simulation per topology and seed, on a pool of processes. """
+
+    # the counters summed over the runs of a topology
+    COUNTERS = ['events', 'serial_frames', 'numTransmissions', 'numReceived', 'numCorrupted']
+
+    def __init__(self, fw_path, seeds, duration, topo_files=None, num_motes=None, sim_topology='', timeout=None,
+                 processes=None, simulate=run_simulation):
+        """
+        :param fw_path: path to openwsn-fw, with the simulation firmware built
+        :param seeds: the random seeds, each topology is simulated once per seed
+        :param duration: simulated duration of the runs, in seconds
+        :param topo_files: topology files, or None to simulate num_motes with sim_topology
+        :param timeout: maximum wall-clock duration of a run, in seconds
+        :param processes: size of the pool, the number of CPUs by default
+        :param simulate: the function running a simulation, in a process of the pool
+        """
+
+        # store params
+        self.fw_path = fw_path
+        self.seeds = seeds
+        self.duration = duration
+        self.topo_files = topo_files
+        self.num_motes = num_motes
+        self.sim_topology = sim_topology
+        self.timeout = timeout
+        self.processes = processes
+        self.simulate = simulate
+
+    # ======================== public ==========================================
+
+    def get_params(self):
+        """ Returns the params of the runs, one dict per topology and seed. """
+
+        params = []
+        for topo_file in self.topo_files or [None]:
+            for seed in self.seeds:
+                params.append({
+                    'fw_path': self.fw_path,
+                    'topo_file': topo_file,
+                    'num_motes': self.num_motes,
+                    'sim_topology': self.sim_topology,
+                    'seed': seed,
+                    'duration': self.duration,
+                    'timeout': self.timeout,
+                })
+        return params
+
+    def run(self, callback=None):
+        """
+        Runs the simulations, returns their results in the order of get_params().
+
+        :param callback: called with the result of each run, as soon as it ends
+        """
+
+        params = self.get_params()
+        # a fresh process per run
+        pool = multiprocessing.Pool(self.processes, maxtasksperchild=1)
+        try:
+            results = []
+            for result in pool.imap_unordered(self.simulate, params):
+                results.append(result)
+                if callback:
+                    callback(result)
+            pool.close()
+        except BaseException:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+
+        order = dict(((p['topo_file'], p['seed']), i) for (i, p) in enumerate(params))
+        return sorted(results, key=lambda r: order[(r['topo_file'], r['seed'])])
+
+    @classmethod
+    def aggregate(cls, results):
+        """
+        Aggregates the results per topology: the number of runs, of failed and of incomplete runs, the counters summed
+        over the successful runs, the mean and the maximum wall-clock durations, and the ratio of frames corrupted by
+        collisions.
+        """
+
+        summaries = OrderedDict()
+        for result in results:
+            summary = summaries.setdefault(result['topo_file'], OrderedDict([
+                ('runs', 0),
+                ('errors', 0),
+                ('incomplete', 0),
+            ] + [(c, 0) for c in cls.COUNTERS] + [
+                ('wall_clock_mean', 0.0),
+                ('wall_clock_max', 0.0),
+            ]))
+
+            summary['runs'] += 1
+            summary['wall_clock_mean'] += result['wall_clock']
+            summary['wall_clock_max'] = max(summary['wall_clock_max'], result['wall_clock'])
+            if 'error' in result:
+                summary['errors'] += 1
+                continue
+            if not result['completed']:
+                summary['incomplete'] += 1
+            for c in cls.COUNTERS:
+                summary[c] += result[c]
+
+        for summary in summaries.values():
+            summary['wall_clock_mean'] /= summary['runs']
+            locked = summary['numReceived'] + summary['numCorrupted']
+            summary['collision_ratio'] = float(summary['numCorrupted']) / locked if locked else 0.0
+
+        return summaries
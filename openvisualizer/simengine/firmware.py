@@ -0,0 +1,135 @@
+# Copyright (c) 2010-2013, Regents of the University of California.
+# All rights reserved.
+#
+# Released under the BSD 3-Clause license as published at the link below.
+# https://openwsn.atlassian.net/wiki/display/OW/License
+
+"""
+Loads the firmware the emulated motes run, the oos_openwsn extension built by openwsn-fw.
+
+The extension is copied to a temporary directory, added to the python path and imported once per process. All the
+engines of a process share it, each mote being a separate oos_openwsn.OpenMote().
+"""
+
+import logging
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import threading
+
+from openvisualizer.simengine import motehandler
+
+log = logging.getLogger('SimFirmware')
+log.setLevel(logging.ERROR)
+log.addHandler(logging.NullHandler())
+
+_lock = threading.Lock()
+_loaded = {}  # fw_path: (oos_openwsn module, temporary directory)
+
+
+# ============================ public ==========================================
+
+def load_sim_fw(fw_path):
+    """
+    Returns the oos_openwsn module and the temporary directory it was copied to, (None, None) on failure.
+
+    :param fw_path: path to openwsn-fw, with the extension built
+    """
+
+    with _lock:
+        if fw_path in _loaded:
+            return _loaded[fw_path]
+
+        if _loaded:
+            log.critical('oos_openwsn was already loaded from {0}'.format(_loaded.keys()[0]))
+            return None, None
+
+        temp_dir = copy_sim_fw(fw_path)
+        if temp_dir is None:
+            return None, None
+
+        sys.path.append(temp_dir)
+        motehandler.read_notif_ids(os.path.join(temp_dir, 'openwsnmodule_obj.h'))
+
+        import oos_openwsn  # pylint: disable=import-error
+
+        _loaded[fw_path] = (oos_openwsn, temp_dir)
+        return _loaded[fw_path]
+
+
+def copy_sim_fw(fw_path):
+    """
+    Copy simulation files from build folder in openwsn-fw to a temporary directory.
+    The latter is subsequently added to the python path.
+    """
+
+    hosts = ['amd64-linux', 'x86-linux', 'amd64-windows', 'x86-windows']
+    if os.name == 'nt':
+        index = 2 if platform.architecture()[0] == '64bit' else 3
+    else:
+        index = 0 if platform.architecture()[0] == '64bit' else 1
+
+    host = hosts[index]
+
+    # in openwsn-fw, directory containing 'openwsnmodule_obj.h'
+    inc_dir = os.path.join(fw_path, 'bsp', 'boards', 'python')
+    if not os.path.exists(inc_dir):
+        log.critical("path '{}' does not exist".format(inc_dir))
+        return
+
+    # in openwsn-fw, directory containing extension library
+    lib_dir = os.path.join(fw_path, 'build', 'python_gcc', 'projects', 'common')
+    if not os.path.exists(lib_dir):
+        log.critical("path '{}' does not exist".format(lib_dir))
+        return
+
+    temp_dir = tempfile.mkdtemp()
+
+    # Build source and destination pathnames.
+    arch_and_os = host.split('-')
+    lib_ext = 'pyd' if arch_and_os[1] == 'windows' else 'so'
+    source_name = 'oos_openwsn.{0}'.format(lib_ext)
+    dest_name = 'oos_openwsn-{0}.{1}'.format(arch_and_os[0], lib_ext)
+    dest_dir = os.path.join(temp_dir, arch_and_os[1])
+
+    try:
+        shutil.copy(os.path.join(inc_dir, 'openwsnmodule_obj.h'), temp_dir)
+    except IOError:
+        log.critical("could not find {} file".format('openwsnmodule_obj.h'))
+        return
+
+    log.info("copying '{}' to temporary dir '{}'".format(os.path.join(inc_dir, 'openwsnmodule_obj.h'), temp_dir))
+
+    try:
+        os.makedirs(os.path.join(dest_dir))
+    except OSError:
+        pass
+
+    try:
+        shutil.copy(os.path.join(lib_dir, source_name), os.path.join(dest_dir, dest_name))
+    except IOError:
+        log.critical("Could not find: {}".format(str(os.path.join(lib_dir, source_name))))
+        return
+
+    log.info("copying '{}' to '{}'".format(os.path.join(lib_dir, source_name), os.path.join(dest_dir, dest_name)))
+
+    # Copy the module directly to sim_files directory if it matches this host.
+    if arch_and_os[0] == 'amd64':
+        arch_match = platform.architecture()[0] == '64bit'
+    else:
+        arch_match = platform.architecture()[0] == '32bit'
+    if arch_and_os[1] == 'windows':
+        os_match = os.name == 'nt'
+    else:
+        os_match = os.name == 'posix'
+
+    if arch_match and os_match:
+        try:
+            shutil.copy(os.path.join(lib_dir, source_name), temp_dir)
+        except IOError:
+            log.critical("could not find {}".format(str(os.path.join(lib_dir, source_name))))
+            return
+
+    return temp_dir
@@ -11,10 +11,9 @@ import logging
 class IdManager(object):
     """ The module which assigns ID to the motes. """
 
-    def __init__(self):
+    def __init__(self, engine):
         # store params
-        from openvisualizer.simengine import simengine
-        self.engine = simengine.SimEngine()
+        self.engine = engine
 
         # local variables
         self.current_id = 0
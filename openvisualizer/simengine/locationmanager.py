@@ -12,10 +12,9 @@ import random
 class LocationManager(object):
     """ The module which assigns locations to the motes. """
 
-    def __init__(self):
+    def __init__(self, engine):
         # store params
-        from openvisualizer.simengine import simengine
-        self.engine = simengine.SimEngine()
+        self.engine = engine
 
         # local variables
 
@@ -17,7 +17,6 @@ from openvisualizer.bspemulator import bspsctimer
 from openvisualizer.bspemulator import bspuart
 from openvisualizer.bspemulator import hwcrystal
 from openvisualizer.bspemulator import hwsupply
-from openvisualizer.simengine import simengine
 
 # ============================ get notification IDs ============================
 # Contains the list of notifIds used in the following functions.
@@ -56,10 +55,10 @@ def notif_id(s):
 
 class MoteHandler(threading.Thread):
 
-    def __init__(self, mote, vcdlog):
+    def __init__(self, engine, mote, vcdlog):
 
         # store params
-        self.engine = simengine.SimEngine()
+        self.engine = engine
         self.mote = mote
 
         # === local variables
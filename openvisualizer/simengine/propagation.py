@@ -8,13 +8,27 @@
 import logging
 import random
 import threading
-from math import radians, cos, sin, asin, sqrt, log10
+from collections import defaultdict
+from math import log10
+
+import numpy
 
 from openvisualizer.eventbus.eventbusclient import EventBusClient
 
 
 class Propagation(EventBusClient):
-    """ The propagation model of the engine. """
+    """
+    The propagation model of the engine.
+
+    The links are computed by NumPy, for many pairs of motes at once. With the Pister-hack model, the motes are put in
+    a grid of square cells as large as the range of a mote, so that only the pairs of motes in the same or in adjacent
+    cells are considered.
+
+    The medium is shared per channel: a frame is received when the receiver detects it, with the probability given by
+    the PDR of the link, and when the SINR stays above the capture threshold while it is on the air. The power of the
+    signals is derived from the PDRs, so that the model holds with the configured topologies too. Only the transmissions
+    of the radios of its engine reach the model, the other engines of the process have their own medium.
+    """
 
     SIGNAL_WIRELESSTXSTART = 'wirelessTxStart'
     SIGNAL_WIRELESSTXEND = 'wirelessTxEnd'
@@ -24,18 +38,35 @@ class Propagation(EventBusClient):
     PISTER_HACK_LOSS = 40.0
     SENSITIVITY_dBm = -101.0
     GREY_AREA_dB = 15.0
+    NOISE_FLOOR_dBm = -105.0
+    CAPTURE_THRESHOLD_dB = 3.0
+
+    EARTH_RADIUS_km = 6367
 
-    def __init__(self, sim_topology):
+    # locations closer than this, in degrees, are the same, they went through the float parsing of the web interface
+    LOCATION_TOLERANCE = 1e-9
+
+    # the cells of the grid to pair with a cell, besides itself, so that every pair of cells is considered once
+    NEIGHBOUR_CELLS = [(1, -1), (1, 0), (1, 1), (0, 1)]
+
+    def __init__(self, engine, sim_topology):
 
         # store params
-        from openvisualizer.simengine import simengine
-        self.engine = simengine.SimEngine()
+        self.engine = engine
         self.sim_topology = sim_topology
 
         # local variables
         self.data_lock = threading.Lock()
         self.connections = {}
-        self.pending_tx_end = []
+        self.transmissions = {}  # from_mote: channel
+        self.channel_transmissions = defaultdict(set)  # channel: set of from_motes
+        self.receptions = {}  # to_mote: reception of the frame the receiver is locked on
+        self.pending_tx_end = {}  # from_mote: set of to_motes
+        self.stats = {
+            'numTransmissions': 0,
+            'numReceived': 0,
+            'numCorrupted': 0,
+        }
 
         # logging
         self.log = logging.getLogger('Propagation')
@@ -61,72 +92,84 @@ class Propagation(EventBusClient):
 
     # ======================== public ==========================================
 
-    def create_connection(self, from_mote, to_mote):
-
-        with self.data_lock:
-
-            if not self.sim_topology:
-
-                # ===== Pister-hack model
-
-                # retrieve position
-                mh_from = self.engine.get_mote_handler_by_id(from_mote)
-                (lat_from, lon_from) = mh_from.get_location()
-                mh_to = self.engine.get_mote_handler_by_id(to_mote)
-                (lat_to, lon_to) = mh_to.get_location()
+    def close(self):
+        self.detach()
 
-                # compute distance
-                lon_from, lat_from, lon_to, lat_to = map(radians, [lon_from, lat_from, lon_to, lat_to])
-                d_lon = lon_to - lon_from
-                d_lat = lat_to - lat_from
-                a = sin(d_lat / 2) ** 2 + cos(lat_from) * cos(lat_to) * sin(d_lon / 2) ** 2
-                c = 2 * asin(sqrt(a))
-                d_km = 6367 * c
-
-                # compute reception power (first Friis, then apply Pister-hack)
-                p_rx = self.TX_POWER_dBm - (20 * log10(d_km) + 20 * log10(self.FREQUENCY_GHz) + 92.45)
-                p_rx -= self.PISTER_HACK_LOSS * random.random()
-
-                # turn into PDR
-                if p_rx < self.SENSITIVITY_dBm:
-                    pdr = 0.0
-                elif p_rx > self.SENSITIVITY_dBm + self.GREY_AREA_dB:
-                    pdr = 1.0
-                else:
-                    pdr = (p_rx - self.SENSITIVITY_dBm) / self.GREY_AREA_dB
-
-            elif self.sim_topology == 'linear':
+    def create_connection(self, from_mote, to_mote):
 
-                # linear network
-                if from_mote == to_mote + 1:
-                    pdr = 1.0
-                else:
-                    pdr = 0.0
+        from_location = self.engine.get_mote_handler_by_id(from_mote).get_location()
+        to_location = self.engine.get_mote_handler_by_id(to_mote).get_location()
+        [pdr] = self._compute_pdrs(
+            numpy.array([from_mote]), numpy.radians([from_location]),
+            numpy.array([to_mote]), numpy.radians([to_location]),
+        )
 
-            elif self.sim_topology == 'fully-meshed':
+        with self.data_lock:
+            self._set_connection(from_mote, to_mote, float(pdr))
+
+    def connect_mote(self, mote_id):
+        """
+        (Re)creates the connections of a mote to all the other motes, e.g. when it was created or moved.
+
+        :param mote_id: Mote identifier
+        """
+
+        (mote_ids, locations) = self._get_locations()
+        others = mote_ids != mote_id
+        location = locations[numpy.flatnonzero(~others)]
+        to_motes = mote_ids[others]
+        pdrs = self._compute_pdrs(
+            numpy.full(len(to_motes), mote_id), numpy.repeat(location, len(to_motes), axis=0),
+            to_motes, locations[others],
+        )
 
-                pdr = 1.0
+        with self.data_lock:
+            for to_mote in self.connections.get(mote_id, {}).keys():
+                self._delete_connection(mote_id, to_mote)
+            self._set_connections(numpy.full(len(to_motes), mote_id), to_motes, pdrs)
+
+    def connect_all_motes(self):
+        """ (Re)creates the connections between all the motes, in one pass. """
+
+        (mote_ids, locations) = self._get_locations()
+        if self.sim_topology:
+            (first, second) = numpy.triu_indices(len(mote_ids), 1)
+        else:
+            (first, second) = self._pairs_in_range(locations)
+
+        # the newest mote of a pair connects to the other
+        from_motes = numpy.maximum(mote_ids[first], mote_ids[second])
+        to_motes = numpy.minimum(mote_ids[first], mote_ids[second])
+        from_is_first = from_motes == mote_ids[first]
+        from_locations = numpy.where(from_is_first[:, None], locations[first], locations[second])
+        to_locations = numpy.where(from_is_first[:, None], locations[second], locations[first])
+        pdrs = self._compute_pdrs(from_motes, from_locations, to_motes, to_locations)
 
-            else:
+        with self.data_lock:
+            self.connections = {}
+            self._set_connections(from_motes, to_motes, pdrs)
 
-                raise NotImplementedError('unsupported sim_topology={0}'.format(self.sim_topology))
+    def move_mote(self, mote_id, lat, lon):
+        """
+        Moves a mote, its connections are recomputed when they depend on its location.
 
-            # ==== create, update or delete connection
+        :param mote_id: Mote identifier
+        :param lat: new latitude
+        :param lon: new longitude
+        """
 
-            if pdr:
-                if from_mote not in self.connections:
-                    self.connections[from_mote] = {}
-                self.connections[from_mote][to_mote] = pdr
+        mh = self.engine.get_mote_handler_by_id(mote_id)
+        (cur_lat, cur_lon) = mh.get_location()
+        if abs(cur_lat - lat) < self.LOCATION_TOLERANCE and abs(cur_lon - lon) < self.LOCATION_TOLERANCE:
+            return
+        mh.set_location(lat, lon)
 
-                if to_mote not in self.connections:
-                    self.connections[to_mote] = {}
-                self.connections[to_mote][from_mote] = pdr
-            else:
-                self.delete_connection(to_mote, from_mote)
+        if not self.sim_topology:
+            self.connect_mote(mote_id)
 
     def retrieve_connections(self):
 
-        retrieved_connections = []
+        retrieved_connections = set()
         return_val = []
         with self.data_lock:
 
@@ -140,7 +183,7 @@ class Propagation(EventBusClient):
                                 'pdr': self.connections[from_mote][to_mote],
                             },
                         ]
-                        retrieved_connections += [(from_mote, to_mote)]
+                        retrieved_connections.add((from_mote, to_mote))
 
         return return_val
 
@@ -153,50 +196,214 @@ class Propagation(EventBusClient):
     def delete_connection(self, from_mote, to_mote):
 
         with self.data_lock:
+            self._delete_connection(from_mote, to_mote)
 
-            try:
-                del self.connections[from_mote][to_mote]
-                if not self.connections[from_mote]:
-                    del self.connections[from_mote]
+    def get_stats(self):
+        """ Returns the number of transmissions, of frames received and of frames corrupted by interference. """
 
-                del self.connections[to_mote][from_mote]
-                if not self.connections[to_mote]:
-                    del self.connections[to_mote]
-            except KeyError:
-                pass  # did not exist
+        with self.data_lock:
+            return self.stats.copy()
 
     # ======================== indication from eventBus ========================
 
     def _indicate_tx_start(self, sender, signal, data):
 
-        (from_mote, packet, channel) = data
+        if not self.engine.is_own_radio(sender):
+            return
 
-        if from_mote in self.connections:
-            for (to_mote, pdr) in self.connections[from_mote].items():
-                value = random.random()
-                
-                if value <= pdr:
-                    # indicate start of transmission
-                    mh = self.engine.get_mote_handler_by_id(to_mote)
-                    mh.bsp_radio.indicate_tx_start(from_mote, packet, channel)
+        (from_mote, packet, channel) = data
 
-                    # remember to signal end of transmission
-                    self.pending_tx_end += [(from_mote, to_mote)]
+        with self.data_lock:
+            interferers = self.channel_transmissions[channel]
+            self.transmissions[from_mote] = channel
+            self.stats['numTransmissions'] += 1
+            detected_by = set()
+
+            for (to_mote, pdr) in self.connections.get(from_mote, {}).items():
+                signal_mw = self._signal_mw(pdr)
+
+                # the frame interferes with the one the receiver is locked on
+                reception = self.receptions.get(to_mote)
+                if reception is not None and reception['channel'] == channel:
+                    reception['interference_mW'] += signal_mw
+                    self._check_capture(reception)
+
+                if random.random() > pdr:
+                    continue
+
+                # indicate start of transmission
+                mh = self.engine.get_mote_handler_by_id(to_mote)
+                if mh.bsp_radio.indicate_tx_start(from_mote, packet, channel):
+                    reception = {
+                        'from_mote': from_mote,
+                        'channel': channel,
+                        'signal_mW': signal_mw,
+                        'interference_mW': sum(
+                            self._signal_mw(self.connections.get(i, {}).get(to_mote, 0.0)) for i in interferers
+                        ),
+                        'corrupted': False,
+                    }
+                    self._check_capture(reception)
+                    self.receptions[to_mote] = reception
+
+                # remember to signal end of transmission
+                detected_by.add(to_mote)
+
+            interferers.add(from_mote)
+            self.pending_tx_end[from_mote] = detected_by
 
     def _indicate_tx_end(self, sender, signal, data):
 
+        if not self.engine.is_own_radio(sender):
+            return
+
         from_mote = data
 
-        if from_mote in self.connections:
-            for (to_mote, pdr) in self.connections[from_mote].items():
-                try:
-                    self.pending_tx_end.remove((from_mote, to_mote))
-                except ValueError:
-                    pass
-                else:
-                    mh = self.engine.get_mote_handler_by_id(to_mote)
-                    mh.bsp_radio.indicate_tx_end(from_mote)
+        with self.data_lock:
+            channel = self.transmissions.pop(from_mote, None)
+            if channel is not None:
+                self.channel_transmissions[channel].discard(from_mote)
+
+            for to_mote in self.pending_tx_end.pop(from_mote, ()):
+                crc_passes = True
+                reception = self.receptions.get(to_mote)
+                if reception is not None and reception['from_mote'] == from_mote:
+                    del self.receptions[to_mote]
+                    crc_passes = not reception['corrupted']
+                    self.stats['numReceived' if crc_passes else 'numCorrupted'] += 1
+
+                mh = self.engine.get_mote_handler_by_id(to_mote)
+                mh.bsp_radio.indicate_tx_end(from_mote, crc_passes)
 
     # ======================== private =========================================
 
+    def _get_locations(self):
+        """ Returns the identifiers of the motes and their locations, in radians, as arrays. """
+
+        mote_handlers = [self.engine.get_mote_handler(rank) for rank in range(self.engine.get_num_motes())]
+        mote_ids = numpy.array([mh.get_id() for mh in mote_handlers], dtype=int)
+        locations = numpy.radians(numpy.array([mh.get_location() for mh in mote_handlers], dtype=float))
+        return mote_ids, locations.reshape(len(mote_ids), 2)
+
+    def _pairs_in_range(self, locations):
+        """ Returns the indexes of the pairs of motes in the same or in adjacent cells of the grid. """
+
+        # project the locations on a plane, in km, and put them into cells as large as the range of a mote
+        latitude = numpy.mean(locations[:, 0]) if len(locations) else 0.0
+        x = locations[:, 1] * numpy.cos(latitude) * self.EARTH_RADIUS_km
+        y = locations[:, 0] * self.EARTH_RADIUS_km
+        # the projection may shorten the distances by a few percents, the cells are made a bit larger
+        cell_size = 1.1 * self._max_range_km()
+
+        cells = defaultdict(list)
+        for (i, cell) in enumerate(zip(numpy.floor(x / cell_size).astype(int), numpy.floor(y / cell_size).astype(int))):
+            cells[cell].append(i)
+        cells = dict((cell, numpy.array(members)) for (cell, members) in cells.items())
+
+        (first, second) = ([numpy.zeros(0, dtype=int)], [numpy.zeros(0, dtype=int)])
+        for ((cx, cy), members) in sorted(cells.items()):
+            (a, b) = numpy.triu_indices(len(members), 1)
+            first.append(members[a])
+            second.append(members[b])
+            for (dx, dy) in self.NEIGHBOUR_CELLS:
+                others = cells.get((cx + dx, cy + dy))
+                if others is not None:
+                    first.append(numpy.repeat(members, len(others)))
+                    second.append(numpy.tile(others, len(members)))
+
+        return numpy.concatenate(first), numpy.concatenate(second)
+
+    def _max_range_km(self):
+        """ The distance beyond which the received power is below the sensitivity, even without Pister-hack loss. """
+        margin_db = self.TX_POWER_dBm - self.SENSITIVITY_dBm - 20 * log10(self.FREQUENCY_GHz) - 92.45
+        return 10 ** (margin_db / 20)
+
+    def _compute_pdrs(self, from_motes, from_locations, to_motes, to_locations):
+        """
+        Returns the PDRs of links, as an array.
+
+        :param from_motes: array of the identifiers of the motes the links are from
+        :param from_locations: array of their locations, in radians
+        :param to_motes: array of the identifiers of the motes the links are to
+        :param to_locations: array of their locations, in radians
+        """
+
+        if not self.sim_topology:
+
+            # ===== Pister-hack model
+
+            # compute distance
+            (lat_from, lon_from) = (from_locations[:, 0], from_locations[:, 1])
+            (lat_to, lon_to) = (to_locations[:, 0], to_locations[:, 1])
+            a = numpy.sin((lat_to - lat_from) / 2) ** 2 + \
+                numpy.cos(lat_from) * numpy.cos(lat_to) * numpy.sin((lon_to - lon_from) / 2) ** 2
+            d_km = 2 * self.EARTH_RADIUS_km * numpy.arcsin(numpy.sqrt(a))
+
+            # compute reception power (first Friis, then apply Pister-hack), co-located motes are always connected
+            with numpy.errstate(divide='ignore'):
+                p_rx = self.TX_POWER_dBm - (20 * numpy.log10(d_km) + 20 * log10(self.FREQUENCY_GHz) + 92.45)
+            rnd = numpy.random.RandomState(random.getrandbits(32))
+            p_rx -= self.PISTER_HACK_LOSS * rnd.random_sample(len(p_rx))
+
+            # turn into PDR
+            return numpy.clip((p_rx - self.SENSITIVITY_dBm) / self.GREY_AREA_dB, 0.0, 1.0)
+
+        elif self.sim_topology == 'linear':
+
+            # linear network
+            return (from_motes == to_motes + 1).astype(float)
+
+        elif self.sim_topology == 'fully-meshed':
+
+            return numpy.ones(len(from_motes))
+
+        else:
+
+            raise NotImplementedError('unsupported sim_topology={0}'.format(self.sim_topology))
+
+    def _signal_mw(self, pdr):
+        """ The power of a signal at a receiver, in mW, from the PDR of the link: the higher in the grey area. """
+        if not pdr:
+            return 0.0
+        return 10 ** ((self.SENSITIVITY_dBm + self.GREY_AREA_dB * pdr) / 10)
+
+    def _check_capture(self, reception):
+        """ A frame is corrupted once its SINR drops below the capture threshold, even when the interference ends. """
+        noise_mw = 10 ** (self.NOISE_FLOOR_dBm / 10)
+        sinr_db = 10 * log10(reception['signal_mW'] / (noise_mw + reception['interference_mW']))
+        if sinr_db < self.CAPTURE_THRESHOLD_dB:
+            reception['corrupted'] = True
+
+    def _set_connections(self, from_motes, to_motes, pdrs):
+        """ Creates the connections with a PDR. Expects the data lock to be held. """
+
+        connected = numpy.flatnonzero(pdrs)
+        for (from_mote, to_mote, pdr) in zip(from_motes[connected].tolist(), to_motes[connected].tolist(),
+                                             pdrs[connected].tolist()):
+            self.connections.setdefault(from_mote, {})[to_mote] = pdr
+            self.connections.setdefault(to_mote, {})[from_mote] = pdr
+
+    def _set_connection(self, from_mote, to_mote, pdr):
+        """ Creates, updates or deletes a connection. Expects the data lock to be held. """
+
+        if pdr:
+            self.connections.setdefault(from_mote, {})[to_mote] = pdr
+            self.connections.setdefault(to_mote, {})[from_mote] = pdr
+        else:
+            self._delete_connection(to_mote, from_mote)
+
+    def _delete_connection(self, from_mote, to_mote):
+        """ Expects the data lock to be held. """
+
+        try:
+            del self.connections[from_mote][to_mote]
+            if not self.connections[from_mote]:
+                del self.connections[from_mote]
+
+            del self.connections[to_mote][from_mote]
+            if not self.connections[to_mote]:
+                del self.connections[to_mote]
+        except KeyError:
+            pass  # did not exist
+
     # ======================== helpers =========================================
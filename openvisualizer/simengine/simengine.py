@@ -5,10 +5,12 @@
 # Released under the BSD 3-Clause license as published at the link below.
 # https://openwsn.atlassian.net/wiki/display/OW/License
 
+import itertools
 import logging
 import threading
 import time
 
+from openvisualizer.bspemulator import vcdlogger
 from openvisualizer.simengine import timeline, propagation, idmanager, locationmanager
 
 
@@ -35,41 +37,44 @@ class SimEngineStats(object):
 
 
 class SimEngine(object):
-    """ The main simulation engine. """
+    """
+    The main simulation engine.
 
-    # ======================== singleton pattern ===============================
+    Each engine simulates its own network: it owns its timeline, propagation model, ID and location managers, and the
+    mote handlers are given the engine they belong to. The first engine of a process is named 'SimEngine', the next
+    ones 'SimEngine_1', 'SimEngine_2', etc. The radios of the next ones are prefixed with the name of their engine on
+    the event bus, so that each propagation model only receives the transmissions of its own motes.
+    """
 
-    _instance = None
-    _init = False
+    _engine_numbers = itertools.count()
 
-    def __new__(cls, *args, **kwargs):
-        if not cls._instance:
-            cls._instance = super(SimEngine, cls).__new__(cls, *args, **kwargs)
-        return cls._instance
+    def __init__(self, sim_topology='', log_handler=logging.StreamHandler(), log_level=logging.WARNING,
+                 vcd_filename=vcdlogger.VcdLogger.FILENAME):
 
-    # ======================== main ============================================
-
-    def __init__(self, sim_topology='', log_handler=logging.StreamHandler(), log_level=logging.WARNING):
-
-        # don't re-initialize an instance (singleton pattern)
-        if self._init:
-            return
-        self._init = True
+        number = next(self._engine_numbers)
+        self.name = 'SimEngine_{0}'.format(number) if number else 'SimEngine'
 
         # store params
         self.log_handler = log_handler
+        self.vcd_filename = vcd_filename
         self.log_handler.setFormatter(
             logging.Formatter(fmt='%(asctime)s [%(name)s:%(levelname)s] %(message)s', datefmt='%H:%M:%S'))
 
         # local variables
         self.moteHandlers = []
-        self.timeline = timeline.TimeLine()
-        self.propagation = propagation.Propagation(sim_topology)
-        self.id_manager = idmanager.IdManager()
-        self.location_manager = locationmanager.LocationManager()
+        self.moteHandlersById = {}
+        self.radioNames = set()
+        self.timeline = timeline.TimeLine(self)
+        self.propagation = propagation.Propagation(self, sim_topology)
+        self.id_manager = idmanager.IdManager(self)
+        self.location_manager = locationmanager.LocationManager(self)
+        self.vcd_logger = None
         self.pauseSem = threading.Lock()
         self.isPaused = False
         self.stopAfterSteps = None
+        self.stopTime = None
+        self.stopTimeReached = threading.Event()
+        self.simulationEnded = False
         self.delay = 0
         self.stats = SimEngineStats()
 
@@ -92,6 +97,13 @@ class SimEngine(object):
         # start timeline
         self.timeline.start()
 
+    def close(self):
+        """ Disconnects the engine from the event bus, its motes no longer reach the propagation model. """
+
+        self.propagation.close()
+        if self.vcd_logger:
+            self.vcd_logger.close()
+
     # ======================== public ==========================================
 
     # === controlling execution speed
@@ -110,16 +122,17 @@ class SimEngine(object):
     def step(self, num_steps):
         self.stopAfterSteps = num_steps
         if self.isPaused:
-            self.pauseSem.release()
+            # cleared before the timeline is released, else it could skip its next pause
             self.isPaused = False
+            self.pauseSem.release()
 
     def resume(self):
         if self.log.isEnabledFor(logging.DEBUG):
             self.log.debug('resume')
         self.stopAfterSteps = None
         if self.isPaused:
-            self.pauseSem.release()
             self.isPaused = False
+            self.pauseSem.release()
             self.stats.indicate_start()
 
     def pause_or_delay(self):
@@ -144,25 +157,89 @@ class SimEngine(object):
     def is_running(self):
         return not self.isPaused
 
+    def run_until(self, at_time, timeout=None):
+        """
+        Runs the simulation until the given simulated time, then pauses it.
+
+        :param at_time: simulated time, in ns
+        :param timeout: maximum wall-clock duration to wait for, in seconds
+        :returns: True when the simulated time, or the end of the simulation, was reached, False on timeout
+        """
+
+        if self.simulationEnded:
+            return True
+
+        self.stopTimeReached.clear()
+        self.stopTime = at_time
+        # resumed before the timeline is started, it could otherwise be resumed once paused at the stop time
+        self.resume()
+        if self.timeline.ident is None:
+            self.start()
+        return self.stopTimeReached.wait(timeout)
+
     # === called from the main script
 
     def indicate_new_mote(self, new_mote_handler):
 
         # add this mote to my list of motes
         self.moteHandlers.append(new_mote_handler)
+        self.moteHandlersById[new_mote_handler.get_id()] = new_mote_handler
 
         # create connections to already existing motes
-        for mh in self.moteHandlers[:-1]:
-            self.propagation.create_connection(
-                from_mote=new_mote_handler.get_id(),
-                to_mote=mh.get_id(),
-            )
+        self.propagation.connect_mote(new_mote_handler.get_id())
+
+    def indicate_new_motes(self, new_mote_handlers):
+        """ Adds several motes at once, the connections between all the motes are computed in one pass. """
+
+        for mh in new_mote_handlers:
+            self.moteHandlers.append(mh)
+            self.moteHandlersById[mh.get_id()] = mh
+
+        self.propagation.connect_all_motes()
+
+    def load_topology(self, topo_config):
+        """
+        Places the motes and replaces their connections with the ones of a saved topology.
+
+        :param topo_config: the content of a topology file, with its 'motes' and 'connections'
+        """
+
+        # delete each connections automatically established during motes creation
+        for co in self.propagation.retrieve_connections():
+            self.propagation.delete_connection(int(co['fromMote']), int(co['toMote']))
+
+        for mote in topo_config['motes']:
+            self.get_mote_handler_by_id(mote['id']).set_location(mote['lat'], mote['lon'])
+
+        # implements new connections
+        for co in topo_config['connections']:
+            (from_mote, to_mote) = (int(co['fromMote']), int(co['toMote']))
+            self.propagation.create_connection(from_mote, to_mote)
+            self.propagation.update_connection(from_mote, to_mote, float(co['pdr']))
 
     # === called from timeline
 
     def indicate_first_event_passed(self):
         self.stats.indicate_start()
 
+    def indicate_end_of_simulation(self):
+        """ Called by the timeline when no event is left, run_until() returns. """
+        self.simulationEnded = True
+        self.stopTime = None
+        self.stopTimeReached.set()
+
+    def reached_stop_time(self, next_time):
+        """ Called by the timeline before executing an event, pauses the engine when the stop time is passed. """
+
+        if self.stopTime is None or next_time <= self.stopTime:
+            return False
+
+        self.timeline.current_time = self.stopTime
+        self.stopTime = None
+        self.pause()
+        self.stopTimeReached.set()
+        return True
+
     # === getting information about the system
 
     def get_num_motes(self):
@@ -172,17 +249,33 @@ class SimEngine(object):
         return self.moteHandlers[rank]
 
     def get_mote_handler_by_id(self, mote_id):
-        return_val = None
-        for h in self.moteHandlers:
-            if h.get_id() == mote_id:
-                return_val = h
-                break
+        return_val = self.moteHandlersById.get(mote_id)
         assert return_val
         return return_val
 
     def get_stats(self):
         return self.stats
 
+    def register_radio(self, mote_id):
+        """ Returns the name the radio of a mote dispatches its transmissions with, unique among the engines. """
+        if self.name == 'SimEngine':
+            name = 'BspRadio_{0}'.format(mote_id)
+        else:
+            name = '{0}.BspRadio_{1}'.format(self.name, mote_id)
+        self.radioNames.add(name)
+        return name
+
+    def is_own_radio(self, sender):
+        """ Tells whether a sender on the event bus is the radio of a mote of this engine. """
+        return sender in self.radioNames
+
+    def get_vcd_logger(self):
+        """ Returns the VCD logger of the engine, the VCD file is created by the first mote logging its debug pins. """
+
+        if self.vcd_logger is None:
+            self.vcd_logger = vcdlogger.VcdLogger(self.vcd_filename)
+        return self.vcd_logger
+
     # ======================== private =========================================
 
     # ======================== helpers =========================================
@@ -5,6 +5,8 @@
 # Released under the BSD 3-Clause license as published at the link below.
 # https://openwsn.atlassian.net/wiki/display/OW/License
 
+import heapq
+import itertools
 import logging
 import threading
 
@@ -34,17 +36,36 @@ class TimeLineEvent(object):
 
 
 class TimeLine(threading.Thread):
-    """ The timeline of the engine. """
+    """
+    The timeline of the engine.
 
-    def __init__(self):
+    The simulated time is an integer number of nanoseconds, so that scheduling and comparing times is exact and a
+    simulation is replayed identically however long it runs. Durations in seconds are converted at the edges, with
+    seconds_to_time() and time_to_seconds().
+
+    Upcoming events are kept in a binary heap, ordered by time. Events at the same time are executed in the reverse
+    order of their scheduling. A cancelled event stays in the heap as a tombstone until it reaches the head of the heap,
+    or until the heap is compacted.
+    """
+
+    # minimum number of tombstones before compacting the heap
+    COMPACT_THRESHOLD = 1024
+
+    # unit of the simulated time
+    NS_PER_SECOND = 1000000000
+
+    def __init__(self, engine):
 
         # store params
-        from openvisualizer.simengine import simengine
-        self.engine = simengine.SimEngine()
+        self.engine = engine
 
         # local variables
-        self.current_time = 0  # current time
-        self.timeline = []  # list of upcoming events
+        self.current_time = 0  # current time, in ns
+        self.timeline = []  # heap of upcoming events, each entry is [at_time, -sequence number, event or None]
+        self.scheduled = {}  # (mote_id, desc) -> entry in the heap
+        self.num_cancelled = 0  # number of tombstones in the heap
+        self.sequence = itertools.count()
+        self.data_lock = threading.Lock()
         self.first_event_passed = False
         self.first_event = threading.Lock()
         self.first_event.acquire()
@@ -86,17 +107,24 @@ class TimeLine(threading.Thread):
         self.engine.pause_or_delay()
 
         while True:
+            # pause at the stop time of the engine, if applicable
+            next_time = self._next_event_time()
+            if next_time is not None and self.engine.reached_stop_time(next_time):
+                self.engine.pause_or_delay()
+                continue
+
+            # pop the event at the head of the timeline
+            event = self._pop_event()
+
             # detect the end of the simulation
-            if len(self.timeline) == 0:
+            if event is None:
                 output = ''
                 output += 'end of simulation reached\n'
-                output += ' - current_time=' + str(self.get_current_time()) + '\n'
+                output += ' - current_time={0:.9f}s\n'.format(self.time_to_seconds(self.get_current_time()))
                 self.log.warning(output)
+                self.engine.indicate_end_of_simulation()
                 raise StopIteration(output)
 
-            # pop the event at the head of the timeline
-            event = self.timeline.pop(0)
-
             # make sure that this event is later in time than the previous
             if not self.current_time <= event.at_time:
                 self.log.critical("Current time {} exceeds event time: {}".format(self.current_time, event))
@@ -107,7 +135,8 @@ class TimeLine(threading.Thread):
 
             # log
             if self.log.isEnabledFor(logging.DEBUG):
-                self.log.debug('\n\nnow {0:.6f}, executing {1}@{2}'.format(event.at_time, event.desc, event.mote_id))
+                self.log.debug('\n\nnow {0:.9f}, executing {1}@{2}'.format(
+                    self.time_to_seconds(event.at_time), event.desc, event.mote_id))
            # if (event.at_time > 170):
            #     print('{0:.6f}: executing {1}@{2}'.format(event.at_time, event.desc, event.mote_id))
             
@@ -126,13 +155,24 @@ class TimeLine(threading.Thread):
     # ======================== public ==========================================
 
     def get_current_time(self):
+        """ Returns the current simulated time, in ns. """
         return self.current_time
 
+    @classmethod
+    def seconds_to_time(cls, seconds):
+        """ Converts a duration in seconds into simulated time, rounded to the closest ns. """
+        return int(round(seconds * cls.NS_PER_SECOND))
+
+    @classmethod
+    def time_to_seconds(cls, at_time):
+        """ Converts a simulated time into seconds. """
+        return at_time / float(cls.NS_PER_SECOND)
+
     def schedule_event(self, at_time, mote_id, cb, desc):
         """
         Add an event into the timeline
 
-        :param at_time: The time at which this event should be called.
+        :param at_time: The time at which this event should be called, in ns.
         :param mote_id: Mote identifier
         :param cb: The function to call when this event happens.
         :param desc: A unique description (a string) of this event.
@@ -140,7 +180,7 @@ class TimeLine(threading.Thread):
 
         # log
         if self.log.isEnabledFor(logging.DEBUG):
-            self.log.debug('scheduling {0}@{1} at {2:.6f}'.format(desc, mote_id, at_time))
+            self.log.debug('scheduling {0}@{1} at {2:.9f}'.format(desc, mote_id, self.time_to_seconds(at_time)))
 
         # make sure that I'm scheduling an event in the future
         try:
@@ -155,26 +195,17 @@ class TimeLine(threading.Thread):
             self.log.critical(output)
             raise
 
-        # create a new event
+        # create a new event, among events at the same time the last scheduled one is executed first
         new_event = TimeLineEvent(mote_id, at_time, cb, desc)
+        entry = [at_time, -next(self.sequence), new_event]
 
-        # remove any event already in the queue with same description
-        for i in range(len(self.timeline)):
-            if (self.timeline[i].mote_id == mote_id and
-                    self.timeline[i].desc == desc):
-                self.timeline.pop(i)
-                break
+        with self.data_lock:
+            # remove any event already in the queue with same description
+            self._cancel((mote_id, desc))
 
-        # look for where to put this event
-        i = 0
-        while i < len(self.timeline):
-            if new_event.at_time > self.timeline[i].at_time:
-                i += 1
-            else:
-                break
-
-        # insert the new event
-        self.timeline.insert(i, new_event)
+            # insert the new event
+            self.scheduled[(mote_id, desc)] = entry
+            heapq.heappush(self.timeline, entry)
 
         # start the timeline, if applicable
         with self.first_event_lock:
@@ -196,23 +227,12 @@ class TimeLine(threading.Thread):
         if self.log.isEnabledFor(logging.DEBUG):
             self.log.debug('cancelEvent {0}@{1}'.format(desc, mote_id))
 
-        # initialize return variable
-        num_events_canceled = 0
-
-        # remove any event already the queue with same description
-        i = 0
-        while i < len(self.timeline):
-            if self.timeline[i].mote_id == mote_id and self.timeline[i].desc == desc:
-                self.timeline.pop(i)
-                num_events_canceled += 1
-            else:
-                i += 1
-
-        # return the number of events canceled
-        return num_events_canceled
+        # remove the event already in the queue with same description
+        with self.data_lock:
+            return self._cancel((mote_id, desc))
 
     def get_events(self):
-        return [[ev.at_time, ev.mote_id, ev.desc] for ev in self.timeline]
+        return [[ev.at_time, ev.mote_id, ev.desc] for ev in self._sorted_events()]
 
     def get_stats(self):
         return self.stats
@@ -221,8 +241,52 @@ class TimeLine(threading.Thread):
 
     def _print_timeline(self):
         output = ''
-        for event in self.timeline:
+        for event in self._sorted_events():
             output += '\n' + str(event)
         return output
 
+    def _sorted_events(self):
+        with self.data_lock:
+            entries = sorted(entry for entry in self.timeline if entry[-1] is not None)
+        return [entry[-1] for entry in entries]
+
+    def _next_event_time(self):
+        """ Returns the time of the next event, None if the timeline is empty. """
+        with self.data_lock:
+            while self.timeline:
+                if self.timeline[0][-1] is not None:
+                    return self.timeline[0][0]
+                heapq.heappop(self.timeline)
+                self.num_cancelled -= 1
+        return None
+
+    def _pop_event(self):
+        """ Removes and returns the next event, None if the timeline is empty. """
+        with self.data_lock:
+            while self.timeline:
+                event = heapq.heappop(self.timeline)[-1]
+                if event is None:
+                    self.num_cancelled -= 1
+                    continue
+                del self.scheduled[(event.mote_id, event.desc)]
+                return event
+        return None
+
+    def _cancel(self, key):
+        """ Turns the event scheduled for key into a tombstone. Expects the data lock to be held. """
+        entry = self.scheduled.pop(key, None)
+        if entry is None:
+            return 0
+
+        entry[-1] = None
+        self.num_cancelled += 1
+
+        # drop the tombstones once they make up most of the heap
+        if self.num_cancelled > self.COMPACT_THRESHOLD and 2 * self.num_cancelled > len(self.timeline):
+            self.timeline = [e for e in self.timeline if e[-1] is not None]
+            heapq.heapify(self.timeline)
+            self.num_cancelled = 0
+
+        return 1
+
     # ======================== helpers =========================================
@@ -0,0 +1,136 @@
+"""
+Per-packet cost of the UDP checksum and of the IEEE802.15.4 FCS.
+
+Compares the former implementations, which walked the lists two bytes at a time for the checksum and reversed the bits
+of every byte in a Python loop for the FCS, with the sums of the high and of the low bytes and the binascii.crc_hqx()
+based FCS. The checksum is also computed over an array('H') and over a NumPy view of the packet, for reference: both
+pay for the conversion of the list first.
+"""
+
+import random
+
+import click
+import numpy
+
+from openvisualizer import utils
+from scripts.benchmarks.benchutils import measure, print_header, print_row, speedup
+
+SRC = [0xfe, 0x80, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x14, 0x15, 0x92, 0x00, 0x00, 0x00, 0x00, 0x02]
+DST = [0xbb, 0xbb, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x14, 0x15, 0x92, 0x00, 0x00, 0x00, 0x00, 0x01]
+NH = [0x00, 0x00, 0x00, 17]
+
+
+def legacy_fcs16_table():
+    """ Table of the CRC-16/CCITT (polynomial 0x1021) of every byte value. """
+
+    table = []
+    for i in range(256):
+        crc = i << 8
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x1021 if crc & 0x8000 else crc << 1) & 0xffff
+        table.append(crc)
+    return tuple(table)
+
+
+LEGACY_FCS16TAB = legacy_fcs16_table()
+
+
+def legacy_one_complement_sum(field, checksum):
+    res = 0xFFFF & (checksum[0] << 8 | checksum[1])
+    i = len(field)
+    while i > 1:
+        res += 0xFFFF & (field[-i] << 8 | (field[-i + 1]))
+        i -= 2
+    if i:
+        res += (0xFF & field[-1]) << 8
+    while res >> 16:
+        res = (res & 0xFFFF) + (res >> 16)
+
+    checksum[0] = (res >> 8) & 0xFF
+    checksum[1] = res & 0xFF
+
+    return checksum
+
+
+def legacy_pseudo_header_crc(src, dst, length, nh, payload):
+    checksum = [0x00] * 2
+
+    checksum = legacy_one_complement_sum(src, checksum)
+    checksum = legacy_one_complement_sum(dst, checksum)
+    checksum = legacy_one_complement_sum(length, checksum)
+    checksum = legacy_one_complement_sum(nh, checksum)
+    checksum = legacy_one_complement_sum(payload, checksum)
+
+    checksum[0] ^= 0xFF
+    checksum[1] ^= 0xFF
+
+    return checksum
+
+
+def legacy_byteinverse(b):
+    rb = 0
+    for pos in range(8):
+        if b & (1 << pos) != 0:
+            bitval = 1
+        else:
+            bitval = 0
+        rb |= bitval << (7 - pos)
+    return rb
+
+
+def legacy_fcs(rpayload):
+    payload = []
+    for b in rpayload:
+        payload += [legacy_byteinverse(b)]
+
+    crc = 0x0000
+    for b in payload:
+        crc = ((crc << 8) & 0xffff) ^ LEGACY_FCS16TAB[((crc >> 8) ^ b) & 0xff]
+
+    return [legacy_byteinverse(crc >> 8), legacy_byteinverse(crc & 0xff)]
+
+
+def array_pseudo_header_crc(src, dst, length, nh, payload):
+    return utils.calculate_pseudo_header_crc(bytearray(src), bytearray(dst), bytearray(length), bytearray(nh),
+                                             bytearray(payload))
+
+
+def numpy_pseudo_header_crc(src, dst, length, nh, payload):
+    buf = bytearray(src + dst + length + nh + payload)
+    if len(buf) % 2:
+        buf.append(0)
+    checksum = utils._fold(int(numpy.frombuffer(buf, dtype='>u2').sum(dtype=numpy.uint64)))
+    checksum = ~checksum & 0xffff
+    return [checksum >> 8, checksum & 0xff]
+
+
+@click.command()
+@click.option('--lengths', default='127,1280', show_default=True, help='Comma-separated payload lengths, in bytes')
+@click.option('--number', default=2000, show_default=True, help='Number of packets per measurement')
+def cli(lengths, number):
+    """ Compare the former checksum and FCS with the vectorized ones. """
+
+    print_header('per packet, in us', ['bytes', 'checksum', 'sums', 'speedup', 'array', 'numpy', 'fcs', 'crc_hqx',
+                                       'speedup'])
+    for length in [int(n) for n in lengths.split(',')]:
+        rnd = random.Random(length)
+        payload = [rnd.randint(0x00, 0xff) for _ in range(length)]
+        udp_len = [0x00, 0x00, (length + 8) >> 8, (length + 8) & 0xff]
+        args = (SRC, DST, udp_len, NH, payload)
+
+        assert legacy_pseudo_header_crc(*args) == utils.calculate_pseudo_header_crc(*args) == \
+            array_pseudo_header_crc(*args) == numpy_pseudo_header_crc(*args)
+        assert legacy_fcs(payload) == utils.calculate_fcs(payload)
+
+        durations = [measure(lambda: f(*args), number=number) for f in
+                     [legacy_pseudo_header_crc, utils.calculate_pseudo_header_crc, array_pseudo_header_crc,
+                      numpy_pseudo_header_crc]]
+        durations += [measure(lambda: f(payload), number=number) for f in [legacy_fcs, utils.calculate_fcs]]
+        durations = [d * 1e6 for d in durations]
+
+        print_row([length, durations[0], durations[1], speedup(durations[0], durations[1]), durations[2],
+                   durations[3], durations[4], durations[5], speedup(durations[4], durations[5])])
+
+
+if __name__ == '__main__':
+    cli()
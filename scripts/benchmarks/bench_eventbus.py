@@ -0,0 +1,127 @@
+"""
+Microbenchmark of the EventBus dispatch path.
+
+Compares the former broadcast-and-scan implementation, where every client is connected to PyDispatcher and scans its
+own registrations, with the indexed EventBusRouter. The simulated network mimics the clients created per mote (a
+MoteConnector and a MoteState) plus a single subscriber of 'fromMote.data', as OpenLbr does.
+"""
+
+import threading
+
+import click
+from pydispatch import dispatcher
+
+from openvisualizer.eventbus.eventbusclient import EventBusClient
+from scripts.benchmarks.benchutils import measure, print_header, print_row, speedup
+
+WILDCARD = '*'
+
+
+class LegacyEventBusClient(object):
+    """ Copy of the EventBusClient dispatch path before the introduction of the EventBusRouter. """
+
+    def __init__(self, name, registrations):
+        self.data_lock = threading.RLock()
+        self.registrations = []
+        self.name = name
+        for r in registrations:
+            self.registrations += [dict(r, numRx=0)]
+        dispatcher.connect(receiver=self._event_bus_notification)
+
+    def dispatch(self, signal, data):
+        return dispatcher.send(sender=self.name, signal=signal, data=data)
+
+    def close(self):
+        dispatcher.disconnect(receiver=self._event_bus_notification)
+
+    def _event_bus_notification(self, signal, sender, data):
+        callback = None
+        with self.data_lock:
+            for r in self.registrations:
+                if self._signals_equivalent(r['signal'], signal) and (
+                        r['sender'] == sender or r['sender'] == WILDCARD):
+                    callback = r['callback']
+                    break
+        if not callback:
+            return None
+        return callback(sender=sender, signal=signal, data=data)
+
+    @staticmethod
+    def _signals_equivalent(s1, s2):
+        return_val = True
+        if type(s1) == type(s2) == str:
+            if (s1 != s2) and (s1 != WILDCARD) and (s2 != WILDCARD):
+                return_val = False
+        elif type(s1) == type(s2) == tuple:
+            if len(s1) == len(s2) == 3:
+                for i in range(3):
+                    if (s1[i] != s2[i]) and (s1[i] != WILDCARD) and (s2[i] != WILDCARD):
+                        return_val = False
+            else:
+                return_val = False
+        else:
+            return_val = False
+        return return_val
+
+
+def _noop(sender, signal, data):
+    return None
+
+
+def _mote_registrations(index):
+    """ Registrations resembling those of a MoteConnector and a MoteState. """
+    return [
+        [
+            {'sender': WILDCARD, 'signal': 'infoDagRoot', 'callback': _noop},
+            {'sender': WILDCARD, 'signal': 'cmdToMote', 'callback': _noop},
+            {'sender': WILDCARD, 'signal': ('mote{0}'.format(index), 'udp', 5683), 'callback': _noop},
+        ],
+        [
+            {'sender': WILDCARD, 'signal': 'networkPrefix', 'callback': _noop},
+            {'sender': WILDCARD, 'signal': 'getStateElem', 'callback': _noop},
+        ],
+    ]
+
+
+def _build(cls, num_motes, tag):
+    clients = []
+    for i in range(num_motes):
+        for j, regs in enumerate(_mote_registrations(i)):
+            clients.append(cls('{0}-mote{1}-{2}'.format(tag, i, j), regs))
+    clients.append(cls('{0}-openLbr'.format(tag), [{'sender': WILDCARD, 'signal': 'fromMote.data', 'callback': _noop}]))
+    sender = cls('{0}-sender'.format(tag), [])
+    clients.append(sender)
+    return sender, clients
+
+
+@click.command()
+@click.option('--motes', default='1,10,50,100', show_default=True, help='Comma separated list of network sizes')
+@click.option('--dispatches', default=2000, show_default=True, help='Number of dispatches per measurement')
+def cli(motes, dispatches):
+    """ Compare the legacy PyDispatcher broadcast with the indexed EventBusRouter. """
+
+    sizes = [int(m) for m in motes.split(',')]
+    results = {}
+
+    # the legacy clients are measured first, before the router connects itself to PyDispatcher
+    for n in sizes:
+        sender, clients = _build(LegacyEventBusClient, n, 'legacy{0}'.format(n))
+        results[n] = [measure(lambda: sender.dispatch('fromMote.data', None), number=dispatches)]
+        for c in clients:
+            c.close()
+
+    for n in sizes:
+        sender, clients = _build(EventBusClient, n, 'router{0}'.format(n))
+        results[n].append(measure(lambda: sender.dispatch('fromMote.data', None), number=dispatches))
+        for c in clients:
+            for r in c.registrations:
+                c.unregister(sender=r['sender'], signal=r['signal'], callback=r['callback'])
+
+    print_header("Dispatch of 'fromMote.data' (us per dispatch)", ['motes', 'legacy', 'router', 'speedup'])
+    for n in sizes:
+        legacy, router = results[n]
+        print_row([n, legacy * 1e6, router * 1e6, speedup(legacy, router)])
+
+
+if __name__ == '__main__':
+    cli()
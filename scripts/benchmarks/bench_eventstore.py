@@ -0,0 +1,78 @@
+"""
+Ingest benchmark of the mote event database.
+
+Compares the former per-event INSERT and commit, as done by ParserEvent on a per-mote database, with the batched
+write-behind EventStore. Events are 'pkt' rows, the most frequent event when the debug events are enabled.
+"""
+
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+
+import click
+
+from openvisualizer.motehandler.moteconnector.openparser.eventstore import EventStore
+from scripts.benchmarks.benchutils import print_header, print_row, speedup
+
+PKT_ROW = (1000, '0000000000000001', 'TX', '0000000000000001', '0000000000000002', 'DATA', 1, 3, 4, 0, 0, 0, 1,
+           0, 0, 1, 2, 'bbbb0000000000000000000000000001', 'bbbb0000000000000000000000000002', 17, 5683)
+
+
+def _legacy_ingest(db_filename, num_events):
+    columns = dict(EventStore.TABLES)['pkt']
+    insert = 'INSERT INTO pkt ({0}) VALUES ({1})'.format(', '.join(c for (c, _) in columns),
+                                                         ','.join('?' for _ in columns))
+
+    dbconn = sqlite3.connect(db_filename)
+    dbconn.execute('CREATE TABLE pkt ({0})'.format(', '.join(' '.join(c) for c in columns)))
+    dbconn.commit()
+    dbconn.isolation_level = 'EXCLUSIVE'
+
+    start = time.time()
+    for _ in range(num_events):
+        c = dbconn.cursor()
+        c.execute(insert, PKT_ROW)
+        dbconn.commit()
+    duration = time.time() - start
+
+    dbconn.close()
+    return duration
+
+
+def _store_ingest(store, num_events):
+    start = time.time()
+    for _ in range(num_events):
+        store.insert('pkt', PKT_ROW)
+    enqueued = time.time() - start
+    store.flush()
+    return enqueued, time.time() - start
+
+
+@click.command()
+@click.option('--events', default='1000,10000', show_default=True, help='Comma separated numbers of events')
+@click.option('--batch-size', default=EventStore.BATCH_SIZE, show_default=True, help='Rows per batch')
+@click.option('--directory', type=click.Path(exists=True, file_okay=False), help='Directory of the databases')
+def cli(events, batch_size, directory):
+    """ Compare per-event commits with the write-behind event store. """
+
+    tmp = tempfile.mkdtemp(dir=directory)
+    store = EventStore(os.path.join(tmp, 'openv_events.db'), batch_size=batch_size)
+
+    try:
+        print_header('Ingest of pkt events (events/s)', ['events', 'legacy', 'enqueue', 'store', 'speedup'])
+        for n in [int(e) for e in events.split(',')]:
+            legacy = _legacy_ingest(os.path.join(tmp, 'legacy{0}.db'.format(n)), n)
+            enqueued, stored = _store_ingest(store, n)
+            print_row([n, n / legacy, n / enqueued, n / stored, speedup(legacy, stored)])
+
+        stats = store.get_stats()
+        click.secho('\nflushed {0} events in {1} batches'.format(stats['flushed'], stats['batches']))
+    finally:
+        store.close()
+        shutil.rmtree(tmp)
+
+
+if __name__ == '__main__':
+    cli()
@@ -0,0 +1,79 @@
+"""
+Throughput benchmark of the HDLC codec.
+
+Reports MB/s for the former per-byte CRC loop and for the bulk codec, for hdlcify(), dehdlcify() and the streaming
+feed() decoder.
+"""
+
+import random
+
+import click
+
+from openvisualizer.motehandler.moteprobe.openhdlc import OpenHdlc, crc16, crc16_table
+from scripts.benchmarks.benchutils import measure, print_header, print_row, speedup
+
+
+class LegacyOpenHdlc(OpenHdlc):
+    """ OpenHdlc with the per-byte CRC iteration used before the bulk codec. """
+
+    def hdlcify(self, in_buf):
+        out_buf = in_buf[:]
+        crc = self.HDLC_CRCINIT
+        for b in out_buf:
+            crc = self._crc_iteration(crc, b)
+        crc = 0xffff - crc
+        out_buf = out_buf + chr(crc & 0xff) + chr((crc & 0xff00) >> 8)
+        out_buf = out_buf.replace(self.HDLC_ESCAPE, self.HDLC_ESCAPE + self.HDLC_ESCAPE_ESCAPED)
+        out_buf = out_buf.replace(self.HDLC_FLAG, self.HDLC_ESCAPE + self.HDLC_FLAG_ESCAPED)
+        return self.HDLC_FLAG + out_buf + self.HDLC_FLAG
+
+    def dehdlcify(self, in_buf):
+        out_buf = in_buf[1:-1]
+        out_buf = out_buf.replace(self.HDLC_ESCAPE + self.HDLC_FLAG_ESCAPED, self.HDLC_FLAG)
+        out_buf = out_buf.replace(self.HDLC_ESCAPE + self.HDLC_ESCAPE_ESCAPED, self.HDLC_ESCAPE)
+        crc = self.HDLC_CRCINIT
+        for b in out_buf:
+            crc = self._crc_iteration(crc, b)
+        assert crc == self.HDLC_CRCGOOD
+        return out_buf[:-2]
+
+    def _crc_iteration(self, crc, b):
+        return (crc >> 8) ^ self.FCS16TAB[((crc ^ (ord(b))) & 0xff)]
+
+
+@click.command()
+@click.option('--frames', default=1000, show_default=True, help='Number of frames per measurement')
+@click.option('--lengths', default='16,127,1280', show_default=True, help='Comma separated frame lengths')
+def cli(frames, lengths):
+    """ Compare the per-byte HDLC codec with the bulk codec. """
+
+    legacy = LegacyOpenHdlc()
+    bulk = OpenHdlc()
+
+    print_header('HDLC codec throughput (MB/s)', ['length', 'operation', 'legacy', 'bulk', 'speedup'])
+
+    for length in [int(n) for n in lengths.split(',')]:
+        payloads = [''.join(chr(random.randint(0x00, 0xff)) for _ in range(length)) for _ in range(frames)]
+        encoded = [bulk.hdlcify(p) for p in payloads]
+        stream = ''.join(encoded)
+        size_mb = length * frames / 1e6
+
+        t_legacy = measure(lambda: [legacy.hdlcify(p) for p in payloads])
+        t_bulk = measure(lambda: [bulk.hdlcify(p) for p in payloads])
+        print_row([length, 'hdlcify', size_mb / t_legacy, size_mb / t_bulk, speedup(t_legacy, t_bulk)])
+
+        t_legacy = measure(lambda: [legacy.dehdlcify(e) for e in encoded])
+        t_bulk = measure(lambda: [bulk.dehdlcify(e) for e in encoded])
+        print_row([length, 'dehdlcify', size_mb / t_legacy, size_mb / t_bulk, speedup(t_legacy, t_bulk)])
+
+        # the legacy column of the crc16 row is the pure Python table-driven implementation
+        t_legacy = measure(lambda: [crc16_table(p) for p in payloads])
+        t_bulk = measure(lambda: [crc16(p) for p in payloads])
+        print_row([length, 'crc16', size_mb / t_legacy, size_mb / t_bulk, speedup(t_legacy, t_bulk)])
+
+        t_bulk = measure(lambda: OpenHdlc().feed(stream))
+        print_row([length, 'feed', '-', size_mb / t_bulk, '-'])
+
+
+if __name__ == '__main__':
+    cli()
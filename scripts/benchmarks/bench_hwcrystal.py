@@ -0,0 +1,135 @@
+"""
+Cost and accuracy of the emulated crystal.
+
+Replays what the sctimer of an emulated mote asks the crystal at every compare interrupt: the time of the last tick,
+the counter since the last reset and the time of the next compare, every 20 ms slot of simulated time. Compares the
+former crystal, computing in float seconds, with the integer one. Also reports how far from the exact tick the
+former crystal put the compare after the given number of simulated hours, with a drifting crystal.
+"""
+
+import logging
+from fractions import Fraction
+
+import click
+
+from openvisualizer.bspemulator.hwcrystal import HwCrystal
+from openvisualizer.simengine.simengine import SimEngine
+from openvisualizer.simengine.timeline import TimeLine
+from scripts.benchmarks.benchutils import measure, print_header, print_row, speedup
+
+SLOT_TICKS = 655  # about 20 ms
+DRIFT = 13.37  # ppm
+
+
+class LegacyCrystal(object):
+    """ Copy of the former HwCrystal, with times in float seconds. """
+
+    def __init__(self, timeline, drift):
+        self.timeline = timeline
+        self.frequency = HwCrystal.FREQUENCY
+        self.drift = drift
+        self._period = None
+        self.ts_tick = self.timeline.get_current_time()
+
+    def get_time_last_tick(self):
+        current_time = self.timeline.get_current_time()
+        time_since_last = current_time - self.ts_tick
+
+        ticks_since_last = round(float(time_since_last) / float(self.period))
+        time_last_tick = self.ts_tick + ticks_since_last * self.period
+
+        self.ts_tick = time_last_tick
+
+        return time_last_tick
+
+    def get_time_in(self, num_ticks):
+        time_last_tick = self.get_time_last_tick()
+        return time_last_tick + num_ticks * self.period
+
+    def get_ticks_since(self, event_time):
+        time_last_tick = self.get_time_last_tick()
+        if time_last_tick < event_time:
+            return 0
+        return int(float(time_last_tick - event_time) / float(self.period))
+
+    @property
+    def period(self):
+        if self._period is None:
+            self._period = float(1) / float(self.frequency)
+            self._period += float(self.drift / 1000000.0) * float(self._period)
+        return self._period
+
+
+class _Timeline(object):
+
+    def __init__(self):
+        self.current_time = 0
+
+    def get_current_time(self):
+        return self.current_time
+
+
+class _MoteHandler(object):
+
+    def __init__(self, engine):
+        self.engine = engine
+
+    @staticmethod
+    def get_id():
+        return 0
+
+
+def _crystal(engine, timeline, drift):
+    crystal = HwCrystal(_MoteHandler(engine))
+    crystal.log.setLevel(logging.WARNING)
+    crystal.drift = drift
+    (crystal.period_num, crystal.period_den) = HwCrystal.tick_period(crystal.frequency, drift)
+    crystal.timeline = timeline
+    crystal.start()
+    return crystal
+
+
+def _replay(crystal, timeline, num_slots):
+    """ Returns the time of the last compare. """
+    time_last_reset = crystal.get_time_last_tick()
+    compare_time = timeline.current_time
+    for _ in range(num_slots):
+        timeline.current_time = compare_time
+        crystal.get_time_last_tick()
+        crystal.get_ticks_since(time_last_reset)
+        compare_time = crystal.get_time_in(SLOT_TICKS)
+    return compare_time
+
+
+@click.command()
+@click.option('--slots', default=20000, show_default=True, help='Number of slots per throughput measurement')
+@click.option('--hours', default='1,10', show_default=True, help='Comma-separated simulated durations')
+def cli(slots, hours):
+    """ Compare the former float crystal with the integer one. """
+
+    engine = SimEngine()
+
+    print_header('Sctimer calls during {0} slots: slots/s'.format(slots), ['legacy', 'integer', 'speedup'])
+    legacy_timeline = _Timeline()
+    legacy = measure(lambda: _replay(LegacyCrystal(legacy_timeline, DRIFT), legacy_timeline, slots)) / slots
+    integer_timeline = _Timeline()
+    integer = measure(lambda: _replay(_crystal(engine, integer_timeline, DRIFT), integer_timeline, slots)) / slots
+    print_row([1 / legacy, 1 / integer, speedup(legacy, integer)])
+
+    print_header('Error on the time of the last compare, {0} ppm drift: ns'.format(DRIFT),
+                 ['hours', 'legacy', 'integer'])
+    period = Fraction(TimeLine.NS_PER_SECOND, HwCrystal.FREQUENCY) * (1 + Fraction(int(round(DRIFT * 1000)), 10 ** 9))
+    for num_hours in [int(h) for h in hours.split(',')]:
+        num_slots = int(num_hours * 3600 / (SLOT_TICKS * period / TimeLine.NS_PER_SECOND))
+        exact = num_slots * SLOT_TICKS * period
+
+        legacy_timeline.current_time = 0.0
+        legacy = _replay(LegacyCrystal(legacy_timeline, DRIFT), legacy_timeline, num_slots)
+        integer_timeline.current_time = 0
+        integer = _replay(_crystal(engine, integer_timeline, DRIFT), integer_timeline, num_slots)
+        legacy_error = abs(Fraction(legacy) * TimeLine.NS_PER_SECOND - exact)
+        print_row([num_hours, float(legacy_error), float(abs(integer - exact))])
+
+
+if __name__ == '__main__':
+    cli()
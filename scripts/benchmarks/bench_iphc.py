@@ -0,0 +1,573 @@
+"""
+Per-packet cost of the 6LoWPAN header compression and decompression of OpenLbr.
+
+Compares the former compression, which compared the prefixes and chose the IPHC, RH3 and IPinIP encodings for every
+packet, with the headers compiled once per flow, and the former decompression, which branched on every TF, HLIM, SAM
+and DAM value, with the address layouts compiled for the network prefix and the DAG root. Each packet of a flow
+carries a different payload, the flows are used round-robin.
+"""
+
+import logging
+import random
+
+import click
+
+from openvisualizer.openlbr import openlbr
+from openvisualizer.opentun.opentun import OpenTun
+from openvisualizer.utils import format_addr
+from scripts.benchmarks.benchutils import measure, print_header, print_row, speedup
+
+log = logging.getLogger('OpenLbr')
+
+DAGROOT = [0x14, 0x15, 0x92, 0x00, 0x00, 0x00, 0x00, 0x01]
+
+
+class LegacyOpenLbr(openlbr.OpenLbr):
+    """ Copy of the former compression and decompression. """
+
+    def reassemble_lowpan(self, lowpan):
+        return_val = bytearray()
+
+        if self.use_page_zero:
+            print 'Page dispatch page number zero is not supported!\n'
+            raise SystemError()
+
+        # the 6lowpan packet contains 4 parts
+        # 1. Page Dispatch (page 1)
+        # 2. RH3 6LoRH(s)
+        # 3. RPI 6LoRH (maybe elided)
+        # 4. IPinIP 6LoRH (maybe elided)
+        # 5. IPHC inner header
+
+        # ===================== 1. Page Dispatch (page 1) =====================
+
+        return_val.append(self.PAGE_ONE_DISPATCH)
+
+        # compare the addresses as bytearrays, whatever the type of the fields
+        lowpan['src_addr'] = bytearray(lowpan['src_addr'])
+        lowpan['dst_addr'] = bytearray(lowpan['dst_addr'])
+        tun_prefix = bytearray(OpenTun.IPV6PREFIX)
+        tun_addr = tun_prefix + bytearray(OpenTun.IPV6HOST)
+
+        if lowpan['src_addr'][:8] != tun_prefix:
+            compress_reference = tun_addr
+        else:
+            compress_reference = lowpan['src_addr']
+
+        # destination address
+        if len(lowpan['route']) > 1:
+            # source route needed, get prefix from compression Reference
+            if len(compress_reference) == 16:
+                _ = compress_reference[:8]  # prefix
+
+            # =======================3. RH3 6LoRH(s) ==============================
+            size_unit_type = 0xff
+            size = 0
+            hop_list = bytearray()
+
+            for hop in reversed(lowpan['route'][1:]):
+                hop = bytearray(hop)
+                size += 1
+                if compress_reference[-8:-1] == hop[-8:-1]:
+                    if size_unit_type != 0xff:
+                        if size_unit_type != self.TYPE_6LoRH_RH3_0:
+                            return_val.extend([self.CRITICAL_6LoRH | (size - 2), size_unit_type])
+                            return_val.extend(hop_list)
+                            size = 1
+                            size_unit_type = self.TYPE_6LoRH_RH3_0
+                            hop_list = hop[-1:]
+                            compress_reference = hop
+                        else:
+                            hop_list.append(hop[-1])
+                            compress_reference = hop
+                    else:
+                        size_unit_type = self.TYPE_6LoRH_RH3_0
+                        hop_list.append(hop[-1])
+                        compress_reference = hop
+                elif compress_reference[-8:-2] == hop[-8:-2]:
+                    if size_unit_type != 0xff:
+                        if size_unit_type != self.TYPE_6LoRH_RH3_1:
+                            return_val.extend([self.CRITICAL_6LoRH | (size - 2), size_unit_type])
+                            return_val.extend(hop_list)
+                            size = 1
+                            size_unit_type = self.TYPE_6LoRH_RH3_1
+                            hop_list = hop[-2:]
+                            compress_reference = hop
+                        else:
+                            hop_list += hop[-2:]
+                            compress_reference = hop
+                    else:
+                        size_unit_type = self.TYPE_6LoRH_RH3_1
+                        hop_list += hop[-2:]
+                        compress_reference = hop
+                elif compress_reference[-8:-4] == hop[-8:-4]:
+                    if size_unit_type != 0xff:
+                        if size_unit_type != self.TYPE_6LoRH_RH3_2:
+                            return_val.extend([self.CRITICAL_6LoRH | (size - 2), size_unit_type])
+                            return_val.extend(hop_list)
+                            size = 1
+                            size_unit_type = self.TYPE_6LoRH_RH3_2
+                            hop_list = hop[-4:]
+                            compress_reference = hop
+                        else:
+                            hop_list += hop[-4:]
+                            compress_reference = hop
+                    else:
+                        size_unit_type = self.TYPE_6LoRH_RH3_2
+                        hop_list += hop[-4:]
+                        compress_reference = hop
+                else:
+                    if size_unit_type != 0xff:
+                        if size_unit_type != self.TYPE_6LoRH_RH3_3:
+                            return_val.extend([self.CRITICAL_6LoRH | (size - 2), size_unit_type])
+                            return_val.extend(hop_list)
+                            size = 1
+                            size_unit_type = self.TYPE_6LoRH_RH3_3
+                            hop_list = bytearray(hop)
+                            compress_reference = hop
+                        else:
+                            hop_list += hop
+                            compress_reference = hop
+                    else:
+                        size_unit_type = self.TYPE_6LoRH_RH3_3
+                        hop_list += hop
+                        compress_reference = hop
+
+            return_val.extend([self.CRITICAL_6LoRH | (size - 1), size_unit_type])
+            return_val.extend(hop_list)
+
+        # ===================== 2. IPinIP 6LoRH ===============================
+
+        if lowpan['src_addr'][:8] != lowpan['dst_addr'][:8]:
+            # add RPI
+            # TBD
+            flag = self.O_FLAG | self.I_FLAG | self.K_FLAG
+            sender_rank = 0  # rank of dagroot
+            return_val.extend([self.CRITICAL_6LoRH | flag, self.TYPE_6LoRH_RPI, sender_rank])
+            # ip in ip 6lorh
+            length = 1
+            return_val.extend([self.ELECTIVE_6LoRH | length, self.TYPE_6LoRH_IP_IN_IP])
+            return_val.extend(lowpan['hlim'])
+
+            compress_reference = tun_addr
+        else:
+            compress_reference = lowpan['src_addr']
+
+        # ========================= 4. IPHC inner header ======================
+        # Byte1: 011(3b) TF(2b) NH(1b) HLIM(2b)
+        if len(lowpan['tf']) == 0:
+            tf = self.IPHC_TF_ELIDED
+        else:
+            raise NotImplementedError()
+        # next header is in NHC format
+        nh = self.IPHC_NH_INLINE
+        if lowpan['hlim'][0] == 1:
+            hlim = self.IPHC_HLIM_1
+            lowpan['hlim'] = []
+        elif lowpan['hlim'][0] == 64:
+            hlim = self.IPHC_HLIM_64
+            lowpan['hlim'] = []
+        elif lowpan['hlim'][0] == 255:
+            hlim = self.IPHC_HLIM_255
+            lowpan['hlim'] = []
+        else:
+            hlim = self.IPHC_HLIM_INLINE
+        return_val.append((self.IPHC_DISPATCH << 5) + (tf << 3) + (nh << 2) + (hlim << 0))
+
+        # Byte2: CID(1b) SAC(1b) SAM(2b) M(1b) DAC(2b) DAM(2b)
+        if len(lowpan['cid']) == 0:
+            cid = self.IPHC_CID_NO
+        else:
+            cid = self.IPHC_CID_YES
+
+        if self._is_link_local(lowpan['src_addr']):
+            sac = self.IPHC_SAC_STATELESS
+            lowpan['src_addr'] = lowpan['src_addr'][8:]
+        else:
+            if lowpan['src_addr'][:8] == tun_prefix:
+                sac = self.IPHC_SAC_STATEFUL
+                lowpan['src_addr'] = lowpan['src_addr'][8:]
+            else:
+                sac = self.IPHC_SAC_STATELESS
+
+        if len(lowpan['src_addr']) == 128 / 8:
+            sam = self.IPHC_SAM_128B
+        elif len(lowpan['src_addr']) == 64 / 8:
+            sam = self.IPHC_SAM_64B
+        elif len(lowpan['src_addr']) == 16 / 8:
+            sam = self.IPHC_SAM_16B
+        elif len(lowpan['src_addr']) == 0:
+            sam = self.IPHC_SAM_ELIDED
+        else:
+            raise SystemError()
+
+        if self._is_link_local(lowpan['dst_addr']):
+            dac = self.IPHC_DAC_STATELESS
+            lowpan['dst_addr'] = lowpan['dst_addr'][8:]
+        else:
+
+            if lowpan['dst_addr'][:8] == tun_prefix:
+                dac = self.IPHC_DAC_STATEFUL
+                lowpan['dst_addr'] = lowpan['dst_addr'][8:]
+            else:
+                dac = self.IPHC_DAC_STATELESS
+
+        m = self.IPHC_M_NO
+        if len(lowpan['dst_addr']) == 128 / 8:
+            dam = self.IPHC_DAM_128B
+        elif len(lowpan['dst_addr']) == 64 / 8:
+            dam = self.IPHC_DAM_64B
+        elif len(lowpan['dst_addr']) == 16 / 8:
+            dam = self.IPHC_DAM_16B
+        elif len(lowpan['dst_addr']) == 0:
+            dam = self.IPHC_DAM_ELIDED
+        else:
+            raise SystemError()
+        return_val.append((cid << 7) + (sac << 6) + (sam << 4) + (m << 3) + (dac << 2) + (dam << 0))
+
+        # tf
+        return_val.extend(lowpan['tf'])
+
+        # nh
+        return_val.extend(lowpan['nh'])
+
+        # hlim
+        return_val.extend(lowpan['hlim'])
+
+        # cid
+        return_val.extend(lowpan['cid'])
+
+        # src_addr
+        return_val.extend(lowpan['src_addr'])
+
+        # dst_addr
+        return_val.extend(lowpan['dst_addr'])
+
+        # payload
+        return_val.extend(lowpan['payload'])
+
+        return return_val
+
+    def lowpan_to_ipv6(self, data):
+
+        pkt_ipv6 = {}
+        mac_prev_hop = data[0]
+        pkt_lowpan = data[1]
+
+        if pkt_lowpan[0] == self.PAGE_ONE_DISPATCH:
+            ptr = 1
+            if pkt_lowpan[ptr] & self.MASK_6LoRH == self.CRITICAL_6LoRH and pkt_lowpan[ptr + 1] == self.TYPE_6LoRH_RPI:
+                # next header is RPI (hop by hop)
+                pkt_ipv6['next_header'] = self.IANA_IPv6HOPHEADER
+                pkt_ipv6['hop_flags'] = pkt_lowpan[ptr] & self.FLAG_MASK
+                ptr = ptr + 2
+
+                if pkt_ipv6['hop_flags'] & self.I_FLAG == 0:
+                    pkt_ipv6['hop_rplInstanceID'] = pkt_lowpan[ptr]
+                    ptr += 1
+                else:
+                    pkt_ipv6['hop_rplInstanceID'] = 0
+
+                if pkt_ipv6['hop_flags'] & self.K_FLAG == 0:
+                    pkt_ipv6['hop_senderRank'] = ((pkt_lowpan[ptr]) << 8) + ((pkt_lowpan[ptr + 1]) << 0)
+                    ptr += 2
+                else:
+                    pkt_ipv6['hop_senderRank'] = (pkt_lowpan[ptr]) << 8
+                    ptr += 1
+                # iphc is following after hopbyhop header
+                pkt_ipv6['hop_next_header'] = self.IPV6_HEADER
+
+                if pkt_lowpan[ptr] & self.MASK_6LoRH == self.ELECTIVE_6LoRH and \
+                        pkt_lowpan[ptr + 1] == self.TYPE_6LoRH_IP_IN_IP:
+                    # ip in ip encapsulation
+                    length = pkt_lowpan[ptr] & self.MASK_LENGTH_6LoRH_IPINIP
+                    pkt_ipv6['hop_limit'] = pkt_lowpan[ptr + 2]
+                    ptr += 3
+                    if length == 1:
+                        pkt_ipv6['src_addr'] = OpenTun.IPV6PREFIX + OpenTun.IPV6HOST
+                    elif length == 9:
+                        pkt_ipv6['src_addr'] = self.network_prefix + pkt_lowpan[ptr:ptr + 8]
+                        ptr += 8
+                    elif length == 17:
+                        pkt_ipv6['src_addr'] = pkt_lowpan[ptr:ptr + 16]
+                        ptr += 16
+                    else:
+                        log.error("ERROR wrong length of encapsulate")
+                elif pkt_lowpan[ptr] & self.MASK_6LoRH == self.ELECTIVE_6LoRH and \
+                        pkt_lowpan[ptr + 1] == self.TYPE_6LoRH_DEADLINE:
+
+                    length = pkt_lowpan[ptr] & self.MASK_LENGTH_6LoRH_IPINIP
+                    _ = pkt_lowpan[ptr + 2]  # next byte
+
+                    # 3rd byte
+                    o_val = (pkt_lowpan[ptr + 2] & self.ORG_FLAG) >> 7
+                    _ = (pkt_lowpan[ptr + 2] & self.DELAY_FLAG) >> 6  # d_val
+                    etl_val = (pkt_lowpan[ptr + 2] & self.ETL_FLAG) >> 3
+                    otl_val = (pkt_lowpan[ptr + 2] & self.OTL_FLAG)
+
+                    # 4th byte
+                    _ = (pkt_lowpan[ptr + 3] & self.TU_FLAG) >> 6  # tu_val
+                    _ = (pkt_lowpan[ptr + 3] & self.EXP_FLAG) >> 3  # exponent
+
+                    # Expiration Time
+                    nxt_ptr = ptr + 4
+                    exp_time = []
+                    for counter in range(0, etl_val + 1):
+                        exp_time.append(pkt_lowpan[nxt_ptr + counter])
+                    e_time = exp_time[::-1]
+
+                    # Origination Time
+                    if o_val == 1:
+                        org_time = []
+                        nxt_ptr = nxt_ptr + counter + 1
+                        for counter in range(0, otl_val + 1):
+                            org_time.append(pkt_lowpan[nxt_ptr + counter])
+                        o_time = org_time[::-1]
+
+                    # log
+                    if log.isEnabledFor(logging.ERROR):
+                        output = []
+                        output += [' ']
+                        output += ['Received a DeadLine Hop-by-Hop Header']
+                        output += ['exp_time is {0}'.format(format_addr(e_time))]
+                        if o_val == 1:
+                            output += ['org_time is {0}'.format(format_addr(o_time))]
+                        output = '\n'.join(output)
+                        log.error(output)
+                        print output
+
+                    ptr += length + 1
+            else:
+                log.error("ERROR no support this type of 6LoRH yet")
+        else:
+            ptr = 2
+            if (pkt_lowpan[0] >> 5) != 0x03:
+                log.error("ERROR not a 6LowPAN packet")
+                return
+
+            # tf
+            tf = ((pkt_lowpan[0]) >> 3) & 0x03
+            if tf == self.IPHC_TF_3B:
+                pkt_ipv6['flow_label'] = ((pkt_lowpan[ptr]) << 16) + ((pkt_lowpan[ptr + 1]) << 8) + (
+                        (pkt_lowpan[ptr + 2]) << 0)
+                ptr = ptr + 3
+            elif tf == self.IPHC_TF_ELIDED:
+                pkt_ipv6['flow_label'] = 0
+            else:
+                log.error("Unsupported or wrong tf")
+            # nh
+            nh = ((pkt_lowpan[0]) >> 2) & 0x01
+            if nh == self.IPHC_NH_INLINE:
+                pkt_ipv6['next_header'] = (pkt_lowpan[ptr])
+                ptr = ptr + 1
+            elif nh == self.IPHC_NH_COMPRESSED:
+                # the next header will be retrieved later
+                pass
+            else:
+                log.error("wrong nh field nh=" + str(nh))
+
+            # hlim
+            hlim = (pkt_lowpan[0]) & 0x03
+            if hlim == self.IPHC_HLIM_INLINE:
+                pkt_ipv6['hop_limit'] = (pkt_lowpan[ptr])
+                ptr = ptr + 1
+            elif hlim == self.IPHC_HLIM_1:
+                pkt_ipv6['hop_limit'] = 1
+            elif hlim == self.IPHC_HLIM_64:
+                pkt_ipv6['hop_limit'] = 64
+            elif hlim == self.IPHC_HLIM_255:
+                pkt_ipv6['hop_limit'] = 255
+            else:
+                log.error("wrong hlim==" + str(hlim))
+
+            # sac
+            sac = ((pkt_lowpan[1]) >> 6) & 0x01
+            if sac == self.IPHC_SAC_STATELESS:
+                prefix = self.LINK_LOCAL_PREFIX
+            elif sac == self.IPHC_SAC_STATEFUL:
+                prefix = self.network_prefix
+            else:
+                log.error("wrong sac==" + str(sac))
+                return
+
+            # sam
+            sam = ((pkt_lowpan[1]) >> 4) & 0x03
+            if sam == self.IPHC_SAM_ELIDED:
+                # pkt from the previous hop
+                pkt_ipv6['src_addr'] = prefix + mac_prev_hop
+
+            elif sam == self.IPHC_SAM_16B:
+                a1 = pkt_lowpan[ptr]
+                a2 = pkt_lowpan[ptr + 1]
+                ptr = ptr + 2
+                s = ''.join(['\x00', '\x00', '\x00', '\x00', '\x00', '\x00', a1, a2])
+                pkt_ipv6['src_addr'] = prefix + s
+
+            elif sam == self.IPHC_SAM_64B:
+                pkt_ipv6['src_addr'] = prefix + pkt_lowpan[ptr:ptr + 8]
+                ptr = ptr + 8
+            elif sam == self.IPHC_SAM_128B:
+                pkt_ipv6['src_addr'] = pkt_lowpan[ptr:ptr + 16]
+                ptr = ptr + 16
+            else:
+                log.error("wrong sam==" + str(sam))
+
+            # dac
+            dac = ((pkt_lowpan[1]) >> 2) & 0x01
+            if dac == self.IPHC_DAC_STATELESS:
+                prefix = self.LINK_LOCAL_PREFIX
+            elif dac == self.IPHC_DAC_STATEFUL:
+                prefix = self.network_prefix
+
+            # dam
+            dam = ((pkt_lowpan[1]) & 0x03)
+            if dam == self.IPHC_DAM_ELIDED:
+                if log.isEnabledFor(logging.DEBUG):
+                    log.debug("IPHC_DAM_ELIDED this packet is for the dagroot!")
+                pkt_ipv6['dst_addr'] = prefix + self.dagRootEui64
+            elif dam == self.IPHC_DAM_16B:
+                a1 = pkt_lowpan[ptr]
+                a2 = pkt_lowpan[ptr + 1]
+                ptr = ptr + 2
+                s = ''.join(['\x00', '\x00', '\x00', '\x00', '\x00', '\x00', a1, a2])
+                pkt_ipv6['dst_addr'] = prefix + s
+            elif dam == self.IPHC_DAM_64B:
+                pkt_ipv6['dst_addr'] = prefix + pkt_lowpan[ptr:ptr + 8]
+                ptr = ptr + 8
+            elif dam == self.IPHC_DAM_128B:
+                pkt_ipv6['dst_addr'] = pkt_lowpan[ptr:ptr + 16]
+                ptr = ptr + 16
+            else:
+                log.error("wrong dam==" + str(dam))
+
+            if nh == self.IPHC_NH_COMPRESSED:
+                if ((pkt_lowpan[ptr] >> 4) & 0x0f) == self.NHC_DISPATCH:
+                    eid = (pkt_lowpan[ptr] & self.NHC_EID_MASK) >> 1
+                    if eid == self.NHC_EID_HOPBYHOP:
+                        pkt_ipv6['next_header'] = self.IANA_IPv6HOPHEADER
+                    elif eid == self.NHC_EID_IPV6:
+                        pkt_ipv6['next_header'] = self.IPV6_HEADER
+                    else:
+                        log.error("wrong NH_EID==" + str(eid))
+                elif pkt_lowpan[ptr] & self.NHC_UDP_ID == self.NHC_UDP_ID:
+                    pkt_ipv6['next_header'] = self.IANA_UDP
+
+            # hop by hop header
+            # composed of NHC, NextHeader,Len + Rpl Option
+            if pkt_ipv6['next_header'] == self.IANA_IPv6HOPHEADER:
+                pkt_ipv6['hop_nhc'] = pkt_lowpan[ptr]
+                ptr = ptr + 1
+                if (pkt_ipv6['hop_nhc'] & 0x01) == 0:
+                    pkt_ipv6['hop_next_header'] = pkt_lowpan[ptr]
+                    ptr = ptr + 1
+                else:
+                    # the next header filed will be elided
+                    pass
+                pkt_ipv6['hop_hdr_len'] = pkt_lowpan[ptr]
+                ptr = ptr + 1
+                # start of rpl Option
+                pkt_ipv6['hop_optionType'] = pkt_lowpan[ptr]
+                ptr = ptr + 1
+                pkt_ipv6['hop_optionLen'] = pkt_lowpan[ptr]
+                ptr = ptr + 1
+                pkt_ipv6['hop_flags'] = pkt_lowpan[ptr]
+                ptr = ptr + 1
+                pkt_ipv6['hop_rplInstanceID'] = pkt_lowpan[ptr]
+                ptr = ptr + 1
+                pkt_ipv6['hop_senderRank'] = ((pkt_lowpan[ptr]) << 8) + ((pkt_lowpan[ptr + 1]) << 0)
+                ptr = ptr + 2
+                # end rpl option
+                if (pkt_ipv6['hop_nhc'] & 0x01) == 1:
+                    if ((pkt_lowpan[ptr] >> 1) & 0x07) == self.NHC_EID_IPV6:
+                        pkt_ipv6['hop_next_header'] = self.IPV6_HEADER
+
+        # payload
+        pkt_ipv6['version'] = 6
+        pkt_ipv6['traffic_class'] = 0
+        pkt_ipv6['payload'] = pkt_lowpan[ptr:len(pkt_lowpan)]
+
+        pkt_ipv6['payload_length'] = len(pkt_ipv6['payload'])
+        pkt_ipv6['pre_hop'] = mac_prev_hop
+        return pkt_ipv6
+
+
+def _flows(num_flows, rnd):
+    """ Returns the 6LoWPAN dictionaries of the flows from the host to the motes, with their source routes. """
+
+    flows = []
+    for i in range(num_flows):
+        hops = [[0x14, 0x15, 0x92, 0x00, 0x00, 0x00, (j + i) >> 8, (j + i) & 0xff] for j in range(rnd.randint(1, 4))]
+        flows.append({
+            'tf': [],
+            'nh': [openlbr.OpenLbr.IANA_UDP],
+            'hlim': [rnd.choice([64, 32])],
+            'cid': [],
+            'src_addr': OpenTun.IPV6PREFIX + OpenTun.IPV6HOST,
+            'dst_addr': rnd.choice([OpenTun.IPV6PREFIX, [0xfe, 0x80] + [0x00] * 6]) + hops[-1],
+            'route': list(reversed(hops)),
+        })
+    return flows
+
+
+def _upstream(num_flows, rnd):
+    """ Returns the IPHC headers of the motes towards the host or the DAG root, with their previous hops. """
+
+    packets = []
+    for i in range(num_flows):
+        mote = [0x14, 0x15, 0x92, 0x00, 0x00, 0x00, i >> 8, i & 0xff]
+        # stateful SAM 64 bits, DAM 64 bits or elided
+        iphc = [0x7a, rnd.choice([0x55, 0x57]), openlbr.OpenLbr.IANA_UDP] + mote
+        if iphc[1] == 0x55:
+            iphc += OpenTun.IPV6HOST
+        packets.append((mote, iphc))
+    return packets
+
+
+def _run(lbr, flows, upstream):
+    """ Returns the time per packet of the compression and of the decompression, in us. """
+
+    # the former compression modified the dictionary, each packet gets its own
+    def compress():
+        for flow in flows:
+            lbr.reassemble_lowpan(dict(flow))
+
+    def decompress():
+        for (mote, iphc) in upstream:
+            lbr.lowpan_to_ipv6([mote, iphc])
+
+    return (measure(compress, number=10) / len(flows) * 1e6, measure(decompress, number=10) / len(upstream) * 1e6)
+
+
+@click.command()
+@click.option('--flows', default='1,16,256', show_default=True, help='Comma-separated numbers of flows')
+@click.option('--length', default=80, show_default=True, help='Payload length, in bytes')
+@click.option('--packets', default=1000, show_default=True, help='Number of packets per measurement')
+def cli(flows, length, packets):
+    """ Compare the former per-packet IPHC encoding and decoding with the compiled headers and layouts. """
+
+    print_header('per packet, in us', ['flows', 'compress', 'compiled', 'speedup', 'decompress', 'layouts',
+                                       'speedup'])
+    for num_flows in [int(n) for n in flows.split(',')]:
+        rnd = random.Random(num_flows)
+        (flows, upstream) = (_flows(num_flows, rnd), _upstream(num_flows, rnd))
+        payloads = [[rnd.randint(0x00, 0xff) for _ in range(length)] for _ in range(packets)]
+        flows = [dict(flows[i % num_flows], payload=payloads[i]) for i in range(packets)]
+        upstream = [(upstream[i % num_flows][0], upstream[i % num_flows][1] + payloads[i]) for i in range(packets)]
+
+        lbrs = [LegacyOpenLbr(use_page_zero=False), openlbr.OpenLbr(use_page_zero=False)]
+        lbrs[0].dispatch('networkPrefix', OpenTun.IPV6PREFIX)
+        lbrs[0].dispatch('infoDagRoot', {'serialPort': 'bench_iphc', 'isDAGroot': 1, 'eui64': DAGROOT})
+        for (flow, (mote, iphc)) in zip(flows, upstream)[:2 * num_flows]:
+            assert lbrs[0].reassemble_lowpan(dict(flow)) == lbrs[1].reassemble_lowpan(dict(flow))
+            assert lbrs[0].lowpan_to_ipv6([mote, iphc]) == lbrs[1].lowpan_to_ipv6([mote, iphc])
+
+        ((old_compress, old_decompress), (new_compress, new_decompress)) = [_run(lbr, flows, upstream) for lbr in lbrs]
+        for lbr in lbrs:
+            lbr.close()
+
+        print_row([num_flows, old_compress, new_compress, speedup(old_compress, new_compress), old_decompress,
+                   new_decompress, speedup(old_decompress, new_decompress)])
+
+
+if __name__ == '__main__':
+    cli()
@@ -0,0 +1,183 @@
+"""
+Join storm on the JRC, e.g. when all the motes of a network reboot at once.
+
+The join requests of the pledges, protected with OSCORE, are dispatched on the event bus towards the DAG root, as
+OpenLbr does, and the join responses are collected on the 'v6ToMesh' signal. Compares the former JRC, which created a
+CoAP endpoint per request, scanned the list of the joined nodes and loaded each new OSCORE context from a JSON file it
+had just written, with the JRC keeping an endpoint per requester and its contexts in memory, persisted in the
+background.
+"""
+
+import binascii
+import os
+import shutil
+import tempfile
+import time
+
+import cbor
+import click
+from coap import coap, coapDefines as Defs, coapMessage, coapObjectSecurity as Oscoap, coapOption, coapUtils as Utils
+
+from openvisualizer.eventbus.eventbusclient import EventBusClient
+from openvisualizer.jrc import jrc
+from openvisualizer.jrc.cojp_defines import CoJPLabel
+from openvisualizer.utils import format_ipv6_addr
+from scripts.benchmarks.benchutils import print_header, print_row, speedup
+
+PREFIX = [0xbb, 0xbb, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00]
+DAGROOT_HOST = [0x14, 0x15, 0x92, 0x00, 0x00, 0x00, 0x00, 0x01]
+
+
+class LegacyContextHandler(jrc.ContextHandler):
+    """ Copy of the former lookup of the security contexts, writing the files to context_dir. """
+
+    def __init__(self, join_resource, context_dir):
+        super(LegacyContextHandler, self).__init__(join_resource)
+        self.context_dir = context_dir
+
+    def security_context_lookup(self, kid, kid_context):
+        eui64 = kid_context
+        for dictionary in self.join_resource.joinedNodes:
+            if dictionary['eui64'] == eui64:
+                return dictionary['context']
+
+        file_path = os.path.join(self.context_dir, "oscore_context_{0}.json".format(binascii.hexlify(eui64)))
+        with open(file_path, "w") as context_file:
+            context_file.write(jrc.OscoreContext(self.security_context_dict(
+                binascii.hexlify(eui64), self.master_salt, self.master_secret, binascii.hexlify("JRC"),
+                binascii.hexlify(""))).to_json())
+        return Oscoap.SecurityContext(securityContextFilePath=file_path)
+
+
+class LegacyJoinResource(jrc.JoinResource):
+    """ Copy of the former list of the joined nodes. """
+
+    def __init__(self):
+        super(LegacyJoinResource, self).__init__()
+        self.joinedNodes = []
+
+    def POST(self, options=[], payload=[]):  # noqa: N802
+        link_layer_keyset = [self.networkKeyIndex, Utils.buf2str(self.networkKey)]
+        configuration = {CoJPLabel.COJP_PARAMETERS_LABELS_LLKEYSET: link_layer_keyset}
+        resp_payload = [ord(b) for b in cbor.dumps(configuration)]
+
+        object_security = Oscoap.objectSecurityOptionLookUp(options)
+        if object_security:
+            eui64 = Utils.buf2str(object_security.kidContext)
+            found = False
+            for node in self.joinedNodes:
+                if node['eui64'] == eui64:
+                    found = True
+                    break
+            if not found:
+                self.joinedNodes += [{'eui64': eui64, 'context': object_security.context}]
+            return Defs.COAP_RC_2_04_CHANGED, [], resp_payload
+        else:
+            return Defs.COAP_RC_4_01_UNAUTHORIZED, [], []
+
+
+class LegacyCoapServer(jrc.CoapServer):
+    """ Copy of the former CoAP endpoint per request. """
+
+    def _receive_from_mesh(self, sender, signal, data):
+        sender = format_ipv6_addr(data[0])
+        self.coap_client = coap.coap(ipAddress=sender, udpPort=Defs.DEFAULT_UDP_PORT, testing=True,
+                                     receiveCallback=self._legacy_receive_from_coap)
+        self.coap_client.socketUdp.sendUdp(destIp='', destPort=Defs.DEFAULT_UDP_PORT, msg=data[1])
+        return True
+
+    def _legacy_receive_from_coap(self, timestamp, sender, data):
+        self.coap_client.close()
+        self._receive_from_coap(self.coap_client.ipAddress, timestamp, sender, data)
+
+
+class LegacyJRC(jrc.JRC):
+
+    def __init__(self, context_dir):
+        coap_resource = LegacyJoinResource()
+        self.context_handler = LegacyContextHandler(coap_resource, context_dir)
+        self.coap_server = LegacyCoapServer(coap_resource, self.context_handler.security_context_lookup)
+
+
+class _Mesh(EventBusClient):
+
+    def __init__(self):
+        self.num_responses = 0
+        super(_Mesh, self).__init__(
+            name='bench_jrc',
+            registrations=[{'sender': self.WILDCARD, 'signal': 'v6ToMesh', 'callback': self._v6_to_mesh_notif}],
+        )
+
+    def _v6_to_mesh_notif(self, sender, signal, data):
+        self.num_responses += 1
+
+
+def _join_requests(num_pledges, num_rounds):
+    """ Returns, per round, the source address and the join request of each pledge. """
+    rounds = [[] for _ in range(num_rounds)]
+    for i in range(num_pledges):
+        eui64 = [0x14, 0x15, 0x92, 0x00, 0x00, 0x01, i >> 8, i & 0xff]
+        context = jrc.OscoreContext(jrc.ContextHandler.security_context_dict(
+            binascii.hexlify(Utils.buf2str(eui64)), jrc.ContextHandler.master_salt, jrc.ContextHandler.master_secret,
+            binascii.hexlify(''), binascii.hexlify('JRC')))
+        for requests in rounds:
+            options = [coapOption.UriPath(path='j'), coapOption.ObjectSecurity(context=context)]
+            (context, request_seq) = Oscoap.getRequestSecurityParams(Oscoap.objectSecurityOptionLookUp(options))
+            message = coapMessage.buildMessage(msgtype=Defs.TYPE_CON, token=i & 0xff, code=Defs.METHOD_POST,
+                                               messageId=i, options=options, securityContext=context,
+                                               partialIV=request_seq)
+            requests.append((jrc.CoapServer.LINK_LOCAL_PREFIX + eui64, message))
+    return rounds
+
+
+def _storm(mesh, new_jrc, rounds):
+    """
+    Dispatches the join requests, round after round, returns the duration of each round, until the contexts are
+    persisted, and the JRC stats.
+    """
+    server = new_jrc()
+    mesh.dispatch('registerDagRoot', {'prefix': PREFIX, 'host': DAGROOT_HOST})
+    signal = (tuple(jrc.CoapServer.LINK_LOCAL_PREFIX + DAGROOT_HOST), mesh.PROTO_UDP, Defs.DEFAULT_UDP_PORT)
+
+    durations = []
+    for requests in rounds:
+        start = time.time()
+        for request in requests:
+            mesh.dispatch(signal, request)
+        if server.context_handler.persister:
+            server.context_handler.persister.flush()
+        durations.append(time.time() - start)
+
+    stats = server.get_stats()
+    server.close()
+    return durations, stats
+
+
+@click.command()
+@click.option('--pledges', default='10,100,500', show_default=True, help='Comma-separated numbers of pledges')
+@click.option('--directory', default=None, help='Directory of the context files, a temporary one by default')
+def cli(pledges, directory):
+    """ Compare the former JRC with the pooled endpoints and in-memory contexts. """
+
+    mesh = _Mesh()
+    tmp = tempfile.mkdtemp(dir=directory)
+    try:
+        print_header('join storm, then rejoin storm: joins/s',
+                     ['pledges', 'legacy', 'pooled', 'speedup', 're legacy', 're pooled', 're speedup', 'latency ms',
+                      'max ms'])
+        for num_pledges in [int(p) for p in pledges.split(',')]:
+            rounds = _join_requests(num_pledges, 2)
+            mesh.num_responses = 0
+            (legacy, _) = _storm(mesh, lambda: LegacyJRC(tmp), rounds)
+            (pooled, stats) = _storm(mesh, lambda: jrc.JRC(context_dir=tmp), rounds)
+            assert mesh.num_responses == 4 * num_pledges and stats['numJoins'] == 2 * num_pledges
+            print_row([num_pledges] +
+                      [num_pledges / legacy[0], num_pledges / pooled[0], speedup(legacy[0], pooled[0])] +
+                      [num_pledges / legacy[1], num_pledges / pooled[1], speedup(legacy[1], pooled[1])] +
+                      [stats['latencyMean'] * 1000, stats['latencyMax'] * 1000])
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == '__main__':
+    cli()
@@ -0,0 +1,116 @@
+"""
+Cost of the uinject KPIs over a long experiment.
+
+Feeds the samples of the uinject packets of a network of motes, in rounds, and measures the cost of a sample at the
+end of a run of the given number of rounds. Compares the former per-mote lists, which were re-summed, re-sorted and
+averaged over all the motes for every packet, with the rolling windows of the KPI aggregator, which only compute the
+network KPIs once per publication.
+"""
+
+import random
+import time
+
+import click
+
+from openvisualizer.motehandler.moteconnector.openparser.kpi import KpiAggregator
+from openvisualizer.motehandler.moteconnector.openparser.parserdata import ParserData
+from scripts.benchmarks.benchutils import print_header, print_row, speedup
+
+
+class LegacyKpi(object):
+    """ Copy of the KPIs of ParserData before the aggregator, computed as they were for every packet. """
+
+    def __init__(self):
+        self.avg_kpi = {}
+
+    def add_sample(self, src_id, counter, latency, cells_tx):
+        if src_id in self.avg_kpi:
+            self.avg_kpi[src_id]['counter'].append(counter)
+            self.avg_kpi[src_id]['latency'].append(latency)
+            self.avg_kpi[src_id]['numCellsUsedTx'].append(cells_tx)
+        else:
+            self.avg_kpi[src_id] = {
+                'counter': [counter],
+                'latency': [latency],
+                'numCellsUsedTx': [cells_tx],
+                'avg_cellsUsage': 0.0,
+                'avg_latency': 0.0,
+                'avg_pdr': 0.0,
+            }
+        self.publish_kpi(src_id)
+
+    def publish_kpi(self, src_id):
+        mote_data = self.avg_kpi[src_id]
+        mote_data['avg_cellsUsage'] = \
+            float(sum(mote_data['numCellsUsedTx']) / len(mote_data['numCellsUsedTx'])) / float(64)
+        mote_data['avg_latency'] = sum(mote_data['latency']) / len(mote_data['latency'])
+        mote_data['counter'].sort()
+        mote_data['avg_pdr'] = \
+            float(len(set(mote_data['counter']))) / float(1 + mote_data['counter'][-1] - mote_data['counter'][0])
+
+        payload = {'avg_cellsUsage': 0.0, 'avg_latency': 0.0, 'avg_pdr': 0.0}
+        for data in self.avg_kpi.values():
+            for k in payload:
+                payload[k] += data[k]
+        for k in payload:
+            payload[k] /= float(len(self.avg_kpi))
+        return payload
+
+
+class Aggregator(object):
+    """ The KPI aggregator, published once per interval of the publisher thread. """
+
+    def __init__(self, publish_every):
+        self.kpi = KpiAggregator(ParserData.KPI_WINDOW_SIZE, ParserData.KPI_WINDOW_DURATION)
+        self.publish_every = publish_every
+        self.num_samples = 0
+
+    def add_sample(self, src_id, counter, latency, cells_tx):
+        self.kpi.add_sample(src_id, counter, latency, cells_tx)
+        self.num_samples += 1
+        if self.num_samples % self.publish_every == 0:
+            self.kpi.pop_updates()
+
+
+def _samples(num_motes, rnd, counter):
+    return [('{0:04x}'.format(m + 2), counter & 0xffff, rnd.randrange(10, 200), rnd.randrange(1, 8))
+            for m in range(num_motes) if rnd.random() > 0.05]
+
+
+def _run(kpi, num_motes, num_rounds, num_measured):
+    """ Returns the time per sample, in seconds, of the last num_measured rounds. """
+    rnd = random.Random(1)
+    for r in range(num_rounds - num_measured):
+        for sample in _samples(num_motes, rnd, r):
+            kpi.add_sample(*sample)
+
+    duration = 0.0
+    num_samples = 0
+    for r in range(num_rounds - num_measured, num_rounds):
+        samples = _samples(num_motes, rnd, r)
+        start = time.time()
+        for sample in samples:
+            kpi.add_sample(*sample)
+        duration += time.time() - start
+        num_samples += len(samples)
+    return duration / num_samples
+
+
+@click.command()
+@click.option('--motes', default=50, show_default=True, help='Number of motes')
+@click.option('--rounds', default='10,100,1000', show_default=True, help='Comma-separated numbers of packets per mote')
+@click.option('--publish-every', default=100, show_default=True, help='Number of samples per publication')
+def cli(motes, rounds, publish_every):
+    """ Compare the former per-packet KPIs with the KPI aggregator. """
+
+    print_header('{0} motes, time per sample (us) after N packets per mote'.format(motes),
+                 ['N', 'legacy', 'aggregator', 'speedup'])
+    for num_rounds in [int(r) for r in rounds.split(',')]:
+        num_measured = min(10, num_rounds)
+        legacy = _run(LegacyKpi(), motes, num_rounds, num_measured)
+        aggregator = _run(Aggregator(publish_every), motes, num_rounds, num_measured)
+        print_row([num_rounds, legacy * 1e6, aggregator * 1e6, speedup(legacy, aggregator)])
+
+
+if __name__ == '__main__':
+    cli()
@@ -0,0 +1,564 @@
+"""
+Packets per second through the border router, from the TUN interface to the serial port of the DAG root.
+
+IPv6 packets are written to a datagram socket standing for the TUN interface, read by the TunReadThread, compacted
+and fragmented by OpenLbr, framed by the MoteConnector and HDLC-framed towards a second socket standing for the serial
+port, until the last frame is read back. The fragments are sent as soon as they are queued, without the pacing of the
+TxScheduler. Compares the former pipeline, which converted the packets to lists of ints when reading them, grew lists
+with += and joined the frames with chr() one byte at a time, with the bytearray pipeline.
+"""
+
+import logging
+import os
+import socket
+import threading
+import time
+
+import click
+from pydispatch import dispatcher
+
+from openvisualizer.eventbus.eventbusclient import EventBusClient
+from openvisualizer.motehandler.moteconnector.moteconnector import MoteConnector
+from openvisualizer.motehandler.moteconnector.openparser import openparser
+from openvisualizer.motehandler.moteprobe.openhdlc import OpenHdlc
+from openvisualizer.openlbr import openlbr
+from openvisualizer.openlbr.sixlowpan_frag import Fragmentor
+from openvisualizer.opentun.opentun import OpenTun
+from openvisualizer.opentun.opentunlinux import OpenTunLinux, TunReadThread
+from openvisualizer.utils import buf2int, format_buf, format_ipv6_addr, hex2buf
+from scripts.benchmarks.benchutils import print_header, print_row, speedup
+
+log = logging.getLogger('OpenLbr')
+
+PORT = 'bench_lbr'
+STACK_DEFINES = {'components': {}, 'log_descriptions': {}, 'sixtop_returncodes': {}, 'sixtop_states': {}}
+
+DAGROOT = [0x14, 0x15, 0x92, 0x00, 0x00, 0x00, 0x00, 0x01]
+MOTES = [[0x14, 0x15, 0x92, 0x00, 0x00, 0x00, 0x00, i] for i in range(2, 6)]
+
+
+class LegacyTunReadThread(TunReadThread):
+    """ Copy of the former reading of the TUN interface. """
+
+    def run(self):
+        while self.goOn:
+            p = os.read(self.tun_if, self.ETHERNET_MTU)
+            p = [ord(b) for b in p]
+            log.debug('packet captured on tun interface: {0}'.format(format_buf(p)))
+            p = p[4:]
+            if (p[0] & 0xf0) != 0x60:
+                continue
+            p = p[:self.IPv6_HEADER_LENGTH + 256 * p[4] + p[5]]
+            self.callback(p)
+
+
+class LegacyFragmentor(Fragmentor):
+    """ Copy of the former fragmentation. """
+
+    def do_fragment(self, ip6_pkt):
+        fragment_list = []
+        original_length = len(ip6_pkt)
+
+        if len(ip6_pkt) <= self.MAX_FRAGMENT_SIZE + self.FRAGN_HDR_SIZE:
+            return [ip6_pkt]
+
+        while len(ip6_pkt) > 0:
+            frag_header = []
+            fragment = []
+            datagram_tag = hex2buf("{:04x}".format(self.datagram_tag))
+            if len(ip6_pkt) > self.MAX_FRAGMENT_SIZE:
+                frag_len = self.MAX_FRAGMENT_SIZE
+            else:
+                frag_len = len(ip6_pkt)
+            if len(fragment_list) == 0:
+                dispatch_size = hex2buf("{:02x}".format((self.FRAG1_DISPATCH << 8) | original_length))
+                frag_header.extend(dispatch_size)
+                frag_header.extend(datagram_tag)
+            else:
+                dispatch_size = hex2buf("{:02x}".format((self.FRAGN_DISPATCH << 8) | original_length))
+                offset = [len(fragment_list) * (self.MAX_FRAGMENT_SIZE / 8)]
+                frag_header.extend(dispatch_size)
+                frag_header.extend(datagram_tag)
+                frag_header.extend(offset)
+            fragment.extend(frag_header)
+            fragment.extend(ip6_pkt[:frag_len])
+            fragment_list.append(fragment)
+            ip6_pkt = ip6_pkt[frag_len:]
+
+        self.datagram_tag += 1
+        log.info("[GATEWAY] Fragmenting incoming IPv6 packet (size: {}) into {} fragments with tag {}".format(
+            original_length, len(fragment_list), self.datagram_tag - 1))
+        return fragment_list
+
+
+class LegacyOpenLbr(openlbr.OpenLbr):
+    """ Copy of the former translation of the IPv6 packets, on lists of ints. """
+
+    def __init__(self, use_page_zero):
+        super(LegacyOpenLbr, self).__init__(use_page_zero)
+        self.fragmentor = LegacyFragmentor()
+
+    def _v6_to_mesh_notif(self, sender, signal, data):
+        try:
+            ipv6_bytes = data
+
+            ipv6 = self.disassemble_ipv6(ipv6_bytes)
+
+            if ipv6['dst_addr'][0] == 0xff:
+                return
+
+            if ipv6['dst_addr'][0] == 0xfe and ipv6['dst_addr'][1] == 0x80:
+                is_link_local = True
+            else:
+                is_link_local = False
+
+            log.verbose("v6tomesh: {0}:{1}:{2}".format(sender, data, ipv6['dst_addr'][0]))
+
+            if log.isEnabledFor(logging.DEBUG):
+                log.debug(self._format_ipv6(ipv6, ipv6_bytes))
+
+            lowpan = self.ipv6_to_lowpan(ipv6)
+
+            if len(lowpan['dst_addr']) == 16:
+                dst_addr = lowpan['dst_addr'][8:]
+            elif len(lowpan['dst_addr']) == 8:
+                dst_addr = lowpan['dst_addr']
+            else:
+                dst_addr = None
+                log.warning('unsupported address format {0}'.format(lowpan['dst_addr']))
+
+            if is_link_local:
+                lowpan['route'] = [dst_addr]
+            else:
+                lowpan['route'] = self._get_source_route(dst_addr)
+
+                if len(lowpan['route']) < 2:
+                    log.error('no source route to {0}'.format(lowpan['dst_addr']))
+                    return
+
+                lowpan['route'].pop()  # remove last as this is me.
+
+            log.verbose("route {0}".format(lowpan['route']))
+
+            lowpan['nextHop'] = lowpan['route'][len(lowpan['route']) - 1]
+
+            lowpan_bytes = self.reassemble_lowpan(lowpan)
+
+            log.verbose("lowpanbytes {0}".format(lowpan_bytes))
+
+            if log.isEnabledFor(logging.DEBUG):
+                log.debug(self._format_lowpan(lowpan, lowpan_bytes))
+
+            if ipv6['next_header'] == self.IANA_ICMPv6 and ipv6['payload'][0] == self.ERR_DESTINATIONUNREACHABLE:
+                log.error(
+                    'ICMPv6 packet with destination {0} dropped (DESTINATIONUNREACHABLE not supported)'.format(
+                        format_ipv6_addr(ipv6['dst_addr'])))
+                log.error(self._format_lowpan(lowpan, lowpan_bytes))
+                return
+
+            self.tx_scheduler.enqueue(lowpan['nextHop'], self.fragmentor.do_fragment(lowpan_bytes))
+
+        except (ValueError, NotImplementedError) as err:
+            log.error(err)
+            pass
+
+    def disassemble_ipv6(self, ipv6):
+        if len(ipv6) < self.IPv6_HEADER_LEN:
+            raise ValueError('Packet too small ({0} bytes) no space for IPv6 header'.format(len(ipv6)))
+
+        return_val = \
+            {
+                'version': ipv6[0] >> 4,
+                'traffic_class': ((ipv6[0] & 0x0F) << 4) + (ipv6[1] >> 4),
+                'flow_label': ((ipv6[1] & 0x0F) << 16) + (ipv6[2] << 8) + ipv6[3],
+                'payload_length': buf2int(ipv6[4:6]),
+                'next_header': ipv6[6],
+                'hop_limit': ipv6[7],
+                'src_addr': ipv6[8:8 + 16],
+                'dst_addr': ipv6[24:24 + 16],
+                'payload': ipv6[40:],
+            }
+
+        if return_val['version'] != 6:
+            raise ValueError('Not an IPv6 packet, version=={0}'.format(return_val['version']))
+
+        return return_val
+
+    def ipv6_to_lowpan(self, ipv6):
+        lowpan = {}
+
+        if ipv6['traffic_class'] != 0:
+            raise NotImplementedError('traffic_class={0} unsupported'.format(ipv6['traffic_class']))
+        lowpan['tf'] = []
+
+        lowpan['nh'] = [ipv6['next_header']]
+
+        lowpan['hlim'] = [ipv6['hop_limit']]
+
+        lowpan['cid'] = []
+
+        lowpan['src_addr'] = ipv6['src_addr']
+
+        lowpan['dst_addr'] = ipv6['dst_addr']
+
+        lowpan['payload'] = ipv6['payload']
+
+        return lowpan
+
+    def reassemble_lowpan(self, lowpan):
+        return_val = []
+
+        if self.use_page_zero:
+            print 'Page dispatch page number zero is not supported!\n'
+            raise SystemError()
+
+        return_val += [self.PAGE_ONE_DISPATCH]
+
+        if lowpan['src_addr'][:8] != OpenTun.IPV6PREFIX:
+            compress_reference = OpenTun.IPV6PREFIX + OpenTun.IPV6HOST
+        else:
+            compress_reference = lowpan['src_addr']
+
+        if len(lowpan['route']) > 1:
+            if len(compress_reference) == 16:
+                _ = compress_reference[:8]  # prefix
+
+            size_unit_type = 0xff
+            size = 0
+            hop_list = []
+
+            for hop in list(reversed(lowpan['route'][1:])):
+                size += 1
+                if compress_reference[-8:-1] == hop[-8:-1]:
+                    if size_unit_type != 0xff:
+                        if size_unit_type != self.TYPE_6LoRH_RH3_0:
+                            return_val += [self.CRITICAL_6LoRH | (size - 2), size_unit_type]
+                            return_val += hop_list
+                            size = 1
+                            size_unit_type = self.TYPE_6LoRH_RH3_0
+                            hop_list = [hop[-1]]
+                            compress_reference = hop
+                        else:
+                            hop_list += [hop[-1]]
+                            compress_reference = hop
+                    else:
+                        size_unit_type = self.TYPE_6LoRH_RH3_0
+                        hop_list += [hop[-1]]
+                        compress_reference = hop
+                elif compress_reference[-8:-2] == hop[-8:-2]:
+                    if size_unit_type != 0xff:
+                        if size_unit_type != self.TYPE_6LoRH_RH3_1:
+                            return_val += [self.CRITICAL_6LoRH | (size - 2), size_unit_type]
+                            return_val += hop_list
+                            size = 1
+                            size_unit_type = self.TYPE_6LoRH_RH3_1
+                            hop_list = hop[-2:]
+                            compress_reference = hop
+                        else:
+                            hop_list += hop[-2:]
+                            compress_reference = hop
+                    else:
+                        size_unit_type = self.TYPE_6LoRH_RH3_1
+                        hop_list += hop[-2:]
+                        compress_reference = hop
+                elif compress_reference[-8:-4] == hop[-8:-4]:
+                    if size_unit_type != 0xff:
+                        if size_unit_type != self.TYPE_6LoRH_RH3_2:
+                            return_val += [self.CRITICAL_6LoRH | (size - 2), size_unit_type]
+                            return_val += hop_list
+                            size = 1
+                            size_unit_type = self.TYPE_6LoRH_RH3_2
+                            hop_list = hop[-4:]
+                            compress_reference = hop
+                        else:
+                            hop_list += hop[-4:]
+                            compress_reference = hop
+                    else:
+                        size_unit_type = self.TYPE_6LoRH_RH3_2
+                        hop_list += hop[-4:]
+                        compress_reference = hop
+                else:
+                    if size_unit_type != 0xff:
+                        if size_unit_type != self.TYPE_6LoRH_RH3_3:
+                            return_val += [self.CRITICAL_6LoRH | (size - 2), size_unit_type]
+                            return_val += hop_list
+                            size = 1
+                            size_unit_type = self.TYPE_6LoRH_RH3_3
+                            hop_list = hop
+                            compress_reference = hop
+                        else:
+                            hop_list += hop
+                            compress_reference = hop
+                    else:
+                        size_unit_type = self.TYPE_6LoRH_RH3_3
+                        hop_list += hop
+                        compress_reference = hop
+
+            return_val += [self.CRITICAL_6LoRH | (size - 1), size_unit_type]
+            return_val += hop_list
+
+        if lowpan['src_addr'][:8] != lowpan['dst_addr'][:8]:
+            flag = self.O_FLAG | self.I_FLAG | self.K_FLAG
+            sender_rank = 0  # rank of dagroot
+            return_val += [self.CRITICAL_6LoRH | flag, self.TYPE_6LoRH_RPI, sender_rank]
+            length = 1
+            return_val += [self.ELECTIVE_6LoRH | length, self.TYPE_6LoRH_IP_IN_IP]
+            return_val += lowpan['hlim']
+
+            compress_reference = OpenTun.IPV6PREFIX + OpenTun.IPV6HOST
+        else:
+            compress_reference = lowpan['src_addr']
+
+        if len(lowpan['tf']) == 0:
+            tf = self.IPHC_TF_ELIDED
+        else:
+            raise NotImplementedError()
+        nh = self.IPHC_NH_INLINE
+        if lowpan['hlim'][0] == 1:
+            hlim = self.IPHC_HLIM_1
+            lowpan['hlim'] = []
+        elif lowpan['hlim'][0] == 64:
+            hlim = self.IPHC_HLIM_64
+            lowpan['hlim'] = []
+        elif lowpan['hlim'][0] == 255:
+            hlim = self.IPHC_HLIM_255
+            lowpan['hlim'] = []
+        else:
+            hlim = self.IPHC_HLIM_INLINE
+        return_val += [(self.IPHC_DISPATCH << 5) + (tf << 3) + (nh << 2) + (hlim << 0)]
+
+        if len(lowpan['cid']) == 0:
+            cid = self.IPHC_CID_NO
+        else:
+            cid = self.IPHC_CID_YES
+
+        if self._is_link_local(lowpan['src_addr']):
+            sac = self.IPHC_SAC_STATELESS
+            lowpan['src_addr'] = lowpan['src_addr'][8:]
+        else:
+            if lowpan['src_addr'][:8] == OpenTun.IPV6PREFIX:
+                sac = self.IPHC_SAC_STATEFUL
+                lowpan['src_addr'] = lowpan['src_addr'][8:]
+            else:
+                sac = self.IPHC_SAC_STATELESS
+
+        if len(lowpan['src_addr']) == 128 / 8:
+            sam = self.IPHC_SAM_128B
+        elif len(lowpan['src_addr']) == 64 / 8:
+            sam = self.IPHC_SAM_64B
+        elif len(lowpan['src_addr']) == 16 / 8:
+            sam = self.IPHC_SAM_16B
+        elif len(lowpan['src_addr']) == 0:
+            sam = self.IPHC_SAM_ELIDED
+        else:
+            raise SystemError()
+
+        if self._is_link_local(lowpan['dst_addr']):
+            dac = self.IPHC_DAC_STATELESS
+            lowpan['dst_addr'] = lowpan['dst_addr'][8:]
+        else:
+
+            if lowpan['dst_addr'][:8] == OpenTun.IPV6PREFIX:
+                dac = self.IPHC_DAC_STATEFUL
+                lowpan['dst_addr'] = lowpan['dst_addr'][8:]
+            else:
+                dac = self.IPHC_DAC_STATELESS
+
+        m = self.IPHC_M_NO
+        if len(lowpan['dst_addr']) == 128 / 8:
+            dam = self.IPHC_DAM_128B
+        elif len(lowpan['dst_addr']) == 64 / 8:
+            dam = self.IPHC_DAM_64B
+        elif len(lowpan['dst_addr']) == 16 / 8:
+            dam = self.IPHC_DAM_16B
+        elif len(lowpan['dst_addr']) == 0:
+            dam = self.IPHC_DAM_ELIDED
+        else:
+            raise SystemError()
+        return_val += [(cid << 7) + (sac << 6) + (sam << 4) + (m << 3) + (dac << 2) + (dam << 0)]
+
+        return_val += lowpan['tf']
+
+        return_val += lowpan['nh']
+
+        return_val += lowpan['hlim']
+
+        return_val += lowpan['cid']
+
+        return_val += lowpan['src_addr']
+
+        return_val += lowpan['dst_addr']
+
+        return_val += lowpan['payload']
+
+        return return_val
+
+
+class LegacyMoteConnector(MoteConnector):
+    """ Copy of the former framing of the 6LoWPAN packets. """
+
+    def _bytes_to_mesh_handler(self, sender, signal, data):
+        next_hop, lowpan = data
+        self._send_to_mote_probe(data_to_send=[openparser.OpenParser.SERFRAME_PC2MOTE_DATA] + next_hop + lowpan)
+
+    def _send_to_mote_probe(self, data_to_send):
+        dispatcher.send(
+            sender=self.name,
+            signal='fromMoteConnector@' + self.serialport,
+            data=''.join([chr(c) for c in data_to_send]),
+        )
+
+
+class _Unpaced(object):
+    """ Sends the fragments as soon as they are queued. """
+
+    def __init__(self, send):
+        self.send = send
+
+    def enqueue(self, next_hop, fragments):
+        for fragment in fragments:
+            self.send(next_hop, fragment)
+
+    def close(self):
+        pass
+
+
+class _Rpl(EventBusClient):
+    """ Answers the source routes: MOTES[i] is reached through MOTES[:i]. """
+
+    def __init__(self):
+        super(_Rpl, self).__init__(
+            name='bench_lbr',
+            registrations=[{'sender': self.WILDCARD, 'signal': 'getSourceRoute', 'callback': self._get_route_notif}],
+        )
+
+    def close(self):
+        for r in self.registrations:
+            self.unregister(sender=r['sender'], signal=r['signal'], callback=r['callback'])
+
+    def _get_route_notif(self, sender, signal, data):
+        i = MOTES.index(list(data))
+        return [list(m) for m in reversed(MOTES[:i + 1])] + [DAGROOT]
+
+
+class _SerialPort(object):
+    """ HDLC-frames the bytes sent to the DAG root, as the mote probe does, and reads them back. """
+
+    def __init__(self):
+        self.portname = PORT
+        self.send_to_parser = None
+        self.hdlc = OpenHdlc()
+        (self.tx, self.rx) = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.num_sent = 0
+        self.num_read = 0
+        self.read_cond = threading.Condition()
+        self.reader = threading.Thread(target=self._read)
+        self.reader.daemon = True
+        self.reader.start()
+        dispatcher.connect(self._send_data, signal='fromMoteConnector@' + PORT)
+
+    def close(self):
+        dispatcher.disconnect(self._send_data, signal='fromMoteConnector@' + PORT)
+        self.tx.close()
+
+    def wait_read(self, num_frames):
+        with self.read_cond:
+            while self.num_read < num_frames:
+                self.read_cond.wait()
+
+    def _send_data(self, data):
+        self.tx.send(self.hdlc.hdlcify(data))
+        self.num_sent += 1
+
+    def _read(self):
+        while self.rx.recv(2048):
+            with self.read_cond:
+                self.num_read += 1
+                self.read_cond.notify_all()
+
+
+def _run(packets, new_lbr, new_connector, new_reader):
+    """
+    Writes the packets on the TUN socket, returns the duration until the last frame is read on the serial port and the
+    number of frames.
+    """
+
+    rpl = _Rpl()
+    serial = _SerialPort()
+    lbr = new_lbr(use_page_zero=False)
+    lbr.tx_scheduler.close()
+    lbr.tx_scheduler = _Unpaced(lbr._send_to_mesh)
+    connector = new_connector(serial, STACK_DEFINES, None)
+    rpl.dispatch('networkPrefix', OpenTun.IPV6PREFIX)
+    rpl.dispatch('infoDagRoot', {'serialPort': PORT, 'isDAGroot': 1, 'eui64': DAGROOT})
+
+    processed = threading.Event()
+    num_processed = [0]
+
+    def to_mesh(pkt):
+        rpl.dispatch('v6ToMesh', pkt)
+        num_processed[0] += 1
+        if num_processed[0] == len(packets):
+            processed.set()
+
+    (tun, tun_if) = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+    reader = new_reader(tun_if.fileno(), to_mesh)
+
+    start = time.time()
+    for pkt in packets:
+        tun.send(pkt)
+    processed.wait()
+    num_frames = serial.num_sent
+    serial.wait_read(num_frames)
+    duration = time.time() - start
+
+    reader.close()
+    tun.send(packets[0])
+    reader.join()
+    for c in [tun, tun_if]:
+        c.close()
+    connector.unregister(sender=connector.WILDCARD, signal='bytesToMesh', callback=connector._bytes_to_mesh_handler)
+    for r in connector.registrations:
+        connector.unregister(sender=r['sender'], signal=r['signal'], callback=r['callback'])
+    lbr.close()
+    serial.close()
+    rpl.close()
+    return duration, num_frames
+
+
+def _packets(num_packets, length, hops):
+    """ Returns the UDP packets towards the mote hops away, as read on the TUN interface. """
+
+    src = OpenTun.IPV6PREFIX + OpenTun.IPV6HOST
+    dst = OpenTun.IPV6PREFIX + MOTES[hops - 1]
+    packets = []
+    for i in range(num_packets):
+        udp = [0xf0, 0xb1, 0xf0, 0xb2, (length + 8) >> 8, (length + 8) & 0xff, 0x00, 0x00]
+        udp += [(i + j) & 0xff for j in range(length)]
+        ipv6 = [0x60, 0x00, 0x00, 0x00, len(udp) >> 8, len(udp) & 0xff, openlbr.OpenLbr.IANA_UDP, 64] + src + dst
+        packets.append(str(bytearray(OpenTunLinux.VIRTUAL_TUN_ID + ipv6 + udp)))
+    return packets
+
+
+@click.command()
+@click.option('--lengths', default='32,80,500,1200', show_default=True, help='Comma-separated UDP payload lengths')
+@click.option('--packets', default=2000, show_default=True, help='Number of packets per measurement')
+@click.option('--hops', default=3, show_default=True, type=click.IntRange(1, len(MOTES)),
+              help='Number of hops to the destination')
+def cli(lengths, packets, hops):
+    """ Compare the former list-based pipeline with the bytearray one. """
+
+    print_header('TUN to serial, {0} hops: packets/s'.format(hops),
+                 ['bytes', 'frames', 'legacy', 'bytearray', 'speedup'])
+    for length in [int(n) for n in lengths.split(',')]:
+        pkts = _packets(packets, length, hops)
+
+        (legacy, num_frames) = _run(pkts, LegacyOpenLbr, LegacyMoteConnector, LegacyTunReadThread)
+        (new, new_num_frames) = _run(pkts, openlbr.OpenLbr, MoteConnector, TunReadThread)
+        assert num_frames == new_num_frames
+
+        print_row([length, num_frames / packets, packets / legacy, packets / new, speedup(legacy, new)])
+
+
+if __name__ == '__main__':
+    cli()
@@ -0,0 +1,151 @@
+"""
+Cost of the shared radio medium, and how many frames collide in a dense network.
+
+Replays the slots of a dense network, in which groups of motes transmit together on the channels of the TSCH hopping
+sequence, as in shared cells. Compares the former propagation model, which kept the pending ends of the transmissions
+in a list and ignored the concurrent transmissions, with the per-channel medium.
+"""
+
+import logging
+import random
+
+import click
+
+from openvisualizer.simengine.propagation import Propagation
+from openvisualizer.simengine.simengine import SimEngine
+from scripts.benchmarks.benchutils import measure, print_header, print_row, speedup
+
+CHANNELS = range(11, 27)
+
+
+class LegacyPropagation(Propagation):
+    """ Copy of the former indications of the start and of the end of the transmissions. """
+
+    def __init__(self, engine, sim_topology):
+        super(LegacyPropagation, self).__init__(engine, sim_topology)
+        self.pending_tx_end = []
+
+    def _indicate_tx_start(self, sender, signal, data):
+        (from_mote, packet, channel) = data
+        if from_mote in self.connections:
+            for (to_mote, pdr) in self.connections[from_mote].items():
+                if random.random() <= pdr:
+                    mh = self.engine.get_mote_handler_by_id(to_mote)
+                    mh.bsp_radio.indicate_tx_start(from_mote, packet, channel)
+                    self.pending_tx_end += [(from_mote, to_mote)]
+
+    def _indicate_tx_end(self, sender, signal, data):
+        from_mote = data
+        if from_mote in self.connections:
+            for (to_mote, pdr) in self.connections[from_mote].items():
+                try:
+                    self.pending_tx_end.remove((from_mote, to_mote))
+                except ValueError:
+                    pass
+                else:
+                    mh = self.engine.get_mote_handler_by_id(to_mote)
+                    mh.bsp_radio.indicate_tx_end(from_mote)
+
+
+class _Radio(object):
+    """ Listens on the channel of the slot and locks on the first frame it detects. """
+
+    def __init__(self, name):
+        self.name = name
+        self.channel = None
+        self.rx_from = None
+        self.received = 0
+        self.corrupted = 0
+
+    def indicate_tx_start(self, mote_id, packet, channel):
+        if self.rx_from is None and channel == self.channel:
+            self.rx_from = mote_id
+            return True
+        return False
+
+    def indicate_tx_end(self, mote_id, crc_passes=True):
+        if mote_id == self.rx_from:
+            self.rx_from = None
+            if crc_passes:
+                self.received += 1
+            else:
+                self.corrupted += 1
+
+
+class _MoteHandler(object):
+
+    def __init__(self, mote_id, location):
+        self.id = mote_id
+        self.location = location
+        self.bsp_radio = None
+
+    def get_id(self):
+        return self.id
+
+    def get_location(self):
+        return self.location
+
+
+def _slots(num_motes, num_slots, senders_per_channel):
+    """ Returns, per slot, the channel each mote listens to and the motes transmitting on each channel. """
+    rnd = random.Random(num_motes)
+    slots = []
+    for _ in range(num_slots):
+        motes = rnd.sample(range(1, num_motes + 1), num_motes)
+        listen = dict((mote_id, CHANNELS[i % len(CHANNELS)]) for (i, mote_id) in enumerate(motes))
+        senders = motes[:len(CHANNELS) * senders_per_channel]
+        slots.append((listen, [(mote_id, listen[mote_id]) for mote_id in senders]))
+    return slots
+
+
+def _replay(engine, propagation, slots):
+    random.seed(0)
+    packet = [0x00] * 127
+    for (listen, senders) in slots:
+        for (mote_id, channel) in listen.items():
+            engine.moteHandlersById[mote_id].bsp_radio.channel = channel
+        for (mote_id, channel) in senders:
+            radio = engine.moteHandlersById[mote_id].bsp_radio
+            radio.channel = None
+            propagation._indicate_tx_start(radio.name, Propagation.SIGNAL_WIRELESSTXSTART, (mote_id, packet, channel))
+        for (mote_id, _) in senders:
+            radio = engine.moteHandlersById[mote_id].bsp_radio
+            propagation._indicate_tx_end(radio.name, Propagation.SIGNAL_WIRELESSTXEND, mote_id)
+
+
+@click.command()
+@click.option('--motes', default='50,100,200', show_default=True, help='Comma-separated numbers of motes')
+@click.option('--slots', default=100, show_default=True, help='Number of slots per measurement')
+@click.option('--senders', default=2, show_default=True, help='Number of motes transmitting per channel and slot')
+def cli(motes, slots, senders):
+    """ Compare the former propagation model with the per-channel medium. """
+
+    engine = SimEngine()
+    print_header('{0} slots, {1} senders per channel: transmissions/s'.format(slots, senders),
+                 ['motes', 'legacy', 'medium', 'speedup', 'received', 'corrupted'])
+    for num_motes in [int(m) for m in motes.split(',')]:
+        rnd = random.Random(num_motes)
+        mote_handlers = [_MoteHandler(i + 1, (37.875095 + rnd.random() * 0.001, -122.257473 + rnd.random() * 0.001))
+                         for i in range(num_motes)]
+        replayed = _slots(num_motes, slots, senders)
+        num_tx = sum(len(s) for (_, s) in replayed)
+
+        durations = []
+        for propagation_class in [LegacyPropagation, Propagation]:
+            (engine.moteHandlers, engine.moteHandlersById) = ([], {})
+            engine.propagation.close()
+            engine.propagation = propagation_class(engine, '')
+            engine.propagation.log.setLevel(logging.WARNING)
+            engine.indicate_new_motes(mote_handlers)
+            for mh in mote_handlers:
+                mh.bsp_radio = _Radio(engine.register_radio(mh.get_id()))
+            durations.append(measure(lambda: _replay(engine, engine.propagation, replayed), repeat=1))
+
+        received = sum(mh.bsp_radio.received for mh in mote_handlers)
+        corrupted = sum(mh.bsp_radio.corrupted for mh in mote_handlers)
+        print_row([num_motes, num_tx / durations[0], num_tx / durations[1], speedup(durations[0], durations[1]),
+                   received, corrupted])
+
+
+if __name__ == '__main__':
+    cli()
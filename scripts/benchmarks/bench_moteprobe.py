@@ -0,0 +1,139 @@
+"""
+Throughput benchmark of the MoteProbe serial input path.
+
+Replays a serial stream through the former byte-per-read, byte-per-iteration parser and through the chunked HDLC
+frame scanner. The stream is either a raw capture of a serial port (--capture) or a synthetic stream of HDLC frames
+with XON/XOFF escaping and flow control bytes, as sent by the motes.
+"""
+
+import random
+import time
+
+import click
+
+from openvisualizer.motehandler.moteprobe.mockmoteprobe import MockMoteProbe
+from openvisualizer.motehandler.moteprobe.moteprobe import MoteProbe
+from openvisualizer.motehandler.moteprobe.openhdlc import HdlcException, OpenHdlc
+from scripts.benchmarks.benchutils import print_header, print_row, speedup
+
+
+class LegacyMockMoteProbe(MockMoteProbe):
+    """ MockMoteProbe with the per-byte parser used before the chunked frame scanner. """
+
+    hdlc_flag = False
+    receiving = False
+    rx_buf = ''
+
+    def _handle_frame(self):
+        valid_frame = False
+        try:
+            self.rx_buf = self.hdlc.dehdlcify(self.rx_buf)
+            if self.send_to_parser:
+                self.send_to_parser([ord(c) for c in self.rx_buf])
+            valid_frame = True
+        except HdlcException:
+            pass
+        return valid_frame
+
+    def _rx_buf_add(self, byte):
+        if byte == chr(self.XONXOFF_ESCAPE):
+            self.xonxoff_escaping = True
+        else:
+            if self.xonxoff_escaping is True:
+                self.rx_buf += chr(ord(byte) ^ self.XONXOFF_MASK)
+                self.xonxoff_escaping = False
+            elif byte != chr(self.XON) and byte != chr(self.XOFF):
+                self.rx_buf += byte
+
+    def _parse_bytes(self, octets):
+        for byte in octets:
+            if not self.receiving:
+                if self.hdlc_flag and byte != self.hdlc.HDLC_FLAG:
+                    self.receiving = True
+                    self.hdlc_flag = False
+                    self.xonxoff_escaping = False
+                    self.rx_buf = self.hdlc.HDLC_FLAG
+                    self._rx_buf_add(byte)
+                elif byte == self.hdlc.HDLC_FLAG:
+                    self.hdlc_flag = True
+            else:
+                if byte != self.hdlc.HDLC_FLAG:
+                    self._rx_buf_add(byte)
+                else:
+                    self.hdlc_flag = True
+                    self.receiving = False
+                    self._rx_buf_add(byte)
+                    if self._handle_frame():
+                        self.hdlc_flag = False
+
+
+def _synthetic_stream(num_frames, frame_len):
+    hdlc = OpenHdlc()
+    special = [chr(MoteProbe.XON), chr(MoteProbe.XOFF), chr(MoteProbe.XONXOFF_ESCAPE)]
+
+    out = []
+    for _ in range(num_frames):
+        frame = ''.join(chr(random.randint(0x00, 0xff)) for _ in range(frame_len))
+        for c in hdlc.hdlcify(frame):
+            if c in special:
+                out += [chr(MoteProbe.XONXOFF_ESCAPE), chr(ord(c) ^ MoteProbe.XONXOFF_MASK)]
+            else:
+                out += [c]
+            if random.random() < 0.01:
+                out += [random.choice([chr(MoteProbe.XON), chr(MoteProbe.XOFF)])]
+    return ''.join(out)
+
+
+def _stopped_probe(cls):
+    probe = cls('bench')
+    probe.close()
+    probe.join()
+    probe.xonxoff_escaping = False
+    probe.num_frames = 0
+
+    def count(data):
+        probe.num_frames += 1
+
+    probe.send_to_parser = count
+    return probe
+
+
+@click.command()
+@click.option('--capture', type=click.Path(exists=True), help='Raw serial capture to replay')
+@click.option('--frames', default=5000, show_default=True, help='Number of frames in the synthetic stream')
+@click.option('--length', default=100, show_default=True, help='Frame length in the synthetic stream')
+@click.option('--chunks', default='1,64,256,4096', show_default=True, help='Comma separated read sizes to replay')
+def cli(capture, frames, length, chunks):
+    """ Compare the per-byte serial parser with the chunked HDLC frame scanner. """
+
+    if capture:
+        with open(capture, 'rb') as f:
+            stream = f.read()
+    else:
+        stream = _synthetic_stream(frames, length)
+
+    size_mb = len(stream) / 1e6
+
+    # legacy path: one read(1) per byte
+    probe = _stopped_probe(LegacyMockMoteProbe)
+    start = time.time()
+    for byte in stream:
+        probe._parse_bytes(byte)
+    legacy = time.time() - start
+    legacy_frames = probe.num_frames
+
+    print_header('Replay of {0} bytes, {1} frames (MB/s)'.format(len(stream), legacy_frames),
+                 ['read size', 'legacy', 'chunked', 'speedup'])
+
+    for chunk in [int(c) for c in chunks.split(',')]:
+        probe = _stopped_probe(MockMoteProbe)
+        start = time.time()
+        for pos in xrange(0, len(stream), chunk):
+            probe._parse_bytes(stream[pos:pos + chunk])
+        duration = time.time() - start
+        assert probe.num_frames == legacy_frames
+        print_row([chunk, size_mb / legacy, size_mb / duration, speedup(legacy, duration)])
+
+
+if __name__ == '__main__':
+    cli()
@@ -0,0 +1,166 @@
+"""
+Latency benchmark of the get_mote_state() RPC.
+
+Serves the state of a network of motes, each with a full schedule table, over XML-RPC and fetches the state of every
+mote in rounds, as the web and CLI clients do. Between two rounds, each mote gets an ASN update and one of its
+schedule rows is updated. Compares the former RPC, which dumped the 13 state elements to JSON on every request, with
+the cached dumps and with the requests passing the version of the previous response.
+"""
+
+import json
+import threading
+import time
+import xmlrpclib
+from SimpleXMLRPCServer import SimpleXMLRPCServer
+from SocketServer import ThreadingMixIn
+
+import click
+
+from openvisualizer.motehandler.motestate.elements import StateElem
+from openvisualizer.motehandler.motestate.motestate import MoteState
+from openvisualizer.motehandler.motestate.opentype import OpenType
+from scripts.benchmarks.benchutils import print_header, print_row, speedup
+
+
+class MoteConnector(object):
+    def __init__(self, serialport):
+        self.serialport = serialport
+
+
+class RpcServer(ThreadingMixIn, SimpleXMLRPCServer):
+    daemon_threads = True
+
+
+def _notify(ms, name, **fields):
+    named_tuple = ms.parser_status.named_tuple[name]
+    values = dict((f, 0) for f in named_tuple._fields)
+    values.update(fields)
+    ms._received_status_notif(named_tuple(**values))
+
+
+def _update_schedule_row(ms, row, asn):
+    _notify(ms, MoteState.ST_SCHEDULEROW, row=row, slotOffset=row, type=1 + row % 3, channelOffset=row % 16,
+            neighbor_type=3, neighbor_bodyH=0x14159200, neighbor_bodyL=row, numRx=asn % 100, numTx=asn % 50,
+            lastUsedAsn_0_1=asn & 0xffff)
+
+
+def _build_motes(num_motes, num_rows):
+    mote_states = []
+    for i in range(num_motes):
+        ms = MoteState(MoteConnector('emulated{0}'.format(i)))
+        _notify(ms, MoteState.ST_MACSTATS, numSyncPkt=10, numTicsOn=1, numTicsTotal=100)
+        _notify(ms, MoteState.ST_ISSYNC, isSync=1)
+        for row in range(num_rows):
+            _update_schedule_row(ms, row, 0)
+        mote_states.append(ms)
+    return mote_states
+
+
+def _legacy_elem_to_dict(elem):
+    """ Copy of StateElem._elem_to_dict() before the cache, the rows of the tables are converted every time. """
+    return_val = []
+    for row_num in range(len(elem)):
+        if isinstance(elem[row_num], dict):
+            return_val.append({})
+            for k, v in elem[row_num].items():
+                if isinstance(v, (list, tuple)):
+                    return_val[-1][k] = [{'meta': _legacy_elem_to_dict(m.meta), 'data': _legacy_elem_to_dict(m.data)}
+                                         for m in v]
+                else:
+                    if isinstance(v, OpenType):
+                        return_val[-1][k] = str(v)
+                    elif isinstance(v, type):
+                        return_val[-1][k] = v.__name__
+                    else:
+                        return_val[-1][k] = v
+        elif isinstance(elem[row_num], StateElem):
+            _legacy_elem_to_dict(elem[row_num].meta)
+            parsed_row = _legacy_elem_to_dict(elem[row_num].data)
+            if len(parsed_row) == 1:
+                return_val.append(parsed_row[0])
+    return return_val
+
+
+def _legacy_get_mote_state(ms):
+    """ Former get_mote_state(): every element converted and dumped on every request. """
+    return dict((name, json.dumps(_legacy_elem_to_dict(ms.get_state_elem(name).data))) for name in ms.ST_ALL)
+
+
+def _start_server(mote_states):
+    server = RpcServer(('localhost', 0), allow_none=True, logRequests=False)
+
+    def legacy_get_mote_state(mote):
+        return _legacy_get_mote_state(mote_states[mote])
+
+    def get_mote_state(mote, since=None):
+        version, states = mote_states[mote].get_changes(since)
+        if since is None:
+            return states
+        return {'version': version, 'states': states}
+
+    server.register_function(legacy_get_mote_state)
+    server.register_function(get_mote_state)
+
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+def _run(mote_states, num_rows, num_rounds, fetch, update):
+    """ Returns the mean latency of an RPC, in seconds, and the mean size of a response, in bytes. """
+    duration = 0.0
+    size = 0
+    for r in range(num_rounds):
+        if update:
+            for ms in mote_states:
+                _notify(ms, MoteState.ST_ASN, asn_0_1=r)
+                _update_schedule_row(ms, r % num_rows, r)
+
+        start = time.time()
+        for mote in range(len(mote_states)):
+            size += len(xmlrpclib.dumps((fetch(mote),), methodresponse=True))
+        duration += time.time() - start
+
+    num_rpcs = float(num_rounds * len(mote_states))
+    return duration / num_rpcs, size / num_rpcs
+
+
+@click.command()
+@click.option('--motes', default=50, show_default=True, help='Number of motes')
+@click.option('--rows', default=30, show_default=True, help='Number of rows of the schedule tables')
+@click.option('--rounds', default=20, show_default=True, help='Number of requests per mote')
+def cli(motes, rows, rounds):
+    """ Compare the former get_mote_state() with the cached and versioned one. """
+
+    mote_states = _build_motes(motes, rows)
+    server = _start_server(mote_states)
+    proxy = xmlrpclib.ServerProxy('http://{}:{}'.format(*server.server_address), allow_none=True)
+    versions = {}
+
+    def legacy(mote):
+        return proxy.legacy_get_mote_state(mote)
+
+    def cached(mote):
+        return proxy.get_mote_state(mote)
+
+    def since(mote):
+        changes = proxy.get_mote_state(mote, versions.get(mote, 0))
+        versions[mote] = changes['version']
+        return changes
+
+    try:
+        click.secho('{0} motes, {1} schedule rows, {2} rounds'.format(motes, rows, rounds))
+        for (title, update) in [('ASN and one schedule row updated per round', True), ('no updates', False)]:
+            results = [_run(mote_states, rows, rounds, f, update) for f in [legacy, cached, since]]
+            print_header('{0}: latency (ms) and size (bytes) per RPC'.format(title),
+                         ['', 'legacy', 'cached', 'since', 'speedup'])
+            print_row(['latency'] + [r[0] * 1000 for r in results] + [speedup(results[0][0], results[2][0])])
+            print_row(['size'] + [int(r[1]) for r in results] + [''])
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+if __name__ == '__main__':
+    cli()
@@ -0,0 +1,107 @@
+"""
+Throughput benchmark of the parsing of the status frames.
+
+Feeds OpenParser with status frames, either recorded in a file (one frame per line, in hexadecimal, as written by
+--save) or generated in the order the firmware emits them: one status element per frame, in round-robin, the tables
+one row at a time. Compares the former parsing, which scanned the parsing keys, converted the frames to strings
+before unpacking them and formatted its log messages even when they were not logged, with the compiled dispatch
+tables and structures.
+"""
+
+import logging
+import random
+import struct
+
+import click
+
+from openvisualizer.motehandler.moteconnector.openparser.openparser import OpenParser
+from openvisualizer.motehandler.moteconnector.openparser.parserexception import ParserException
+from scripts.benchmarks.benchutils import measure, print_header, print_row, speedup
+
+log = logging.getLogger('bench_parser')
+log.setLevel(logging.ERROR)
+log.addHandler(logging.NullHandler())
+
+STACK_DEFINES = {'components': {}, 'log_descriptions': {}, 'sixtop_returncodes': {}, 'sixtop_states': {}}
+
+TABLE_ROWS = {'ScheduleRow': 30, 'NeighborsRow': 10, 'QueueRow': 20}
+
+
+def _legacy_parse_status(parser_status, data):
+    log.debug("received data={0}".format(data))
+    (mote_id, status_elem) = struct.unpack('<HB', ''.join([chr(c) for c in data[:3]]))
+    log.debug("moteId={0} statusElem={1}".format(mote_id, status_elem))
+    data = data[3:]
+    for key in parser_status.fields_parsing_keys:
+        if status_elem == key.val:
+            log.debug("parsing {0}, ({1} bytes) as {2}".format(data, len(data), key.name))
+            fields = struct.unpack(key.structure, ''.join([chr(c) for c in data]))
+            return_tuple = parser_status.named_tuple[key.name](*fields)
+            log.debug("parsed into {0}".format(return_tuple))
+            return 'status', return_tuple
+    raise ParserException(ParserException.ExceptionType.NO_KEY.value)
+
+
+def _legacy_parse(open_parser, data):
+    """ Former OpenParser.parse_input(), for the status frames, log messages included. """
+    log.debug("received data: {0}".format(data))
+    for key in open_parser.parsing_keys:
+        if data[key.index] == key.val:
+            if key.parser is open_parser.parser_status:
+                return _legacy_parse_status(key.parser, data[open_parser.header_length:])
+            return key.parser.parse_input(data[open_parser.header_length:])
+    raise ParserException(ParserException.ExceptionType.NO_KEY)
+
+
+def _generate_frames(open_parser, num_frames, seed):
+    rnd = random.Random(seed)
+    keys = open_parser.parser_status.fields_parsing_keys
+    next_row = dict((name, 0) for name in TABLE_ROWS)
+
+    frames = []
+    while len(frames) < num_frames:
+        for key in keys:
+            body = [rnd.randrange(256) for _ in range(struct.calcsize(key.structure))]
+            if key.name in TABLE_ROWS:
+                body[0] = next_row[key.name]
+                next_row[key.name] = (next_row[key.name] + 1) % TABLE_ROWS[key.name]
+            frames.append([OpenParser.SERFRAME_MOTE2PC_STATUS, 0x01, 0x00, key.val] + body)
+    return frames[:num_frames]
+
+
+def _parse_all(parse, frames):
+    for frame in frames:
+        parse(frame)
+
+
+@click.command()
+@click.option('--frames', default=100000, show_default=True, help='Number of generated frames')
+@click.option('--load', type=click.File('r'), help='File of recorded frames, replaces the generated ones')
+@click.option('--save', type=click.File('w'), help='File to record the frames to')
+def cli(frames, load, save):
+    """ Compare the former status parsing with the compiled one. """
+
+    open_parser = OpenParser(None, STACK_DEFINES, 'emulated1')
+
+    if load:
+        recording = [list(bytearray.fromhex(line.strip())) for line in load if line.strip()]
+    else:
+        recording = _generate_frames(open_parser, frames, 1)
+    if save:
+        for frame in recording:
+            save.write(''.join('{0:02x}'.format(b) for b in frame) + '\n')
+
+    # both parsers must decode the frames into the same tuples
+    assert [_legacy_parse(open_parser, f) for f in recording] == [open_parser.parse_input(f) for f in recording]
+
+    legacy = measure(lambda: _parse_all(lambda f: _legacy_parse(open_parser, f), recording))
+    compiled = measure(lambda: _parse_all(open_parser.parse_input, recording))
+
+    n = len(recording)
+    print_header('Parsing of {0} status frames'.format(n), ['', 'legacy', 'compiled', 'speedup'])
+    print_row(['frames/s', n / legacy, n / compiled, speedup(legacy, compiled)])
+    print_row(['us/frame', legacy / n * 1e6, compiled / n * 1e6, ''])
+
+
+if __name__ == '__main__':
+    cli()
@@ -0,0 +1,123 @@
+"""
+Time to bring up the links of a simulated network.
+
+Adds motes to the engine, with the Pister-hack model, as OpenVisualizer does when it starts a simulation. Compares the
+former propagation model, which created the connections of every new mote one pair at a time, with the one-pass NumPy
+computation. The motes are placed as the LocationManager does, within about 100 m, or scattered over a few km, where
+the grid spares the pairs out of range.
+"""
+
+import logging
+import random
+import time
+from math import radians, cos, sin, asin, sqrt, log10
+
+import click
+
+from openvisualizer.simengine.propagation import Propagation
+from openvisualizer.simengine.simengine import SimEngine
+from scripts.benchmarks.benchutils import print_header, print_row, speedup
+
+
+class _MoteHandler(object):
+
+    def __init__(self, mote_id, location):
+        self.id = mote_id
+        self.location = location
+
+    def get_id(self):
+        return self.id
+
+    def get_location(self):
+        return self.location
+
+
+def _legacy_bring_up(mote_handlers):
+    """ Copy of the former SimEngine.indicate_new_mote() and Propagation.create_connection(). """
+    added = []
+    connections = {}
+
+    def get_mote_handler_by_id(mote_id):
+        for h in added:
+            if h.get_id() == mote_id:
+                return h
+
+    for new_mote_handler in mote_handlers:
+        added.append(new_mote_handler)
+        for mh in added[:-1]:
+            (from_mote, to_mote) = (new_mote_handler.get_id(), mh.get_id())
+            (lat_from, lon_from) = get_mote_handler_by_id(from_mote).get_location()
+            (lat_to, lon_to) = get_mote_handler_by_id(to_mote).get_location()
+
+            lon_from, lat_from, lon_to, lat_to = map(radians, [lon_from, lat_from, lon_to, lat_to])
+            d_lon = lon_to - lon_from
+            d_lat = lat_to - lat_from
+            a = sin(d_lat / 2) ** 2 + cos(lat_from) * cos(lat_to) * sin(d_lon / 2) ** 2
+            c = 2 * asin(sqrt(a))
+            d_km = 6367 * c
+
+            p_rx = Propagation.TX_POWER_dBm - (20 * log10(d_km) + 20 * log10(Propagation.FREQUENCY_GHz) + 92.45)
+            p_rx -= Propagation.PISTER_HACK_LOSS * random.random()
+
+            if p_rx < Propagation.SENSITIVITY_dBm:
+                pdr = 0.0
+            elif p_rx > Propagation.SENSITIVITY_dBm + Propagation.GREY_AREA_dB:
+                pdr = 1.0
+            else:
+                pdr = (p_rx - Propagation.SENSITIVITY_dBm) / Propagation.GREY_AREA_dB
+
+            if pdr:
+                connections.setdefault(from_mote, {})[to_mote] = pdr
+                connections.setdefault(to_mote, {})[from_mote] = pdr
+    return connections
+
+
+def _bring_up(engine, mote_handlers, one_pass):
+    (engine.moteHandlers, engine.moteHandlersById) = ([], {})
+    if one_pass:
+        engine.indicate_new_motes(mote_handlers)
+    else:
+        for mh in mote_handlers:
+            engine.indicate_new_mote(mh)
+    return engine.propagation.connections
+
+
+def _motes(num_motes, span_deg):
+    rnd = random.Random(num_motes)
+    return [_MoteHandler(i + 1, (37.875095 + rnd.random() * span_deg, -122.257473 + rnd.random() * span_deg))
+            for i in range(num_motes)]
+
+
+def _duration(func):
+    start = time.time()
+    func()
+    return time.time() - start
+
+
+@click.command()
+@click.option('--motes', default='100,250,500', show_default=True, help='Comma-separated numbers of motes')
+@click.option('--legacy-max', default=250, show_default=True, help='Largest network brought up by the former model')
+def cli(motes, legacy_max):
+    """ Compare the former pairwise propagation model with the NumPy one. """
+
+    engine = SimEngine()
+    engine.propagation.log.setLevel(logging.WARNING)
+
+    for (area, span_deg) in [('100 m', 0.001), ('5 km', 0.05)]:
+        print_header('Bring-up of motes within {0}: ms'.format(area),
+                     ['motes', 'links', 'legacy', 'incremental', 'one pass', 'speedup'])
+        for num_motes in [int(m) for m in motes.split(',')]:
+            mote_handlers = _motes(num_motes, span_deg)
+            if num_motes <= legacy_max:
+                legacy = _duration(lambda: _legacy_bring_up(mote_handlers))
+            else:
+                legacy = None
+            incremental = _duration(lambda: _bring_up(engine, mote_handlers, False))
+            one_pass = _duration(lambda: _bring_up(engine, mote_handlers, True))
+            num_links = sum(len(c) for c in engine.propagation.connections.values()) / 2
+            print_row([num_motes, num_links, legacy * 1e3 if legacy else '-', incremental * 1e3, one_pass * 1e3,
+                       speedup(legacy, one_pass) if legacy else '-'])
+
+
+if __name__ == '__main__':
+    cli()
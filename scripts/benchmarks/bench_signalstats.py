@@ -0,0 +1,85 @@
+"""
+Cost of the signal statistics of the EventBusMonitor.
+
+Threads, standing for the mote probes and the TUN thread, count signals of their own senders, as the monitor does for
+every dispatch, while a reader fetches the statistics. Compares the former counters, a dictionary behind a lock which
+was deep-copied on read, with the per-thread shards.
+"""
+
+import copy
+import threading
+import time
+
+import click
+
+from openvisualizer.eventbus.signalstats import ShardedCounters
+from scripts.benchmarks.benchutils import print_header, print_row, speedup
+
+SIGNALS = ['fromMote.data', 'fromMote.status', 'fromMote.error', 'bytesToMesh', 'v6ToInternet']
+
+
+class LegacyCounters(object):
+    """ Copy of the counters of the former EventBusMonitor. """
+
+    def __init__(self):
+        self.data_lock = threading.Lock()
+        self.stats = {}
+
+    def increment(self, key):
+        with self.data_lock:
+            if key not in self.stats:
+                self.stats[key] = 0
+            self.stats[key] += 1
+
+    def get_counts(self):
+        with self.data_lock:
+            return copy.deepcopy(self.stats)
+
+
+def _run(counters, num_threads, num_signals):
+    """ Returns the time per counted signal, in seconds. """
+    go_on = [True]
+
+    def count(i):
+        keys = [('moteConnector@emulated{0}'.format(i), s) for s in SIGNALS]
+        for n in range(num_signals):
+            counters.increment(keys[n % len(keys)])
+
+    def read():
+        while go_on[0]:
+            counters.get_counts()
+            time.sleep(0.01)
+
+    reader = threading.Thread(target=read)
+    reader.start()
+    threads = [threading.Thread(target=count, args=(i,)) for i in range(num_threads)]
+
+    start = time.time()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    duration = time.time() - start
+
+    go_on[0] = False
+    reader.join()
+    assert sum(counters.get_counts().values()) == num_threads * num_signals
+    return duration / (num_threads * num_signals)
+
+
+@click.command()
+@click.option('--threads', default='1,4,16', show_default=True, help='Comma-separated numbers of counting threads')
+@click.option('--signals', default=100000, show_default=True, help='Number of signals counted per thread')
+def cli(threads, signals):
+    """ Compare the former locked counters with the sharded ones. """
+
+    print_header('Counting {0} signals per thread: ns per signal'.format(signals),
+                 ['threads', 'legacy', 'sharded', 'speedup'])
+    for num_threads in [int(t) for t in threads.split(',')]:
+        legacy = _run(LegacyCounters(), num_threads, signals)
+        sharded = _run(ShardedCounters(), num_threads, signals)
+        print_row([num_threads, legacy * 1e9, sharded * 1e9, speedup(legacy, sharded)])
+
+
+if __name__ == '__main__':
+    cli()
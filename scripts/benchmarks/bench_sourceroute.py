@@ -0,0 +1,104 @@
+"""
+Benchmark of the source route calculation.
+
+Replays a ping flood towards every mote of a random DODAG, with DAOs refreshing the parents of random motes during the
+flood. Compares the former calculation, which fetches the parents from the Topology over the EventBus and walks them
+for every packet, with the cached SourceRoute.
+"""
+
+import random
+
+import click
+
+from openvisualizer.eventbus.eventbusclient import EventBusClient
+from openvisualizer.rpl.sourceroute import SourceRoute
+from openvisualizer.rpl.topology import Topology
+from scripts.benchmarks.benchutils import measure, print_header, print_row, speedup
+
+
+class LegacySourceRoute(EventBusClient):
+    """ Copy of the SourceRoute calculation used before the route cache. """
+
+    def __init__(self):
+        super(LegacySourceRoute, self).__init__(name='LegacySourceRoute', registrations=[])
+
+    def get_source_route(self, dest_addr):
+        source_route = []
+        parents = self._dispatch_and_get_result(signal='getParents', data=None)
+        self._get_source_route_internal(dest_addr, source_route, parents)
+        return source_route
+
+    def _get_source_route_internal(self, dest_addr, source_route, parents):
+        if not dest_addr:
+            return
+        if not parents.get(tuple(dest_addr)):
+            return
+        if dest_addr not in source_route:
+            source_route += [dest_addr]
+        parent = parents.get(tuple(dest_addr))[0]
+        if parent not in source_route:
+            source_route += [parent]
+            self._get_source_route_internal(parent, source_route, parents)
+
+
+def _address(i):
+    return [0x14, 0x15, 0x92, 0x00, 0x00, 0x00, (i >> 8) & 0xff, i & 0xff]
+
+
+def _random_dodag(num_motes, rnd):
+    """ Returns (node, parents) tuples, every mote picks its preferred parent among the previous motes. """
+    return [(tuple(_address(i)), [_address(rnd.randrange(i))]) for i in range(1, num_motes + 1)]
+
+
+def _flood(route_calculator, sender, destinations, num_pings, dao_every, rnd):
+    for i in range(num_pings):
+        route_calculator.get_source_route(destinations[i % len(destinations)])
+        if dao_every and i % dao_every == 0:
+            node = rnd.choice(destinations)
+            index = (node[-2] << 8) + node[-1]
+            # most DAOs announce the same preferred parent, some announce a new one
+            if rnd.random() < 0.1:
+                parents = [_address(rnd.randrange(index))]
+            else:
+                parents = sender.parents[tuple(node)]
+            sender.parents[tuple(node)] = parents
+            sender.dispatch(signal='updateParents', data=(tuple(node), parents))
+
+
+@click.command()
+@click.option('--motes', default=200, show_default=True, help='Number of destinations')
+@click.option('--pings', default=10000, show_default=True, help='Number of pings in the flood')
+@click.option('--dao-every', default=50, show_default=True, help='Pings between two DAOs, 0 for no DAO')
+def cli(motes, pings, dao_every):
+    """ Compare the per-packet source route calculation with the cached source routes. """
+
+    rnd = random.Random(motes)
+    dodag = _random_dodag(motes, rnd)
+    destinations = [list(node) for (node, _) in dodag]
+
+    _ = Topology()
+    sender = EventBusClient(name='bench_sourceroute', registrations=[])
+    sender.parents = {}
+    legacy = LegacySourceRoute()
+    cached = SourceRoute()
+    for (node, parents) in dodag:
+        sender.parents[node] = parents
+        sender.dispatch(signal='updateParents', data=(node, parents))
+
+    assert all(legacy.get_source_route(d) == cached.get_source_route(d) for d in destinations)
+
+    t_legacy = measure(lambda: _flood(legacy, sender, destinations, pings, dao_every, random.Random(0)))
+    t_cached = measure(lambda: _flood(cached, sender, destinations, pings, dao_every, random.Random(0)))
+
+    print_header('Ping flood to {0} destinations (us per packet)'.format(motes), ['legacy', 'cached', 'speedup'])
+    print_row([t_legacy / pings * 1e6, t_cached / pings * 1e6, speedup(t_legacy, t_cached)])
+
+    stats = cached.get_stats()
+    click.secho('\ncache hits {0}, misses {1}, invalidations {2}'.format(
+        stats['hits'], stats['misses'], stats['invalidations']))
+
+    assert all(legacy.get_source_route(d) == cached.get_source_route(d) for d in destinations)
+
+
+if __name__ == '__main__':
+    cli()
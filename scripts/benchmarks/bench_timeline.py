@@ -0,0 +1,107 @@
+"""
+Throughput benchmark of the simulation TimeLine.
+
+Replays the event pattern of emulated motes: every mote has a sctimer, a radio and a UART event which are rescheduled
+each time they fire, and sometimes cancelled. Compares the former sorted list with the binary heap.
+"""
+
+import logging
+import random
+import time
+
+import click
+
+from openvisualizer.simengine.simengine import SimEngine
+from openvisualizer.simengine.timeline import TimeLine
+from scripts.benchmarks.benchutils import print_header, print_row, speedup
+
+DESCS = ['sctimer', 'radio', 'uart']
+SECOND = TimeLine.NS_PER_SECOND
+
+
+class LegacyTimeLine(object):
+    """ Copy of the sorted list TimeLine used before the heap. """
+
+    def __init__(self):
+        self.timeline = []
+
+    def schedule_event(self, at_time, mote_id, cb, desc):
+        for i in range(len(self.timeline)):
+            if self.timeline[i].mote_id == mote_id and self.timeline[i].desc == desc:
+                self.timeline.pop(i)
+                break
+        i = 0
+        while i < len(self.timeline):
+            if at_time > self.timeline[i].at_time:
+                i += 1
+            else:
+                break
+        self.timeline.insert(i, _Event(mote_id, at_time, cb, desc))
+
+    def cancel_event(self, mote_id, desc):
+        num_events_canceled = 0
+        i = 0
+        while i < len(self.timeline):
+            if self.timeline[i].mote_id == mote_id and self.timeline[i].desc == desc:
+                self.timeline.pop(i)
+                num_events_canceled += 1
+            else:
+                i += 1
+        return num_events_canceled
+
+    def _pop_event(self):
+        return self.timeline.pop(0)
+
+
+class _Event(object):
+
+    def __init__(self, mote_id, at_time, cb, desc):
+        self.at_time = at_time
+        self.mote_id = mote_id
+        self.desc = desc
+        self.cb = cb
+
+
+def _noop():
+    pass
+
+
+def _replay(timeline, num_motes, num_events):
+    rnd = random.Random(num_motes)
+
+    for mote_id in range(num_motes):
+        for desc in DESCS:
+            timeline.schedule_event(rnd.randrange(SECOND), mote_id, _noop, desc)
+
+    start = time.time()
+    for _ in range(num_events):
+        event = timeline._pop_event()
+        timeline.schedule_event(event.at_time + rnd.randrange(SECOND), event.mote_id, _noop, event.desc)
+        if rnd.random() < 0.1:
+            # e.g. a sctimer compare value being moved
+            mote_id = rnd.randrange(num_motes)
+            timeline.cancel_event(mote_id, 'sctimer')
+            timeline.schedule_event(event.at_time + rnd.randrange(SECOND), mote_id, _noop, 'sctimer')
+    return time.time() - start
+
+
+@click.command()
+@click.option('--motes', default='10,50,100,500', show_default=True, help='Comma separated list of network sizes')
+@click.option('--events', default=20000, show_default=True, help='Number of events per measurement')
+def cli(motes, events):
+    """ Compare the sorted list timeline with the heap timeline. """
+
+    print_header('Timeline throughput (events/s)', ['motes', 'legacy', 'heap', 'speedup'])
+
+    for n in [int(m) for m in motes.split(',')]:
+        timeline = SimEngine().timeline
+        # every TimeLine sets its logger to DEBUG
+        timeline.log.setLevel(logging.WARNING)
+
+        legacy = _replay(LegacyTimeLine(), n, events)
+        heap = _replay(timeline, n, events)
+        print_row([n, events / legacy, events / heap, speedup(legacy, heap)])
+
+
+if __name__ == '__main__':
+    cli()
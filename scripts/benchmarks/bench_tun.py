@@ -0,0 +1,243 @@
+"""
+Echo requests per second and round-trip time through the Linux TUN backend, under the load of scripts/ping_responder.py.
+
+The ReadThread of ping_responder answers the echo requests read on the interface, the echo requests are sent with up to
+window of them outstanding. By default the interface is replaced by datagram sockets, one per queue; with --tun a
+real interface is created (root only) and the echo requests are sent to it by a raw ICMPv6 socket. Compares the former
+backend, which read one packet per blocking read and wrote the echo replies from the reading thread, with the queues
+read through epoll and the echo replies written by the TunWriteThread. The time taken by the bus thread to forward an
+echo reply to the interface is reported as well: the former backend wrote it, the TunWriteThread only queues it.
+"""
+
+import logging
+import os
+import socket
+import struct
+import time
+
+import click
+
+from openvisualizer.opentun.opentun import OpenTun
+from openvisualizer.opentun.opentunlinux import OpenTunLinux, TunReadThread, ioctl
+from openvisualizer.utils import format_buf, format_critical_message, format_ipv6_addr
+from scripts.benchmarks.benchutils import print_header, print_row, speedup
+from scripts.ping_responder import ReadThread, WriteThread
+
+log = logging.getLogger('OpenTunLinux')
+
+TIMEOUT = 2  # seconds to wait for an echo reply
+
+
+class LegacyTunReadThread(TunReadThread):
+    """ Copy of the former reading of the TUN interface, one blocking read per packet. """
+
+    def run(self):
+        while self.goOn:
+            p = os.read(self.tun_if, self.ETHERNET_MTU)
+            p = bytearray(p)
+            if log.isEnabledFor(logging.DEBUG):
+                log.debug('packet captured on tun interface: {0}'.format(format_buf(p)))
+            if len(p) < 4 + self.IPv6_HEADER_LENGTH or (p[4] & 0xf0) != 0x60:
+                continue
+            del p[4 + self.IPv6_HEADER_LENGTH + 256 * p[8] + p[9]:]
+            del p[:4]
+            self.callback(p)
+
+
+class LegacyOpenTunLinux(OpenTunLinux):
+    """ Copy of the former backend: a single queue with the packet information header, written from the bus. """
+
+    def close(self):
+        OpenTun.close(self)
+        os.close(self.tun_if[0])
+
+    def _v6_to_internet_notif(self, sender, signal, data):
+        if not self.tun_if:
+            return
+        pkt = bytearray(self.VIRTUAL_TUN_ID)
+        pkt.extend(data)
+        try:
+            os.write(self.tun_if[0], pkt)
+            log.debug("data dispatched to tun correctly {0}, {1}".format(signal, sender))
+        except Exception as err:
+            log.critical(format_critical_message(err))
+
+    def _open_queues(self, num_queues):
+        fd = os.open("/dev/net/tun", os.O_RDWR)
+        ifs = ioctl(fd, self.TUN_SET_IFF, struct.pack("16sH", "tun%d", self.IFF_TUN))
+        return [fd], ifs[:16].strip("\x00")
+
+    def _create_tun_read_thread(self):
+        return LegacyTunReadThread(self.tun_if[0], self._v6_to_mesh_notif)
+
+    def _create_tun_write_thread(self):
+        return None
+
+
+class _TimedResponder(ReadThread):
+    """ The ReadThread of ping_responder, measures the time spent by the bus thread forwarding its echo replies. """
+
+    def __init__(self):
+        super(_TimedResponder, self).__init__()
+        self.dispatch_time = 0.0
+        self.num_dispatched = 0
+
+    def dispatch(self, signal, data):
+        start = time.time()
+        super(_TimedResponder, self).dispatch(signal, data)
+        self.dispatch_time += time.time() - start
+        self.num_dispatched += 1
+
+
+class _SocketTun(object):
+    """ Replaces the queues of the TUN interface with datagram sockets, the other ends are in self.host. """
+
+    def _open_queues(self, num_queues):
+        self.host = []
+        queues = []
+        for _ in range(num_queues):
+            (host, tun) = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+            host.settimeout(TIMEOUT)
+            self.host.append(host)
+            queues.append(os.dup(tun.fileno()))
+            tun.close()
+        return queues, 'stand-in'
+
+    def _create_tun_if(self):
+        return self._open_queues(self.NUM_QUEUES)[0]
+
+
+class SocketOpenTun(_SocketTun, OpenTunLinux):
+    pass
+
+
+class SocketLegacyOpenTun(_SocketTun, LegacyOpenTunLinux):
+    NUM_QUEUES = 1
+
+    def close(self):
+        # unblock the read with an empty packet
+        self.tun_read_thread.close()
+        self.host[0].send(bytearray(self.VIRTUAL_TUN_ID))
+        self.tun_read_thread.join()
+        os.close(self.tun_if[0])
+
+
+class _StandInHost(object):
+    """ Sends the echo requests on the sockets standing for the queues, reads the echo replies. """
+
+    def __init__(self, tun):
+        self.tun = tun
+        self.header = bytearray(OpenTunLinux.VIRTUAL_TUN_ID) if isinstance(tun, LegacyOpenTunLinux) else bytearray()
+        self.request = self.header + bytearray(WriteThread._create_ipv6echo_request())
+        self.offset = len(self.header) + 44
+        self.num_sent = 0
+
+    def send(self, seq):
+        self.request[self.offset:self.offset + 4] = struct.pack('!I', seq)
+        # the kernel spreads the flows over the queues
+        self.tun.host[self.num_sent % len(self.tun.host)].send(self.request)
+        self.num_sent += 1
+
+    def recv(self):
+        return struct.unpack('!I', self.tun.host[0].recv(2048)[self.offset:self.offset + 4])[0]
+
+    def close(self):
+        for host in self.tun.host:
+            host.close()
+
+
+class _TunHost(object):
+    """ Sends the echo requests to an address behind the TUN interface, reads the echo replies. """
+
+    def __init__(self, tun):
+        dst = OpenTun.IPV6PREFIX + OpenTun.IPV6HOST
+        dst[15] += 4
+        self.dst = (format_ipv6_addr(dst), 0)
+        self.sock = socket.socket(socket.AF_INET6, socket.SOCK_RAW, socket.IPPROTO_ICMPV6)
+        self.sock.settimeout(TIMEOUT)
+        self.payload = 'a' * 32
+
+    def send(self, seq):
+        # the kernel computes the checksum
+        self.sock.sendto(struct.pack('!BBHI', 128, 0, 0, seq) + self.payload, self.dst)
+
+    def recv(self):
+        while True:
+            reply = self.sock.recv(2048)
+            if ord(reply[0]) == 129:
+                return struct.unpack('!I', reply[4:8])[0]
+
+    def close(self):
+        self.sock.close()
+
+
+def _run(new_tun, new_host, num_requests, window):
+    """
+    Returns the duration of the echo requests, their round-trip times, the number of lost replies and the time taken to
+    forward an echo reply to the interface.
+    """
+
+    tun = new_tun()
+    responder = _TimedResponder()
+    host = new_host(tun)
+
+    sent = {}
+    rtts = []
+    start = time.time()
+    try:
+        for seq in range(min(window, num_requests)):
+            sent[seq] = time.time()
+            host.send(seq)
+        while len(rtts) < num_requests:
+            seq = host.recv()
+            rtts.append(time.time() - sent.pop(seq))
+            next_seq = len(rtts) + window - 1
+            if next_seq < num_requests:
+                sent[next_seq] = time.time()
+                host.send(next_seq)
+    except socket.timeout:
+        pass
+    duration = time.time() - start
+
+    tun.close()
+    host.close()
+    for c in [responder, tun]:
+        c.detach()
+    return duration, sorted(rtts), num_requests - len(rtts), responder.dispatch_time / responder.num_dispatched
+
+
+@click.command()
+@click.option('--windows', default='1,8,64', show_default=True,
+              help='Comma-separated numbers of outstanding echo requests')
+@click.option('--requests', default=5000, show_default=True, help='Number of echo requests per measurement')
+@click.option('--queues', default=OpenTunLinux.NUM_QUEUES, show_default=True, help='Number of queues of the interface')
+@click.option('--tun', is_flag=True, help='Use a real TUN interface, requires root')
+def cli(windows, requests, queues, tun):
+    """ Compare the former blocking backend with the epoll and writer thread one. """
+
+    logging.getLogger('scripts.ping_responder').setLevel(logging.ERROR)
+    OpenTunLinux.NUM_QUEUES = queues
+
+    if tun:
+        if os.geteuid() != 0:
+            click.echo('--tun must be run with root privileges.')
+            return
+        (legacy_tun, new_tun, new_host) = (LegacyOpenTunLinux, OpenTunLinux, _TunHost)
+    else:
+        (legacy_tun, new_tun, new_host) = (SocketLegacyOpenTun, SocketOpenTun, _StandInHost)
+
+    print_header('echo requests through {0}, {1} queues'.format('tun' if tun else 'sockets', queues),
+                 ['window', 'legacy pps', 'new pps', 'speedup', 'legacy us', 'new us', 'legacy p99', 'new p99',
+                  'legacy bus us', 'new bus us', 'lost'])
+    for window in [int(n) for n in windows.split(',')]:
+        (legacy, legacy_rtts, legacy_lost, legacy_bus) = _run(legacy_tun, new_host, requests, window)
+        (new, new_rtts, new_lost, new_bus) = _run(new_tun, new_host, requests, window)
+
+        print_row([window, len(legacy_rtts) / legacy, len(new_rtts) / new, speedup(legacy, new),
+                   1e6 * sum(legacy_rtts) / len(legacy_rtts), 1e6 * sum(new_rtts) / len(new_rtts),
+                   1e6 * legacy_rtts[len(legacy_rtts) * 99 // 100], 1e6 * new_rtts[len(new_rtts) * 99 // 100],
+                   1e6 * legacy_bus, 1e6 * new_bus, '{0}/{1}'.format(legacy_lost, new_lost)])
+
+
+if __name__ == '__main__':
+    cli()
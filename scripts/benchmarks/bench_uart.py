@@ -0,0 +1,141 @@
+"""
+Cost of the serial traffic between an emulated mote and its mote probe.
+
+Upstream, the mote writes HDLC frames byte by byte, as openserial does, while a thread reads them as the
+EmulatedMoteProbe does. Downstream, the mote probe writes frames to the mote and the timeline delivers them. Compares
+the former UART, which handed every byte over to the mote probe and had one timeline event per byte sent to the mote,
+with the batched one.
+"""
+
+import logging
+import threading
+
+import click
+
+from openvisualizer.bspemulator.bspuart import BspUart
+from openvisualizer.simengine.simengine import SimEngine
+from scripts.benchmarks.benchutils import measure, print_header, print_row, speedup
+
+
+class LegacyUart(BspUart):
+    """ Copy of the former hand over of the RX buffer and of the former RX interrupts. """
+
+    def write(self, bytes_to_write):
+        if len(self.uart_tx_frames) != 0:
+            return 0
+        with self.uart_tx_buffer_lock:
+            self.uart_tx_frames.append([ord(b) for b in bytes_to_write])
+        self.engine.pause()
+        self._schedule_next_byte()
+        self.engine.resume()
+        return len(bytes_to_write)
+
+    def intr_rx(self):
+        with self.uart_tx_buffer_lock:
+            self.uart_tx_next = self.uart_tx_frames[0].pop(0)
+            if len(self.uart_tx_frames[0]):
+                self._schedule_next_byte()
+            else:
+                self.uart_tx_frames.popleft()
+        self.motehandler.mote.uart_isr_rx()
+        return False
+
+    def _add_to_rx_buffer(self, bytes_to_add):
+        with self.uart_rx_buffer_lock:
+            self.uart_rx_buffer += bytes_to_add
+        self.uart_rx_buffer_sem.release()
+        self.wait_for_done_reading.acquire()
+
+    def _schedule_next_byte(self):
+        self.timeline.schedule_event(self.timeline.get_current_time() + self.byte_duration,
+                                     self.motehandler.get_id(), self.intr_rx, self.INTR_RX)
+
+
+class _Mote(object):
+
+    def __init__(self, uart_class):
+        self.engine = SimEngine()
+        self.mote = self
+        self.bsp_uart = uart_class(self)
+        self.bsp_uart.log.setLevel(logging.WARNING)
+        self.bsp_uart.timeline.log.setLevel(logging.WARNING)
+        self.num_received = 0
+
+    @staticmethod
+    def get_id():
+        return 0
+
+    def uart_isr_rx(self):
+        self.bsp_uart.cmd_read_byte()
+        self.num_received += 1
+
+    def uart_isr_tx(self):
+        pass
+
+
+def _upstream(uart, frames):
+    """ The mote writes the frames byte by byte, the interrupts of the escaped bytes are ignored. """
+    def read():
+        while True:
+            uart.read()
+            uart.done_reading()
+
+    reader = threading.Thread(target=read)
+    reader.daemon = True
+    reader.start()
+
+    def write():
+        for frame in frames:
+            for byte in frame:
+                uart.cmd_write_byte(byte)
+
+    return measure(write, repeat=1)
+
+
+def _downstream(uart, frames):
+    """ The mote probe writes the frames, the timeline delivers them. Returns the duration and number of events. """
+    timeline = uart.timeline
+    num_events = [0]
+
+    # drop the TX interrupts left by the upstream measurements
+    while timeline._pop_event():
+        pass
+
+    def deliver():
+        for frame in frames:
+            while not uart.write(frame):
+                pass
+            while True:
+                event = timeline._pop_event()
+                if event is None:
+                    break
+                timeline.current_time = event.at_time
+                event.cb()
+                num_events[0] += 1
+
+    return measure(deliver, repeat=1), num_events[0]
+
+
+@click.command()
+@click.option('--frames', default=2000, show_default=True, help='Number of frames per measurement')
+@click.option('--size', default=60, show_default=True, help='Size of the HDLC frames, in bytes')
+def cli(frames, size):
+    """ Compare the former per-byte UART with the batched one. """
+
+    frame = [0x7e] + [0x40 + i % 32 for i in range(size - 2)] + [0x7e]
+
+    print_header('{0} frames of {1} bytes: frames/s'.format(frames, size),
+                 ['direction', 'legacy', 'batched', 'speedup'])
+    legacy = _upstream(_Mote(LegacyUart).bsp_uart, [frame] * frames)
+    batched = _upstream(_Mote(BspUart).bsp_uart, [frame] * frames)
+    print_row(['to probe', frames / legacy, frames / batched, speedup(legacy, batched)])
+
+    data = ''.join(chr(b) for b in frame)
+    (legacy, legacy_events) = _downstream(_Mote(LegacyUart).bsp_uart, [data] * frames)
+    (batched, batched_events) = _downstream(_Mote(BspUart).bsp_uart, [data] * frames)
+    print_row(['to mote', frames / legacy, frames / batched, speedup(legacy, batched)])
+    print_row(['events', legacy_events, batched_events, ''])
+
+
+if __name__ == '__main__':
+    cli()
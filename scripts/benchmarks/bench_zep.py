@@ -0,0 +1,104 @@
+"""
+Throughput of the export of the mesh debug packets to Wireshark.
+
+Wraps 6LoWPAN packets of the given sizes, as sent towards the mesh, into IPv6/UDP/ZEP packets. Compares the former
+export, which built the ZEP header by list concatenations and the IPv6 and UDP headers with scapy, with the template of
+the ZEP encoder. The 802.15.4 frames and their FCS are built the same way by both.
+"""
+
+import time
+
+import click
+from scapy.compat import raw
+from scapy.layers.inet import UDP
+from scapy.layers.inet6 import IPv6
+
+from openvisualizer.eventbus.eventbusmonitor import EventBusMonitor
+from openvisualizer.eventbus.pcapngwriter import PcapngWriter
+from openvisualizer.opentun.opentun import OpenTun
+from openvisualizer.utils import calculate_fcs, format_ipv6_addr
+from scripts.benchmarks.benchutils import measure, print_header, print_row, speedup
+
+DAGROOT = [0x14, 0x15, 0x92, 0x00, 0x00, 0x00, 0x00, 0x01]
+NEXT_HOP = [0x14, 0x15, 0x92, 0x00, 0x00, 0x00, 0x00, 0x02]
+
+
+def _legacy_export(previous_hop, next_hop, lowpan):
+    """ Copy of the former EventBusMonitor._wrap_mac_and_zep() and _dispatch_mesh_debug_packet(). """
+    phop = previous_hop[:]
+    phop.reverse()
+    nhop = next_hop[:]
+    nhop.reverse()
+
+    zep = [ord('E'), ord('X')]
+    zep += [0x02]
+    zep += [0x01]
+    zep += [0x00]
+    zep += [0x00, 0x01]
+    zep += [0x01]
+    zep += [0xff]
+    zep += [0x01] * 8
+    zep += [0x02] * 4
+    zep += [0x00] * 10
+    zep += [21 + len(lowpan) + 2]
+
+    mac = [0x41, 0xcc]
+    mac += [0x66]
+    mac += [0xfe, 0xca]
+    mac += nhop
+    mac += phop
+    mac += lowpan
+    mac += calculate_fcs(mac)
+    zep = zep + mac
+
+    udp = UDP(sport=0, dport=17754)
+    udp.add_payload("".join([chr(i) for i in zep]))
+
+    addr = []
+    addr += OpenTun.IPV6PREFIX
+    addr += OpenTun.IPV6HOST
+    addr = format_ipv6_addr(addr)
+
+    ip = IPv6(version=6, tc=0, src=addr, hlim=64, dst=addr)
+    ip = ip / udp
+
+    return [ord(b) for b in raw(ip)]
+
+
+def _export(ebm, previous_hop, next_hop, lowpan):
+    """ What EventBusMonitor now does for a packet, up to the dispatch. """
+    mac = ebm._wrap_mac(previous_hop, next_hop, lowpan)
+    return list(ebm.zep_encoder.encode(mac, 0, time.time()))
+
+
+def _run(export, lowpans, number):
+    for _ in range(number):
+        for lowpan in lowpans:
+            export(DAGROOT, NEXT_HOP, lowpan)
+
+
+@click.command()
+@click.option('--sizes', default='20,60,100', show_default=True, help='Comma-separated sizes of 6LoWPAN packets')
+@click.option('--packets', default=500, show_default=True, help='Number of packets per size')
+@click.option('--pcapng', type=click.Path(), help='Also measure the writing of the packets to this pcapng file')
+def cli(sizes, packets, pcapng):
+    """ Compare the former ZEP export with the template encoder. """
+
+    ebm = EventBusMonitor()
+    print_header('Export of {0} packets: packets/s'.format(packets), ['size', 'legacy', 'encoder', 'speedup'])
+    for size in [int(s) for s in sizes.split(',')]:
+        lowpan = [0x78, 0x33, 0x3a] + [i % 256 for i in range(size - 3)]
+        legacy = measure(lambda: _run(_legacy_export, [lowpan], packets)) / packets
+        encoder = measure(lambda: _run(lambda p, n, l: _export(ebm, p, n, l), [lowpan], packets)) / packets
+        print_row([size, 1 / legacy, 1 / encoder, speedup(legacy, encoder)])
+
+    if pcapng:
+        writer = PcapngWriter(pcapng)
+        pkt = ebm.zep_encoder.encode(ebm._wrap_mac(DAGROOT, NEXT_HOP, [0x78, 0x33, 0x3a] * 20), 0)
+        duration = measure(lambda: [writer.write(pkt) for _ in range(packets)]) / packets
+        writer.close()
+        print_row(['pcapng write', '', 1 / duration, ''])
+
+
+if __name__ == '__main__':
+    cli()
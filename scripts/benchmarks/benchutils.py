@@ -0,0 +1,46 @@
+"""
+Helpers shared by the benchmark scripts.
+
+Every benchmark is a small click command which can be run from the root of the repository, e.g.:
+
+    python -m scripts.benchmarks.bench_eventbus --help
+"""
+
+import timeit
+
+import click
+
+
+def measure(func, repeat=3, number=1):
+    """
+    Runs func() number times, repeat times, and returns the best time per call in seconds.
+
+    :param func: callable taking no arguments
+    :param repeat: number of measurements
+    :param number: number of calls per measurement
+    """
+    timer = timeit.Timer(func)
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def print_header(title, columns, width=14):
+    click.secho('\n' + title, bold=True)
+    click.secho(''.join('{0:>{1}}'.format(c, width) for c in columns))
+    click.secho('-' * width * len(columns))
+
+
+def print_row(values, width=14):
+    cells = []
+    for v in values:
+        if isinstance(v, float):
+            cells.append('{0:>{1}.3f}'.format(v, width))
+        else:
+            cells.append('{0:>{1}}'.format(v, width))
+    click.secho(''.join(cells))
+
+
+def speedup(old, new):
+    """ Ratio between two durations, formatted for printing. """
+    if new == 0:
+        return 'inf'
+    return '{0:.1f}x'.format(float(old) / new)
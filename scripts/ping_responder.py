@@ -94,7 +94,8 @@ class ReadThread(EventBusClient):
 
     def _v6_to_mesh_notif(self, sender, signal, data):
 
-        p = data
+        # the TUN interface reads the packets as bytearrays
+        p = list(data)
 
         assert (p[0] & 0xf0) == 0x60
 
@@ -0,0 +1,76 @@
+#!/usr/bin/env python2
+
+import json
+import logging
+import os
+
+import click
+import coloredlogs
+
+from openvisualizer.simengine import batchrunner
+
+logger = logging.getLogger(__name__)
+for log in [logger, batchrunner.log]:
+    coloredlogs.install(logger=log, fmt="%(asctime)s [%(name)s:%(levelname)s] %(message)s", datefmt="%H:%m:%S",
+                        level='WARNING')
+
+
+def _print_result(result):
+    name = '{0} seed {1}'.format(result['topo_file'] or '{0} motes'.format(result['num_motes']), result['seed'])
+    if 'error' in result:
+        click.secho('{0}: {1}'.format(name, result['error']), fg='red')
+    elif not result['completed']:
+        click.secho('{0}: timed out at {1:.3f} s, after {2:.1f} s'.format(name, result['simulated'],
+                                                                          result['wall_clock']), fg='yellow')
+    else:
+        click.secho('{0}: {1} events, {2} transmissions, {3} collisions, {4:.1f} s'.format(
+            name, result['events'], result['numTransmissions'], result['numCorrupted'], result['wall_clock']),
+            fg='green')
+
+
+@click.command()
+@click.argument('topo_files', nargs=-1, type=str)
+@click.option('--fw-path', default=lambda: os.environ.get('OPENWSN_FW_BASE'), help='Path to openwsn-fw')
+@click.option('-s', '--seeds', default=4, show_default=True, help='Number of runs per topology, with seeds 1, 2, ...')
+@click.option('-d', '--duration', default=60.0, show_default=True, help='Simulated duration, in seconds')
+@click.option('-m', '--motes', default=5, show_default=True, help='Number of motes, without topology file')
+@click.option('--sim-topology', default='', help='Topology of the motes, without topology file')
+@click.option('-t', '--timeout', default=None, type=float, help='Maximum wall-clock duration of a run, in seconds')
+@click.option('-j', '--processes', default=None, type=int, help='Number of processes, the number of CPUs by default')
+@click.option('-o', '--output', default=None, type=click.Path(), help='Writes the results to a JSON file')
+def cli(topo_files, fw_path, seeds, duration, motes, sim_topology, timeout, processes, output):
+    """ Runs independent simulations in parallel and aggregates their results """
+
+    if fw_path is None:
+        raise click.UsageError("Neither OPENWSN_FW_BASE or '--fw-path' was specified.")
+
+    runner = batchrunner.BatchRunner(
+        fw_path=os.path.expanduser(fw_path),
+        seeds=range(1, seeds + 1),
+        duration=duration,
+        topo_files=[os.path.expanduser(f) for f in topo_files] or None,
+        num_motes=motes,
+        sim_topology=sim_topology,
+        timeout=timeout,
+        processes=processes,
+    )
+
+    click.secho("Running {0} simulations...".format(len(runner.get_params())), bold=True)
+    results = runner.run(callback=_print_result)
+    summaries = runner.aggregate(results)
+
+    for (topo_file, summary) in summaries.items():
+        click.secho('\n{0}:'.format(topo_file or '{0} motes'.format(motes)), bold=True)
+        for (k, v) in summary.items():
+            click.secho('{0:<18}{1:>12}'.format(k, '{0:.3f}'.format(v) if isinstance(v, float) else v))
+
+    if output:
+        with open(output, 'w') as f:
+            json.dump({'results': results, 'summaries': summaries.values()}, f, indent=4)
+
+    if any('error' in r or not r['completed'] for r in results):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    cli()
@@ -41,6 +41,7 @@ setup(
             'openv-client = openvisualizer.client.main:cli',
             'openv-serial = scripts.serialtester_cli:cli',
             'openv-tun = scripts.ping_responder:cli',
+            'openv-batch = scripts.simbatch_cli:cli',
         ],
     },
     install_requires=INSTALL_REQUIREMENTS,
@@ -0,0 +1,164 @@
+#!/usr/bin/env python2
+
+import logging.handlers
+import threading
+
+import pytest
+
+from openvisualizer.bspemulator.bspuart import BspUart
+from openvisualizer.motehandler.moteprobe.emulatedmoteprobe import EmulatedMoteProbe
+from openvisualizer.motehandler.moteprobe.openhdlc import OpenHdlc
+from openvisualizer.simengine.simengine import SimEngine
+
+# ============================ logging =================================
+
+LOGFILE_NAME = 'test_bspuart.log'
+
+log = logging.getLogger('test_bspuart')
+log.setLevel(logging.ERROR)
+log.addHandler(logging.NullHandler())
+
+log_handler = logging.handlers.RotatingFileHandler(LOGFILE_NAME, backupCount=5, mode='w')
+log_handler.setFormatter(logging.Formatter("%(asctime)s [%(name)s:%(levelname)s] %(message)s"))
+for logger_name in ['test_bspuart', 'MoteProbe']:
+    temp = logging.getLogger(logger_name)
+    temp.setLevel(logging.DEBUG)
+    temp.addHandler(log_handler)
+
+
+# ============================ helpers =================================
+
+class EmulatedMote(object):
+    """ Stands for the mote handler and the mote, records the bytes the mote receives. """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.mote = self
+        self.bsp_uart = BspUart(self)
+        self.received = []  # (time, byte)
+
+    @staticmethod
+    def get_id():
+        return 0
+
+    def uart_isr_rx(self):
+        self.received.append((self.bsp_uart.timeline.get_current_time(), self.bsp_uart.cmd_read_byte()))
+
+    def uart_isr_tx(self):
+        pass
+
+
+class Reader(threading.Thread):
+    """ Reads the bytes of the mote, as the mote probe does. """
+
+    def __init__(self, uart):
+        super(Reader, self).__init__()
+        self.daemon = True
+        self.uart = uart
+        self.reads = []
+        self.start()
+
+    def run(self):
+        while True:
+            self.reads.append(''.join(self.uart.read()))
+            self.uart.done_reading()
+
+
+def run_events(timeline):
+    """ Executes the events of the timeline, returns their times. """
+    times = []
+    while True:
+        event = timeline._pop_event()
+        if event is None:
+            return times
+        timeline.current_time = event.at_time
+        times.append(event.at_time)
+        event.cb()
+
+
+# ============================ fixtures ================================
+
+@pytest.fixture
+def mote():
+    engine = SimEngine()
+    try:
+        yield EmulatedMote(engine)
+    finally:
+        engine.close()
+
+
+# ============================ tests ===================================
+
+def test_frames_to_mote(mote):
+    uart = mote.bsp_uart
+    uart.timeline.current_time = 1000
+
+    assert uart.write('\x7eabc\x7e') == 5
+    assert uart.write('\x7exyz12\x7e') == 7
+
+    # one event per frame, when its last byte is received
+    first_end = 1000 + BspUart._transmission_time(5)
+    assert run_events(uart.timeline) == [first_end, first_end + BspUart._transmission_time(7)]
+    assert [chr(b) for (_, b) in mote.received] == list('\x7eabc\x7e\x7exyz12\x7e')
+    assert [t for (t, _) in mote.received] == [first_end] * 5 + [first_end + 60764] * 7
+
+
+def test_write_keeps_pause(mote):
+    uart = mote.bsp_uart
+
+    mote.engine.pause()
+    uart.write('\x7eabc\x7e')
+    assert not mote.engine.is_running()
+
+    # the frame is delivered once the simulation runs
+    assert run_events(uart.timeline) == [BspUart._transmission_time(5)]
+
+
+def test_frames_from_mote(mote):
+    uart = mote.bsp_uart
+    reader = Reader(uart)
+
+    # a frame written byte by byte is handed over at its closing flag
+    for byte in [0x7e, 0x01, 0x02]:
+        uart.cmd_write_byte(byte)
+    assert reader.reads == []
+    uart.cmd_write_byte(0x7e)
+    assert reader.reads == ['\x7e\x01\x02\x7e']
+
+    # the escaped XON is written when the escape has been sent, before the mote writes the next byte
+    for byte in [0x7e, 0x11]:
+        uart.cmd_write_byte(byte)
+    run_events(uart.timeline)
+    for byte in [0x03, 0x7e]:
+        uart.cmd_write_byte(byte)
+    assert reader.reads[1:] == ['\x7e\x12\x01\x03\x7e']
+
+    # several frames in a buffer
+    uart.uart_write_buffer_by_len_fastsim([0x7e, 0x11, 0x7e, 0x7e, 0x05, 0x7e])
+    assert reader.reads[2:] == ['\x7e\x12\x01\x7e\x7e\x05\x7e']
+
+    # flow control and long frames
+    uart.cmd_set_cts(False)
+    uart.cmd_write_circular_buffer_fastsim([0x7e] + [0x00] * BspUart.RX_BUFFER_THRESHOLD)
+    assert reader.reads[3:] == ['\x13', '\x7e' + '\x00' * BspUart.RX_BUFFER_THRESHOLD]
+
+
+def test_emulated_mote_probe(mote):
+    hdlc = OpenHdlc()
+    frames = [[0x44, 0x01, 0x02, 0x11], [0x7e, 0x12, 0x13] * 40]
+    parsed = []
+    done = threading.Event()
+
+    def send_to_parser(frame):
+        parsed.append(frame)
+        if len(parsed) == len(frames):
+            done.set()
+
+    probe = EmulatedMoteProbe(mote)
+    probe.send_to_parser = send_to_parser
+    for frame in frames:
+        mote.bsp_uart.uart_write_buffer_by_len_fastsim([ord(c) for c in hdlc.hdlcify(''.join(chr(b) for b in frame))])
+
+    assert done.wait(5)
+    probe.close()
+    assert parsed == frames
@@ -0,0 +1,237 @@
+#!/usr/bin/env python2
+
+import gc
+import logging.handlers
+import uuid
+import weakref
+
+import pytest
+from pydispatch import dispatcher
+
+from openvisualizer.eventbus.eventbusclient import EventBusClient
+from openvisualizer.eventbus.eventbusrouter import EventBusRouter
+
+# ============================ logging =================================
+
+LOGFILE_NAME = 'test_eventbus.log'
+
+log = logging.getLogger('test_eventbus')
+log.setLevel(logging.ERROR)
+log.addHandler(logging.NullHandler())
+
+log_handler = logging.handlers.RotatingFileHandler(LOGFILE_NAME, backupCount=5, mode='w')
+log_handler.setFormatter(logging.Formatter("%(asctime)s [%(name)s:%(levelname)s] %(message)s"))
+for logger_name in ['test_eventbus', 'EventBusClient', 'EventBusRouter']:
+    temp = logging.getLogger(logger_name)
+    temp.setLevel(logging.DEBUG)
+    temp.addHandler(log_handler)
+
+
+# ============================ helpers =================================
+
+class Recorder(object):
+    """ Callable which records the signals it receives and returns a fixed value. """
+
+    def __init__(self, return_val=None):
+        self.return_val = return_val
+        self.received = []
+
+    def __call__(self, sender, signal, data):
+        self.received.append((sender, signal, data))
+        return self.return_val
+
+
+def unique(prefix):
+    """ The router is a singleton, every test uses its own signal names. """
+    return '{0}-{1}'.format(prefix, uuid.uuid4().hex)
+
+
+# ============================ fixtures ================================
+
+@pytest.fixture
+def sig():
+    return unique('signal')
+
+
+@pytest.fixture
+def sender():
+    return EventBusClient(unique('sender'), registrations=[])
+
+
+# ============================ tests ===================================
+
+def test_exact_signal(sig, sender):
+    rec = Recorder()
+    EventBusClient(unique('rx'), [{'sender': EventBusClient.WILDCARD, 'signal': sig, 'callback': rec}])
+
+    sender.dispatch(sig, 1)
+    sender.dispatch(unique('other'), 2)
+
+    assert rec.received == [(sender.name, sig, 1)]
+
+
+def test_sender_filter(sig, sender):
+    other = EventBusClient(unique('other'), registrations=[])
+    rec = Recorder()
+    EventBusClient(unique('rx'), [{'sender': sender.name, 'signal': sig, 'callback': rec}])
+
+    other.dispatch(sig, 1)
+    sender.dispatch(sig, 2)
+
+    assert rec.received == [(sender.name, sig, 2)]
+
+
+def test_wildcard_string_signal(sig, sender):
+    rec = Recorder()
+    EventBusClient(unique('rx'), [{'sender': sender.name, 'signal': EventBusClient.WILDCARD, 'callback': rec}])
+
+    sender.dispatch(sig, 1)
+    # tuples never match the string wildcard
+    sender.dispatch((sig, EventBusClient.PROTO_UDP, 1), 2)
+
+    assert rec.received == [(sender.name, sig, 1)]
+
+
+def test_wildcard_tuple_signal(sig, sender):
+    rec = Recorder()
+    EventBusClient(
+        unique('rx'),
+        [{'sender': EventBusClient.WILDCARD, 'signal': (sig, EventBusClient.WILDCARD, 5683), 'callback': rec}],
+    )
+
+    sender.dispatch((sig, EventBusClient.PROTO_UDP, 5683), 1)
+    sender.dispatch((sig, EventBusClient.PROTO_ICMPv6, 5683), 2)
+    sender.dispatch((sig, EventBusClient.PROTO_UDP, 5684), 3)
+    sender.dispatch((sig, EventBusClient.PROTO_UDP), 4)
+
+    assert [d for (_, _, d) in rec.received] == [1, 2]
+
+
+def test_wildcard_in_dispatched_signal(sig, sender):
+    rec = Recorder()
+    EventBusClient(unique('rx'), [{'sender': EventBusClient.WILDCARD, 'signal': (sig, 'udp', 1), 'callback': rec}])
+
+    sender.dispatch((sig, EventBusClient.WILDCARD, 1), 1)
+
+    assert [d for (_, _, d) in rec.received] == [1]
+
+
+def test_first_matching_registration_per_client(sig, sender):
+    first = Recorder()
+    second = Recorder()
+    EventBusClient(
+        unique('rx'),
+        [
+            {'sender': EventBusClient.WILDCARD, 'signal': EventBusClient.WILDCARD, 'callback': first},
+            {'sender': EventBusClient.WILDCARD, 'signal': sig, 'callback': second},
+        ],
+    )
+
+    sender.dispatch(sig, 1)
+
+    assert len(first.received) == 1
+    assert len(second.received) == 0
+
+
+def test_duplicate_registration(sig):
+    rec = Recorder()
+    client = EventBusClient(unique('rx'), [{'sender': EventBusClient.WILDCARD, 'signal': sig, 'callback': rec}])
+
+    with pytest.raises(SystemError):
+        client.register(sender=EventBusClient.WILDCARD, signal=sig, callback=rec)
+
+
+def test_unregister(sig, sender):
+    rec = Recorder()
+    client = EventBusClient(unique('rx'), registrations=[])
+    client.register(sender=EventBusClient.WILDCARD, signal=(sig, 'udp', 1), callback=rec)
+    client.register(sender=EventBusClient.WILDCARD, signal=(sig, 'udp', 2), callback=rec)
+    assert len(client.registrations) == 2
+
+    # equivalent signals are unregistered as well
+    client.unregister(sender=EventBusClient.WILDCARD, signal=(sig, 'udp', EventBusClient.WILDCARD), callback=rec)
+    assert len(client.registrations) == 0
+
+    sender.dispatch((sig, 'udp', 1), 1)
+    assert rec.received == []
+
+
+class Receiver(EventBusClient):
+    """ Client which registers one of its own methods, as the components of OpenVisualizer do. """
+
+    def __init__(self, sig):
+        self.received = []
+        super(Receiver, self).__init__(
+            unique('rx'),
+            [{'sender': self.WILDCARD, 'signal': sig, 'callback': self._notif}],
+        )
+
+    def _notif(self, sender, signal, data):
+        self.received.append(data)
+
+
+def test_unregister_last_registration_releases_client(sig, sender):
+    client = Receiver(sig)
+    ref = weakref.ref(client)
+
+    client.unregister(sender=EventBusClient.WILDCARD, signal=sig, callback=client._notif)
+    del client
+    gc.collect()
+
+    assert ref() is None
+    sender.dispatch(sig, 1)
+
+
+def test_detach(sig, sender):
+    clients = [Receiver(sig) for _ in range(2)]
+    refs = [weakref.ref(c) for c in clients]
+
+    clients[0].detach()
+    sender.dispatch(sig, 1)
+    assert [c.received for c in clients] == [[], [1]]
+    assert clients[0].registrations == []
+
+    # a detached client registers again, it is notified after the others
+    clients[0].register(sender=EventBusClient.WILDCARD, signal=sig, callback=clients[0]._notif)
+    notified = [reg['client'] for reg in EventBusRouter().lookup(sender.name, sig) if reg['client'] in clients]
+    assert notified == [clients[1], clients[0]]
+
+    for c in clients:
+        c.detach()
+    del clients, notified, reg, c
+    gc.collect()
+    assert [r() for r in refs] == [None, None]
+
+
+def test_dispatch_and_get_result(sig, sender):
+    EventBusClient(unique('none'), [{'sender': EventBusClient.WILDCARD, 'signal': sig, 'callback': Recorder()}])
+    EventBusClient(unique('answer'), [{'sender': EventBusClient.WILDCARD, 'signal': sig, 'callback': Recorder(42)}])
+
+    assert sender._dispatch_and_get_result(sig, None) == 42
+    assert sender._dispatch_protocol(sig, None) is True
+    assert sender._dispatch_protocol(unique('other'), None) is False
+
+    with pytest.raises(SystemError):
+        sender._dispatch_and_get_result(unique('other'), None)
+
+
+def test_pydispatch_interoperability(sig, sender):
+    rec = Recorder()
+    EventBusClient(unique('rx'), [{'sender': EventBusClient.WILDCARD, 'signal': sig, 'callback': rec}])
+
+    received = []
+
+    def receiver(signal, sender, data):
+        received.append(data)
+
+    dispatcher.connect(receiver, signal=sig)
+
+    # signals sent through the event bus still reach plain PyDispatcher receivers, exactly once
+    sender.dispatch(sig, 1)
+    # signals sent directly through PyDispatcher still reach the event bus clients, exactly once
+    dispatcher.send(sender='raw', signal=sig, data=2)
+
+    assert received == [1, 2]
+    assert rec.received == [(sender.name, sig, 1), ('raw', sig, 2)]
+
+    dispatcher.disconnect(receiver, signal=sig)
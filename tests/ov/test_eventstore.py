@@ -0,0 +1,215 @@
+#!/usr/bin/env python2
+
+import logging.handlers
+import sqlite3
+import time
+
+import pytest
+
+from openvisualizer.motehandler.moteconnector.openparser.eventstore import EventStore
+from openvisualizer.motehandler.moteconnector.openparser.parserevent import ParserEvent
+
+# ============================ logging =================================
+
+LOGFILE_NAME = 'test_eventstore.log'
+
+log = logging.getLogger('test_eventstore')
+log.setLevel(logging.ERROR)
+log.addHandler(logging.NullHandler())
+
+log_handler = logging.handlers.RotatingFileHandler(LOGFILE_NAME, backupCount=5, mode='w')
+log_handler.setFormatter(logging.Formatter("%(asctime)s [%(name)s:%(levelname)s] %(message)s"))
+for logger_name in ['test_eventstore', 'EventStore']:
+    temp = logging.getLogger(logger_name)
+    temp.setLevel(logging.DEBUG)
+    temp.addHandler(log_handler)
+
+# ============================ defines =================================
+
+RPL_ROW = (1, '0001', 'PARENT_CHANGE', '0002', '0003')
+
+
+# ============================ helpers =================================
+
+def wait_for(condition, timeout=5):
+    start = time.time()
+    while not condition():
+        assert time.time() - start < timeout
+        time.sleep(0.01)
+
+
+def count_rows(db_filename, table):
+    dbconn = sqlite3.connect(db_filename)
+    try:
+        return dbconn.execute('SELECT COUNT(*) FROM {0}'.format(table)).fetchone()[0]
+    finally:
+        dbconn.close()
+
+
+# ============================ fixtures ================================
+
+@pytest.fixture
+def db_filename(tmpdir):
+    return str(tmpdir.join('openv_events.db'))
+
+
+@pytest.fixture
+def store(request, db_filename):
+    # the keyword arguments of the store are given by the parameter of the fixture
+    event_store = EventStore(db_filename, **getattr(request, 'param', {}))
+    yield event_store
+    event_store.close()
+
+
+# ============================ tests ===================================
+
+def test_tables_and_pragmas(store, db_filename):
+    dbconn = sqlite3.connect(db_filename)
+    tables = [r[0] for r in dbconn.execute("SELECT name FROM sqlite_master WHERE type='table'")]
+    journal_mode = dbconn.execute('PRAGMA journal_mode').fetchone()[0]
+    dbconn.close()
+
+    assert sorted(tables) == sorted(t for (t, _) in store.TABLES)
+    assert journal_mode == 'wal'
+
+
+def test_singleton(store, db_filename):
+    assert EventStore(db_filename + '.other') is store
+
+    store.close()
+    other = EventStore(db_filename)
+    other.close()
+    assert other is not store
+
+
+@pytest.mark.parametrize('store', [{'batch_size': 1000, 'flush_interval': 60}], indirect=['store'])
+def test_flush(store, db_filename):
+    for _ in range(10):
+        assert store.insert('rpl', RPL_ROW)
+    store.insert('sixtopStates', (1, '0001', 'IDLE'))
+    store.flush()
+
+    assert count_rows(db_filename, 'rpl') == 10
+    assert count_rows(db_filename, 'sixtopStates') == 1
+    stats = store.get_stats()
+    assert stats['queued'] == stats['flushed'] == 11
+    assert stats['batches'] == 1
+
+
+@pytest.mark.parametrize('store', [{'batch_size': 10, 'flush_interval': 60}], indirect=['store'])
+def test_flush_on_size(store, db_filename):
+    for _ in range(25):
+        store.insert('rpl', RPL_ROW)
+
+    wait_for(lambda: store.get_stats()['flushed'] == 20)
+    assert store.get_stats()['batches'] == 2
+    assert count_rows(db_filename, 'rpl') == 20
+
+
+@pytest.mark.parametrize('store', [{'batch_size': 1000, 'flush_interval': 0.05}], indirect=['store'])
+def test_flush_on_time(store, db_filename):
+    for _ in range(3):
+        store.insert('rpl', RPL_ROW)
+
+    wait_for(lambda: store.get_stats()['flushed'] == 3)
+    assert count_rows(db_filename, 'rpl') == 3
+
+
+@pytest.mark.parametrize('store', [{'batch_size': 1000, 'flush_interval': 60}], indirect=['store'])
+def test_close_writes_pending_rows(store, db_filename):
+    store.insert('rpl', RPL_ROW)
+    store.close()
+
+    assert count_rows(db_filename, 'rpl') == 1
+    # rows inserted after closing are dropped
+    assert store.insert('rpl', RPL_ROW) is False
+    assert store.get_stats()['dropped'] == 1
+
+
+@pytest.mark.parametrize('store', [{'queue_size': 2, 'batch_size': 1, 'backpressure': EventStore.DROP}],
+                         indirect=['store'])
+def test_backpressure_drop(store, db_filename):
+    # stall the writer thread behind an exclusive transaction
+    blocker = sqlite3.connect(db_filename)
+    blocker.execute('BEGIN EXCLUSIVE')
+
+    store.insert('rpl', RPL_ROW)
+    wait_for(lambda: store.get_stats()['pending'] == 0)
+    assert store.insert('rpl', RPL_ROW)
+    assert store.insert('rpl', RPL_ROW)
+    assert store.insert('rpl', RPL_ROW) is False
+
+    blocker.rollback()
+    blocker.close()
+    store.flush()
+
+    stats = store.get_stats()
+    assert stats['queued'] == stats['flushed'] == 3
+    assert stats['dropped'] == 1
+
+
+@pytest.mark.parametrize('store', [{'queue_size': 2, 'batch_size': 1}], indirect=['store'])
+def test_writer_died(store, db_filename, monkeypatch):
+    def write_batch(dbconn, batch, num_rows):
+        raise RuntimeError('writer killed')
+
+    monkeypatch.setattr(store, '_write_batch', write_batch)
+    store.insert('rpl', RPL_ROW)
+    wait_for(lambda: not store.is_alive())
+
+    # neither the producers nor flush() wait on the dead writer, under the block policy
+    start = time.time()
+    results = [store.insert('rpl', RPL_ROW) for _ in range(5)]
+    store.flush()
+    assert time.time() - start < 1
+
+    assert results == [False] * 5
+    stats = store.get_stats()
+    assert (stats['queued'], stats['flushed'], stats['dropped']) == (1, 0, 5)
+
+
+def test_invalid_arguments(db_filename):
+    with pytest.raises(ValueError):
+        EventStore(db_filename, backpressure='wait')
+
+
+def test_invalid_table(store):
+    with pytest.raises(ValueError):
+        store.insert('unknown', RPL_ROW)
+
+
+def test_parser_event(store, db_filename):
+    parser_event = ParserEvent('emulated1')
+    parser_event.event_store = store
+
+    asn = [0x10, 0x00, 0x00, 0x00, 0x00]
+    moteid = [0x00] * 6 + [0x00, 0x01]
+    addr1 = [0x00] * 6 + [0x00, 0x02]
+    addr2 = [0x00] * 6 + [0x00, 0x03]
+    parser_event.parse_input(asn + [3] + moteid + [1] + addr1 + addr2)
+    parser_event.event_store.flush()
+
+    dbconn = sqlite3.connect(db_filename)
+    rows = dbconn.execute('SELECT asn, moteid, event, addr1, addr2 FROM rpl').fetchall()
+    dbconn.close()
+
+    assert rows == [(16, '0000000000000001', 'PARENT_CHANGE', '0000000000000002', '0000000000000003')]
+
+
+def test_parser_event_options(tmpdir):
+    # the db is created in the directory of the log file of the parser
+    handler = logging.FileHandler(str(tmpdir.join('openv-events.log')))
+    logging.getLogger('ParserEvent').handlers.insert(0, handler)
+    try:
+        parser_event = ParserEvent('emulated1', {'backpressure': EventStore.DROP, 'batch_size': 7})
+    finally:
+        logging.getLogger('ParserEvent').removeHandler(handler)
+        handler.close()
+
+    store = parser_event.event_store
+    try:
+        assert store.db_filename == str(tmpdir.join('openv_events.db'))
+        assert (store.backpressure, store.batch_size, store.flush_interval) == \
+            (EventStore.DROP, 7, EventStore.FLUSH_INTERVAL)
+    finally:
+        store.close()
@@ -95,3 +95,77 @@ def test_fragment_packet(random_6lwp_fragments):
         log.debug(list(bytearray(raw(reassembled[1]))))
         log.debug(ip_pkt)
         assert ip_pkt == list(bytearray(raw(reassembled[1])))
+
+
+def _fragments(size, tag):
+    return sixlowpan_frag.Fragmentor(tag=tag).do_fragment([randint(0, 255) for _ in range(size)])
+
+
+def test_reassemble_per_source():
+    assembler = sixlowpan_frag.Fragmentor()
+    frags_a = _fragments(200, tag=7)
+    frags_b = _fragments(200, tag=7)
+
+    # same size and tag, different link-layer sources
+    for frag_a, frag_b in zip(frags_a[:-1], frags_b[:-1]):
+        assert assembler.do_reassemble(frag_a, [0xaa] * 8) is None
+        assert assembler.do_reassemble(frag_b, [0xbb] * 8) is None
+
+    assert assembler.do_reassemble(frags_a[-1], [0xaa] * 8) == list(sum([f[5:] for f in frags_a[1:]], frags_a[0][4:]))
+    assert assembler.do_reassemble(frags_b[-1], [0xbb] * 8) == list(sum([f[5:] for f in frags_b[1:]], frags_b[0][4:]))
+    assert assembler.get_stats()['completed'] == 2
+    assert assembler.get_stats()['buffered_bytes'] == 0
+
+
+def test_reassemble_duplicate_fragment():
+    assembler = sixlowpan_frag.Fragmentor()
+    frags = _fragments(200, tag=1)
+
+    assert assembler.do_reassemble(frags[0]) is None
+    assert assembler.do_reassemble(frags[0]) is None
+    assert assembler.do_reassemble(frags[1]) is None
+    assert assembler.do_reassemble(frags[2]) is not None
+
+
+def test_reassemble_timeout(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(sixlowpan_frag.time, 'time', lambda: now[0])
+
+    assembler = sixlowpan_frag.Fragmentor()
+    frags = _fragments(200, tag=1)
+    idle = _fragments(200, tag=2)
+
+    assembler.do_reassemble(idle[0])
+    assembler.do_reassemble(frags[0])
+
+    # the idle datagram is discarded when the next fragment arrives
+    now[0] += assembler.REASSEMBLY_TIMEOUT - 1
+    assembler.do_reassemble(frags[1])
+    now[0] += 2
+    assert assembler.do_reassemble(frags[2]) is None
+    assert assembler.get_stats()['expired'] == 2
+    assert assembler.get_stats()['pending'] == 1
+
+    # the fragments of the expired datagram start a new reassembly
+    assert assembler.do_reassemble(frags[0]) is None
+    assert assembler.do_reassemble(frags[1]) is not None
+
+
+def test_reassemble_memory_bound():
+    assembler = sixlowpan_frag.Fragmentor(max_buffer_bytes=500)
+    datagrams = [_fragments(200, tag=t) for t in range(3)]
+
+    assembler.do_reassemble(datagrams[0][0])
+    assembler.do_reassemble(datagrams[1][0])
+    # the first datagram becomes the most recently updated one
+    assembler.do_reassemble(datagrams[0][1])
+    assembler.do_reassemble(datagrams[2][0])
+
+    stats = assembler.get_stats()
+    assert stats['evicted'] == 1
+    assert stats['buffered_bytes'] == 400
+    assert assembler.do_reassemble(datagrams[0][2]) is not None
+
+    # datagrams larger than the buffer are dropped
+    assert assembler.do_reassemble(_fragments(600, tag=4)[0]) is None
+    assert assembler.get_stats()['dropped'] == 1
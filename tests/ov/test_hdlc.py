@@ -46,6 +46,18 @@ def random_frame(request):
 
 # ============================ helpers =========================================
 
+def legacy_hdlcify(hdlc, in_buf):
+    """ hdlcify() before the introduction of the bulk CRC, used as reference. """
+    crc = hdlc.HDLC_CRCINIT
+    for b in in_buf:
+        crc = (crc >> 8) ^ hdlc.FCS16TAB[((crc ^ (ord(b))) & 0xff)]
+    crc = 0xffff - crc
+    out_buf = in_buf + chr(crc & 0xff) + chr((crc & 0xff00) >> 8)
+    out_buf = out_buf.replace(hdlc.HDLC_ESCAPE, hdlc.HDLC_ESCAPE + hdlc.HDLC_ESCAPE_ESCAPED)
+    out_buf = out_buf.replace(hdlc.HDLC_FLAG, hdlc.HDLC_ESCAPE + hdlc.HDLC_FLAG_ESCAPED)
+    return hdlc.HDLC_FLAG + out_buf + hdlc.HDLC_FLAG
+
+
 # ============================ tests ===========================================
 
 def test_build_request_frame():
@@ -105,3 +117,72 @@ def test_randdom_back_and_forth(random_frame):
     log.debug("dehdlcified:    {0}".format(format_string_buf(frame_dehdlcified)))
 
     assert frame_dehdlcified == random_frame
+
+
+def test_byte_exact_with_legacy(random_frame):
+    random_frame = ''.join([chr(b) for b in json.loads(random_frame)])
+
+    hdlc = openhdlc.OpenHdlc()
+
+    assert hdlc.hdlcify(random_frame) == legacy_hdlcify(hdlc, random_frame)
+    assert hdlc.hdlcify(bytearray(random_frame)) == legacy_hdlcify(hdlc, random_frame)
+
+
+def test_crc16_implementations():
+    for length in range(0, 300, 7):
+        buf = ''.join(chr(random.randint(0x00, 0xff)) for _ in range(length))
+        crc = openhdlc.OpenHdlc.HDLC_CRCINIT
+        for b in buf:
+            crc = (crc >> 8) ^ openhdlc.OpenHdlc.FCS16TAB[((crc ^ (ord(b))) & 0xff)]
+
+        assert openhdlc.crc16(buf) == crc
+        assert openhdlc.crc16(bytearray(buf)) == crc
+        assert openhdlc.crc16(memoryview(buf)) == crc
+        assert openhdlc.crc16_table(buf) == crc
+
+
+def test_dehdlcify_errors():
+    hdlc = openhdlc.OpenHdlc()
+
+    with pytest.raises(openhdlc.HdlcException):
+        hdlc.dehdlcify(hdlc.HDLC_FLAG + '\x53' + hdlc.HDLC_FLAG)
+
+    frame = hdlc.hdlcify('\x53\x7e\x7d')
+    corrupted = frame[:2] + chr(ord(frame[2]) ^ 0x01) + frame[3:]
+    with pytest.raises(openhdlc.HdlcException):
+        hdlc.dehdlcify(corrupted)
+
+
+def test_feed_stream():
+    hdlc = openhdlc.OpenHdlc()
+
+    frames = []
+    stream = ''
+    for _ in range(200):
+        frame = ''.join(chr(random.randint(0x00, 0xff)) for _ in range(random.randint(1, 150)))
+        frames.append(frame)
+        # garbage between frames is dropped
+        stream += random.choice(['', '\x00', hdlc.HDLC_FLAG]) + hdlc.hdlcify(frame)
+
+    received = []
+    pos = 0
+    while pos < len(stream):
+        size = random.randint(1, 200)
+        received += hdlc.feed(stream[pos:pos + size])
+        pos += size
+
+    assert received == frames
+    assert hdlc.num_invalid_frames == 0
+
+
+def test_feed_invalid_frame_reuses_flag():
+    hdlc = openhdlc.OpenHdlc()
+    valid = hdlc.hdlcify('\x53\x01\x02')
+
+    # the closing flag of the invalid frame opens the valid one
+    assert hdlc.feed('\x7e\x13\x11' + valid) == ['\x53\x01\x02']
+    assert hdlc.num_invalid_frames == 1
+
+    # the closing flag of a valid frame does not open a new frame
+    assert hdlc.feed('\x01\x02' + valid) == ['\x53\x01\x02']
+    assert hdlc.num_invalid_frames == 1
@@ -0,0 +1,185 @@
+#!/usr/bin/env python2
+
+import logging.handlers
+import random
+from fractions import Fraction
+
+import pytest
+
+from openvisualizer.bspemulator.bspsctimer import BspSctimer
+from openvisualizer.bspemulator.bspuart import BspUart
+from openvisualizer.bspemulator.hwcrystal import HwCrystal
+from openvisualizer.simengine.simengine import SimEngine
+from openvisualizer.simengine.timeline import TimeLine
+
+# ============================ logging =================================
+
+LOGFILE_NAME = 'test_hwcrystal.log'
+
+log = logging.getLogger('test_hwcrystal')
+log.setLevel(logging.ERROR)
+log.addHandler(logging.NullHandler())
+
+log_handler = logging.handlers.RotatingFileHandler(LOGFILE_NAME, backupCount=5, mode='w')
+log_handler.setFormatter(logging.Formatter("%(asctime)s [%(name)s:%(levelname)s] %(message)s"))
+for logger_name in ['test_hwcrystal']:
+    temp = logging.getLogger(logger_name)
+    temp.setLevel(logging.DEBUG)
+    temp.addHandler(log_handler)
+
+# ============================ defines =================================
+
+HOUR = 3600 * TimeLine.NS_PER_SECOND
+COMPARE_PERIOD = 60 * HwCrystal.FREQUENCY + 7  # ticks, not a divider of the rollover
+
+
+# ============================ helpers =================================
+
+class SimulatedMote(object):
+    """
+    Stands for a mote and its firmware: every compare interrupt reads the counter, then moves the compare value
+    COMPARE_PERIOD ticks later and writes a few bytes to the UART.
+    """
+
+    def __init__(self, engine, mote_id, start_time):
+        self.id = mote_id
+        self.engine = engine
+        self.timeline = engine.timeline
+        self.timeline.current_time = start_time
+
+        self.hw_crystal = HwCrystal(self)
+        self.hw_crystal.start()
+        self.bsp_sctimer = BspSctimer(self)
+        self.bsp_sctimer.cmd_init()
+        self.bsp_sctimer.log.setLevel(logging.ERROR)
+        self.mote = self
+
+        self.compare_value = 0
+        self.compares = []  # (time, counter) of the compare interrupts
+        self.uart_reads = []  # (time, counter) at the end of the UART transmissions
+        self.rnd = random.Random(mote_id)
+
+        self._set_compare()
+
+    def get_id(self):
+        return self.id
+
+    def handle_event(self, cb):
+        cb()
+
+    def sctimer_isr(self):
+        self.compares.append((self.timeline.get_current_time(), self.bsp_sctimer.cmd_read_counter()))
+        self._set_compare()
+
+        # these bytes are done sending long before the next compare
+        uart_time = self.timeline.get_current_time() + BspUart._transmission_time(self.rnd.randrange(1, 128))
+        self.timeline.schedule_event(uart_time, self.id, self._uart_done, 'uart')
+
+    def _set_compare(self):
+        self.compare_value = (self.compare_value + COMPARE_PERIOD) % BspSctimer.ROLLOVER
+        self.bsp_sctimer.cmd_set_compare(self.compare_value)
+
+    def _uart_done(self):
+        self.uart_reads.append((self.timeline.get_current_time(), self.bsp_sctimer.cmd_read_counter()))
+
+
+def run_until(engine, end_time):
+    """ Executes the events of the timeline, as the thread of the timeline does. """
+    timeline = engine.timeline
+    while True:
+        event = timeline._pop_event()
+        if event is None or event.at_time > end_time:
+            return
+        assert isinstance(event.at_time, (int, long))
+        assert timeline.current_time <= event.at_time
+        timeline.current_time = event.at_time
+        engine.get_mote_handler_by_id(event.mote_id).handle_event(event.cb)
+
+
+def exact_tick_time(crystal, start_time, index):
+    """ Reference: the time of a tick, computed with the exact period of the crystal. """
+    drift = Fraction(int(round(crystal.drift * 1000)), 1000000000)
+    period = Fraction(TimeLine.NS_PER_SECOND, crystal.frequency) * (1 + drift)
+    return start_time + int(index * period)
+
+
+def simulate(num_motes, duration, max_drift):
+    """ Runs motes for duration ns of simulated time, returns them. """
+    engine = SimEngine()
+    motes = []
+    original = HwCrystal.MAXDRIFT
+    HwCrystal.MAXDRIFT = max_drift
+    random.seed(1)
+    try:
+        for mote_id in range(num_motes):
+            # the motes are switched on at odd times
+            motes.append(SimulatedMote(engine, mote_id, 1000003 * mote_id))
+            engine.moteHandlersById[mote_id] = motes[-1]
+        run_until(engine, duration)
+    finally:
+        HwCrystal.MAXDRIFT = original
+        engine.close()
+    return motes
+
+
+# ============================ tests ===================================
+
+@pytest.mark.parametrize('max_drift', [0, 40])
+def test_multi_hour_run(max_drift):
+    # the sctimer rolls over after 2^32 ticks, about 36.4 hours
+    duration = 40 * HOUR
+    motes = simulate(3, duration, max_drift)
+
+    for mote in motes:
+        crystal = mote.hw_crystal
+        start_time = crystal.ts_tick
+        num_compares = (duration - start_time) * crystal.frequency // TimeLine.NS_PER_SECOND // COMPARE_PERIOD
+        assert abs(len(mote.compares) - num_compares) <= 1
+
+        for (i, (at_time, counter)) in enumerate(mote.compares):
+            index = (i + 1) * COMPARE_PERIOD
+            # the compare interrupts are still on the exact ticks after 40 hours, the counter has rolled over
+            assert at_time == exact_tick_time(crystal, start_time, index)
+            assert counter == index % BspSctimer.ROLLOVER
+
+        for (at_time, counter) in mote.uart_reads:
+            # the UART transmissions end between two ticks, the counter reads the closest one
+            rollovers = sum(1 for (t, _) in mote.compares if t <= at_time) * COMPARE_PERIOD // BspSctimer.ROLLOVER
+            index = counter + rollovers * BspSctimer.ROLLOVER
+            assert abs(at_time - exact_tick_time(crystal, start_time, index)) <= 15259
+
+    if max_drift:
+        # the crystals do drift from each other
+        assert len(set(mote.hw_crystal.period_num for mote in motes)) == 3
+
+
+def test_deterministic():
+    first = simulate(2, 2 * HOUR, 40)
+    second = simulate(2, 2 * HOUR, 40)
+
+    for (mote, other) in zip(first, second):
+        assert mote.compares == other.compares
+        assert mote.uart_reads == other.uart_reads
+
+
+def test_nominal_period():
+    motes = simulate(1, 0, 0)
+    crystal = motes[0].hw_crystal
+
+    assert (crystal.period_num, crystal.period_den) == (1953125, 64)
+    assert crystal.period == 1.0 / 32768
+
+
+def test_ticks_since():
+    [mote] = simulate(1, 0, 0)
+    (crystal, timeline) = (mote.hw_crystal, mote.timeline)
+    timeline.current_time = crystal.ts_tick
+    assert crystal.get_ticks_since(crystal.ts_tick) == 0
+
+    # 10 ticks and a bit later
+    timeline.current_time = crystal.ts_tick + 305180
+    assert crystal.get_time_last_tick() == crystal.ts_tick + 305175
+    assert crystal.get_ticks_since(crystal.ts_tick) == 10
+    assert crystal.get_ticks_since(crystal.ts_tick + 1) == 9
+    assert crystal.get_ticks_since(crystal.ts_tick + 305176) == 0
+    assert crystal.get_time_in(2) == crystal.ts_tick + 366210
@@ -0,0 +1,305 @@
+#!/usr/bin/env python2
+
+import binascii
+import json
+import logging.handlers
+import os
+import threading
+import time
+import xmlrpclib
+
+import cbor
+import pytest
+from coap import coapDefines as Defs, coapMessage, coapObjectSecurity as Oscoap, coapOption, coapResource, \
+    coapUtils as Utils
+
+from openvisualizer.eventbus.eventbusclient import EventBusClient
+from openvisualizer.jrc.cojp_defines import CoJPLabel
+from openvisualizer.jrc.jrc import JRC, ContextHandler, CoapServer, OscoreContext
+from openvisualizer.main import OpenVisualizerServer
+from openvisualizer.utils import format_ipv6_addr
+
+# ============================ logging =================================
+
+LOGFILE_NAME = 'test_jrc.log'
+
+log = logging.getLogger('test_jrc')
+log.setLevel(logging.ERROR)
+log.addHandler(logging.NullHandler())
+
+log_handler = logging.handlers.RotatingFileHandler(LOGFILE_NAME, backupCount=5, mode='w')
+log_handler.setFormatter(logging.Formatter("%(asctime)s [%(name)s:%(levelname)s] %(message)s"))
+for logger_name in ['test_jrc', 'JRC']:
+    temp = logging.getLogger(logger_name)
+    temp.setLevel(logging.DEBUG)
+    temp.addHandler(log_handler)
+
+# ============================ defines =================================
+
+PREFIX = [0xbb, 0xbb, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00]
+DAGROOT_HOST = [0x14, 0x15, 0x92, 0x00, 0x00, 0x00, 0x00, 0x01]
+
+
+# ============================ helpers =================================
+
+class Pledge(object):
+    """ Builds the join requests of a mote and decrypts the join responses. """
+
+    def __init__(self, index):
+        self.eui64 = [0x14, 0x15, 0x92, 0x00, 0x00, 0x01, index >> 8, index & 0xff]
+        self.address = CoapServer.LINK_LOCAL_PREFIX + self.eui64
+        self.context = OscoreContext(ContextHandler.security_context_dict(
+            binascii.hexlify(Utils.buf2str(self.eui64)),
+            ContextHandler.master_salt,
+            ContextHandler.master_secret,
+            binascii.hexlify(''),
+            binascii.hexlify('JRC'),
+        ))
+        self.message_id = 0
+        self.request_seq = None
+
+    def join_request(self, protected=True, path='j'):
+        self.message_id += 1
+        options = [coapOption.UriPath(path=path)]
+        if protected:
+            options += [coapOption.ObjectSecurity(context=self.context)]
+        (context, self.request_seq) = Oscoap.getRequestSecurityParams(Oscoap.objectSecurityOptionLookUp(options))
+        return coapMessage.buildMessage(msgtype=Defs.TYPE_CON, token=self.message_id, code=Defs.METHOD_POST,
+                                        messageId=self.message_id, options=options, securityContext=context,
+                                        partialIV=self.request_seq)
+
+    def parse_join_response(self, ip):
+        """ Returns the configuration in the join response. """
+        message = coapMessage.parseMessage(ip[48:])
+        (code, _, payload) = Oscoap.unprotectMessage(self.context, version=message['version'],
+                                                     code=message['code'], options=message['options'],
+                                                     ciphertext=message['ciphertext'], partialIV=self.request_seq)
+        assert code == Defs.COAP_RC_2_04_CHANGED
+        return cbor.loads(Utils.buf2str(payload))
+
+
+class ChangedResource(coapResource.coapResource):
+    """ Resource answering 2.04 (Changed), without OSCORE. """
+
+    def __init__(self):
+        coapResource.coapResource.__init__(self, path='x')
+
+    def POST(self, options=[], payload=[]):  # noqa: N802
+        return Defs.COAP_RC_2_04_CHANGED, [], []
+
+
+class Mesh(EventBusClient):
+    """ Forwards the requests of the pledges to the JRC and collects the packets towards the mesh. """
+
+    def __init__(self):
+        self.packets = []
+        super(Mesh, self).__init__(
+            name='mesh',
+            registrations=[
+                {
+                    'sender': self.WILDCARD,
+                    'signal': 'v6ToMesh',
+                    'callback': self._v6_to_mesh_notif,
+                },
+            ],
+        )
+
+    def close(self):
+        for r in self.registrations:
+            self.unregister(sender=r['sender'], signal=r['signal'], callback=r['callback'])
+
+    def send(self, pledge, message):
+        signal = (tuple(CoapServer.LINK_LOCAL_PREFIX + DAGROOT_HOST), self.PROTO_UDP, Defs.DEFAULT_UDP_PORT)
+        return self._dispatch_protocol(signal, (pledge.address, message))
+
+    def packets_to(self, pledge):
+        return [ip for ip in self.packets if ip[24:40] == pledge.address]
+
+    def _v6_to_mesh_notif(self, sender, signal, data):
+        self.packets.append(data)
+
+
+# ============================ fixtures ================================
+
+@pytest.fixture
+def mesh():
+    mesh = Mesh()
+    try:
+        yield mesh
+    finally:
+        mesh.close()
+
+
+@pytest.fixture
+def jrc(mesh):
+    jrc = JRC(context_dir=None)
+    mesh.dispatch('registerDagRoot', {'prefix': PREFIX, 'host': DAGROOT_HOST})
+    try:
+        yield jrc
+    finally:
+        jrc.close()
+
+
+# ============================ tests ===================================
+
+def test_join(jrc, mesh):
+    pledge = Pledge(1)
+
+    assert mesh.send(pledge, pledge.join_request())
+
+    [ip] = mesh.packets_to(pledge)
+    assert ip[8:24] == CoapServer.LINK_LOCAL_PREFIX + DAGROOT_HOST
+    configuration = pledge.parse_join_response(ip)
+    assert configuration[CoJPLabel.COJP_PARAMETERS_LABELS_LLKEYSET][1] == \
+        Utils.buf2str(jrc.coap_server.coap_resource.networkKey)
+
+    stats = jrc.get_stats()
+    assert (stats['numRequests'], stats['numResponses'], stats['numJoins'], stats['numJoinedNodes']) == (1, 1, 1, 1)
+    assert stats['joinsPerSecond'] == 1 / CoapServer.RATE_WINDOW
+    assert 0 < stats['latencyMean'] <= stats['latencyMax']
+
+
+def test_rejoin_reuses_endpoint_and_context(jrc, mesh):
+    pledge = Pledge(1)
+
+    mesh.send(pledge, pledge.join_request())
+    context = jrc.coap_server.coap_resource.joined_nodes[Utils.buf2str(pledge.eui64)]
+    mesh.send(pledge, pledge.join_request())
+
+    assert len(mesh.packets_to(pledge)) == 2
+    pledge.parse_join_response(mesh.packets_to(pledge)[-1])
+    assert jrc.coap_server.coap_resource.joined_nodes.values() == [context]
+    assert context.securityContext['replayWindow'] == [0, 1, 2]
+
+    stats = jrc.get_stats()
+    assert (stats['numJoins'], stats['numJoinedNodes'], stats['numEndpoints']) == (2, 1, 1)
+
+
+def test_unprotected_request(jrc, mesh):
+    pledge = Pledge(1)
+
+    mesh.send(pledge, pledge.join_request(protected=False))
+
+    [ip] = mesh.packets_to(pledge)
+    assert coapMessage.parseMessage(ip[48:])['code'] == Defs.COAP_RC_4_01_UNAUTHORIZED
+    stats = jrc.get_stats()
+    assert (stats['numResponses'], stats['numJoins'], stats['numJoinedNodes']) == (1, 0, 0)
+
+
+def test_other_resource(jrc, mesh):
+    jrc.coap_server.coap_server.addResource(ChangedResource())
+    pledge = Pledge(1)
+
+    mesh.send(pledge, pledge.join_request(protected=False, path='x'))
+
+    [ip] = mesh.packets_to(pledge)
+    assert coapMessage.parseMessage(ip[48:])['code'] == Defs.COAP_RC_2_04_CHANGED
+    # only the responses of the join resource are joins
+    stats = jrc.get_stats()
+    assert (stats['numRequests'], stats['numResponses'], stats['numJoins']) == (1, 1, 0)
+
+
+def test_join_storm(jrc, mesh):
+    pledges = [Pledge(i) for i in range(40)]
+
+    def join(pledges):
+        for pledge in pledges:
+            mesh.send(pledge, pledge.join_request())
+
+    threads = [threading.Thread(target=join, args=(pledges[i::4],)) for i in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    # every response is routed to the pledge which sent the request
+    for pledge in pledges:
+        [ip] = mesh.packets_to(pledge)
+        pledge.parse_join_response(ip)
+    stats = jrc.get_stats()
+    assert (stats['numJoins'], stats['numJoinedNodes'], stats['numEndpoints']) == (40, 40, 40)
+
+
+def test_endpoints_evicted(jrc, mesh, monkeypatch):
+    monkeypatch.setattr(CoapServer, 'MAX_ENDPOINTS', 2)
+    pledges = [Pledge(i) for i in range(3)]
+
+    for pledge in pledges + pledges[:1]:
+        mesh.send(pledge, pledge.join_request())
+
+    # the least recently used endpoints were closed
+    assert jrc.coap_server.coap_clients.keys() == [format_ipv6_addr(p.address) for p in [pledges[2], pledges[0]]]
+    assert jrc.get_stats()['numJoins'] == 4
+    assert [len(mesh.packets_to(p)) for p in pledges] == [2, 1, 1]
+
+
+def test_contexts_persisted(mesh, tmpdir):
+    jrc = JRC(context_dir=str(tmpdir))
+    mesh.dispatch('registerDagRoot', {'prefix': PREFIX, 'host': DAGROOT_HOST})
+    pledge = Pledge(1)
+
+    try:
+        mesh.send(pledge, pledge.join_request())
+        jrc.context_handler.persister.flush()
+    finally:
+        jrc.close()
+
+    eui64 = Utils.buf2str(pledge.eui64)
+    file_path = os.path.join(str(tmpdir), 'oscore_context_{0}.json'.format(binascii.hexlify(eui64)))
+    with open(file_path) as f:
+        context = json.load(f)
+    assert context['idContext'] == binascii.hexlify(eui64)
+    assert context['replayWindow'] == [0, 1]
+    assert context['sequenceNumber'] == 0
+
+
+def test_context_derivation(tmpdir):
+    security_context = ContextHandler.security_context_dict(
+        binascii.hexlify('\x14\x15\x92\x00\x00\x01\x00\x01'),
+        binascii.hexlify('salt'),
+        ContextHandler.master_secret,
+        binascii.hexlify('JRC'),
+        binascii.hexlify('\x01'),
+    )
+    file_path = str(tmpdir.join('context.json'))
+    with open(file_path, 'w') as f:
+        json.dump(security_context, f)
+
+    # the context built from the dict derives the same parameters as the one loaded from a file
+    context = OscoreContext(security_context)
+    expected = Oscoap.SecurityContext(file_path)
+    for attr in ['idContext', 'masterSalt', 'senderID', 'recipientID', 'commonIV', 'senderKey', 'recipientKey']:
+        assert getattr(context, attr) == getattr(expected, attr)
+
+
+def test_rpc_stats(jrc, mesh):
+    server = OpenVisualizerServer.__new__(OpenVisualizerServer)
+    server.jrc = jrc
+    pledge = Pledge(1)
+
+    mesh.send(pledge, pledge.join_request())
+
+    stats = server.get_jrc_stats()
+    assert (stats['numRequests'], stats['numJoins'], stats['numJoinedNodes']) == (1, 1, 1)
+    # the statistics can be marshalled by the RPC server
+    assert xmlrpclib.loads(xmlrpclib.dumps((stats,)))[0][0] == stats
+
+
+def test_overlapping_requests(jrc, mesh, monkeypatch):
+    responses = []
+    monkeypatch.setattr(jrc.coap_server, '_receive_from_coap', lambda *args: responses.append(args))
+    pledge = Pledge(1)
+
+    # the second request of the pledge arrives before the response to the first one
+    mesh.send(pledge, pledge.join_request())
+    time.sleep(0.05)
+    mesh.send(pledge, pledge.join_request())
+    monkeypatch.undo()
+    for args in responses:
+        jrc.coap_server._receive_from_coap(*args)
+
+    stats = jrc.get_stats()
+    assert stats['numResponses'] == 2
+    # the latency of the first request is counted from its own arrival
+    assert stats['latencyMax'] >= 0.05
+    assert not jrc.coap_server.request_times
@@ -0,0 +1,188 @@
+#!/usr/bin/env python2
+
+import json
+import logging.handlers
+import struct
+
+import pytest
+
+from openvisualizer.motehandler.moteconnector.openparser.kpi import KpiAggregator, MoteKpi
+from openvisualizer.motehandler.moteconnector.openparser.openparser import OpenParser
+from openvisualizer.motehandler.moteconnector.openparser.parserdata import ParserData
+
+# ============================ logging =================================
+
+LOGFILE_NAME = 'test_kpi.log'
+
+log = logging.getLogger('test_kpi')
+log.setLevel(logging.ERROR)
+log.addHandler(logging.NullHandler())
+
+log_handler = logging.handlers.RotatingFileHandler(LOGFILE_NAME, backupCount=5, mode='w')
+log_handler.setFormatter(logging.Formatter("%(asctime)s [%(name)s:%(levelname)s] %(message)s"))
+for logger_name in ['test_kpi', 'Kpi', 'ParserData']:
+    temp = logging.getLogger(logger_name)
+    temp.setLevel(logging.DEBUG)
+    temp.addHandler(log_handler)
+
+
+# ============================ helpers =================================
+
+def legacy_kpis(samples):
+    """ Reference: the KPIs recomputed from all the samples of a mote, as ParserData.publish_kpi() used to. """
+    counters = sorted(s[0] for s in samples)
+    return {
+        'avg_cellsUsage': sum(s[2] for s in samples) / float(len(samples)) / 64,
+        'avg_latency': sum(s[1] for s in samples) / float(len(samples)),
+        'avg_pdr': len(set(counters)) / float(1 + counters[-1] - counters[0]),
+        'numSamples': len(samples),
+    }
+
+
+def uinject_frame(src_id, counter, latency, cells_tx):
+    """ Data frame of a uinject packet, as received by the DAG root, for counters below 256. """
+    # the counter is read from the last bytes of the ASN of the packet, the received ASN gets them too
+    asn = [100, 0, 0, counter, 0]
+    header = [0, 0] + [100 + latency, 0, 0, counter, 0] + [0] * 16
+    payload = [0] * 20
+    payload += list(bytearray(struct.pack('<II', 100, 10)))  # ticks in total, ticks on
+    payload += [src_id & 0xff, src_id >> 8, 0, cells_tx] + asn + [0, 0]
+    payload += [ord(c) for c in ParserData.UINJECT_MASK]
+    return header + payload
+
+
+class MqttClient(object):
+    def __init__(self):
+        self.published = []
+
+    def publish(self, topic, payload, qos):
+        self.published.append((topic, json.loads(payload), qos))
+
+
+# ============================ fixtures ================================
+
+@pytest.fixture
+def parser_data():
+    parser_data = ParserData(None, 'emulated1')
+    parser_data.mqtt_client = MqttClient()
+    return parser_data
+
+
+# ============================ tests ===================================
+
+def test_same_as_legacy():
+    mote = MoteKpi()
+    samples = [(c, c % 7, c % 3) for c in [3, 4, 4, 6, 9, 8, 10, 15]]
+    for (i, sample) in enumerate(samples):
+        mote.add_sample(*(sample + (i,)))
+        assert mote.get_kpis() == pytest.approx(legacy_kpis(samples[:i + 1]))
+
+
+def test_count_window():
+    mote = MoteKpi(window_size=4)
+    samples = [(c, c, 1) for c in range(10) if c != 7]
+    for (i, sample) in enumerate(samples):
+        mote.add_sample(*(sample + (i,)))
+        assert len(mote) == min(i + 1, 4)
+        assert mote.get_kpis() == pytest.approx(legacy_kpis(samples[max(0, i - 3):i + 1]))
+
+
+def test_time_window():
+    mote = MoteKpi(window_duration=10)
+    for c in range(5):
+        mote.add_sample(c, 10 * c, 0, c * 5)
+    # samples at 10, 15 and 20 seconds
+    assert mote.get_kpis()['avg_latency'] == 30
+
+    # the last sample is kept, whatever its age
+    mote.expire(100)
+    assert mote.get_kpis() == {'avg_cellsUsage': 0.0, 'avg_latency': 40.0, 'avg_pdr': 1.0, 'numSamples': 1}
+
+
+def test_counter_wraparound():
+    mote = MoteKpi()
+    for (i, counter) in enumerate([0xfffd, 0xfffe, 0x0000, 0xffff, 0x0001, 0x0003]):
+        mote.add_sample(counter, 0, 0, i)
+
+    # 7 packets sent, one lost, not 6 out of 65536
+    assert mote.get_kpis()['avg_pdr'] == pytest.approx(6 / 7.0)
+
+
+def test_duplicates_leave_window():
+    mote = MoteKpi(window_size=3)
+    for (i, counter) in enumerate([1, 1, 2, 3, 5]):
+        mote.add_sample(counter, 0, 0, i)
+    # window holds 2, 3 and 5
+    assert mote.get_kpis()['avg_pdr'] == pytest.approx(3 / 4.0)
+    assert mote.seq_counts == {2: 1, 3: 1, 5: 1}
+
+
+def test_pop_updates():
+    kpi = KpiAggregator()
+    assert kpi.pop_updates() == (None, {})
+
+    kpi.add_sample('0002', 1, 10, 64)
+    kpi.add_sample('0003', 1, 20, 0)
+    kpi.add_sample('0002', 3, 10, 64)
+
+    (network, motes) = kpi.pop_updates()
+    assert motes.keys() == ['0003', '0002']
+    assert motes['0002'] == {'avg_cellsUsage': 1.0, 'avg_latency': 10.0, 'avg_pdr': 2 / 3.0, 'numSamples': 2}
+    assert network == pytest.approx({'avg_cellsUsage': 0.5, 'avg_latency': 15.0, 'avg_pdr': 5 / 6.0})
+    assert kpi.pop_updates() == (None, {})
+
+    # the network KPIs include the motes not updated
+    kpi.add_sample('0003', 2, 20, 0)
+    (network, motes) = kpi.pop_updates()
+    assert motes.keys() == ['0003']
+    assert network['avg_cellsUsage'] == 0.5
+
+    assert kpi.get_stats() == {'numSamples': 4, 'numPublished': 2, 'numMotes': 2, 'numWindowSamples': 4}
+
+
+def test_batched_publication(parser_data):
+    for counter in range(5):
+        for src_id in [2, 3]:
+            parser_data.parse_input(uinject_frame(src_id, counter, 5, 32))
+
+    # nothing published per packet
+    assert parser_data.mqtt_client.published == []
+
+    # one message for all the packets, none when no packet was received since
+    parser_data.publish_kpi()
+    parser_data.publish_kpi()
+    [(topic, payload, qos)] = parser_data.mqtt_client.published
+
+    assert topic == ParserData.KPI_TOPIC
+    assert qos == ParserData.KPI_QOS
+    assert payload['token'] == 123
+    assert payload['src_id'] == '0003'
+    assert sorted(payload['motes'].keys()) == ['0002', '0003']
+    assert payload['motes']['0002']['numSamples'] == 5
+    assert payload['avg_latency'] == 5.0
+    assert payload['avg_cellsUsage'] == 0.5
+    assert payload['avg_pdr'] == 1.0
+
+
+def test_parser_data_window():
+    parser_data = ParserData(None, 'emulated1', kpi_window_size=3)
+    parser_data.mqtt_client = MqttClient()
+    assert (parser_data.kpi.window_size, parser_data.kpi.window_duration) == (3, ParserData.KPI_WINDOW_DURATION)
+
+    for counter in range(5):
+        parser_data.parse_input(uinject_frame(2, counter, 5, 32))
+    parser_data.publish_kpi()
+    [(_, payload, _)] = parser_data.mqtt_client.published
+
+    assert payload['motes']['0002']['numSamples'] == 3
+
+
+def test_open_parser_window():
+    stack_defines = {'components': {}, 'log_descriptions': {}, 'sixtop_returncodes': {}, 'sixtop_states': {}}
+    open_parser = OpenParser(None, stack_defines, 'emulated1',
+                             kpi_options={'kpi_window_size': 3, 'kpi_window_duration': 60.0})
+    try:
+        kpi = open_parser.parser_data.kpi
+        assert (kpi.window_size, kpi.window_duration) == (3, 60.0)
+    finally:
+        open_parser.parser_event.close()
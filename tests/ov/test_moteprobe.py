@@ -1,12 +1,14 @@
 #!/usr/bin/env python2
 
 import logging.handlers
+import random
 import time
 
 import mock
 import pytest
 
 from openvisualizer.motehandler.moteprobe.mockmoteprobe import MockMoteProbe
+from openvisualizer.motehandler.moteprobe.openhdlc import OpenHdlc
 
 # ============================ logging =================================
 
@@ -107,6 +109,21 @@ INVALID_FRAME_1 = [
 ]
 
 
+# ============================ helpers =================================
+
+def xonxoff_escape(buf):
+    """ Escapes the XON/XOFF bytes as the mote does, and sprinkles flow control bytes in the stream. """
+    out = []
+    for c in buf:
+        if ord(c) in [XOFF, XON, XONXOFF_ESC]:
+            out += [chr(XONXOFF_ESC), chr(ord(c) ^ XONXOFF_MASK)]
+        else:
+            out += [c]
+        if random.random() < 0.05:
+            out += [chr(random.choice([XON, XOFF]))]
+    return ''.join(out)
+
+
 # ============================ fixtures ================================
 
 @pytest.fixture
@@ -122,8 +139,7 @@ def probe_stopped(request):
     # Stop the thread
     my_mock.close()
     my_mock.join()
-    # Reset Buffer
-    my_mock.rx_buf = ''
+    # Reset the escaping state
     my_mock.xonxoff_escaping = False
     yield my_mock
 
@@ -173,36 +189,23 @@ def test_moteprobe_init(prob_running):
 
 
 @pytest.mark.parametrize('probe_stopped', [('mock')], indirect=["probe_stopped"])
-def test_moteprobe__rx_buf_add(probe_stopped):
-    assert probe_stopped.rx_buf == ''
-    for c in FRAME_IN_1:
-        probe_stopped._rx_buf_add(chr(c))
-    assert probe_stopped.rx_buf == ''.join(chr(c) for c in FRAME_OUT_1)
-
-    probe_stopped.rx_buf = ''
-    assert probe_stopped.rx_buf == ''
-    for c in FRAME_IN_2:
-        probe_stopped._rx_buf_add(chr(c))
-    assert probe_stopped.rx_buf == ''.join(chr(c) for c in FRAME_OUT_2)
-
-    probe_stopped.rx_buf = ''
-    assert probe_stopped.rx_buf == ''
-    for c in FRAME_IN_3:
-        probe_stopped._rx_buf_add(chr(c))
-    assert probe_stopped.rx_buf == ''.join(chr(c) for c in FRAME_OUT_3)
+def test_moteprobe__xonxoff_unescape(probe_stopped):
+    for (frame_in, frame_out) in [(FRAME_IN_1, FRAME_OUT_1), (FRAME_IN_2, FRAME_OUT_2), (FRAME_IN_3, FRAME_OUT_3)]:
+        probe_stopped.xonxoff_escaping = False
+        assert probe_stopped._xonxoff_unescape(''.join(chr(c) for c in frame_in)) == ''.join(chr(c) for c in frame_out)
 
 
 @pytest.mark.parametrize('probe_stopped', [('mock')], indirect=["probe_stopped"])
-def test_moteprobe__handle_frame(probe_stopped):
-    probe_stopped.rx_buf = ''.join(chr(c) for c in VALID_FRAME_1)
-    valid = probe_stopped._handle_frame()
-    assert valid is True
+def test_moteprobe__parse_bytes_crc(probe_stopped):
+    received = []
+    probe_stopped.send_to_parser = received.append
+
+    probe_stopped._parse_bytes(''.join(chr(c) for c in VALID_FRAME_1))
+    assert len(received) == 1
 
-    probe_stopped.rx_buf = ''
-    assert probe_stopped.rx_buf == ''
-    probe_stopped.rx_buf = ''.join(chr(c) for c in INVALID_FRAME_1)
-    valid = probe_stopped._handle_frame()
-    assert valid is False
+    # a frame with a wrong CRC is dropped
+    probe_stopped._parse_bytes(''.join(chr(c) for c in INVALID_FRAME_1))
+    assert len(received) == 1
 
 
 @pytest.mark.parametrize('probe_stopped', [('mock')], indirect=["probe_stopped"])
@@ -216,6 +219,46 @@ def test_moteprobe__parse_bytes(probe_stopped):
     assert probe_stopped.send_to_parser_data == FRAME_OUT_5
 
 
+@pytest.mark.parametrize('probe_stopped', [('mock')], indirect=["probe_stopped"])
+def test_moteprobe__parse_bytes_chunks(probe_stopped):
+    received = []
+    probe_stopped.send_to_parser = received.append
+
+    # escaped XON/XOFF bytes, split in the middle of escape sequences
+    for i in range(len(FRAME_IN_3)):
+        out = probe_stopped._xonxoff_unescape(''.join(chr(c) for c in FRAME_IN_3[:i]))
+        out += probe_stopped._xonxoff_unescape(''.join(chr(c) for c in FRAME_IN_3[i:]))
+        assert out == ''.join(chr(c) for c in FRAME_OUT_3)
+
+    # garbage followed by a valid frame, delivered in a single read
+    received[:] = []
+    probe_stopped._parse_bytes(''.join(chr(c) for c in [0x01, 0x02] + FRAME_IN_5))
+    assert received == [FRAME_OUT_5]
+
+
+@pytest.mark.parametrize('probe_stopped', [('mock')], indirect=["probe_stopped"])
+def test_moteprobe__parse_bytes_random_stream(probe_stopped):
+    received = []
+    probe_stopped.send_to_parser = received.append
+    hdlc = OpenHdlc()
+
+    frames = []
+    stream = ''
+    for _ in range(200):
+        frame = [random.randint(0x00, 0xff) for _ in range(random.randint(1, 120))]
+        frames.append(frame)
+        stream += xonxoff_escape(hdlc.hdlcify(''.join(chr(b) for b in frame)))
+
+    # replay the stream with random read sizes
+    pos = 0
+    while pos < len(stream):
+        size = random.randint(1, 300)
+        probe_stopped._parse_bytes(stream[pos:pos + size])
+        pos += size
+
+    assert received == frames
+
+
 @mock.patch("{}.MockMoteProbe._attach".format(MODULE_PATH))
 def test_moteprobe__attach_error(m_attach, caplog):
     try:
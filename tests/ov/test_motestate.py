@@ -0,0 +1,217 @@
+#!/usr/bin/env python2
+
+import collections
+import json
+import logging.handlers
+import threading
+import time
+from SimpleXMLRPCServer import SimpleXMLRPCServer
+from SocketServer import ThreadingMixIn
+
+import pytest
+
+from openvisualizer.client.statestream import MoteStateStream
+from openvisualizer.motehandler.moteconnector.openparser.parserstatus import ParserStatus
+from openvisualizer.motehandler.motestate.motestate import MoteState
+
+# ============================ logging =================================
+
+LOGFILE_NAME = 'test_motestate.log'
+
+log = logging.getLogger('test_motestate')
+log.setLevel(logging.ERROR)
+log.addHandler(logging.NullHandler())
+
+log_handler = logging.handlers.RotatingFileHandler(LOGFILE_NAME, backupCount=5, mode='w')
+log_handler.setFormatter(logging.Formatter("%(asctime)s [%(name)s:%(levelname)s] %(message)s"))
+for logger_name in ['test_motestate', 'MoteState']:
+    temp = logging.getLogger(logger_name)
+    temp.setLevel(logging.DEBUG)
+    temp.addHandler(log_handler)
+
+
+# ============================ helpers =================================
+
+class MoteConnector(object):
+    def __init__(self, serialport):
+        self.serialport = serialport
+
+
+class RpcServer(ThreadingMixIn, SimpleXMLRPCServer):
+    daemon_threads = True
+
+
+def notify(mote_state, name, *fields):
+    mote_state._received_status_notif(mote_state.parser_status.named_tuple[name](*fields))
+
+
+def notify_row(mote_state, row, num_rx):
+    named_tuple = mote_state.parser_status.named_tuple[MoteState.ST_SCHEDULEROW]
+    fields = dict((f, 0) for f in named_tuple._fields)
+    fields.update(row=row, slotOffset=row, numRx=num_rx)
+    mote_state._received_status_notif(named_tuple(**fields))
+
+
+# ============================ fixtures ================================
+
+@pytest.fixture
+def mote_state():
+    return MoteState(MoteConnector('emulated1'))
+
+
+@pytest.fixture
+def rpc_server(mote_state):
+    def wait_mote_state(mote_id, since=None):
+        (version, states) = mote_state.wait_changes(since, 1)
+        return {'version': version, 'states': states}
+
+    server = RpcServer(('localhost', 0), allow_none=True, logRequests=False)
+    server.register_function(wait_mote_state)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+
+    yield server.server_address
+
+    server.shutdown()
+    server.server_close()
+
+
+# ============================ tests ===================================
+
+def test_changes_since(mote_state):
+    (version, changes) = mote_state.get_changes()
+    assert version == 0
+    assert sorted(changes.keys()) == sorted(MoteState.ST_ALL)
+
+    notify(mote_state, MoteState.ST_ISSYNC, 1)
+    (version, changes) = mote_state.get_changes(0)
+    assert version == 1
+    assert changes == {MoteState.ST_ISSYNC: '[{"isSync": 1}]'}
+
+    notify(mote_state, MoteState.ST_KAPERIOD, 30)
+    assert mote_state.get_changes(1) == (2, {MoteState.ST_KAPERIOD: '[{"kaPeriod": 30}]'})
+    assert sorted(mote_state.get_changes(0)[1].keys()) == sorted([MoteState.ST_ISSYNC, MoteState.ST_KAPERIOD])
+    assert mote_state.get_changes(2) == (2, {})
+
+
+def test_unknown_version_gets_all(mote_state):
+    notify(mote_state, MoteState.ST_ISSYNC, 1)
+
+    # a version from a previous run of the server
+    (version, changes) = mote_state.get_changes(100)
+    assert version == 1
+    assert sorted(changes.keys()) == sorted(MoteState.ST_ALL)
+
+
+def test_versions_per_mote(mote_state):
+    other = MoteState(MoteConnector('emulated2'))
+
+    notify(mote_state, MoteState.ST_ISSYNC, 1)
+    notify(mote_state, MoteState.ST_ISSYNC, 0)
+    notify(other, MoteState.ST_ISSYNC, 1)
+
+    assert mote_state.get_changes(0)[0] == 2
+    assert other.get_changes(0)[0] == 1
+
+
+def test_wait_changes_timeout(mote_state):
+    start = time.time()
+    assert mote_state.wait_changes(0, 0.1) == (0, {})
+    assert time.time() - start >= 0.1
+
+    # without a version, returns at once
+    start = time.time()
+    assert len(mote_state.wait_changes(None, 5)[1]) == len(MoteState.ST_ALL)
+    assert time.time() - start < 1
+
+
+def test_wait_changes_wakes_up(mote_state):
+    timer = threading.Timer(0.05, notify, [mote_state, MoteState.ST_ISSYNC, 1])
+    timer.start()
+
+    start = time.time()
+    (version, changes) = mote_state.wait_changes(0, 5)
+    timer.join()
+
+    assert time.time() - start < 1
+    assert version == 1
+    assert changes.keys() == [MoteState.ST_ISSYNC]
+
+
+def test_state_stream(mote_state, rpc_server):
+    stream = MoteStateStream(rpc_server, '0001')
+    stream.start()
+
+    try:
+        (version, changes) = stream.wait(None, 5)
+        assert sorted(changes.keys()) == sorted(MoteState.ST_ALL)
+
+        notify(mote_state, MoteState.ST_ISSYNC, 1)
+        (version, changes) = stream.wait(version, 5)
+        assert changes == {MoteState.ST_ISSYNC: '[{"isSync": 1}]'}
+
+        event = stream.format_event(version, changes)
+        assert event.startswith('id: {0}:{1}\nevent: state\ndata: '.format(stream.stream_id, version))
+        assert event.endswith('\n\n')
+        assert stream.parse_event_id('{0}:{1}'.format(stream.stream_id, version)) == version
+        assert stream.parse_event_id('0:{0}'.format(version)) is None
+        assert stream.parse_event_id(None) is None
+
+        # nothing changed
+        assert stream.wait(version, 0.1) == (version, {})
+    finally:
+        stream.close()
+        stream.join()
+
+
+def test_json_cache(mote_state):
+    for row in range(3):
+        notify_row(mote_state, row, row)
+    schedule = mote_state.get_state_elem(MoteState.ST_SCHEDULE)
+
+    dump = schedule.to_json('data')
+    assert schedule.to_json('data') is dump
+    assert [r['numRx'] for r in json.loads(dump)] == [0, 1, 2]
+
+    # only the updated row is converted again
+    rows = [r._to_dict() for r in schedule.data]
+    notify_row(mote_state, 1, 10)
+    assert schedule.data[0]._to_dict() is rows[0]
+    assert schedule.data[1]._to_dict() is not rows[1]
+    assert [r['numRx'] for r in json.loads(schedule.to_json('data'))] == [0, 10, 2]
+    assert json.loads(schedule.to_json('all'))['meta'][0]['numUpdates'] == 4
+
+
+def test_routing(mote_state):
+    # the named tuples of the parser of the mote connector are other classes
+    other_parser = ParserStatus()
+    for name in [MoteState.ST_SCHEDULEROW, MoteState.ST_NEIGHBORSROW, MoteState.ST_QUEUEROW]:
+        named_tuple = other_parser.named_tuple[name]
+        assert named_tuple is not mote_state.parser_status.named_tuple[name]
+        mote_state._received_status_notif(named_tuple(**dict((f, 0) for f in named_tuple._fields)))
+
+    for name in [MoteState.ST_SCHEDULE, MoteState.ST_NEIGHBORS, MoteState.ST_QUEUE]:
+        assert mote_state.get_state_elem(name).meta[0]['numUpdates'] == 1
+
+    with pytest.raises(SystemError):
+        mote_state._received_status_notif(collections.namedtuple('Tuple_Unknown', ['unknown'])(0))
+
+
+def test_update_rate(mote_state):
+    is_sync = mote_state.get_state_elem(MoteState.ST_ISSYNC)
+    assert is_sync.meta[0]['updateRate'] == 0
+
+    for _ in range(4):
+        notify(mote_state, MoteState.ST_ISSYNC, 1)
+    assert is_sync.meta[0]['updateRate'] == 4.0 / is_sync.RATE_WINDOW
+    assert json.loads(is_sync.to_json('meta'))[0]['updateRate'] == 4.0 / is_sync.RATE_WINDOW
+
+    # the updates stop, the rate decays as they leave the window, without any update
+    is_sync.update_times[0] -= is_sync.RATE_WINDOW
+    assert json.loads(is_sync.to_json('meta'))[0]['updateRate'] == 3.0 / is_sync.RATE_WINDOW
+
+    for i in range(len(is_sync.update_times)):
+        is_sync.update_times[i] -= is_sync.RATE_WINDOW
+    assert json.loads(is_sync.to_json('meta'))[0]['updateRate'] == 0.0
+    assert len(is_sync.update_times) == 0
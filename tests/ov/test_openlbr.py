@@ -0,0 +1,336 @@
+#!/usr/bin/env python2
+
+import logging.handlers
+import os
+import random
+import socket
+import threading
+import time
+
+import pytest
+from pydispatch import dispatcher
+
+from openvisualizer.eventbus.eventbusclient import EventBusClient
+from openvisualizer.motehandler.moteconnector.moteconnector import MoteConnector
+from openvisualizer.motehandler.moteconnector.openparser.openparser import OpenParser
+from openvisualizer.motehandler.moteprobe.openhdlc import OpenHdlc
+from openvisualizer.openlbr.ipv6packet import Ipv6Packet
+from openvisualizer.openlbr.openlbr import OpenLbr
+from openvisualizer.openlbr.sixlowpan_frag import Fragmentor
+from openvisualizer.opentun.opentunlinux import OpenTunLinux, TunReadThread
+
+# ============================ logging =================================
+
+LOGFILE_NAME = 'test_openlbr.log'
+
+log = logging.getLogger('test_openlbr')
+log.setLevel(logging.ERROR)
+log.addHandler(logging.NullHandler())
+
+log_handler = logging.handlers.RotatingFileHandler(LOGFILE_NAME, backupCount=5, mode='w')
+log_handler.setFormatter(logging.Formatter("%(asctime)s [%(name)s:%(levelname)s] %(message)s"))
+for logger_name in ['test_openlbr', 'OpenLbr']:
+    temp = logging.getLogger(logger_name)
+    temp.setLevel(logging.DEBUG)
+    temp.addHandler(log_handler)
+
+# ============================ defines =================================
+
+PORT = 'emulated1'
+STACK_DEFINES = {'components': {}, 'log_descriptions': {}, 'sixtop_returncodes': {}, 'sixtop_states': {}}
+
+PREFIX = [0xbb, 0xbb, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00]
+HOST = [0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x01]
+DAGROOT = [0x14, 0x15, 0x92, 0x00, 0x00, 0x00, 0x00, 0x01]
+MOTE_2 = [0x14, 0x15, 0x92, 0x00, 0x00, 0x00, 0x00, 0x02]
+MOTE_3 = [0x14, 0x15, 0x92, 0x00, 0x00, 0x00, 0x00, 0x03]
+MOTE_4 = [0x14, 0x15, 0x92, 0x00, 0x00, 0x00, 0x00, 0x04]
+LINK_LOCAL = OpenLbr.LINK_LOCAL_PREFIX
+
+
+# ============================ helpers =================================
+
+def udp_packet(src, dst, payload, hop_limit=64):
+    """ Returns an IPv6 packet carrying payload in a UDP datagram, as a list of bytes. """
+    length = len(payload) + 8
+    udp = [0xf0, 0xb1, 0xf0, 0xb2, length >> 8, length & 0xff, 0x00, 0x00] + payload
+    return [0x60, 0x00, 0x00, 0x00, length >> 8, length & 0xff, OpenLbr.IANA_UDP, hop_limit] + src + dst + udp
+
+
+def decompress(lbr, prev_hop, lowpan):
+    """ Returns the IPv6 fields of a 6LoWPAN packet, with the inner header of an IPinIP one, as OpenLbr does. """
+    ipv6 = lbr.lowpan_to_ipv6([prev_hop, lowpan])
+    if ipv6['next_header'] == OpenLbr.IANA_IPv6HOPHEADER and ipv6['hop_next_header'] == OpenLbr.IPV6_HEADER:
+        inner = lbr.lowpan_to_ipv6([prev_hop, ipv6['payload']])
+        assert inner['hop_limit'] == ipv6['hop_limit']
+        ipv6 = inner
+    return ipv6
+
+
+class Rpl(EventBusClient):
+    """ Answers the source routes, from the destination to the DAG root. """
+
+    def __init__(self, routes):
+        self.routes = routes
+        super(Rpl, self).__init__(
+            name='rpl',
+            registrations=[
+                {
+                    'sender': self.WILDCARD,
+                    'signal': 'getSourceRoute',
+                    'callback': self._get_source_route_notif,
+                },
+            ],
+        )
+
+    def close(self):
+        for r in self.registrations:
+            self.unregister(sender=r['sender'], signal=r['signal'], callback=r['callback'])
+
+    def _get_source_route_notif(self, sender, signal, data):
+        return [list(hop) for hop in self.routes.get(tuple(data), [])]
+
+
+class SerialProbe(object):
+    """ Stands for the mote probe of the DAG root, HDLC-frames the bytes of the mote connector. """
+
+    def __init__(self):
+        self.portname = PORT
+        self.send_to_parser = None
+        self.hdlc = OpenHdlc()
+        self.frames = []
+        self.received = threading.Condition()
+        dispatcher.connect(self._send_data, signal='fromMoteConnector@' + PORT)
+
+    def close(self):
+        dispatcher.disconnect(self._send_data, signal='fromMoteConnector@' + PORT)
+
+    def wait_frames(self, count, timeout=5):
+        """ Returns the data of the first count frames, or fewer if they are not written before timeout. """
+        deadline = time.time() + timeout
+        with self.received:
+            while len(self.frames) < count and time.time() < deadline:
+                self.received.wait(deadline - time.time())
+            return [[ord(c) for c in self.hdlc.dehdlcify(f)] for f in self.frames[:count]]
+
+    def _send_data(self, data):
+        with self.received:
+            self.frames.append(self.hdlc.hdlcify(data))
+            self.received.notify_all()
+
+
+# ============================ fixtures ================================
+
+@pytest.fixture
+def border_router():
+    rpl = Rpl({tuple(MOTE_2): [MOTE_2, DAGROOT], tuple(MOTE_4): [MOTE_4, MOTE_3, MOTE_2, DAGROOT]})
+    probe = SerialProbe()
+    lbr = OpenLbr(use_page_zero=False)
+    connector = MoteConnector(probe, STACK_DEFINES, None)
+    rpl.dispatch('networkPrefix', PREFIX)
+    rpl.dispatch('infoDagRoot', {'serialPort': PORT, 'isDAGroot': 1, 'eui64': DAGROOT})
+    try:
+        yield rpl, probe
+    finally:
+        connector.unregister(sender=connector.WILDCARD, signal='bytesToMesh',
+                             callback=connector._bytes_to_mesh_handler)
+        for r in connector.registrations:
+            connector.unregister(sender=r['sender'], signal=r['signal'], callback=r['callback'])
+        connector.parser.parser_event.close()
+        lbr.close()
+        probe.close()
+        rpl.close()
+
+
+@pytest.fixture
+def lbr():
+    lbr = OpenLbr(use_page_zero=False)
+    lbr.dispatch('networkPrefix', PREFIX)
+    lbr.dispatch('infoDagRoot', {'serialPort': PORT, 'isDAGroot': 1, 'eui64': DAGROOT})
+    try:
+        yield lbr
+    finally:
+        lbr.close()
+
+
+# ============================ tests ===================================
+
+def test_ipv6_packet_fields():
+    src = PREFIX + HOST
+    dst = PREFIX + MOTE_2
+    buf = bytearray(udp_packet(src, dst, range(10), hop_limit=7))
+    buf[1:4] = bytearray([0x0a, 0xbc, 0xde])
+
+    ipv6 = Ipv6Packet(buf)
+
+    assert ipv6.buf is buf
+    assert (ipv6.version, ipv6.traffic_class, ipv6.flow_label) == (6, 0x00, 0xabcde)
+    assert (ipv6.payload_length, ipv6.next_header, ipv6.hop_limit) == (18, OpenLbr.IANA_UDP, 7)
+    assert (ipv6.src_addr, ipv6.dst_addr) == (bytearray(src), bytearray(dst))
+    assert ipv6.payload.tobytes() == str(buf[40:])
+
+    # the payload is a view on the packet
+    buf[-1] = 0xff
+    assert ipv6.payload[-1] == '\xff'
+
+
+@pytest.mark.parametrize('pkt', [
+    [0x60] * 39,
+    [0x40] + [0x00] * 39,
+])
+def test_ipv6_packet_invalid(pkt):
+    with pytest.raises(ValueError):
+        Ipv6Packet(pkt)
+
+
+@pytest.mark.parametrize('as_type', [list, bytearray, str])
+def test_v6_to_mesh(border_router, as_type):
+    (rpl, probe) = border_router
+    payload = range(10)
+    pkt = udp_packet(PREFIX + HOST, PREFIX + MOTE_2, payload)
+
+    rpl.dispatch('v6ToMesh', as_type(bytearray(pkt)))
+
+    # IPHC: TF elided, NH inline, HLIM 64, SAC/DAC stateful, SAM/DAM 64 bits
+    lowpan = [OpenLbr.PAGE_ONE_DISPATCH, 0x7a, 0x55, OpenLbr.IANA_UDP] + HOST + MOTE_2 + pkt[40:]
+    assert probe.wait_frames(1) == [[OpenParser.SERFRAME_PC2MOTE_DATA] + MOTE_2 + lowpan]
+
+
+def test_v6_to_mesh_fragments(border_router):
+    (rpl, probe) = border_router
+    pkt = udp_packet(PREFIX + HOST, PREFIX + MOTE_4, [i & 0xff for i in range(300)])
+
+    rpl.dispatch('v6ToMesh', bytearray(pkt))
+
+    # RH3 6LoRHs: MOTE_2 inline, then MOTE_3 compressed to its last byte
+    lowpan = [OpenLbr.PAGE_ONE_DISPATCH, OpenLbr.CRITICAL_6LoRH, OpenLbr.TYPE_6LoRH_RH3_3] + MOTE_2
+    lowpan += [OpenLbr.CRITICAL_6LoRH, OpenLbr.TYPE_6LoRH_RH3_0, 0x03]
+    lowpan += [0x7a, 0x55, OpenLbr.IANA_UDP] + HOST + MOTE_4 + pkt[40:]
+    frames = probe.wait_frames(5)
+    assert len(frames) == 5
+
+    fragmentor = Fragmentor()
+    for frame in frames:
+        assert frame[:9] == [OpenParser.SERFRAME_PC2MOTE_DATA] + MOTE_2
+        reassembled = fragmentor.do_reassemble(frame[9:])
+    assert reassembled == lowpan
+
+
+def test_tun_to_serial(border_router):
+    (rpl, probe) = border_router
+    pkts = [udp_packet(PREFIX + HOST, PREFIX + MOTE_2, [i] * (i + 1)) for i in range(20)]
+    (tun, tun_if) = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+
+    reader = TunReadThread(tun_if.fileno(), lambda p: rpl.dispatch('v6ToMesh', p))
+    try:
+        for pkt in pkts:
+            # the trailing bytes beyond the payload length are ignored
+            os.write(tun.fileno(), bytearray(OpenTunLinux.VIRTUAL_TUN_ID + pkt + [0x00] * 3))
+        frames = probe.wait_frames(len(pkts))
+    finally:
+        reader.close()
+        os.write(tun.fileno(), bytearray(OpenTunLinux.VIRTUAL_TUN_ID))
+        reader.join()
+        tun.close()
+        tun_if.close()
+
+    assert [f[29:] for f in frames] == [p[40:] for p in pkts]
+
+
+def test_iphc_round_trip(lbr):
+    rnd = random.Random(24)
+
+    def address():
+        iid = rnd.choice([MOTE_2, MOTE_3, [rnd.randint(0x00, 0xff) for _ in range(8)]])
+        return rnd.choice([PREFIX, LINK_LOCAL, [rnd.randint(0x00, 0xff) for _ in range(8)]]) + iid
+
+    for _ in range(2000):
+        (src, dst) = (address(), address())
+        pkt = udp_packet(src, dst, [rnd.randint(0x00, 0xff) for _ in range(rnd.randint(0, 40))],
+                         hop_limit=rnd.choice([1, 64, 255, rnd.randint(0, 255)]))
+        lowpan = lbr.ipv6_to_lowpan(lbr.disassemble_ipv6(pkt))
+        lowpan['route'] = [dst[8:]] + [rnd.choice([MOTE_2, MOTE_3, MOTE_4]) for _ in range(rnd.randint(0, 3))]
+
+        ipv6 = decompress(lbr, MOTE_2, list(lbr.reassemble_lowpan(lowpan)))
+
+        assert (ipv6['src_addr'], ipv6['dst_addr']) == (src, dst)
+        assert (ipv6['traffic_class'], ipv6['flow_label']) == (0, 0)
+        assert (ipv6['hop_limit'], ipv6['next_header'], ipv6['payload']) == (pkt[7], pkt[6], pkt[40:])
+
+
+@pytest.mark.parametrize('iphc, fields', [
+    # TF 4 bytes, ECN and DSCP swapped, flow label; SAM/DAM 16 bits
+    ([0x60, 0x22, 0x4b, 0x0a, 0xbc, 0xde, 17, 33, 0x00, 0x05, 0x00, 0x06],
+     {'traffic_class': 0x2d, 'flow_label': 0xabcde, 'hop_limit': 33,
+      'src_addr': LINK_LOCAL + [0, 0, 0, 0xff, 0xfe, 0, 0x00, 0x05],
+      'dst_addr': LINK_LOCAL + [0, 0, 0, 0xff, 0xfe, 0, 0x00, 0x06]}),
+    # TF 3 bytes, ECN and flow label; SAM elided, from the link-layer address; DAM elided, to the DAG root
+    ([0x69, 0x33, 0x80, 0x0b, 0xcd, 17],
+     {'traffic_class': 0x02, 'flow_label': 0xbcd, 'hop_limit': 1, 'src_addr': LINK_LOCAL + MOTE_2,
+      'dst_addr': LINK_LOCAL + DAGROOT}),
+    # TF 1 byte; stateful SAM 64 bits and DAM elided
+    ([0x72, 0x57, 0x40, 17] + MOTE_3,
+     {'traffic_class': 0x01, 'flow_label': 0, 'hop_limit': 64, 'src_addr': PREFIX + MOTE_3,
+      'dst_addr': PREFIX + DAGROOT}),
+    # context identifier 0; unspecified source; multicast ff02::1
+    ([0x7b, 0xcb, 0x00, 17, 0x01],
+     {'traffic_class': 0, 'flow_label': 0, 'hop_limit': 255, 'src_addr': [0x00] * 16,
+      'dst_addr': [0xff, 0x02] + [0x00] * 13 + [0x01]}),
+    # multicast ff05::1:3 in 32 bits and ff05::00cd:ef01:0203 in 48 bits
+    ([0x7b, 0x3a, 17, 0x05, 0x01, 0x00, 0x03],
+     {'src_addr': LINK_LOCAL + MOTE_2, 'dst_addr': [0xff, 0x05] + [0x00] * 11 + [0x01, 0x00, 0x03]}),
+    ([0x7b, 0x39, 17, 0x05, 0xcd, 0xef, 0x01, 0x02, 0x03],
+     {'src_addr': LINK_LOCAL + MOTE_2, 'dst_addr': [0xff, 0x05] + [0x00] * 9 + [0xcd, 0xef, 0x01, 0x02, 0x03]}),
+    # multicast based on the network prefix
+    ([0x7b, 0x3c, 17, 0x3e, 0x00, 0x00, 0x00, 0x12, 0x34],
+     {'src_addr': LINK_LOCAL + MOTE_2, 'dst_addr': [0xff, 0x3e, 0x00, 0x40] + PREFIX + [0x00, 0x00, 0x12, 0x34]}),
+])
+def test_iphc_decompress(lbr, iphc, fields):
+    ipv6 = lbr.lowpan_to_ipv6([MOTE_2, iphc + [0xaa, 0xbb]])
+
+    assert dict((k, ipv6[k]) for k in fields) == fields
+    assert (ipv6['next_header'], ipv6['payload']) == (17, [0xaa, 0xbb])
+
+
+@pytest.mark.parametrize('iphc', [
+    # stateful DAM 128 bits, unicast prefix based multicast DAM 64 bits, and context 1
+    [0x7b, 0x34, 17] + [0x00] * 16,
+    [0x7b, 0x3d, 17] + [0x00] * 8,
+    [0x7b, 0xb3, 0x10, 17],
+])
+def test_iphc_decompress_unsupported(lbr, iphc):
+    with pytest.raises((ValueError, NotImplementedError)):
+        lbr.lowpan_to_ipv6([MOTE_2, iphc])
+
+
+def test_lowpan_headers_invalidated(lbr):
+    pkt = udp_packet(PREFIX + HOST, PREFIX + MOTE_2, range(10))
+    new_prefix = [0xcc, 0xcc] + PREFIX[2:]
+
+    def compress():
+        lowpan = lbr.ipv6_to_lowpan(lbr.disassemble_ipv6(pkt))
+        lowpan['route'] = [MOTE_2]
+        return list(lbr.reassemble_lowpan(lowpan))
+
+    assert compress() == compress() == [OpenLbr.PAGE_ONE_DISPATCH, 0x7a, 0x55, OpenLbr.IANA_UDP] + HOST + MOTE_2 + \
+        pkt[40:]
+    stats = lbr.get_stats()
+    assert (stats['hits'], stats['misses'], stats['flows']) == (1, 1, 1)
+
+    # the addresses are not in the new context 0 anymore
+    lbr.dispatch('networkPrefix', new_prefix)
+    assert compress() == [OpenLbr.PAGE_ONE_DISPATCH, 0x7a, 0x00, OpenLbr.IANA_UDP] + pkt[8:40] + pkt[40:]
+    assert lbr.lowpan_to_ipv6([MOTE_2, [0x7a, 0x55, 17] + HOST + MOTE_2])['dst_addr'] == new_prefix + MOTE_2
+
+    lbr.dispatch('infoDagRoot', {'serialPort': PORT, 'isDAGroot': 1, 'eui64': MOTE_4})
+    assert lbr.lowpan_to_ipv6([MOTE_2, [0x7a, 0x57, 17] + HOST])['dst_addr'] == new_prefix + MOTE_4
+    stats = lbr.get_stats()
+    assert (stats['misses'], stats['flows'], stats['invalidations']) == (2, 0, 4)
+
+
+def test_tx_pacing():
+    lbr = OpenLbr(use_page_zero=False, tx_rate=50, tx_burst=4)
+    try:
+        assert (lbr.tx_scheduler.rate, lbr.tx_scheduler.burst) == (50, 4)
+    finally:
+        lbr.close()
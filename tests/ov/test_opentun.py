@@ -0,0 +1,261 @@
+#!/usr/bin/env python2
+
+import logging.handlers
+import os
+import socket
+import threading
+import time
+
+import pytest
+
+from openvisualizer.eventbus.eventbusclient import EventBusClient
+from openvisualizer.opentun.opentunlinux import OpenTunLinux, TunReadThread, TunWriteThread
+
+# ============================ logging =================================
+
+LOGFILE_NAME = 'test_opentun.log'
+
+log = logging.getLogger('test_opentun')
+log.setLevel(logging.ERROR)
+log.addHandler(logging.NullHandler())
+
+log_handler = logging.handlers.RotatingFileHandler(LOGFILE_NAME, backupCount=5, mode='w')
+log_handler.setFormatter(logging.Formatter("%(asctime)s [%(name)s:%(levelname)s] %(message)s"))
+for logger_name in ['test_opentun', 'OpenTunLinux']:
+    temp = logging.getLogger(logger_name)
+    temp.setLevel(logging.DEBUG)
+    temp.addHandler(log_handler)
+
+# ============================ defines =================================
+
+PREFIX = [0xbb, 0xbb, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00]
+HOST = [0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x01]
+MOTE = [0x14, 0x15, 0x92, 0x00, 0x00, 0x00, 0x00, 0x02]
+
+
+# ============================ helpers =================================
+
+def echo_request(seq, src=PREFIX + HOST, dst=PREFIX + MOTE):
+    """ Returns an ICMPv6 echo request, as a list of bytes, the checksum is not computed. """
+    icmp = [128, 0, 0x00, 0x00, 0x00, 0x04, seq >> 8, seq & 0xff] + [ord('a') + b for b in range(32)]
+    return [0x60, 0x00, 0x00, 0x00, 0x00, len(icmp), 58, 64] + src + dst + icmp
+
+
+def recv_all(sock, num_packets):
+    """ Reads num_packets datagrams from sock, as lists of bytes. """
+    sock.settimeout(5)
+    return [list(bytearray(sock.recv(2048))) for _ in range(num_packets)]
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline
+        time.sleep(0.01)
+
+
+class Responder(EventBusClient):
+    """ Answers the echo requests read on the TUN interface, as scripts/ping_responder.py does. """
+
+    def __init__(self):
+        super(Responder, self).__init__(
+            name='responder',
+            registrations=[{'sender': self.WILDCARD, 'signal': 'v6ToMesh', 'callback': self._v6_to_mesh_notif}],
+        )
+
+    def close(self):
+        self.detach()
+
+    def _v6_to_mesh_notif(self, sender, signal, data):
+        if data[6] == 58 and data[40] == 128:
+            self.dispatch('v6ToInternet', data[:8] + data[24:40] + data[8:24] + bytearray([129]) + data[41:])
+
+
+class SocketOpenTun(OpenTunLinux):
+    """ OpenTunLinux on datagram sockets standing for the queues of the TUN interface. """
+
+    NUM_QUEUES = 2
+
+    def _create_tun_if(self):
+        self.host = []
+        queues = []
+        for _ in range(self.NUM_QUEUES):
+            (host, tun) = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+            self.host.append(host)
+            queues.append(os.dup(tun.fileno()))
+            tun.close()
+        return queues
+
+    def close(self):
+        super(SocketOpenTun, self).close()
+        for host in self.host:
+            host.close()
+
+
+# ============================ fixtures ================================
+
+@pytest.fixture
+def sockets(request):
+    # pairs of datagram sockets, (host, tun), their number is given by the parameter of the fixture
+    pairs = [socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM) for _ in range(getattr(request, 'param', 1))]
+    yield pairs
+    for pair in pairs:
+        for s in pair:
+            s.close()
+
+
+# ============================ tests ===================================
+
+@pytest.mark.parametrize('sockets', [2], indirect=['sockets'])
+@pytest.mark.parametrize('packet_info', [True, False])
+def test_read_queues(sockets, packet_info):
+    pairs = sockets
+    header = OpenTunLinux.VIRTUAL_TUN_ID if packet_info else []
+    received = []
+
+    reader = TunReadThread([tun.fileno() for (_, tun) in pairs], received.append, packet_info=packet_info)
+    try:
+        for i in range(10):
+            (host, _) = pairs[i % 2]
+            # the trailing bytes beyond the payload length are ignored
+            host.send(bytearray(header + echo_request(i) + [0x00] * 3))
+        for (queue, (host, _)) in enumerate(pairs):
+            # not IPv6, too short
+            host.send(bytearray(header + [0x45] + [0x00] * 59))
+            host.send(bytearray(header + echo_request(0)[:20]))
+            host.send(bytearray(header + echo_request(10 + queue)))
+
+        wait_for(lambda: len(received) == 12)
+    finally:
+        reader.close()
+        reader.join(5)
+    assert not reader.isAlive()
+
+    # the packets of every queue are read in order
+    assert all(isinstance(p, bytearray) for p in received)
+    seqs = [p[47] for p in received]
+    assert sorted(seqs) == range(12)
+    for queue in range(2):
+        in_queue = [s for s in seqs if s < 10 and s % 2 == queue]
+        assert in_queue == sorted(in_queue)
+    assert received[seqs.index(3)] == bytearray(echo_request(3))
+
+    stats = reader.get_stats()
+    assert (stats['read_packets'], stats['dropped_packets']) == (12, 4)
+
+
+def test_read_batches(sockets):
+    [(host, tun)] = sockets
+    received = []
+
+    for i in range(8):
+        host.send(bytearray(echo_request(i)))
+    reader = TunReadThread(tun.fileno(), received.append, packet_info=False)
+    try:
+        wait_for(lambda: len(received) == 8)
+    finally:
+        reader.close()
+        reader.join(5)
+
+    # the packets waiting on the queue are read on the same wakeup
+    assert [p[47] for p in received] == range(8)
+    stats = reader.get_stats()
+    assert (stats['wakeups'], stats['max_batch'], stats['packets_per_wakeup']) == (1, 8, 8.0)
+
+
+@pytest.mark.parametrize('packet_info', [True, False])
+def test_write(sockets, packet_info):
+    [(host, tun)] = sockets
+    header = OpenTunLinux.VIRTUAL_TUN_ID if packet_info else []
+    writer = TunWriteThread(tun.fileno(), packet_info=packet_info)
+
+    def write(first):
+        for i in range(first, 100, 4):
+            # lists of bytes and bytearrays are written
+            assert writer.write(echo_request(i) if i % 2 else bytearray(echo_request(i)))
+
+    threads = [threading.Thread(target=write, args=(i,)) for i in range(4)]
+    try:
+        for t in threads:
+            t.start()
+        packets = recv_all(host, 100)
+    finally:
+        for t in threads:
+            t.join()
+        writer.close()
+        writer.join()
+
+    assert sorted(packets) == sorted(header + echo_request(i) for i in range(100))
+    # the packets of every thread are written in order
+    seqs = [p[len(header) + 47] for p in packets]
+    for first in range(4):
+        assert [s for s in seqs if s % 4 == first] == range(first, 100, 4)
+
+    stats = writer.get_stats()
+    assert (stats['written_packets'], stats['dropped_packets'], stats['queued_packets']) == (100, 0, 0)
+    assert 0 <= stats['latency_avg'] <= stats['latency_max']
+
+
+def test_write_queue_full(sockets, monkeypatch):
+    monkeypatch.setattr(TunWriteThread, 'MAX_QUEUED', 5)
+    [(host, tun)] = sockets
+    # shared with the reads, the file descriptor of the interface is non-blocking
+    tun.setblocking(False)
+    writer = TunWriteThread(tun.fileno(), packet_info=False)
+
+    try:
+        # the socket is not read, the writer waits for it while the packets are queued
+        accepted = [i for i in range(50) if writer.write(echo_request(i))]
+        packets = recv_all(host, len(accepted))
+    finally:
+        writer.close()
+        writer.join()
+
+    assert 0 < len(accepted) < 50
+    assert [p[47] for p in packets] == accepted
+    stats = writer.get_stats()
+    assert (stats['written_packets'], stats['dropped_packets']) == (len(accepted), 50 - len(accepted))
+    assert stats['max_queued'] == 5
+
+
+def test_close_writes_queued_packets(sockets):
+    [(host, tun)] = sockets
+    writer = TunWriteThread(tun.fileno(), packet_info=False)
+
+    try:
+        # the packets are still queued when the writer is closed
+        with writer.data_lock:
+            for i in range(20):
+                assert writer.write(echo_request(i))
+            writer.close()
+        assert not writer.write(echo_request(20))
+        packets = recv_all(host, 20)
+    finally:
+        writer.close()
+        writer.join(5)
+    assert not writer.isAlive()
+
+    assert [p[47] for p in packets] == range(20)
+    stats = writer.get_stats()
+    assert (stats['written_packets'], stats['dropped_packets'], stats['queued_packets']) == (20, 1, 0)
+
+
+def test_echo():
+    responder = Responder()
+    tun = SocketOpenTun()
+    try:
+        # the replies are written on the first queue, whatever the queue of the request
+        for i in range(20):
+            tun.host[i % tun.NUM_QUEUES].send(bytearray(echo_request(i)))
+        replies = recv_all(tun.host[0], 20)
+    finally:
+        tun.close()
+        responder.close()
+
+    assert sorted(r[47] for r in replies) == range(20)
+    reply = replies[[r[47] for r in replies].index(0)]
+    assert reply[8:24] == PREFIX + MOTE and reply[24:40] == PREFIX + HOST and reply[40] == 129
+
+    stats = tun.get_stats()
+    assert (stats['read']['read_packets'], stats['write']['written_packets']) == (20, 20)
+    assert not tun.tun_read_thread.isAlive() and not tun.tun_write_thread.isAlive()
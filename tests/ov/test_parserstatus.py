@@ -0,0 +1,136 @@
+#!/usr/bin/env python2
+
+import logging.handlers
+import random
+import struct
+
+import pytest
+
+from openvisualizer.motehandler.moteconnector.openparser.parser import Parser
+from openvisualizer.motehandler.moteconnector.openparser.parserexception import ParserException
+from openvisualizer.motehandler.moteconnector.openparser.parserstatus import ParserStatus
+from openvisualizer.utils import format_buf
+
+# ============================ logging =================================
+
+LOGFILE_NAME = 'test_parserstatus.log'
+
+log = logging.getLogger('test_parserstatus')
+log.setLevel(logging.ERROR)
+log.addHandler(logging.NullHandler())
+
+log_handler = logging.handlers.RotatingFileHandler(LOGFILE_NAME, backupCount=5, mode='w')
+log_handler.setFormatter(logging.Formatter("%(asctime)s [%(name)s:%(levelname)s] %(message)s"))
+for logger_name in ['test_parserstatus', 'ParserStatus']:
+    temp = logging.getLogger(logger_name)
+    temp.setLevel(logging.DEBUG)
+    temp.addHandler(log_handler)
+
+
+# ============================ helpers =================================
+
+def legacy_parse(parser_status, data):
+    """ Reference implementation: the linear scan and string conversions used before the compiled dispatch. """
+    if len(data) < parser_status.HEADER_LENGTH:
+        raise ParserException(ParserException.ExceptionType.TOO_SHORT)
+
+    (mote_id, status_elem) = struct.unpack('<HB', ''.join([chr(c) for c in data[:3]]))
+    data = data[3:]
+
+    for key in parser_status.fields_parsing_keys:
+        if status_elem == key.val:
+            try:
+                fields = struct.unpack(key.structure, ''.join([chr(c) for c in data]))
+            except struct.error as err:
+                raise ParserException(
+                    ParserException.ExceptionType.DESERIALIZE.value,
+                    "could not extract tuple {0} by applying {1} to {2}; error: {3}".format(
+                        key.name, key.structure, format_buf(data), str(err)),
+                )
+            return 'status', parser_status.named_tuple[key.name](*fields)
+
+    raise ParserException(ParserException.ExceptionType.NO_KEY.value,
+                          "type={0} (\"{1}\")".format(data[0], chr(data[0])))
+
+
+def outcome(parse, parser_status, frame):
+    try:
+        return parse(parser_status, frame)
+    except ParserException as err:
+        return err.error_code, str(err)
+
+
+def random_frame(rnd, key):
+    return [0x01, 0x00, key.val] + [rnd.randrange(256) for _ in range(struct.calcsize(key.structure))]
+
+
+class SubParser(object):
+    def __init__(self, name):
+        self.name = name
+
+    def parse_input(self, data):
+        return self.name, data
+
+
+class TwoLevelParser(Parser):
+    def __init__(self):
+        super(TwoLevelParser, self).__init__(2)
+        self._add_sub_parser(index=0, val=1, parser=SubParser('a'))
+        self._add_sub_parser(index=0, val=2, parser=SubParser('b'))
+        self._add_sub_parser(index=1, val=1, parser=SubParser('c'))
+        self._add_sub_parser(index=0, val=1, parser=SubParser('ignored'))
+
+
+# ============================ fixtures ================================
+
+@pytest.fixture
+def parser_status():
+    return ParserStatus()
+
+
+# ============================ tests ===================================
+
+def test_same_tuples(parser_status):
+    rnd = random.Random(1)
+
+    for key in parser_status.fields_parsing_keys:
+        for _ in range(50):
+            frame = random_frame(rnd, key)
+            (event_type, notif) = parser_status.parse_input(frame)
+            assert (event_type, notif) == legacy_parse(parser_status, frame)
+            assert type(notif) is parser_status.named_tuple[key.name]
+
+
+def test_same_errors(parser_status):
+    rnd = random.Random(2)
+    # unknown status elements, too short
+    frames = [[0x01, 0x00, 0xff, 0x00], [0x01, 0x00, 0xff, ord('x'), 0x00], [0x01, 0x00, 0x00]]
+    # wrong lengths
+    for key in parser_status.fields_parsing_keys:
+        frame = random_frame(rnd, key)
+        frames += [frame[:-1], frame + [0x00]]
+
+    for frame in frames:
+        expected = outcome(legacy_parse, parser_status, frame)
+        assert not isinstance(expected[1], tuple)
+        assert outcome(ParserStatus.parse_input, parser_status, frame) == expected
+
+
+def test_input_types(parser_status):
+    frame = [0x01, 0x00, 0x00, 0x01]
+    expected = parser_status.parse_input(frame)
+
+    assert parser_status.parse_input(bytearray(frame)) == expected
+    assert parser_status.parse_input(memoryview(bytearray(frame))) == expected
+
+
+def test_sub_parser_dispatch():
+    parser = TwoLevelParser()
+
+    assert parser.parse_input([1, 1, 9]) == ('a', [9])
+    assert parser.parse_input([2, 1, 9]) == ('b', [9])
+    assert parser.parse_input([3, 1, 9]) == ('c', [9])
+    with pytest.raises(ParserException):
+        parser.parse_input([3, 3, 9])
+    with pytest.raises(ParserException):
+        parser.parse_input([1])
@@ -0,0 +1,355 @@
+#!/usr/bin/env python2
+
+import logging.handlers
+import random
+from math import radians, cos, sin, asin, sqrt, log10
+
+import pytest
+
+from openvisualizer.eventbus.eventbusclient import EventBusClient
+from openvisualizer.simengine.propagation import Propagation
+from openvisualizer.simengine.simengine import SimEngine
+
+# ============================ logging =================================
+
+LOGFILE_NAME = 'test_propagation.log'
+
+log = logging.getLogger('test_propagation')
+log.setLevel(logging.ERROR)
+log.addHandler(logging.NullHandler())
+
+log_handler = logging.handlers.RotatingFileHandler(LOGFILE_NAME, backupCount=5, mode='w')
+log_handler.setFormatter(logging.Formatter("%(asctime)s [%(name)s:%(levelname)s] %(message)s"))
+for logger_name in ['test_propagation', 'Propagation']:
+    temp = logging.getLogger(logger_name)
+    temp.setLevel(logging.DEBUG)
+    temp.addHandler(log_handler)
+
+
+# ============================ helpers =================================
+
+class MoteHandler(object):
+
+    def __init__(self, mote_id, location):
+        self.id = mote_id
+        self.location = location
+
+    def get_id(self):
+        return self.id
+
+    def get_location(self):
+        return self.location
+
+    def set_location(self, lat, lon):
+        self.location = (lat, lon)
+
+
+class Radio(EventBusClient):
+    """ Listens on a channel, locks on the first frame it detects and records the frames it receives. """
+
+    def __init__(self, channel):
+        super(Radio, self).__init__(name='Radio', registrations=[])
+        self.channel = channel
+        self.rx_from = None
+        self.received = []  # (from_mote, crc_passes)
+
+    def indicate_tx_start(self, mote_id, packet, channel):
+        if self.rx_from is None and channel == self.channel:
+            self.rx_from = mote_id
+            return True
+        return False
+
+    def indicate_tx_end(self, mote_id, crc_passes=True):
+        if mote_id == self.rx_from:
+            self.rx_from = None
+            self.received.append((mote_id, crc_passes))
+
+
+class RadioMoteHandler(MoteHandler):
+
+    def __init__(self, mote_id, channel=11):
+        super(RadioMoteHandler, self).__init__(mote_id, (37.87, -122.25))
+        self.bsp_radio = Radio(channel)
+
+
+def reference_pdr(from_location, to_location):
+    """ Reference: the former Pister-hack model, without its random loss. """
+    (lat_from, lon_from) = from_location
+    (lat_to, lon_to) = to_location
+    lon_from, lat_from, lon_to, lat_to = map(radians, [lon_from, lat_from, lon_to, lat_to])
+    a = sin((lat_to - lat_from) / 2) ** 2 + cos(lat_from) * cos(lat_to) * sin((lon_to - lon_from) / 2) ** 2
+    d_km = 6367 * 2 * asin(sqrt(a))
+    p_rx = Propagation.TX_POWER_dBm - (20 * log10(d_km) + 20 * log10(Propagation.FREQUENCY_GHz) + 92.45)
+    return min(max((p_rx - Propagation.SENSITIVITY_dBm) / Propagation.GREY_AREA_dB, 0.0), 1.0)
+
+
+def scattered_motes(num_motes, span_deg, seed=0):
+    rnd = random.Random(seed)
+    return [MoteHandler(i + 1, (37.87 + rnd.random() * span_deg, -122.25 + rnd.random() * span_deg))
+            for i in range(num_motes)]
+
+
+def links(propagation):
+    return dict(((c['fromMote'], c['toMote']), c['pdr']) for c in propagation.retrieve_connections())
+
+
+def medium(engine, motes, pdrs):
+    """ Returns the propagation model of the engine, with the motes connected by the given PDRs. """
+    engine.indicate_new_motes(motes)
+    for mh in motes:
+        mh.bsp_radio.name = engine.register_radio(mh.get_id())
+    propagation = engine.propagation
+    propagation.connections = {}
+    for ((from_mote, to_mote), pdr) in pdrs.items():
+        propagation._set_connection(from_mote, to_mote, pdr)
+    return propagation
+
+
+def tx_start(propagation, from_mote, channel=11):
+    sender = propagation.engine.get_mote_handler_by_id(from_mote).bsp_radio.name
+    propagation._indicate_tx_start(sender, Propagation.SIGNAL_WIRELESSTXSTART, (from_mote, [0x00] * 10, channel))
+
+
+def tx_end(propagation, from_mote):
+    sender = propagation.engine.get_mote_handler_by_id(from_mote).bsp_radio.name
+    propagation._indicate_tx_end(sender, Propagation.SIGNAL_WIRELESSTXEND, from_mote)
+
+
+def symmetric(connections):
+    return dict(((min(a, b), max(a, b)), pdr) for ((a, b), pdr) in connections.items())
+
+
+# ============================ fixtures ================================
+
+@pytest.fixture
+def engine():
+    engines = []
+
+    def with_topology(sim_topology=''):
+        """ Returns a new engine, without motes. """
+        engines.append(SimEngine(sim_topology))
+        return engines[-1]
+
+    try:
+        yield with_topology
+    finally:
+        for e in engines:
+            e.close()
+
+
+@pytest.fixture
+def no_loss(monkeypatch):
+    monkeypatch.setattr(Propagation, 'PISTER_HACK_LOSS', 0.0)
+
+
+# ============================ tests ===================================
+
+def test_pister_hack_same_as_reference(engine, no_loss):
+    # about 4 km wide, the range of a mote is about 1.1 km
+    motes = scattered_motes(150, 0.04)
+    engine = engine()
+    engine.indicate_new_motes(motes)
+
+    expected = {}
+    for (i, a) in enumerate(motes):
+        for b in motes[:i]:
+            pdr = reference_pdr(a.get_location(), b.get_location())
+            if pdr:
+                expected[(b.id, a.id)] = pdr
+
+    actual = symmetric(links(engine.propagation))
+    assert sorted(actual) == sorted(expected)
+    for (pair, pdr) in expected.items():
+        assert actual[pair] == pytest.approx(pdr)
+    # the grid does spare pairs
+    assert 0 < len(expected) < len(motes) * (len(motes) - 1) / 2
+
+
+def test_incremental_same_as_one_pass(engine, no_loss):
+    motes = scattered_motes(60, 0.02)
+    engine = engine()
+    for mh in motes:
+        engine.indicate_new_mote(mh)
+    incremental = symmetric(links(engine.propagation))
+
+    engine.propagation.connect_all_motes()
+    assert symmetric(links(engine.propagation)) == pytest.approx(incremental)
+
+
+def test_random_loss(engine):
+    motes = scattered_motes(30, 0.001)
+    pdrs = []
+    for _ in range(2):
+        random.seed(3)
+        with_topology = engine()
+        with_topology.indicate_new_motes(motes)
+        pdrs.append(links(with_topology.propagation))
+
+    # the same seed gives the same links, the loss gives intermediate PDRs
+    assert pdrs[0] == pdrs[1]
+    assert 0 < len([pdr for pdr in pdrs[0].values() if pdr < 1.0]) < len(pdrs[0])
+
+
+def test_move_mote(engine, no_loss):
+    motes = scattered_motes(40, 0.03)
+    engine = engine()
+    engine.indicate_new_motes(motes)
+    before = symmetric(links(engine.propagation))
+
+    moved = motes[5]
+    engine.propagation.move_mote(moved.id, 37.9, -122.2)
+    after = symmetric(links(engine.propagation))
+
+    # only the connections of the moved mote changed
+    assert dict((k, v) for (k, v) in before.items() if moved.id not in k) == \
+        dict((k, v) for (k, v) in after.items() if moved.id not in k)
+    for other in motes:
+        pair = (min(moved.id, other.id), max(moved.id, other.id))
+        pdr = reference_pdr(moved.get_location(), other.get_location()) if other is not moved else 0.0
+        assert after.get(pair, 0.0) == pytest.approx(pdr)
+
+
+def test_move_mote_same_location(engine, no_loss):
+    motes = scattered_motes(10, 0.001)
+    engine = engine()
+    engine.indicate_new_motes(motes)
+    engine.propagation.delete_connection(1, 2)
+    before = links(engine.propagation)
+
+    # the location posted back by the web interface, off by a rounding error
+    (lat, lon) = motes[0].get_location()
+    engine.propagation.move_mote(1, lat + 1e-12, lon - 1e-12)
+
+    # the hand-edited connections of the mote are kept
+    assert links(engine.propagation) == before
+    assert motes[0].get_location() == (lat, lon)
+
+
+@pytest.mark.parametrize('sim_topology', ['linear', 'fully-meshed'])
+def test_topologies(engine, sim_topology):
+    motes = scattered_motes(5, 0.001)
+    engine = engine(sim_topology)
+    engine.indicate_new_motes(motes)
+
+    if sim_topology == 'linear':
+        assert symmetric(links(engine.propagation)) == {(1, 2): 1.0, (2, 3): 1.0, (3, 4): 1.0, (4, 5): 1.0}
+    else:
+        assert len(links(engine.propagation)) == 10
+
+    # the connections do not depend on the locations
+    engine.propagation.move_mote(3, 0.0, 0.0)
+    assert len(links(engine.propagation)) == (4 if sim_topology == 'linear' else 10)
+
+
+def test_create_and_delete_connection(engine, no_loss):
+    (near, far) = (MoteHandler(1, (37.87, -122.25)), MoteHandler(2, (37.97, -122.25)))
+    engine = engine()
+    engine.indicate_new_motes([near, far])
+    assert links(engine.propagation) == {}
+
+    engine.propagation.create_connection(1, 2)
+    assert links(engine.propagation) == {}
+
+    far.set_location(37.8701, -122.25)
+    engine.propagation.create_connection(1, 2)
+    assert symmetric(links(engine.propagation)) == {(1, 2): 1.0}
+    engine.propagation.delete_connection(2, 1)
+    assert links(engine.propagation) == {}
+
+
+def test_frame_received(engine):
+    motes = [RadioMoteHandler(1), RadioMoteHandler(2), RadioMoteHandler(3, channel=12)]
+    propagation = medium(engine(), motes, {(1, 2): 1.0, (1, 3): 1.0})
+
+    tx_start(propagation, 1)
+    assert propagation.pending_tx_end == {1: set([2, 3])}
+    tx_end(propagation, 1)
+
+    # the mote listening on another channel detected the frame, without receiving it
+    assert motes[1].bsp_radio.received == [(1, True)]
+    assert motes[2].bsp_radio.received == []
+    assert propagation.pending_tx_end == {} and propagation.receptions == {}
+    assert propagation.get_stats() == {'numTransmissions': 1, 'numReceived': 1, 'numCorrupted': 0}
+
+
+def test_collision(engine):
+    motes = [RadioMoteHandler(1), RadioMoteHandler(2), RadioMoteHandler(3)]
+    propagation = medium(engine(), motes, {(1, 3): 1.0, (2, 3): 1.0})
+
+    # two frames of the same power overlap, the receiver locked on the first one gets it corrupted
+    tx_start(propagation, 1)
+    tx_start(propagation, 2)
+    tx_end(propagation, 1)
+    tx_end(propagation, 2)
+    assert motes[2].bsp_radio.received == [(1, False)]
+
+    # the interference of a frame that started first corrupts the frame too
+    tx_start(propagation, 2)
+    tx_start(propagation, 1)
+    tx_end(propagation, 2)
+    tx_end(propagation, 1)
+    assert motes[2].bsp_radio.received[1:] == [(2, False)]
+
+    # on different channels, both frames are received by the motes listening to them
+    motes.append(RadioMoteHandler(4, channel=12))
+    propagation = medium(engine(), motes, {(1, 3): 1.0, (2, 3): 1.0, (1, 4): 1.0, (2, 4): 1.0})
+    tx_start(propagation, 1, channel=11)
+    tx_start(propagation, 2, channel=12)
+    tx_end(propagation, 1)
+    tx_end(propagation, 2)
+    assert motes[2].bsp_radio.received[2:] == [(1, True)]
+    assert motes[3].bsp_radio.received == [(2, True)]
+    assert propagation.get_stats() == {'numTransmissions': 2, 'numReceived': 2, 'numCorrupted': 0}
+
+
+def test_capture_effect(engine):
+    motes = [RadioMoteHandler(1), RadioMoteHandler(2), RadioMoteHandler(3)]
+    # mote 2 is at the edge of the range of mote 3, 12 dB below mote 1
+    propagation = medium(engine(), motes, {(1, 3): 1.0, (2, 3): 0.2})
+
+    random.seed(0)
+    for _ in range(20):
+        tx_start(propagation, 1)
+        tx_start(propagation, 2)
+        tx_end(propagation, 2)
+        tx_end(propagation, 1)
+    assert motes[2].bsp_radio.received == [(1, True)] * 20
+
+    # the weak frame is lost under the strong one
+    tx_start(propagation, 2)
+    tx_start(propagation, 1)
+    tx_end(propagation, 1)
+    tx_end(propagation, 2)
+    assert motes[2].bsp_radio.received[20:] in ([], [(2, False)])
+
+
+def test_dense_network(engine):
+    motes = [RadioMoteHandler(i) for i in range(1, 11)]
+    propagation = medium(engine(), motes, dict(((a, b), 1.0) for a in range(1, 11) for b in range(a + 1, 11)))
+
+    # a shared cell: motes 1 to 5 transmit together, the others hear the first one and the collision
+    for from_mote in range(1, 6):
+        tx_start(propagation, from_mote)
+    for from_mote in range(1, 6):
+        tx_end(propagation, from_mote)
+
+    for mh in motes[5:]:
+        assert mh.bsp_radio.received == [(1, False)]
+    assert propagation.pending_tx_end == {} and propagation.receptions == {}
+    assert propagation.channel_transmissions[11] == set()
+
+
+def test_engines_have_their_own_medium(engine):
+    engines = [engine(), engine()]
+    motes = [[RadioMoteHandler(1), RadioMoteHandler(2)], [RadioMoteHandler(1), RadioMoteHandler(2)]]
+    for (e, m) in zip(engines, motes):
+        medium(e, m, {(1, 2): 1.0})
+    assert motes[0][0].bsp_radio.name != motes[1][0].bsp_radio.name
+
+    # the frames go through the event bus, as the radios send them
+    motes[1][0].bsp_radio.dispatch(Propagation.SIGNAL_WIRELESSTXSTART, (1, [0x00] * 10, 11))
+    motes[1][0].bsp_radio.dispatch(Propagation.SIGNAL_WIRELESSTXEND, 1)
+
+    assert motes[0][1].bsp_radio.received == []
+    assert motes[1][1].bsp_radio.received == [(1, True)]
+    assert [e.propagation.get_stats()['numTransmissions'] for e in engines] == [0, 1]
@@ -0,0 +1,150 @@
+#!/usr/bin/env python2
+
+import json
+import logging.handlers
+import threading
+import time
+import uuid
+
+import pytest
+
+from openvisualizer.eventbus.eventbusclient import EventBusClient
+from openvisualizer.eventbus.eventbusmonitor import EventBusMonitor
+from openvisualizer.eventbus.eventbusrouter import EventBusRouter
+from openvisualizer.eventbus.signalstats import LatencyHistograms, ShardedCounters
+
+# ============================ logging =================================
+
+LOGFILE_NAME = 'test_signalstats.log'
+
+log = logging.getLogger('test_signalstats')
+log.setLevel(logging.ERROR)
+log.addHandler(logging.NullHandler())
+
+log_handler = logging.handlers.RotatingFileHandler(LOGFILE_NAME, backupCount=5, mode='w')
+log_handler.setFormatter(logging.Formatter("%(asctime)s [%(name)s:%(levelname)s] %(message)s"))
+for logger_name in ['test_signalstats', 'EventBusMonitor', 'EventBusRouter']:
+    temp = logging.getLogger(logger_name)
+    temp.setLevel(logging.DEBUG)
+    temp.addHandler(log_handler)
+
+
+# ============================ helpers =================================
+
+def run_threads(num_threads, target):
+    threads = [threading.Thread(target=target, args=(i,)) for i in range(num_threads)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+
+def unique(prefix):
+    """ The router is a singleton, every test uses its own signal names. """
+    return '{0}-{1}'.format(prefix, uuid.uuid4().hex)
+
+
+# ============================ fixtures ================================
+
+@pytest.fixture
+def ebm():
+    ebm = EventBusMonitor()
+    yield ebm
+    EventBusRouter().set_latency_histograms(None)
+
+
+# ============================ tests ===================================
+
+def test_sharded_counters():
+    counters = ShardedCounters()
+
+    def count(i):
+        for _ in range(10000):
+            counters.increment('all')
+            counters.increment(i)
+
+    run_threads(8, count)
+
+    assert counters.get_counts() == dict([('all', 80000)] + [(i, 10000) for i in range(8)])
+    # the shards of the threads which exited are merged
+    assert counters.shards == []
+
+
+def test_short_lived_threads():
+    counters = ShardedCounters()
+    latencies = LatencyHistograms()
+    counters.increment('all')
+    latencies.record('key', 3e-6)
+
+    def count(i):
+        counters.increment('all')
+        latencies.record('key', 3e-6)
+
+    for _ in range(100):
+        # one thread per request, as the RPC server does
+        run_threads(1, count)
+        assert len(counters.shards) <= 2 and len(latencies.shards) <= 2
+
+    assert counters.get_counts() == {'all': 101}
+    assert latencies.get_histograms()['key']['num'] == 101
+    # only the shard of the main thread is left, the ones of the other threads are retired
+    assert len(counters.shards) == len(latencies.shards) == 1
+    assert counters.get_counts() == {'all': 101}
+
+
+def test_latency_histograms():
+    latencies = LatencyHistograms()
+    # 0.5, 3 and 100 us, then 2 seconds
+    for duration in [0.5e-6] * 50 + [3e-6] * 40 + [100e-6] * 9 + [2.0]:
+        latencies.record('key', duration)
+    run_threads(2, lambda i: latencies.record('key', 3e-6))
+
+    [(key, histogram)] = latencies.get_histograms().items()
+    assert key == 'key'
+    assert histogram['num'] == 102
+    assert histogram['mean_us'] == pytest.approx((50 * 0.5 + 42 * 3 + 9 * 100 + 2e6) / 102)
+    assert histogram['max_us'] == pytest.approx(2e6)
+    assert histogram['p50_us'] == 4.0  # bucket from 2 to 4 us
+    assert histogram['p99_us'] == 128.0  # bucket from 64 to 128 us
+    assert histogram['histogram'][0] == 50
+    assert histogram['histogram'][2] == 42
+    assert histogram['histogram'][7] == 9
+    assert histogram['histogram'][21] == 1
+    assert sum(histogram['histogram']) == 102
+
+
+def test_percentile_in_last_bucket():
+    latencies = LatencyHistograms()
+    latencies.record('key', 60.0)
+    histogram = latencies.get_histograms()['key']
+    assert histogram['histogram'][-1] == 1
+    assert histogram['p50_us'] == histogram['p99_us'] == pytest.approx(60e6)
+
+
+def test_monitor_stats(ebm):
+    signal = unique('signal')
+
+    def fast(sender, signal, data):
+        pass
+
+    def slow(sender, signal, data):
+        time.sleep(0.01)
+
+    sender = EventBusClient(unique('sender'), registrations=[])
+    receivers = [
+        EventBusClient(unique('fast'), registrations=[{'sender': sender.name, 'signal': signal, 'callback': fast}]),
+        EventBusClient(unique('slow'), registrations=[{'sender': '*', 'signal': signal, 'callback': slow}]),
+    ]
+
+    run_threads(3, lambda i: sender.dispatch(signal, i))
+
+    [stats] = [s for s in json.loads(ebm.get_stats()) if s['signal'] == signal]
+    assert stats['sender'] == sender.name
+    assert stats['num'] == 3
+    # the clients of the other tests may receive all the signals
+    names = [r.name for r in receivers]
+    latencies = [r for r in stats['receivers'] if r['receiver'] in names]
+    assert [r['receiver'] for r in latencies] == [receivers[1].name, receivers[0].name]
+    assert [r['num'] for r in latencies] == [3, 3]
+    assert latencies[0]['mean_us'] >= 10000
+    assert len(latencies[0]['histogram']) == LatencyHistograms.NUM_BUCKETS
@@ -0,0 +1,168 @@
+#!/usr/bin/env python2
+
+import logging.handlers
+import os
+
+import pytest
+
+from openvisualizer.simengine.batchrunner import BatchRunner
+from openvisualizer.simengine.simengine import SimEngine
+from openvisualizer.simengine.timeline import TimeLine
+
+# ============================ logging =================================
+
+LOGFILE_NAME = 'test_simengine.log'
+
+log = logging.getLogger('test_simengine')
+log.setLevel(logging.ERROR)
+log.addHandler(logging.NullHandler())
+
+log_handler = logging.handlers.RotatingFileHandler(LOGFILE_NAME, backupCount=5, mode='w')
+log_handler.setFormatter(logging.Formatter("%(asctime)s [%(name)s:%(levelname)s] %(message)s"))
+for logger_name in ['test_simengine', 'SimEngine', 'Timeline', 'BatchRunner']:
+    temp = logging.getLogger(logger_name)
+    temp.setLevel(logging.DEBUG)
+    temp.addHandler(log_handler)
+
+# ============================ defines =================================
+
+MS = TimeLine.NS_PER_SECOND // 1000
+
+
+# ============================ helpers =================================
+
+class TickingMote(object):
+    """ Stands for a mote handler, with an event every ms until its last tick. """
+
+    INTR_TICK = 'tick'
+
+    def __init__(self, engine, last_tick=None):
+        self.engine = engine
+        self.id = engine.id_manager.get_id()
+        self.location = engine.location_manager.get_location()
+        self.last_tick = last_tick
+        self.ticks = []
+        engine.indicate_new_mote(self)
+        self._schedule_tick()
+
+    def get_id(self):
+        return self.id
+
+    def get_location(self):
+        return self.location
+
+    def handle_event(self, function_to_call):
+        function_to_call()
+
+    def tick(self):
+        self.ticks.append(self.engine.timeline.get_current_time())
+        if self.last_tick is None or len(self.ticks) < self.last_tick:
+            self._schedule_tick()
+
+    def _schedule_tick(self):
+        self.engine.timeline.schedule_event(self.engine.timeline.get_current_time() + MS, self.id, self.tick,
+                                            self.INTR_TICK)
+
+
+def simulate(params):
+    """ Stands for run_simulation(), in a process of the pool. """
+    if params['seed'] == 13:
+        return {'topo_file': params['topo_file'], 'seed': params['seed'], 'error': 'ValueError: bad luck',
+                'wall_clock': 0.5}
+    return {
+        'topo_file': params['topo_file'],
+        'seed': params['seed'],
+        'pid': os.getpid(),
+        'completed': params['seed'] != 3,
+        'events': 100 * params['seed'],
+        'serial_frames': 10,
+        'numTransmissions': 20,
+        'numReceived': 15,
+        'numCorrupted': 5,
+        'wall_clock': float(params['seed']),
+    }
+
+
+# ============================ fixtures ================================
+
+@pytest.fixture
+def engines():
+    engines = []
+
+    def new_engine(*args, **kwargs):
+        engines.append(SimEngine(*args, **kwargs))
+        engines[-1].set_delay(0)
+        return engines[-1]
+
+    try:
+        yield new_engine
+    finally:
+        for engine in engines:
+            engine.close()
+
+
+# ============================ tests ===================================
+
+def test_engines_are_independent(engines):
+    (first, second) = (engines(), engines('linear'))
+
+    assert first.name != second.name
+    assert first.timeline is not second.timeline
+    assert (first.propagation.sim_topology, second.propagation.sim_topology) == ('', 'linear')
+
+    # each engine numbers its own motes
+    first_motes = [TickingMote(first), TickingMote(first)]
+    second_motes = [TickingMote(second)]
+    assert [mh.get_id() for mh in first_motes + second_motes] == [1, 2, 1]
+    assert first.get_mote_handler_by_id(1) is first_motes[0]
+    assert second.get_mote_handler_by_id(1) is second_motes[0]
+
+
+def test_run_until(engines):
+    (first, second) = (engines(), engines())
+    (first_mote, second_mote) = (TickingMote(first), TickingMote(second))
+
+    assert first.run_until(10 * MS, timeout=10)
+    assert first_mote.ticks == [(i + 1) * MS for i in range(10)]
+    assert first.timeline.get_current_time() == 10 * MS
+
+    # the other engine did not move, the first one continues from where it paused
+    assert second_mote.ticks == []
+    assert second.run_until(5 * MS + 1, timeout=10)
+    assert first.run_until(15 * MS, timeout=10)
+    assert len(first_mote.ticks) == 15
+    assert second_mote.ticks == [(i + 1) * MS for i in range(5)]
+    assert second.timeline.get_current_time() == 5 * MS + 1
+
+
+def test_run_until_end_of_simulation(engines):
+    engine = engines()
+    mote = TickingMote(engine, last_tick=3)
+
+    assert engine.run_until(10 * MS, timeout=10)
+    assert mote.ticks == [MS, 2 * MS, 3 * MS]
+    assert engine.run_until(20 * MS, timeout=10)
+
+
+def test_batch_runner():
+    runner = BatchRunner(fw_path='openwsn-fw', seeds=[1, 2, 3, 13], duration=60.0, topo_files=['a.json', 'b.json'],
+                         processes=2, simulate=simulate)
+    ended = []
+
+    results = runner.run(callback=ended.append)
+
+    # a process per run, the results in the order of the params
+    assert len(ended) == 8
+    assert [(r['topo_file'], r['seed']) for r in results] == [(p['topo_file'], p['seed']) for p in runner.get_params()]
+    assert [r['seed'] for r in results] == [1, 2, 3, 13] * 2
+    pids = [r['pid'] for r in results if 'pid' in r]
+    assert len(set(pids)) == len(pids) and os.getpid() not in pids
+
+    summaries = BatchRunner.aggregate(results)
+    assert summaries.keys() == ['a.json', 'b.json']
+    summary = summaries['a.json']
+    assert (summary['runs'], summary['errors'], summary['incomplete']) == (4, 1, 1)
+    assert (summary['events'], summary['numTransmissions'], summary['numCorrupted']) == (600, 60, 15)
+    assert summary['collision_ratio'] == 0.25
+    assert summary['wall_clock_mean'] == pytest.approx(6.5 / 4)
+    assert summary['wall_clock_max'] == 3.0
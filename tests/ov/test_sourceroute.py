@@ -83,3 +83,82 @@ def test_source_route(expected_source_route):
         log.debug(output)
 
     assert calculated_route == expected_route
+
+
+def test_source_route_cache():
+    """
+    MOTE_A <- MOTE_B <- MOTE_C
+    """
+
+    source_route = SourceRoute()
+
+    source_route.dispatch(signal='updateParents', data=(tuple(MOTE_B), [MOTE_A]))
+    source_route.dispatch(signal='updateParents', data=(tuple(MOTE_C), [MOTE_B]))
+
+    assert source_route.get_source_route(MOTE_C) == [MOTE_C, MOTE_B, MOTE_A]
+    assert source_route.get_source_route(MOTE_C) == [MOTE_C, MOTE_B, MOTE_A]
+    assert source_route.get_stats()['misses'] == 1
+    assert source_route.get_stats()['hits'] == 1
+
+    # the caller may modify the returned route
+    source_route.get_source_route(MOTE_C).pop()
+    assert source_route.get_source_route(MOTE_C) == [MOTE_C, MOTE_B, MOTE_A]
+
+    # a DAO with the same preferred parent keeps the cached routes
+    source_route.dispatch(signal='updateParents', data=(tuple(MOTE_B), [MOTE_A, MOTE_D]))
+    assert source_route.get_stats()['invalidations'] == 0
+
+
+def test_source_route_invalidation():
+    """
+    MOTE_A <- MOTE_B <- MOTE_C, then MOTE_A <- MOTE_D <- MOTE_B <- MOTE_C
+    """
+
+    source_route = SourceRoute()
+
+    source_route.dispatch(signal='updateParents', data=(tuple(MOTE_B), [MOTE_A]))
+    source_route.dispatch(signal='updateParents', data=(tuple(MOTE_C), [MOTE_B]))
+    source_route.dispatch(signal='updateParents', data=(tuple(MOTE_D), [MOTE_A]))
+    assert source_route.get_source_route(MOTE_C) == [MOTE_C, MOTE_B, MOTE_A]
+    assert source_route.get_source_route(MOTE_D) == [MOTE_D, MOTE_A]
+
+    # changing the parent of MOTE_B invalidates the routes through MOTE_B only
+    source_route.dispatch(signal='updateParents', data=(tuple(MOTE_B), [MOTE_D]))
+    assert source_route.get_stats()['invalidations'] == 1
+
+    assert source_route.get_source_route(MOTE_C) == [MOTE_C, MOTE_B, MOTE_D, MOTE_A]
+    assert source_route.get_source_route(MOTE_D) == [MOTE_D, MOTE_A]
+
+
+def test_source_route_loop():
+    source_route = SourceRoute()
+
+    source_route.dispatch(signal='updateParents', data=(tuple(MOTE_B), [MOTE_C]))
+    source_route.dispatch(signal='updateParents', data=(tuple(MOTE_C), [MOTE_B]))
+
+    assert source_route.get_source_route(MOTE_B) == [MOTE_B, MOTE_C]
+    assert source_route.get_source_route(MOTE_A) == []
+
+    # breaking the loop invalidates both routes
+    source_route.dispatch(signal='updateParents', data=(tuple(MOTE_C), [MOTE_A]))
+    assert source_route.get_source_route(MOTE_B) == [MOTE_B, MOTE_C, MOTE_A]
+
+
+def test_source_route_node_timeout():
+    """
+    MOTE_A <- MOTE_B <- MOTE_C <- MOTE_D, until MOTE_C times out
+    """
+
+    source_route = SourceRoute()
+    topo = topology.Topology()
+
+    source_route.dispatch(signal='updateParents', data=(tuple(MOTE_B), [MOTE_A]))
+    source_route.dispatch(signal='updateParents', data=(tuple(MOTE_C), [MOTE_B]))
+    source_route.dispatch(signal='updateParents', data=(tuple(MOTE_D), [MOTE_C]))
+    assert source_route.get_source_route(MOTE_D) == [MOTE_D, MOTE_C, MOTE_B, MOTE_A]
+
+    topo.parents_last_seen[tuple(MOTE_C)] = 0
+    topo._clear_node_timeout()
+
+    assert tuple(MOTE_C) not in topo.parents
+    assert source_route.get_source_route(MOTE_D) == [MOTE_D, MOTE_C]
@@ -0,0 +1,154 @@
+#!/usr/bin/env python2
+
+import logging.handlers
+import random
+
+import pytest
+
+from openvisualizer.simengine.simengine import SimEngine
+
+# ============================ logging =================================
+
+LOGFILE_NAME = 'test_timeline.log'
+
+log = logging.getLogger('test_timeline')
+log.setLevel(logging.ERROR)
+log.addHandler(logging.NullHandler())
+
+log_handler = logging.handlers.RotatingFileHandler(LOGFILE_NAME, backupCount=5, mode='w')
+log_handler.setFormatter(logging.Formatter("%(asctime)s [%(name)s:%(levelname)s] %(message)s"))
+for logger_name in ['test_timeline']:
+    temp = logging.getLogger(logger_name)
+    temp.setLevel(logging.DEBUG)
+    temp.addHandler(log_handler)
+
+
+# ============================ helpers =================================
+
+class ListTimeLine(object):
+    """ Reference implementation: the sorted list used before the heap. """
+
+    def __init__(self):
+        self.timeline = []
+
+    def schedule_event(self, at_time, mote_id, cb, desc):
+        for i in range(len(self.timeline)):
+            if self.timeline[i][1] == mote_id and self.timeline[i][2] == desc:
+                self.timeline.pop(i)
+                break
+        i = 0
+        while i < len(self.timeline) and at_time > self.timeline[i][0]:
+            i += 1
+        self.timeline.insert(i, [at_time, mote_id, desc])
+
+    def cancel_event(self, mote_id, desc):
+        before = len(self.timeline)
+        self.timeline = [e for e in self.timeline if not (e[1] == mote_id and e[2] == desc)]
+        return before - len(self.timeline)
+
+    def get_events(self):
+        return [list(e) for e in self.timeline]
+
+    def pop(self):
+        return self.timeline.pop(0) if self.timeline else None
+
+
+def pop(timeline):
+    event = timeline._pop_event()
+    if event is None:
+        return None
+    timeline.current_time = event.at_time
+    return [event.at_time, event.mote_id, event.desc]
+
+
+def noop():
+    pass
+
+
+# ============================ fixtures ================================
+
+@pytest.fixture
+def timeline():
+    # the thread is never started, events are popped by the tests
+    engine = SimEngine()
+    try:
+        yield engine.timeline
+    finally:
+        engine.close()
+
+
+# ============================ tests ===================================
+
+def test_ordering(timeline):
+    timeline.schedule_event(3, 1, noop, 'c')
+    timeline.schedule_event(1, 1, noop, 'a')
+    timeline.schedule_event(2, 2, noop, 'b')
+
+    assert timeline.get_events() == [[1, 1, 'a'], [2, 2, 'b'], [3, 1, 'c']]
+    assert [pop(timeline) for _ in range(4)] == [[1, 1, 'a'], [2, 2, 'b'], [3, 1, 'c'], None]
+
+
+def test_ties_last_scheduled_first(timeline):
+    for mote_id in range(5):
+        timeline.schedule_event(1, mote_id, noop, 'tick')
+
+    assert [pop(timeline)[1] for _ in range(5)] == [4, 3, 2, 1, 0]
+
+
+def test_reschedule_replaces(timeline):
+    timeline.schedule_event(1, 1, noop, 'a')
+    timeline.schedule_event(5, 1, noop, 'a')
+    timeline.schedule_event(2, 2, noop, 'a')
+
+    assert timeline.get_events() == [[2, 2, 'a'], [5, 1, 'a']]
+    assert pop(timeline) == [2, 2, 'a']
+    assert pop(timeline) == [5, 1, 'a']
+    assert pop(timeline) is None
+
+
+def test_cancel(timeline):
+    timeline.schedule_event(1, 1, noop, 'a')
+    timeline.schedule_event(2, 1, noop, 'b')
+
+    assert timeline.cancel_event(1, 'a') == 1
+    assert timeline.cancel_event(1, 'a') == 0
+    assert timeline.cancel_event(2, 'b') == 0
+    assert timeline.get_events() == [[2, 1, 'b']]
+    assert pop(timeline) == [2, 1, 'b']
+    assert pop(timeline) is None
+    assert timeline.num_cancelled == 0
+
+
+def test_compaction(timeline):
+    timeline.COMPACT_THRESHOLD = 10
+
+    for i in range(50):
+        timeline.schedule_event(i, 1, noop, 'a')
+
+    assert len(timeline.timeline) <= 2 * (timeline.COMPACT_THRESHOLD + 1)
+    assert timeline.get_events() == [[49, 1, 'a']]
+
+
+def test_same_as_list(timeline):
+    random.seed(1)
+    reference = ListTimeLine()
+    now = 0
+
+    for _ in range(5000):
+        action = random.random()
+        mote_id = random.randint(1, 10)
+        desc = random.choice(['sctimer', 'radio', 'uart'])
+        if action < 0.6:
+            # coarse times to get plenty of ties
+            at_time = now + random.randint(0, 5)
+            timeline.schedule_event(at_time, mote_id, noop, desc)
+            reference.schedule_event(at_time, mote_id, noop, desc)
+        elif action < 0.7:
+            assert timeline.cancel_event(mote_id, desc) == reference.cancel_event(mote_id, desc)
+        else:
+            expected = reference.pop()
+            assert pop(timeline) == expected
+            if expected:
+                now = expected[0]
+
+        assert timeline.get_events() == reference.get_events()
@@ -0,0 +1,149 @@
+#!/usr/bin/env python2
+
+import logging.handlers
+import threading
+import time
+
+import pytest
+
+from openvisualizer.openlbr.txscheduler import TxScheduler
+
+# ============================ logging =================================
+
+LOGFILE_NAME = 'test_txscheduler.log'
+
+log = logging.getLogger('test_txscheduler')
+log.setLevel(logging.ERROR)
+log.addHandler(logging.NullHandler())
+
+log_handler = logging.handlers.RotatingFileHandler(LOGFILE_NAME, backupCount=5, mode='w')
+log_handler.setFormatter(logging.Formatter("%(asctime)s [%(name)s:%(levelname)s] %(message)s"))
+for logger_name in ['test_txscheduler', 'TxScheduler']:
+    temp = logging.getLogger(logger_name)
+    temp.setLevel(logging.DEBUG)
+    temp.addHandler(log_handler)
+
+
+# ============================ helpers =================================
+
+class Recorder(object):
+    """ Records the sent fragments, signals once num_expected fragments were sent. """
+
+    def __init__(self, num_expected):
+        self.num_expected = num_expected
+        self.sent = []
+        self.times = []
+        self.done = threading.Event()
+
+    def __call__(self, next_hop, fragment):
+        self.sent.append((next_hop, fragment))
+        self.times.append(time.time())
+        if len(self.sent) == self.num_expected:
+            self.done.set()
+
+
+def stop(scheduler):
+    scheduler.close()
+    scheduler.join()
+
+
+# ============================ tests ===================================
+
+def test_fragments_in_order():
+    rec = Recorder(4)
+    scheduler = TxScheduler(rec, rate=1000)
+    try:
+        scheduler.enqueue('a', [1, 2, 3, 4])
+
+        assert rec.done.wait(5)
+        assert rec.sent == [('a', 1), ('a', 2), ('a', 3), ('a', 4)]
+    finally:
+        stop(scheduler)
+
+
+def test_round_robin():
+    rec = Recorder(11)
+    scheduler = TxScheduler(rec, rate=20)
+    try:
+        scheduler.enqueue('a', range(10))
+        scheduler.enqueue('b', ['ping'])
+
+        assert rec.done.wait(5)
+        # the ping is not delayed by the remaining fragments of the large datagram
+        assert rec.sent.index(('b', 'ping')) <= 2
+        assert [f for (n, f) in rec.sent if n == 'a'] == range(10)
+    finally:
+        stop(scheduler)
+
+
+def test_pacing():
+    rec = Recorder(6)
+    scheduler = TxScheduler(rec, rate=50, burst=2)
+    try:
+        scheduler.enqueue('a', range(6))
+
+        assert rec.done.wait(5)
+        # the first burst is sent immediately, then one fragment every 20 ms
+        assert rec.times[-1] - rec.times[0] >= 4 * 0.02 * 0.9
+    finally:
+        stop(scheduler)
+
+
+def test_stats():
+    rec = Recorder(3)
+    scheduler = TxScheduler(rec, rate=1000)
+    try:
+        scheduler.enqueue('a', [1, 2])
+        scheduler.enqueue('b', [3])
+
+        assert rec.done.wait(5)
+        stats = scheduler.get_stats()
+        assert stats['sent_fragments'] == 3
+        assert stats['sent_datagrams'] == 2
+        assert stats['queued_fragments'] == 0
+        assert stats['queued_datagrams'] == 0
+        assert stats['max_queued_fragments'] >= 2
+        assert 0 <= stats['latency_avg'] <= stats['latency_max']
+    finally:
+        stop(scheduler)
+
+
+def test_empty_datagram():
+    rec = Recorder(1)
+    scheduler = TxScheduler(rec, rate=1000)
+    try:
+        # a datagram without fragment is not queued
+        scheduler.enqueue('a', [])
+        scheduler.enqueue('b', ['ping'])
+
+        assert rec.done.wait(5)
+        assert rec.sent == [('b', 'ping')]
+        assert scheduler.get_stats()['sent_datagrams'] == 1
+    finally:
+        stop(scheduler)
+
+
+def test_send_error():
+    rec = Recorder(1)
+
+    def send(next_hop, fragment):
+        if fragment == 'bad':
+            raise ValueError(fragment)
+        rec(next_hop, fragment)
+
+    scheduler = TxScheduler(send, rate=1000)
+    try:
+        scheduler.enqueue('a', ['bad'])
+        scheduler.enqueue('a', ['good'])
+
+        assert rec.done.wait(5)
+        assert rec.sent == [('a', 'good')]
+    finally:
+        stop(scheduler)
+
+
+def test_invalid_pacing():
+    with pytest.raises(ValueError):
+        TxScheduler(None, rate=0)
+    with pytest.raises(ValueError):
+        TxScheduler(None, burst=0)
@@ -2,11 +2,13 @@
 
 import json
 import logging.handlers
+import random
 
 import pytest
 
 # ============================ logging =========================================
-from openvisualizer.utils import byteinverse, hex2buf, format_ipv6_addr, buf2int
+from openvisualizer.utils import byteinverse, hex2buf, format_ipv6_addr, buf2int, calculate_crc, calculate_fcs, \
+    calculate_pseudo_header_crc
 
 LOGFILE_NAME = 'test_utils.log'
 
@@ -109,8 +111,67 @@ def expected_format_ipv6(request):
     return request.param
 
 
+# ===== payload_length
+
+PAYLOAD_LENGTHS = [0, 1, 2, 7, 127, 128, 1279, 1280]
+
+
+@pytest.fixture(params=PAYLOAD_LENGTHS)
+def payload(request):
+    rnd = random.Random(request.param)
+    return [rnd.randint(0x00, 0xff) for _ in range(request.param)]
+
+
 # ============================ helpers =========================================
 
+def reference_one_complement_sum(field, checksum):
+    """ Former implementation of _one_complement_sum(), two bytes at a time. """
+    res = 0xFFFF & (checksum[0] << 8 | checksum[1])
+    i = len(field)
+    while i > 1:
+        res += 0xFFFF & (field[-i] << 8 | (field[-i + 1]))
+        i -= 2
+    if i:
+        res += (0xFF & field[-1]) << 8
+    while res >> 16:
+        res = (res & 0xFFFF) + (res >> 16)
+    return [(res >> 8) & 0xFF, res & 0xFF]
+
+
+def reference_pseudo_header_crc(src, dst, length, nh, payload):
+    checksum = [0x00] * 2
+    for field in [src, dst, length, nh, payload]:
+        checksum = reference_one_complement_sum(field, checksum)
+    return [checksum[0] ^ 0xFF, checksum[1] ^ 0xFF]
+
+
+def reference_fcs16_table():
+    """ Table of the CRC-16/CCITT (polynomial 0x1021) of every byte value. """
+
+    table = []
+    for i in range(256):
+        crc = i << 8
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x1021 if crc & 0x8000 else crc << 1) & 0xffff
+        table.append(crc)
+    return tuple(table)
+
+
+FCS16TAB = reference_fcs16_table()
+
+
+def reference_fcs(rpayload):
+    """ Former implementation of calculate_fcs(), bit by bit reversal and table-driven CRC. """
+
+    def reverse(b):
+        return int('{0:08b}'.format(b)[::-1], 2)
+
+    crc = 0x0000
+    for b in rpayload:
+        crc = ((crc << 8) & 0xffff) ^ FCS16TAB[((crc >> 8) ^ reverse(b)) & 0xff]
+    return [reverse(crc >> 8), reverse(crc & 0xff)]
+
+
 # ============================ tests ===========================================
 
 def test_buf2int(expected_buf2int):
@@ -139,3 +200,61 @@ def test_format_ipv6_addr(expected_format_ipv6):
     log.info(ipv6_string)
 
     assert format_ipv6_addr(ipv6_list) == ipv6_string
+
+
+def test_byteinverse_all_bytes():
+    for b in range(256):
+        assert byteinverse(byteinverse(b)) == b
+        assert '{0:08b}'.format(byteinverse(b)) == '{0:08b}'.format(b)[::-1]
+
+
+def test_calculate_fcs(payload):
+    assert calculate_fcs(payload) == reference_fcs(payload)
+    assert calculate_fcs(bytearray(payload)) == reference_fcs(payload)
+
+
+def test_calculate_fcs_check_value():
+    # CRC-16/KERMIT check value 0x2189, sent least significant byte first
+    assert calculate_fcs(bytearray('123456789')) == [0x89, 0x21]
+
+
+def test_calculate_pseudo_header_crc(payload):
+    src = [0xfe, 0x80] + [0x00] * 6 + [0x14, 0x15, 0x92, 0x00, 0x00, 0x00, 0x00, 0x01]
+    dst = [0xbb, 0xbb] + [0x00] * 6 + [0x14, 0x15, 0x92, 0x00, 0x00, 0x00, 0x00, 0x02]
+    length = [0x00, 0x00, (len(payload) + 8) >> 8, (len(payload) + 8) & 0xff]
+    nh = [0x00, 0x00, 0x00, 17]
+
+    assert calculate_pseudo_header_crc(src, dst, length, nh, payload) == \
+        reference_pseudo_header_crc(src, dst, length, nh, payload)
+    assert calculate_crc(payload) == reference_pseudo_header_crc([], [], [], [], payload)
+
+    # bytes-like fields
+    expected = calculate_pseudo_header_crc(src, dst, length, nh, payload)
+    for convert in [bytearray, lambda f: str(bytearray(f)), lambda f: memoryview(bytearray(f))]:
+        assert calculate_pseudo_header_crc(*[convert(f) for f in [src, dst, length, nh, payload]]) == expected
+
+    # other sequences of integers
+    for convert in [tuple, iter]:
+        assert calculate_pseudo_header_crc(*[convert(f) for f in [src, dst, length, nh, payload]]) == expected
+
+
+def test_calculate_crc_tuple():
+    expected = reference_pseudo_header_crc([], [], [], [], [1, 2, 3])
+    assert calculate_crc((1, 2, 3)) == calculate_crc([1, 2, 3]) == expected
+
+
+def test_calculate_pseudo_header_crc_words():
+    # fields holding values which are not bytes, e.g. a length of more than 255 in a single element
+    (src, dst) = ([0x00] * 16, [0x00] * 16)
+    payload = [0x12] * 300
+
+    assert calculate_pseudo_header_crc(src, dst, [0, 308], [0, 17], payload) == \
+        reference_pseudo_header_crc(src, dst, [0, 308], [0, 17], payload)
+
+
+def test_calculate_pseudo_header_crc_verifies():
+    # the checksum of a packet with its checksum filled in is zero
+    payload = [0x16, 0x33, 0x16, 0x33, 0x00, 0x0a, 0x00, 0x00, 0xab, 0xcd]
+    payload[6:8] = calculate_pseudo_header_crc([0x01] * 16, [0x02] * 16, [0x00, 0x0a], [0x00, 17], payload)
+
+    assert calculate_pseudo_header_crc([0x01] * 16, [0x02] * 16, [0x00, 0x0a], [0x00, 17], payload) == [0x00, 0x00]
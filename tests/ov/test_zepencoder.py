@@ -0,0 +1,182 @@
+#!/usr/bin/env python2
+
+import logging.handlers
+import struct
+import time
+
+import pytest
+from pydispatch import dispatcher
+from scapy.compat import raw
+from scapy.layers.inet import UDP
+from scapy.layers.inet6 import IPv6
+
+from openvisualizer.eventbus.eventbusmonitor import EventBusMonitor
+from openvisualizer.eventbus.pcapngwriter import PcapngWriter
+from openvisualizer.eventbus.zepencoder import ZepEncoder
+from openvisualizer.opentun.opentun import OpenTun
+from openvisualizer.utils import calculate_fcs, format_ipv6_addr
+
+# ============================ logging =================================
+
+LOGFILE_NAME = 'test_zepencoder.log'
+
+log = logging.getLogger('test_zepencoder')
+log.setLevel(logging.ERROR)
+log.addHandler(logging.NullHandler())
+
+log_handler = logging.handlers.RotatingFileHandler(LOGFILE_NAME, backupCount=5, mode='w')
+log_handler.setFormatter(logging.Formatter("%(asctime)s [%(name)s:%(levelname)s] %(message)s"))
+for logger_name in ['test_zepencoder', 'ZepEncoder', 'PcapngWriter', 'EventBusMonitor']:
+    temp = logging.getLogger(logger_name)
+    temp.setLevel(logging.DEBUG)
+    temp.addHandler(log_handler)
+
+# ============================ defines =================================
+
+ADDR = OpenTun.IPV6PREFIX + OpenTun.IPV6HOST
+DAGROOT = [0x14, 0x15, 0x92, 0x00, 0x00, 0x00, 0x00, 0x01]
+NEXT_HOP = [0x14, 0x15, 0x92, 0x00, 0x00, 0x00, 0x00, 0x02]
+
+ZEP_OFFSET = ZepEncoder.IPV6_HEADER_LENGTH + ZepEncoder.UDP_HEADER_LENGTH
+
+
+# ============================ helpers =================================
+
+def scapy_packet(udp_payload):
+    """ Reference: the IPv6 and UDP headers built by scapy, as EventBusMonitor used to. """
+    udp = UDP(sport=0, dport=17754)
+    udp.add_payload(str(udp_payload))
+    addr = format_ipv6_addr(ADDR)
+    return bytearray(raw(IPv6(version=6, tc=0, src=addr, hlim=64, dst=addr) / udp))
+
+
+def legacy_zep_mac(previous_hop, next_hop, lowpan):
+    """ Reference: former EventBusMonitor._wrap_mac_and_zep(), with dummy timestamp and sequence number. """
+    zep = [ord('E'), ord('X'), 0x02, 0x01, 0x00, 0x00, 0x01, 0x01, 0xff]
+    zep += [0x01] * 8  # timestamp
+    zep += [0x02] * 4  # sequence number
+    zep += [0x00] * 10
+    zep += [21 + len(lowpan) + 2]
+    mac = [0x41, 0xcc, 0x66, 0xfe, 0xca] + next_hop[::-1] + previous_hop[::-1] + lowpan
+    return zep + mac + calculate_fcs(mac)
+
+
+def zep_fields(pkt):
+    """ Returns the channel, the timestamp, the sequence number and the length of the ZEP header of pkt. """
+    (seconds, fraction, sequence_number) = struct.unpack_from('>III', pkt, ZepEncoder.ZEP_TIMESTAMP)
+    timestamp = seconds - ZepEncoder.NTP_EPOCH_OFFSET + fraction / float(0x100000000)
+    return pkt[ZepEncoder.ZEP_CHANNEL], timestamp, sequence_number, pkt[ZepEncoder.ZEP_LENGTH]
+
+
+def read_pcapng(filename):
+    """ Returns the link type and the (timestamp, packet) of a pcapng file written by PcapngWriter. """
+    with open(filename, 'rb') as f:
+        data = f.read()
+
+    blocks = []
+    offset = 0
+    while offset < len(data):
+        (block_type, length) = struct.unpack_from('<II', data, offset)
+        assert struct.unpack_from('<I', data, offset + length - 4)[0] == length
+        blocks.append((block_type, data[offset + 8:offset + length - 4]))
+        offset += length
+
+    assert blocks[0][0] == PcapngWriter.SECTION_HEADER_BLOCK
+    assert struct.unpack_from('<I', blocks[0][1])[0] == PcapngWriter.BYTE_ORDER_MAGIC
+    assert blocks[1][0] == PcapngWriter.INTERFACE_DESCRIPTION_BLOCK
+    linktype = struct.unpack_from('<H', blocks[1][1])[0]
+
+    packets = []
+    for (block_type, body) in blocks[2:]:
+        assert block_type == PcapngWriter.ENHANCED_PACKET_BLOCK
+        (interface, ts_high, ts_low, captured, original) = struct.unpack_from('<IIIII', body)
+        assert interface == 0 and captured == original
+        packets.append(((ts_high << 32 | ts_low) / 1e6, bytearray(body[20:20 + captured])))
+    return linktype, packets
+
+
+# ============================ fixtures ================================
+
+@pytest.fixture
+def encoder():
+    return ZepEncoder(ADDR, ADDR)
+
+
+@pytest.fixture
+def v6_to_internet():
+    received = []
+
+    def receiver(sender, signal, data):
+        received.append(data)
+
+    dispatcher.connect(receiver, signal='v6ToInternet')
+    yield received
+    dispatcher.disconnect(receiver, signal='v6ToInternet')
+
+
+# ============================ tests ===================================
+
+@pytest.mark.parametrize('length', [2, 3, 50, 127])
+def test_same_as_scapy(encoder, length):
+    frame = bytearray((7 * i + length) % 256 for i in range(length))
+    pkt = encoder.encode(frame, 26)
+
+    assert pkt[ZEP_OFFSET + ZepEncoder.ZEP_HEADER_LENGTH:] == frame
+    assert pkt == scapy_packet(pkt[ZEP_OFFSET:])
+
+
+def test_zep_fields(encoder):
+    first = encoder.encode([0x00] * 10, 11, 1500000000.25)
+    second = encoder.encode([0x00] * 20, 26)
+
+    assert zep_fields(first) == (11, pytest.approx(1500000000.25), 1, 10)
+    (channel, timestamp, sequence_number, length) = zep_fields(second)
+    assert (channel, sequence_number, length) == (26, 2, 20)
+    assert abs(timestamp - time.time()) < 5
+
+    # the template is left untouched
+    assert encoder.template[ZepEncoder.ZEP_CHANNEL] == 0
+
+
+def test_monitor_to_internet(v6_to_internet):
+    ebm = EventBusMonitor()
+    ebm.dagoot_eui64 = DAGROOT
+    lowpan = [0x78, 0x33, 0x3a] + range(40)
+
+    ebm._eventbus_notification('bytesToMesh', 'OpenLbr', (NEXT_HOP, lowpan))
+
+    [pkt] = v6_to_internet
+    assert isinstance(pkt, list)
+    pkt = bytearray(pkt)
+    assert pkt == scapy_packet(pkt[ZEP_OFFSET:])
+
+    # but for the timestamp and the sequence number, the ZEP packet is unchanged
+    expected = legacy_zep_mac(DAGROOT, NEXT_HOP, lowpan)
+    zep = list(pkt[ZEP_OFFSET:])
+    zep[9:21] = expected[9:21]
+    assert zep == expected
+
+
+def test_monitor_to_pcapng(tmpdir, v6_to_internet):
+    filename = str(tmpdir.join('debug.pcapng'))
+    ebm = EventBusMonitor(filename)
+    ebm.dagoot_eui64 = DAGROOT
+
+    ebm._eventbus_notification('fromMote.data', 'moteConnector', (NEXT_HOP, [0x78, 0x33, 0x3a, 0x00]))
+    # sniffed frame, CRC and channel
+    ebm._eventbus_notification('fromMote.sniffedPacket', 'moteConnector', [0x41, 0x88, 0x01, 0x00, 0x00, 20])
+    ebm.close()
+
+    assert v6_to_internet == []
+
+    (linktype, packets) = read_pcapng(filename)
+    assert linktype == PcapngWriter.LINKTYPE_RAW
+    assert len(packets) == 2
+    for (timestamp, pkt) in packets:
+        assert abs(timestamp - time.time()) < 5
+        assert pkt == scapy_packet(pkt[ZEP_OFFSET:])
+
+    assert zep_fields(packets[0][1])[0] == 0
+    assert zep_fields(packets[1][1])[0] == 20
+    assert packets[1][1][ZEP_OFFSET + ZepEncoder.ZEP_HEADER_LENGTH:] == \
+        bytearray([0x41, 0x88, 0x01] + calculate_fcs([0x41, 0x88, 0x01]))